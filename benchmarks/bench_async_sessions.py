@@ -0,0 +1,71 @@
+"""
+Idle session benchmark for the async engine: N calculator sessions are
+started on one event loop and left waiting in grab; the memory they hold
+(tracemalloc) and the time to start and to finish them all are printed.
+
+Usage: python benchmarks/bench_async_sessions.py [sessions]
+"""
+import sys
+import os
+import time
+import asyncio
+import tracemalloc
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.async_engine import AsyncSession
+
+SOURCE = """
+rank: op_choice
+rate: n1, n2
+flag: running <-- true
+
+action add(rate a, rate b) -> rate { reward a + b }
+
+play {
+    stay (running) -> {
+        drop "--- MENU ---"
+        op_choice <-- grab "Operazione (0-1): "
+        choice (op_choice == 0) -> {
+            running <-- false
+        } fail -> {
+            n1, n2 <-- grab "Due numeri: "
+            drop "Risultato: " + add(n1, n2)
+        }
+    }
+    drop "Uscita."
+} gameover
+"""
+
+async def main(count):
+    module = BytecodeCompiler().compile_program(compile_source(SOURCE, lower=True))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    sessions = [AsyncSession(module) for _ in range(count)]
+    tasks = [asyncio.create_task(s.run()) for s in sessions]
+    await asyncio.sleep(0)  # every session runs up to its first grab
+    started = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    waiting = sum(1 for s in sessions if s.vm.waiting is not None)
+    start = time.perf_counter()
+    for session in sessions:
+        session.input.put_nowait("0")
+    await asyncio.gather(*tasks)
+    finished = time.perf_counter() - start
+    assert all(s.output[-1] == "Uscita." for s in sessions)
+
+    print(f"sessions waiting in grab: {waiting}")
+    print(f"start:  {started * 1000:8.1f} ms")
+    print(f"memory: {held / 2**20:8.1f} MiB ({held / count:.0f} bytes per idle session)")
+    print(f"finish: {finished * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
@@ -0,0 +1,81 @@
+"""
+Batch benchmark: one scoring program run over N input rows, once per row
+on the VM and as a single vectorized BatchExecutor run (NumPy arrays, see
+play_lang.backend.batch). The VM time is measured on a sample of rows and
+scaled to N.
+
+Usage: python benchmarks/bench_batch.py [rows]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend import batch
+from play_lang.backend.batch import BatchExecutor, input_line
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+SOURCE = """
+rank: age, visits, i, bonus
+rate: spent, score
+flag: member
+
+action clamp(rate x, rate low, rate high) -> rate {
+    choice (x < low) -> { reward low }
+    retry (x > high) -> { reward high }
+    reward x
+}
+
+play {
+    age <-- grab "eta"
+    visits <-- grab "visite"
+    spent <-- grab "spesa"
+    member <-- grab "socio"
+    bonus <-- 0
+    loop (i <-- 0; i < visits; i <-- i + 1) -> {
+        choice (i % 4 == 3) -> { bonus <-- bonus + 2 } fail -> { bonus <-- bonus + 1 }
+    }
+    score <-- spent / 10.0 + bonus * 1.5
+    choice (member && age >= 65) -> { score <-- score * 1.2 }
+    retry (age < 18) -> { score <-- score / 2.0 }
+    drop "punteggio " + clamp(score, 0.0, 100.0)
+} gameover
+"""
+
+def main(rows):
+    np = batch.np
+    if np is None:
+        print("NumPy is not installed: every row runs on the VM")
+        return
+    rng = np.random.default_rng(0)
+    columns = [rng.integers(10, 90, rows), rng.integers(0, 12, rows),
+               np.round(rng.random(rows) * 500, 2), rng.random(rows) < 0.3]
+    program = compile_source(SOURCE, lower=True)
+
+    start = time.perf_counter()
+    result = BatchExecutor(program).run(columns)
+    outputs = result.outputs
+    vectorized = time.perf_counter() - start
+
+    module = BytecodeCompiler().compile_program(program)
+    sample = min(rows, 20000)
+    start = time.perf_counter()
+    for row in range(sample):
+        play_io = MemoryIO([input_line(column[row]) for column in columns])
+        VM(io=play_io).run(module)
+        assert play_io.lines() == outputs[row]
+    per_row = (time.perf_counter() - start) / sample
+
+    print(f"rows: {rows} ({result.vectorized} vectorized, {result.fallback} on the VM)")
+    print(f"VM, one run per row: {per_row * rows:8.2f} s  ({per_row * 1e6:.1f} us/row, {sample} rows timed)")
+    print(f"vectorized batch:    {vectorized:8.2f} s  ({vectorized / rows * 1e6:.2f} us/row)")
+    print(f"speedup: {per_row * rows / vectorized:.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
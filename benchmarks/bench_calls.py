@@ -0,0 +1,72 @@
+"""
+Call benchmark: calls per second of small actions with 0 to 4 parameters
+(rank arguments, the last parameter is a rate to include the call-site
+promotion), on the Interpreter and on the VM.
+
+Usage: python benchmarks/bench_calls.py [calls]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+TEMPLATE = """
+rank: i
+rate: total
+
+action f({params}) -> rate {{
+    reward {body}
+}}
+
+play {{
+    loop (i <-- 0; i < {calls}; i <-- i + 1) -> {{
+        total <-- f({args})
+    }}
+    drop "totale=" + -->total
+}} gameover
+"""
+
+def source(arity, calls):
+    names = ['a', 'b', 'c', 'd'][:arity]
+    params = [f"rank {name}" for name in names[:-1]] + [f"rate {name}" for name in names[-1:]]
+    return TEMPLATE.format(params=', '.join(params), body=' + '.join(names) or '1.5',
+                           args=', '.join(['i'] * arity), calls=calls)
+
+def calls_per_second(run, calls):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return calls / best, output
+
+def run_interpreter(program):
+    play_io = MemoryIO()
+    Interpreter(io=play_io).run(program)
+    return play_io.lines()
+
+def run_vm(module):
+    play_io = MemoryIO()
+    VM(io=play_io).run(module)
+    return play_io.lines()
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"{'args':>4s} {'interp calls/s':>15s} {'vm calls/s':>12s} {'speedup':>8s}")
+    for arity in range(5):
+        lowered = compile_source(source(arity, calls), lower=True)
+        module = BytecodeCompiler().compile_program(lowered)
+        interp_rate, expected = calls_per_second(lambda: run_interpreter(lowered), calls)
+        vm_rate, output = calls_per_second(lambda: run_vm(module), calls)
+        assert output == expected, f"{arity} args: VM output differs"
+        print(f"{arity:4d} {interp_rate:15,.0f} {vm_rate:12,.0f} {vm_rate / interp_rate:7.2f}x")
@@ -0,0 +1,50 @@
+"""
+Counting loop benchmark: sums over a range of rank values, run on the VM
+with and without optimize=True (the loops become closed forms, see
+play_lang.optimizer.reduction).
+
+Usage: python benchmarks/bench_counting_loops.py [n]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+SOURCE = """
+rank: n, i, k <-- 3, total, squares, mixed
+
+play {
+    n <-- grab "n"
+    loop (i <-- 0; i < n; i <-- i + 1) -> { total <-- total + i }
+    loop (i <-- 1; i <= n; i <-- i + 2) -> {
+        squares <-- squares + i * i
+        mixed <-- mixed - k * i * (i - 1) + 5
+    }
+    drop "totale " + total + ", quadrati " + squares + ", misto " + mixed + ", i " + i
+} gameover
+"""
+
+def bench(optimize, n):
+    module = BytecodeCompiler().compile_program(compile_source(SOURCE, optimize=optimize, lower=True))
+    play_io = MemoryIO([str(n)])
+    start = time.perf_counter()
+    VM(io=play_io).run(module)
+    return time.perf_counter() - start, play_io.lines()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    loop_time, loop_out = bench(False, n)
+    closed_time, closed_out = bench(True, n)
+    assert loop_out == closed_out, "closed forms produced different output"
+    print(loop_out[0])
+    print(f"loops:        {loop_time * 1000:10.2f} ms")
+    print(f"closed forms: {closed_time * 1000:10.3f} ms")
+    print(f"speedup:      {loop_time / closed_time:.0f}x")
@@ -0,0 +1,91 @@
+"""
+Symbol index benchmark: a generated repository of Play sources (libraries
+of actions and programs calling them, sharing global names) indexed with
+play_index.SymbolIndex. Reports the first full build, an update with no
+changes, an update after editing one file, and the latency of the
+definition, caller and global-user queries.
+
+Usage: python benchmarks/bench_index.py [files]
+"""
+import sys
+import os
+import time
+import random
+import tempfile
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from play_index import SymbolIndex
+from run_compiler import get_parser
+
+LIBRARY_EVERY = 10  # one library of 8 actions every 10 files
+
+def library_source(k):
+    return "\n".join(f"""
+action f{k}_{j}(rank n) -> rank {{
+    rank: a <-- n * {j + 1}
+    choice (n <= 0) -> {{ reward a }}
+    reward a + f{k}_{(j + 1) % 8}(n - 1)
+}}""" for j in range(8))
+
+def program_source(k, libraries, rng):
+    calls = " + ".join(f"f{rng.randrange(libraries)}_{rng.randrange(8)}(i)" for _ in range(3))
+    return f"""
+rank: g{k % 50}, total
+action step{k}(rank n) -> rank {{ total <-- total + n  reward total }}
+play {{
+    rank: i
+    loop (i <-- 0; i < 10; i <-- i + 1) -> {{
+        g{k % 50} <-- step{k}({calls})
+    }}
+    drop "t " + total + " " + g{k % 50}
+}} gameover
+"""
+
+def write_repository(root, files):
+    rng = random.Random(1)
+    libraries = max(1, files // LIBRARY_EVERY)
+    for k in range(files):
+        directory = os.path.join(root, f"pkg{k % 100}")
+        os.makedirs(directory, exist_ok=True)
+        if k % LIBRARY_EVERY == 0:
+            path, text = os.path.join(directory, f"lib{k // LIBRARY_EVERY}.play"), library_source(k // LIBRARY_EVERY)
+        else:
+            path, text = os.path.join(directory, f"prog{k}.play"), program_source(k, libraries, rng)
+        with open(path, 'w') as f:
+            f.write(text)
+    return libraries
+
+def query_time(function, names):
+    start = time.perf_counter()
+    results = sum(len(function(name)) for name in names)
+    return (time.perf_counter() - start) / len(names), results / len(names)
+
+if __name__ == "__main__":
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    get_parser()
+    get_parser('library')
+    with tempfile.TemporaryDirectory() as root:
+        libraries = write_repository(root, files)
+        with SymbolIndex(os.path.join(root, '.index.db')) as index:
+            build = index.update(root)
+            noop = index.update(root)
+            edited = os.path.join(root, 'pkg1', 'prog1.play')
+            with open(edited, 'a') as f:
+                f.write("\n")
+            edit = index.update(root)
+            print(f"{files} files, {libraries} libraries")
+            print(f"build:        {build.seconds * 1000:9.1f}ms ({build.parsed} parsed)")
+            print(f"no change:    {noop.seconds * 1000:9.1f}ms ({noop.parsed} parsed)")
+            print(f"one edit:     {edit.seconds * 1000:9.1f}ms ({edit.parsed} parsed)")
+
+            rng = random.Random(2)
+            actions = [f"f{rng.randrange(libraries)}_{rng.randrange(8)}" for _ in range(200)]
+            globals_ = [f"g{rng.randrange(50)}" for _ in range(200)]
+            for label, function, names in (("definitions", index.definitions, actions),
+                                           ("callers", index.callers, actions),
+                                           ("users", index.users, globals_)):
+                seconds, results = query_time(function, names)
+                print(f"{label:12s} {seconds * 1000:8.3f}ms per query ({results:.1f} results)")
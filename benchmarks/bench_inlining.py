@@ -0,0 +1,80 @@
+"""
+Inlining benchmark: a hot loop calling small actions (a rate addition
+called with rank arguments, a square, a clamp with a local and a branch),
+compiled with -O with and without inlining (play_lang.optimizer.inlining)
+and run on the VM. Reports run time and the code-size growth: AST nodes,
+bytecode instructions of the play block and of the whole module.
+
+Usage: python benchmarks/bench_inlining.py [iterations]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, get_parser
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.optimizer.ast_utils import iter_stmts, stmt_exprs, iter_expr
+from play_lang.runtime.io import MemoryIO
+
+def build_source(iterations):
+    return f"""
+action add(rate a, rate b) -> rate {{ reward a + b }}
+action sq(rank n) -> rank {{ reward n * n }}
+action clamp(rank n, rank hi) -> rank {{
+    rank: m <-- n
+    choice (m > hi) -> {{ m <-- hi }}
+    reward m
+}}
+play {{
+    rank: i, s
+    rate: t
+    loop (i <-- 0; i < {iterations}; i <-- i + 1) -> {{
+        t <-- add(t, i % 7)
+        s <-- s + sq(i % 100) + clamp(i % 13, 9)
+    }}
+    drop "t " + t + " s " + s
+}} gameover
+"""
+
+def ast_size(program):
+    size = 0
+    for block in [program.main_block] + [f.body for f in program.functions]:
+        for stmt in iter_stmts(block):
+            size += 1
+            for expr in stmt_exprs(stmt):
+                size += sum(1 for _ in iter_expr(expr))
+    return size
+
+def measure(source, **options):
+    stats = {}
+    program = compile_source(source, optimize=True, lower=True, stats=stats, **options)
+    module = BytecodeCompiler().compile_program(program)
+    main_ops = len(module.main.ops)
+    total_ops = main_ops + sum(len(function.ops) for function in module.functions)
+    best = float('inf')
+    for _ in range(3):
+        play_io = MemoryIO([])
+        start = time.perf_counter()
+        VM(io=play_io).run(module)
+        best = min(best, time.perf_counter() - start)
+    size = ast_size(compile_source(source, optimize=True, **options))
+    return play_io.lines(), stats.get('inlined', 0), best, size, main_ops, total_ops
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    source = build_source(iterations)
+    get_parser()
+    plain = measure(source, inline_size=0)
+    inlined = measure(source)
+    assert plain[0] == inlined[0], "inlined program produced different output"
+    print(plain[0][0])
+    print(f"{'':12s} {'inlined':>8s} {'run':>10s} {'AST':>6s} {'play ops':>9s} {'all ops':>8s}")
+    for name, (_, count, run_time, size, main_ops, total_ops) in (("calls", plain), ("inlined", inlined)):
+        print(f"{name:12s} {count:8d} {run_time * 1000:8.1f}ms {size:6d} {main_ops:9d} {total_ops:8d}")
+    print(f"speedup: {plain[2] / inlined[2]:.2f}x, code size: AST {inlined[3] / plain[3]:.2f}x, "
+          f"play block {inlined[4] / plain[4]:.2f}x, module {inlined[5] / plain[5]:.2f}x")
@@ -0,0 +1,71 @@
+"""
+Output/input-heavy benchmark for the runtime I/O layer: the same program is
+run writing with a flushing print per drop and reading with readline per
+grab, then through the buffered PlayIO.
+
+Usage: python benchmarks/bench_io.py [lines]
+"""
+import sys
+import os
+import io
+import tempfile
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter
+from play_lang.runtime.io import PlayIO
+
+SOURCE = """
+rank: i, n, v, total <-- 0
+play {
+    n <-- grab "Quanti valori? "
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        v <-- grab ""
+        total <-- total + v
+    }
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        drop "Riga " + -->i + ": totale " + -->total
+    }
+} gameover
+"""
+
+def run_unbuffered(ast, input_path, output_path):
+    with open(input_path) as inp, open(output_path, 'w') as out:
+        def read(prompt):
+            out.write(prompt)
+            out.flush()
+            return inp.readline().rstrip('\n')
+        def write(text):
+            print(text, file=out, flush=True)
+        Interpreter(input_fn=read, output_fn=write).run(ast)
+
+def run_buffered(ast, input_path, output_path):
+    with open(input_path) as inp, open(output_path, 'w') as out:
+        Interpreter(io=PlayIO(inp, out)).run(ast)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ast = compile_source(SOURCE, lower=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'input.txt')
+        with open(input_path, 'w') as f:
+            f.write(f"{count}\n" + "".join(f"{i % 97}\n" for i in range(count)))
+
+        results = {}
+        for name, runner in (("print/readline", run_unbuffered), ("PlayIO", run_buffered)):
+            output_path = os.path.join(tmp, name.replace('/', '_') + '.txt')
+            start = time.perf_counter()
+            runner(ast, input_path, output_path)
+            results[name] = time.perf_counter() - start
+            with open(output_path) as f:
+                results[name + ' output'] = f.read()
+
+    assert results["print/readline output"] == results["PlayIO output"]
+    for name in ("print/readline", "PlayIO"):
+        print(f"{name:15s} {results[name] * 1000:.1f} ms")
+    print(f"speedup:        {results['print/readline'] / results['PlayIO']:.2f}x")
@@ -0,0 +1,56 @@
+"""
+Output-heavy benchmark for label concatenation: the lowered tree is built
+once with one LabelConcatNode per '+' and once with LabelJoinNode chains
+(precompiled format templates), then run with output to memory.
+
+Usage: python benchmarks/bench_label_join.py [iterations]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.frontend.semantic_analysis import SemanticAnalyzer
+from play_lang.frontend.lowering import Lowerer
+from play_lang.backend.interpreter import Interpreter
+from play_lang.runtime.io import MemoryIO
+
+SOURCE = """
+rank: i, n <-- %d, hp <-- 100
+rate: speed <-- 1.5
+label: name <-- "Giocatore", log <-- ""
+flag: alive <-- true
+play {
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        drop "Turno " + -->i + ": " + name + " hp=" + -->hp + " velocita=" + -->speed + " vivo=" + -->alive + " [" + -->i + "/" + -->n + "]"
+        drop "Risultato: " + (hp - i)
+        log <-- "Stampa di i: " + i + " - " + name + " - " + name + " - " + name
+    }
+} gameover
+"""
+
+def lowered(source, join_labels):
+    ast = compile_source(source)
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    return Lowerer(analyzer.expr_types, join_labels=join_labels).lower_program(ast)
+
+def bench(program):
+    play_io = MemoryIO()
+    start = time.perf_counter()
+    Interpreter(io=play_io).run(program)
+    return time.perf_counter() - start, play_io.getvalue()
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    source = SOURCE % iterations
+    pairwise_time, pairwise_out = bench(lowered(source, False))
+    join_time, join_out = bench(lowered(source, True))
+    assert pairwise_out == join_out
+    print(f"pairwise concat: {pairwise_time * 1000:.1f} ms")
+    print(f"joined template: {join_time * 1000:.1f} ms")
+    print(f"speedup:         {pairwise_time / join_time:.2f}x")
@@ -0,0 +1,71 @@
+"""
+Library benchmark: compile time of a small program that uses a few actions
+of a large library, with the library source pasted in the program (parsed,
+analyzed and compiled every time) and linked as a precompiled Library
+(only the program is compiled, see play_lang.backend.library).
+
+Usage: python benchmarks/bench_library.py [actions]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, compile_library
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+PROGRAM = """
+rank: i, total
+play {
+    loop (i <-- 0; i < 10; i <-- i + 1) -> { total <-- total + f0(i) + f1(i) }
+    drop "totale " + total
+} gameover
+"""
+
+def build_library_source(count):
+    parts = []
+    for k in range(count):
+        callee = f"f{k + 1}(n - 1)" if k + 1 < count else "n"
+        parts.append(f"""
+action f{k}(rank n) -> rank {{
+    rank: a <-- n * {k % 7 + 1}
+    choice (n <= 0) -> {{ reward a }}
+    retry (a % 3 == 0) -> {{ reward a + {k} }}
+    reward a - {callee}
+}}""")
+    return "\n".join(parts)
+
+def compile_and_run(source, libraries=()):
+    start = time.perf_counter()
+    module = BytecodeCompiler().compile_program(compile_source(source, lower=True, libraries=libraries))
+    elapsed = time.perf_counter() - start
+    play_io = MemoryIO([])
+    VM(io=play_io).run(module)
+    return elapsed, play_io.lines()
+
+def best(fn, repeat=5):
+    results = [fn() for _ in range(repeat)]
+    return min(r[0] for r in results), results[0][1]
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    library_source = build_library_source(count)
+    inline = PROGRAM.replace("play {", library_source + "\nplay {", 1)
+
+    start = time.perf_counter()
+    library = compile_library(library_source, "bench")
+    build_time = time.perf_counter() - start
+
+    inline_time, inline_out = best(lambda: compile_and_run(inline))
+    linked_time, linked_out = best(lambda: compile_and_run(PROGRAM, [library]))
+    assert inline_out == linked_out, "linked library produced different output"
+    print(linked_out[0])
+    print(f"library build (once): {build_time * 1000:9.2f} ms  ({count} actions)")
+    print(f"inline source:        {inline_time * 1000:9.2f} ms")
+    print(f"linked library:       {linked_time * 1000:9.2f} ms")
+    print(f"speedup:              {inline_time / linked_time:.0f}x")
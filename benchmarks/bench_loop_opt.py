@@ -0,0 +1,55 @@
+"""
+Loop-heavy benchmark for loop-invariant code motion and common subexpression
+elimination: runs the same program with and without optimize=True.
+
+Usage: python benchmarks/bench_loop_opt.py [repetitions]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter
+
+SOURCE = """
+rank: width <-- 40, height <-- 30, scale <-- 3, x, y, total <-- 0
+rate: gain <-- 1.25, score <-- 0.0
+
+play {
+    loop (y <-- 0; y < height; y <-- y + 1) -> {
+        x <-- 0
+        stay (x < width * scale) -> {
+            total <-- total + (width * height + scale) % 7 + x * (width * height + scale)
+            score <-- score + gain * (scale * scale + 1) + (x - y) * (x - y)
+            x <-- x + 1
+        }
+    }
+    drop "Totale: " + -->total
+    drop "Punteggio: " + -->score
+} gameover
+"""
+
+def bench(optimize, repetitions):
+    ast = compile_source(SOURCE, optimize=optimize)
+    output = []
+    best = None
+    for _ in range(repetitions):
+        output.clear()
+        start = time.perf_counter()
+        Interpreter(output_fn=output.append).run(ast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, list(output)
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    base_time, base_out = bench(False, repetitions)
+    opt_time, opt_out = bench(True, repetitions)
+    assert base_out == opt_out, "optimized program produced different output"
+    print(f"unoptimized: {base_time * 1000:.1f} ms")
+    print(f"optimized:   {opt_time * 1000:.1f} ms")
+    print(f"speedup:     {base_time / opt_time:.2f}x")
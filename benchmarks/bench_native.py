@@ -0,0 +1,70 @@
+"""
+Native backend benchmark: a numeric hot loop (rank and rate arithmetic, a
+small action call, a label built every 1000 iterations) run on the VM and
+as a C executable (play_lang.backend.native). Reports the build time (C
+generation and compilation, then a cached rebuild) separately from the
+run time.
+
+Usage: python benchmarks/bench_native.py [iterations]
+"""
+import sys
+import os
+import time
+import tempfile
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, get_parser
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.backend.native import build_native, run_native
+from play_lang.runtime.io import MemoryIO
+
+def build_source(iterations):
+    return f"""
+action step(rank x) -> rank {{ reward (x * 1103515245 + 12345) % 2147483648 }}
+play {{
+    rank: i, x <-- 1, hits
+    rate: acc
+    loop (i <-- 0; i < {iterations}; i <-- i + 1) -> {{
+        x <-- step(x)
+        acc <-- acc + x / 2147483648.0
+        choice (x % 1000 == 0) -> {{ hits <-- hits + 1 }}
+        choice (i % 1000 == 0) -> {{ drop "i " + i + " " + acc }}
+    }}
+    drop "x " + x + " acc " + acc + " hits " + hits
+}} gameover
+"""
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    get_parser()
+    program = compile_source(build_source(iterations), optimize=True, lower=True, rank_overflow=True)
+
+    module = BytecodeCompiler().compile_program(program)
+    vm_io = MemoryIO([])
+    start = time.perf_counter()
+    VM(io=vm_io).run(module)
+    vm_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        build = build_native(program, cache_dir=cache_dir)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        cached = build_native(program, cache_dir=cache_dir)
+        cached_time = time.perf_counter() - start
+        assert cached.cached
+        native_io = MemoryIO([])
+        start = time.perf_counter()
+        run_native(build, native_io)
+        native_time = time.perf_counter() - start
+
+    assert vm_io.lines() == native_io.lines(), "native program produced different output"
+    print(native_io.lines()[-1])
+    print(f"VM run:       {vm_time * 1000:9.1f}ms")
+    print(f"native build: {build_time * 1000:9.1f}ms (cached: {cached_time * 1000:.1f}ms)")
+    print(f"native run:   {native_time * 1000:9.1f}ms (process start included)")
+    print(f"speedup: {vm_time / native_time:.1f}x run, {vm_time / (native_time + build_time):.1f}x with the build")
@@ -0,0 +1,76 @@
+"""
+Syntax error recovery benchmark: a generated program of many actions with
+a few broken statements. Compares one compile_source call, which reports
+every syntax error (and the semantic errors of the code that parsed), with
+the edit-compile loop of a parser that stops at the first error: fix the
+reported error, compile again, until the source compiles. Also reports the
+compile time of the correct source, which does not go through recovery.
+
+Usage: python benchmarks/bench_recovery.py [actions] [errors]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, get_parser
+from play_lang.frontend.recovery import SyntaxErrors
+
+def action_source(k, broken):
+    update = "t <-- t + * 2" if broken else "t <-- t + 2"
+    return f"""action a{k}(rank n) -> rank {{
+    rank: t <-- n * {k % 7 + 1}
+    choice (t > 50) -> {{ {update} }} fail -> {{ t <-- t - 1 }}
+    reward t
+}}"""
+
+def build_source(actions, broken):
+    parts = [action_source(k, k in broken) for k in range(actions)]
+    parts.append("play {\n    rank: s\n    s <-- a0(3) + a1(4)\n    drop \"s \" + s\n} gameover")
+    return "\n".join(parts)
+
+def first_error_loop(actions, broken):
+    # Stop-at-first-error workflow: one full compile per error, fixing the
+    # first broken action each time (line numbers tell which one)
+    broken = sorted(broken)
+    compiles = 0
+    while True:
+        compiles += 1
+        try:
+            get_parser().parse(build_source(actions, broken))
+        except Exception:
+            broken.pop(0)
+            continue
+        compile_source(build_source(actions, broken))
+        return compiles
+
+if __name__ == "__main__":
+    actions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    errors = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    broken = set(range(0, actions, max(1, actions // errors)))
+    source = build_source(actions, broken)
+    get_parser()
+
+    start = time.perf_counter()
+    compile_source(build_source(actions, set()))
+    clean = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        compile_source(source)
+        found = 0
+    except SyntaxErrors as e:
+        found = len(e.errors)
+    one_pass = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiles = first_error_loop(actions, broken)
+    loop = time.perf_counter() - start
+
+    print(f"{actions} actions, {len(broken)} broken ({len(source.splitlines())} lines)")
+    print(f"correct source:       {clean * 1000:9.1f}ms")
+    print(f"one recovering pass:  {one_pass * 1000:9.1f}ms ({found} errors)")
+    print(f"stop at first error:  {loop * 1000:9.1f}ms ({compiles} compiles)")
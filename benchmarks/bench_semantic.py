@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the SemanticAnalyzer on an expression-heavy program.
+Parsing and AST construction are done once; only the checks are timed.
+
+Usage: python benchmarks/bench_semantic.py [statements] [repetitions]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import get_parser
+from play_lang.frontend.transformer import PlayTransformer
+from play_lang.frontend.semantic_analysis import SemanticAnalyzer
+
+STATEMENTS = [
+    "a <-- (a + b * 3 - c % 7) * (b - 1) / (c + 2)",
+    "r <-- r * 1.5 + a / 2 - (s - r) * 0.25 + -a",
+    "f <-- (a < b && b <= c) || !(r >= s) && a + b <> c",
+    "l <-- \"v=\" + a + \" r=\" + r + \" f=\" + f + \" \" + l",
+    "f <-- mix(a, r, b + c) > r * 2.0 || l == \"fine\"",
+]
+
+def build_source(count):
+    lines = [
+        "rank: a <-- 1, b <-- 2, c <-- 3",
+        "rate: r <-- 0.5, s <-- 2.5",
+        "flag: f",
+        "label: l <-- \"\"",
+        "action mix(rank x, rate y, rate z) -> rate { reward x * y + z }",
+        "play {",
+    ]
+    for i in range(count):
+        lines.append("    " + STATEMENTS[i % len(STATEMENTS)])
+    lines.append("} gameover")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    tree = get_parser().parse(build_source(count))
+    ast = PlayTransformer().transform(tree)
+
+    best = None
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        SemanticAnalyzer().visit(ast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{count} statements: {best * 1000:.1f} ms ({best / count * 1e6:.2f} us/statement)")
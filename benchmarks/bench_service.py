@@ -0,0 +1,61 @@
+"""
+Startup benchmark for the execution service: N small scripts run once as a
+fresh 'run_compiler.py --run --vm' process each, and once as jobs of a warm
+ExecutionService (process workers, per-worker artifact cache).
+
+Usage: python benchmarks/bench_service.py [jobs] [workers]
+"""
+import sys
+import os
+import time
+import subprocess
+import tempfile
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from play_service import ExecutionService, Job
+
+SOURCE = """
+rank: i, total
+play {
+    loop (i <-- 0; i < 200; i <-- i + 1) -> { total <-- total + i * %d }
+    drop "totale=" + total
+} gameover
+"""
+
+def fresh_processes(sources):
+    outputs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, source in enumerate(sources):
+            path = os.path.join(tmp, f"job{n}.play")
+            with open(path, 'w') as f:
+                f.write(source)
+            done = subprocess.run([sys.executable, os.path.join(root_dir, 'run_compiler.py'),
+                                   '--run', '--vm', path], capture_output=True, text=True)
+            outputs.append(done.stdout.splitlines())
+    return outputs
+
+if __name__ == "__main__":
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # A few distinct programs, so most jobs hit the worker artifact caches
+    sources = [SOURCE % (n % 5) for n in range(jobs)]
+
+    start = time.perf_counter()
+    expected = fresh_processes(sources)
+    fresh_time = time.perf_counter() - start
+
+    with ExecutionService(workers=workers) as service:
+        service.run_all([Job(source=sources[0])])  # wait for the workers to be up
+        start = time.perf_counter()
+        results = service.run_all([Job(source=source, tenant=f"t{n % 3}") for n, source in enumerate(sources)])
+        pool_time = time.perf_counter() - start
+        metrics = service.metrics()
+
+    assert [r.output for r in results] == expected, "service output differs"
+    print(f"fresh process per job: {fresh_time * 1000:8.1f} ms ({jobs / fresh_time:7.1f} jobs/s)")
+    print(f"warm pool ({workers} workers): {pool_time * 1000:8.1f} ms ({jobs / pool_time:7.1f} jobs/s)")
+    print(f"latency p50 {metrics['latency_p50'] * 1000:.2f} ms, p95 {metrics['latency_p95'] * 1000:.2f} ms, "
+          f"cache hits {metrics['cache_hits']}/{metrics['completed']}")
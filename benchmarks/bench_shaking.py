@@ -0,0 +1,82 @@
+"""
+Tree shaking benchmark: a play block using a few actions of a large
+generated boilerplate (actions and globals), compiled as is, with
+shake=True (everything checked, unreachable code pruned) and with
+shake=True, check_all=False (only reachable code checked), see
+play_lang.optimizer.shaking. Reports compile time, memory held by the
+lowered tree and bytecode load time (compilation + module size).
+
+Usage: python benchmarks/bench_shaking.py [actions]
+"""
+import sys
+import os
+import gc
+import time
+import pickle
+import tracemalloc
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, get_parser
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+def build_source(count):
+    lines = [f"rank: g{k} <-- {k}" for k in range(count)]
+    for k in range(count):
+        callee = f" + util{k + 1}(n - 1)" if k + 1 < count and k % 10 != 9 else ""
+        lines.append(f"""action util{k}(rank n) -> rank {{
+    rank: t <-- n * g{k}
+    choice (t > 100) -> {{ t <-- t % 97 }} fail -> {{ t <-- t + g{(k * 3) % count} }}
+    reward t{callee}
+}}""")
+    lines.append("""play {
+    rank: i, total
+    loop (i <-- 0; i < 20; i <-- i + 1) -> { total <-- total + util0(i) + util40(i) }
+    drop "totale " + total
+} gameover""")
+    return "\n".join(lines)
+
+def measure(source, **options):
+    stats = {}
+    compile_time = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        program = compile_source(source, lower=True, stats=stats, **options)
+        compile_time = min(compile_time, time.perf_counter() - start)
+    # Memory still held by the lowered tree, from a second, traced compilation
+    program = None
+    tracemalloc.start()
+    program = compile_source(source, lower=True, **options)
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    module = BytecodeCompiler().compile_program(program)
+    load_time = time.perf_counter() - start
+    play_io = MemoryIO([])
+    VM(io=play_io).run(module)
+    size = len(pickle.dumps(module, protocol=pickle.HIGHEST_PROTOCOL))
+    return play_io.lines(), stats, compile_time, held, load_time, size
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    source = build_source(count)
+    get_parser()  # grammar loading is not part of the comparison
+    rows = [("full program", measure(source)),
+            ("shake", measure(source, shake=True)),
+            ("shake, reachable only", measure(source, shake=True, check_all=False))]
+    outputs = {tuple(result[0]) for _, result in rows}
+    assert len(outputs) == 1, "shaken program produced different output"
+    stats = rows[1][1][1]
+    print(rows[0][1][0][0])
+    print(f"removed: {len(stats['shaken_functions'])} of {count} actions, "
+          f"{len(stats['shaken_globals'])} of {count} globals")
+    print(f"{'':24s} {'compile':>10s} {'memory':>10s} {'load':>10s} {'module':>10s}")
+    for name, (_, _, compile_time, held, load_time, size) in rows:
+        print(f"{name:24s} {compile_time * 1000:8.1f}ms {held / 2**20:7.2f}MiB "
+              f"{load_time * 1000:8.1f}ms {size / 1024:8.1f}KB")
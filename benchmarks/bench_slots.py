@@ -0,0 +1,83 @@
+"""
+Frame slot benchmark: a deeply recursive action with many short-lived
+locals, compiled with one slot per declared name and with slots packed by
+live range (BytecodeCompiler(pack_slots=True), see play_lang.optimizer.slots).
+Reports frame sizes, peak memory of the VM at full recursion depth and time.
+
+Usage: python benchmarks/bench_slots.py [depth]
+"""
+import sys
+import os
+import time
+import tracemalloc
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.optimizer.slots import frame_report
+from play_lang.runtime.io import MemoryIO
+
+SOURCE = """
+rank: depth
+
+action walk(rank n, rank acc) -> rank {
+    choice (n <= 0) -> { reward acc }
+    rank: a <-- n % 7
+    rank: b <-- a * a + 1
+    acc <-- acc + b
+    rank: c <-- n % 5
+    choice (c == 0) -> {
+        rank: d <-- c + a
+        rank: e <-- d * 3
+        acc <-- acc - e
+    } fail -> {
+        rank: f <-- c * 2
+        rank: g <-- f + 1
+        acc <-- acc + g
+    }
+    rank: h <-- acc % 11
+    rank: i <-- h + n
+    rank: j <-- walk(n - 1, acc + i % 3)
+    rank: k <-- j % 1000003
+    reward k + 1
+}
+
+play {
+    depth <-- grab "depth"
+    drop "walk " + walk(depth, 0)
+} gameover
+"""
+
+def run(module, depth):
+    play_io = MemoryIO([str(depth)])
+    VM(io=play_io, max_depth=depth + 10).run(module)
+    return play_io.lines()
+
+def measure(pack_slots, depth):
+    compiler = BytecodeCompiler(pack_slots=pack_slots)
+    module = compiler.compile_program(compile_source(SOURCE, lower=True))
+    # Time without tracing, then the peak memory of a traced run
+    start = time.perf_counter()
+    lines = run(module, depth)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run(module, depth)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return compiler, module, lines, peak, elapsed
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    _, plain_module, plain_out, plain_peak, plain_time = measure(False, depth)
+    compiler, packed_module, packed_out, packed_peak, packed_time = measure(True, depth)
+    assert plain_out == packed_out, "packed slots produced different output"
+    print(packed_out[0])
+    print(frame_report(compiler.slot_allocations))
+    walk = plain_module.function_index['walk']
+    print(f"frame slots:     {plain_module.functions[walk].num_slots} -> {packed_module.functions[walk].num_slots}")
+    print(f"peak memory:     {plain_peak / 2**20:7.2f} MiB -> {packed_peak / 2**20:7.2f} MiB  (depth {depth})")
+    print(f"time:            {plain_time * 1000:7.1f} ms  -> {packed_time * 1000:7.1f} ms")
@@ -0,0 +1,107 @@
+"""
+Snapshot benchmark: size of the snapshot of a suspended program and the
+time to save it and to restore it on a new VM. Two states are measured: a
+calculator session waiting in grab, and a recursion suspended in a grab
+DEPTH calls deep (one frame with its slots per call).
+
+Usage: python benchmarks/bench_snapshot.py [depth] [repeats]
+"""
+import sys
+import os
+import time
+import asyncio
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.async_engine import AsyncSession
+from play_lang.backend.snapshot import load_vm, save_vm
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import ChannelIO
+
+CALCULATOR = """
+rank: op_choice
+rate: n1, n2
+flag: running <-- true
+
+action add(rate a, rate b) -> rate { reward a + b }
+
+play {
+    stay (running) -> {
+        op_choice <-- grab "Operazione (0-1): "
+        choice (op_choice == 0) -> {
+            running <-- false
+        } fail -> {
+            n1, n2 <-- grab "Due numeri: "
+            drop "Risultato: " + add(n1, n2)
+        }
+    }
+    drop "Uscita."
+} gameover
+"""
+
+DEEP = """
+action descend(rank n, rate x, label name) -> rank {
+    rank: got
+    choice (n == 0) -> {
+        got <-- grab "Fondo: "
+        reward got
+    }
+    reward 1 + descend(n - 1, x * 1.5, name)
+}
+
+play {
+    drop "Risultato: " + descend(%d, 1.0, "livello")
+} gameover
+"""
+
+def compile_module(code):
+    return BytecodeCompiler().compile_program(compile_source(code, lower=True))
+
+def calculator_session():
+    async def scenario():
+        session = AsyncSession(compile_module(CALCULATOR))
+        for line in ["1", "2", "3", "1", "4.5", "6"] * 5:
+            session.input.put_nowait(line)
+        task = asyncio.create_task(session.run())
+        while session.vm.waiting is None or not session.input.empty():
+            await asyncio.sleep(0)
+        task.cancel()
+        return session
+    return asyncio.run(scenario())
+
+def deep_vm(depth):
+    module = compile_module(DEEP % depth)
+    vm = VM(io=ChannelIO(lambda text: None), max_depth=depth + 10)
+    vm.start(module)
+    assert not vm.resume() and len(vm.frames) == depth + 1
+    return vm
+
+def measure(name, save, restore, repeats):
+    data = save()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        save()
+    saved = (time.perf_counter() - start) / repeats
+    start = time.perf_counter()
+    for _ in range(repeats):
+        restore(data)
+    restored = (time.perf_counter() - start) / repeats
+    print(f"{name:28s} {len(data):10d} {saved * 1e6:12.1f} {restored * 1e6:12.1f}")
+
+def main(depth, repeats):
+    print(f"{'state':28s} {'bytes':>10s} {'save us':>12s} {'restore us':>12s}")
+    session = calculator_session()
+    measure("calculator waiting in grab", session.snapshot,
+            lambda data: AsyncSession.restore(data, session.module), repeats)
+    for d in (depth // 100, depth // 10, depth):
+        vm = deep_vm(d)
+        measure(f"recursion {d} calls deep", lambda: save_vm(vm),
+                lambda data: load_vm(data, vm.module, VM()), max(1, repeats * 10 // d))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,99 @@
+"""
+Tiered execution benchmark: a simulation of n steps is run by the
+Interpreter, by the VM (bytecode compilation included), by the
+TieredInterpreter with the default thresholds and by the
+TieredInterpreter that compiles every action and loop at once
+(call_threshold=1, loop_threshold=0). Short runs show the cost of
+compiling up front, long runs the speed of the compiled tier.
+
+Usage: python benchmarks/bench_tiered.py [repetitions]
+"""
+import sys
+import os
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter
+from play_lang.backend.tiered import TieredInterpreter
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+SOURCE = """
+rank: seed <-- 12345, alive <-- 0
+rate: energy <-- 100.0
+
+action rand(rank bound) -> rank {
+    seed <-- (seed * 1103 + 12345) % 65536
+    reward seed % bound
+}
+
+action cost(rank kind, rate level) -> rate {
+    choice (kind == 0) -> { reward level / 10 + 1 }
+    retry (kind == 1) -> { reward level / 20 + 2.5 }
+    reward 0.5
+}
+
+action tick(rank step) -> rank {
+    rank: moves, k <-- 0
+    stay (k < 8) -> {
+        rank: roll <-- rand(100)
+        choice (roll < 30) -> { moves <-- moves + 1 }
+        energy <-- energy - cost(roll % 3, energy) + 1.2
+        k <-- k + 1
+    }
+    reward moves
+}
+
+play {
+    rank: step, total
+    loop (step <-- 0; step < STEPS; step <-- step + 1) -> {
+        total <-- total + tick(step)
+        choice (energy > 50) -> { alive <-- alive + 1 }
+    }
+    drop "mosse=" + total + " vivi=" + alive + " energia=" + -->energy
+} gameover
+"""
+
+ENGINES = {
+    'interpreter': lambda program, play_io: Interpreter(io=play_io).run(program),
+    'vm': lambda program, play_io: VM(io=play_io).run(BytecodeCompiler().compile_program(program)),
+    'tiered': lambda program, play_io: TieredInterpreter(io=play_io).run(program),
+    'compile all': lambda program, play_io: TieredInterpreter(
+        io=play_io, call_threshold=1, loop_threshold=0).run(program),
+}
+
+def time_best(run, repetitions):
+    best = None
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+def run_engine(engine, program):
+    play_io = MemoryIO()
+    ENGINES[engine](program, play_io)
+    return play_io.lines()
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for steps in (1, 100, 5000):
+        program = compile_source(SOURCE.replace('STEPS', str(steps)), lower=True)
+        print(f"{steps} steps")
+        expected = None
+        for engine in ENGINES:
+            elapsed, output = time_best(lambda: run_engine(engine, program), repetitions)
+            expected = expected or output
+            assert output == expected, (engine, output, expected)
+            print(f"  {engine:12} {elapsed * 1000:9.2f}ms")
+        engine = TieredInterpreter(io=MemoryIO())
+        engine.run(program)
+        compile_time = sum(event.seconds for event in engine.tier_ups)
+        print(f"  tier-ups: {', '.join(f'{e.name} ({e.kind}, {e.count})' for e in engine.tier_ups) or 'none'}"
+              f" in {compile_time * 1000:.2f}ms")
@@ -0,0 +1,144 @@
+"""
+Dispatch benchmark for the bytecode VM: every program is run by the
+Interpreter on the lowered tree, by the VM with only the type-specialized
+opcodes and by the VM with superinstructions.
+
+With --pairs the opcode-pair statistics of the programs (without
+superinstructions) are printed instead: they are the data used to choose
+bytecode.SUPERINSTRUCTIONS.
+
+Usage: python benchmarks/bench_vm.py [--pairs] [repetitions]
+"""
+import sys
+import os
+import time
+from collections import Counter
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter
+from play_lang.backend.bytecode import BytecodeCompiler, OPCODE_NAMES
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+PROGRAMS = {
+    'loops': """
+rank: width <-- 40, height <-- 30, scale <-- 3, x, y, total <-- 0
+rate: gain <-- 1.25, score <-- 0.0
+
+play {
+    loop (y <-- 0; y < height; y <-- y + 1) -> {
+        x <-- 0
+        stay (x < width * scale) -> {
+            total <-- total + (width * height + scale) % 7 + x * (width * height + scale)
+            score <-- score + gain * (scale * scale + 1) + (x - y) * (x - y)
+            x <-- x + 1
+        }
+    }
+    drop "Totale: " + -->total
+    drop "Punteggio: " + -->score
+} gameover
+""",
+    'calls': """
+rate: m <-- 0.0
+rank: i
+
+action fib(rank n) -> rank {
+    choice (n < 2) -> { reward n }
+    reward fib(n - 1) + fib(n - 2)
+}
+
+action media(rate a, rate b) -> rate {
+    reward (a + b) / 2
+}
+
+play {
+    drop "fib=" + fib(20)
+    loop (i <-- 0; i < 20000; i <-- i + 1) -> {
+        m <-- media(m, i)
+    }
+    drop "media=" + -->m
+} gameover
+""",
+    'sieve': """
+rank: n <-- 6000, i, j, count <-- 0
+flag: prime
+
+play {
+    loop (i <-- 2; i <= n; i <-- i + 1) -> {
+        prime <-- true
+        j <-- 2
+        stay (j * j <= i && prime) -> {
+            choice (i % j == 0) -> { prime <-- false }
+            j <-- j + 1
+        }
+        choice (prime) -> { count <-- count + 1 }
+    }
+    drop "primi=" + count
+} gameover
+""",
+    'labels': """
+rank: i, hp <-- 100
+label: name <-- "Giocatore"
+
+play {
+    loop (i <-- 0; i < 5000; i <-- i + 1) -> {
+        drop "Turno " + -->i + ": " + name + " hp=" + -->(hp - i)
+    }
+} gameover
+""",
+}
+
+def time_best(run, repetitions):
+    best = None
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+def run_interpreter(program):
+    play_io = MemoryIO()
+    Interpreter(io=play_io).run(program)
+    return play_io.lines()
+
+def run_vm(module):
+    play_io = MemoryIO()
+    VM(io=play_io).run(module)
+    return play_io.lines()
+
+def print_pairs():
+    pairs = Counter()
+    for source in PROGRAMS.values():
+        module = BytecodeCompiler(superinstructions=False).compile_program(compile_source(source, lower=True))
+        vm = VM(io=MemoryIO(), collect_stats=True)
+        vm.run(module)
+        pairs.update(vm.pair_counts)
+    total = sum(pairs.values())
+    for (a, b), count in pairs.most_common(15):
+        first = OPCODE_NAMES[a] if a >= 0 else '<start>'
+        print(f"{first:>14s} {OPCODE_NAMES[b]:16s} {count:9d} {100 * count / total:5.1f}%")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if '--pairs' in args:
+        print_pairs()
+        sys.exit(0)
+    repetitions = int(args[0]) if args else 3
+
+    print(f"{'program':8s} {'interp':>9s} {'vm':>9s} {'vm+super':>9s} {'speedup':>8s}")
+    for name, source in PROGRAMS.items():
+        lowered = compile_source(source, lower=True)
+        plain = BytecodeCompiler(superinstructions=False).compile_program(lowered)
+        fused = BytecodeCompiler().compile_program(lowered)
+
+        interp_time, expected = time_best(lambda: run_interpreter(lowered), repetitions)
+        plain_time, plain_out = time_best(lambda: run_vm(plain), repetitions)
+        fused_time, fused_out = time_best(lambda: run_vm(fused), repetitions)
+        assert plain_out == expected and fused_out == expected, f"{name}: VM output differs"
+        print(f"{name:8s} {interp_time * 1000:7.1f}ms {plain_time * 1000:7.1f}ms "
+              f"{fused_time * 1000:7.1f}ms {interp_time / fused_time:7.2f}x")
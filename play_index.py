@@ -0,0 +1,331 @@
+"""
+Symbol index of a repository of Play sources, kept in a local SQLite
+database: where every action and global is defined (with its signature),
+which actions call it and which files read or write a global.
+
+    index = SymbolIndex('play.db')
+    index.update('path/to/repo')       # only changed files are parsed again
+    index.definitions('fact')          # [Symbol(path, line, 'action', 'fact', '(rank) -> rank')]
+    index.callers('fact')              # [Reference(path, line, 'call', 'fact', scope)]
+    index.users('total')               # files reading or writing the global
+
+Usage: python play_index.py [--db=<file>] update <root>
+       python play_index.py [--db=<file>] def|callers|users|errors [<name>]
+"""
+import sys
+import os
+import time
+import hashlib
+import sqlite3
+from collections import namedtuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from lark import Tree
+
+from run_compiler import get_parser
+from play_lang.frontend.transformer import PlayTransformer
+from play_lang.frontend.semantic_analysis import SemanticAnalyzer, SemanticError
+
+SOURCE_SUFFIX = '.play'
+DEFAULT_DB = '.play_index.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    scope TEXT
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (name, kind);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file_id);
+"""
+
+# kind: 'action' or 'global'; signature: '(rank, rate) -> rank' or the type of the global
+Symbol = namedtuple('Symbol', 'path line kind name signature')
+# kind: 'call', 'read' or 'write'; scope: the calling action, None in the play block and global declarations
+Reference = namedtuple('Reference', 'path line kind name scope')
+UpdateStats = namedtuple('UpdateStats', 'parsed unchanged removed seconds')
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+class _Collector:
+    """
+    Walks the Lark tree of one source (AST nodes have no line numbers) and
+    collects its definitions and references. Names are resolved like the
+    SemanticAnalyzer: globals are the global declarations and every
+    declaration of the play block; in an action a name is local from its
+    declaration (or parameter) on, and refers to the global before it.
+    References to locals are not recorded.
+    """
+    def __init__(self):
+        self.symbols = []  # (line, kind, name, signature)
+        self.refs = []     # (line, kind, name, scope)
+        self.scope = None
+        self.locals = set()
+
+    def collect(self, tree):
+        self._visit(tree)
+        return self.symbols, self.refs
+
+    def _visit(self, tree):
+        handler = getattr(self, '_' + tree.data, None)
+        if handler is not None:
+            handler(tree.children)
+            return
+        for child in tree.children:
+            if isinstance(child, Tree):
+                self._visit(child)
+
+    def _use(self, token, kind):
+        if self.scope is None or str(token) not in self.locals:
+            self.refs.append((token.line, kind, str(token), self.scope))
+
+    def _function_def(self, items):
+        # ACTION ID LPAR param_list RPAR ARROW return_type block
+        name, params, ret = items[1], items[3], items[6]
+        param_types = [str(param.children[0].children[0]) for param in params.children
+                       if isinstance(param, Tree)]
+        ret_type = ret.children[0]
+        ret_type = str(ret_type.children[0]) if isinstance(ret_type, Tree) else str(ret_type)
+        self.symbols.append((name.line, 'action', str(name), f"({', '.join(param_types)}) -> {ret_type}"))
+        self.scope = str(name)
+        self.locals = {str(param.children[1]) for param in params.children if isinstance(param, Tree)}
+        self._visit(items[7])
+        self.scope = None
+        self.locals = set()
+
+    def _var_decl(self, items):
+        # type COLON var_list
+        type_name = str(items[0].children[0])
+        for var_item in items[2].children:
+            if not isinstance(var_item, Tree):
+                continue
+            names = []
+            # ID | ID ASSIGN expr | ID EQUALS var_item
+            while True:
+                names.append(var_item.children[0])
+                if len(var_item.children) == 1:
+                    break
+                if var_item.children[1].type == 'ASSIGN':
+                    # The initializer is checked before the names are defined
+                    self._visit(var_item.children[2])
+                    break
+                var_item = var_item.children[2]
+            for name in names:
+                if self.scope is None:
+                    self.symbols.append((name.line, 'global', str(name), type_name))
+                else:
+                    self.locals.add(str(name))
+
+    def _lvalue(self, items):
+        # ID | ID EQUALS lvalue
+        self._use(items[0], 'write')
+        if len(items) > 1:
+            self._visit(items[2])
+
+    def _func_call(self, items):
+        # ID LPAR arg_list RPAR
+        self.refs.append((items[0].line, 'call', str(items[0]), self.scope))
+        self._visit(items[2])
+
+    _func_call_stmt = _func_call
+    _func_call_expr = _func_call
+
+    def _base_expr(self, items):
+        # ID and OUT_VAL ID read a variable
+        for item in items:
+            if isinstance(item, Tree):
+                self._visit(item)
+            elif item.type == 'ID':
+                self._use(item, 'read')
+
+def index_source(source_code):
+    """
+    Symbols and references of one Play source (program or library), and the
+    syntax or semantic error that compile_source would report (None if it
+    is valid). A source that does not parse has no symbols.
+    """
+    try:
+        tree = get_parser().parse(source_code)
+    except Exception as e:
+        try:
+            tree = get_parser('library').parse(source_code)
+        except Exception:
+            return [], [], f"Syntax Error: {e}"
+    symbols, refs = _Collector().collect(tree)
+    try:
+        ast = PlayTransformer().transform(tree)
+    except Exception as e:
+        # Checks of the transformer (e.g. a chain with several values)
+        return symbols, refs, f"AST Transformation Error: {e}"
+    error = None
+    try:
+        SemanticAnalyzer().visit(ast)
+    except SemanticError as e:
+        # Typically a call to an action of a linked library
+        error = f"Semantic Error: {e}"
+    return symbols, refs, error
+
+class SymbolIndex:
+    """
+    SQLite index of the Play sources below a root directory (paths are
+    stored relative to it). update() walks the tree and parses only new
+    files and files whose size or mtime changed and whose content hash
+    differs; files that disappeared are dropped. Queries only read the
+    database.
+    """
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, root):
+        start = time.perf_counter()
+        known = {path: (file_id, mtime_ns, size, digest) for file_id, path, mtime_ns, size, digest
+                 in self.db.execute("SELECT id, path, mtime_ns, size, digest FROM files")}
+        parsed = unchanged = 0
+        seen = set()
+        with self.db:
+            for full_path, path in _source_files(root):
+                seen.add(path)
+                stat = os.stat(full_path)
+                entry = known.get(path)
+                if entry is not None and entry[1:3] == (stat.st_mtime_ns, stat.st_size):
+                    unchanged += 1
+                    continue
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                digest = file_digest(data)
+                if entry is not None and entry[3] == digest:
+                    # Touched but not edited
+                    self.db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?",
+                                    (stat.st_mtime_ns, stat.st_size, entry[0]))
+                    unchanged += 1
+                    continue
+                symbols, refs, error = index_source(data.decode('utf-8', errors='replace'))
+                if entry is not None:
+                    self._forget(entry[0])
+                file_id = self.db.execute(
+                    "INSERT INTO files (path, mtime_ns, size, digest, error) VALUES (?, ?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, digest, error)).lastrowid
+                self.db.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+                                    [(file_id,) + symbol for symbol in symbols])
+                self.db.executemany("INSERT INTO refs VALUES (?, ?, ?, ?, ?)",
+                                    [(file_id,) + ref for ref in refs])
+                parsed += 1
+            removed = [entry[0] for path, entry in known.items() if path not in seen]
+            for file_id in removed:
+                self._forget(file_id)
+        return UpdateStats(parsed, unchanged, len(removed), time.perf_counter() - start)
+
+    def _forget(self, file_id):
+        self.db.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM refs WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    # --- Queries ---
+
+    def definitions(self, name, kind=None):
+        """Where name is defined: actions and globals, or only kind ('action' / 'global')."""
+        query = ("SELECT f.path, s.line, s.kind, s.name, s.signature FROM symbols s "
+                 "JOIN files f ON f.id = s.file_id WHERE s.name = ?")
+        args = (name,)
+        if kind is not None:
+            query += " AND s.kind = ?"
+            args += (kind,)
+        return [Symbol(*row) for row in self.db.execute(query + " ORDER BY f.path, s.line, s.rowid", args)]
+
+    def callers(self, name):
+        """Every call of the action name, with the calling action (None in the play block)."""
+        return self._references(name, ('call',))
+
+    def references(self, name):
+        """Every read and write of the global name."""
+        return self._references(name, ('read', 'write'))
+
+    def users(self, name):
+        """Paths of the files that read or write the global name."""
+        rows = self.db.execute(
+            "SELECT DISTINCT f.path FROM refs r JOIN files f ON f.id = r.file_id "
+            "WHERE r.name = ? AND r.kind IN ('read', 'write') ORDER BY f.path", (name,))
+        return [path for (path,) in rows]
+
+    def errors(self):
+        """(path, error) of the indexed files that do not compile on their own."""
+        return list(self.db.execute("SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path"))
+
+    def _references(self, name, kinds):
+        rows = self.db.execute(
+            "SELECT f.path, r.line, r.kind, r.name, r.scope FROM refs r JOIN files f ON f.id = r.file_id "
+            f"WHERE r.name = ? AND r.kind IN ({', '.join('?' * len(kinds))}) ORDER BY f.path, r.line, r.rowid",
+            (name,) + kinds)
+        return [Reference(*row) for row in rows]
+
+def _source_files(root):
+    # (path, path relative to root, as stored) of every source, hidden directories excluded
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if not d.startswith('.'))
+        for file_name in sorted(files):
+            if file_name.endswith(SOURCE_SUFFIX):
+                path = os.path.join(directory, file_name)
+                yield path, os.path.relpath(path, root)
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    flags = [a for a in sys.argv[1:] if a.startswith('--')]
+    db_path = next((flag[len('--db='):] for flag in flags if flag.startswith('--db=')), DEFAULT_DB)
+    commands = {'update': 2, 'def': 2, 'callers': 2, 'users': 2, 'errors': 1}
+    if not args or commands.get(args[0]) != len(args):
+        print("Usage: python play_index.py [--db=<file>] update <root> | def <name> | callers <name> "
+              "| users <name> | errors")
+        sys.exit(1)
+
+    command = args[0]
+    with SymbolIndex(db_path) as index:
+        start = time.perf_counter()
+        if command == 'update':
+            stats = index.update(args[1])
+            print(f"{stats.parsed} parsed, {stats.unchanged} unchanged, {stats.removed} removed "
+                  f"in {stats.seconds:.2f}s")
+            sys.exit(0)
+        if command == 'def':
+            for symbol in index.definitions(args[1]):
+                print(f"{symbol.path}:{symbol.line}: {symbol.kind} {symbol.name} {symbol.signature}")
+        elif command == 'callers':
+            for ref in index.callers(args[1]):
+                print(f"{ref.path}:{ref.line}: in {ref.scope or 'play'}")
+        elif command == 'users':
+            for path in index.users(args[1]):
+                print(path)
+        else:
+            for path, error in index.errors():
+                print(f"{path}: {error.splitlines()[0]}")
+        print(f"({(time.perf_counter() - start) * 1000:.1f}ms)", file=sys.stderr)
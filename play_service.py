@@ -0,0 +1,273 @@
+"""
+Execution service for Play scripts: a pool of warm workers (processes by
+default) that already have the frontend loaded, fed by a scheduler that
+serves tenants round-robin.
+
+    with ExecutionService(workers=4) as service:
+        artifact = service.compile(source)
+        future = service.submit(Job(artifact=artifact, inputs=["3"], tenant="alice"))
+        result = future.result()
+        print(result.output, result.latency, service.metrics())
+"""
+import sys
+import os
+import time
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from run_compiler import compile_source, get_parser
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.snapshot import load_vm
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+def source_digest(source_code):
+    return hashlib.sha256(source_code.encode('utf-8')).hexdigest()
+
+class Artifact:
+    """A compiled program (bytecode Module) and the digest of its source."""
+    def __init__(self, digest, module):
+        self.digest = digest
+        self.module = module
+
+def compile_artifact(source_code):
+    lowered = compile_source(source_code, lower=True)
+    return Artifact(source_digest(source_code), BytecodeCompiler().compile_program(lowered))
+
+class Job:
+    """
+    One run of a Play program: source code or a compiled Artifact, the
+    lines read by grab and a step budget (None for no limit).
+    With a snapshot (AsyncSession.snapshot() of the same program) the job
+    continues that suspended run instead of starting a new one; it must
+    come from a trusted source, not from a tenant (see snapshot.load_vm).
+    Jobs of the same tenant run in submission order.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, source=None, artifact=None, inputs=(), step_budget=None, tenant='default',
+                 snapshot=None):
+        if (source is None) == (artifact is None):
+            raise ValueError("A job needs either source or artifact")
+        self.job_id = next(Job._ids)
+        self.source = source
+        self.artifact = artifact
+        self.inputs = list(inputs)
+        self.step_budget = step_budget
+        self.tenant = tenant
+        self.snapshot = snapshot
+
+class JobResult:
+    """Output of a job (drop lines), its error message if it failed, and its timings."""
+    def __init__(self, job_id, tenant, output, error, steps, compile_time, run_time,
+                 cached, worker, latency=None):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.output = output
+        self.error = error
+        self.steps = steps
+        self.compile_time = compile_time  # seconds, 0 if the artifact was cached
+        self.run_time = run_time
+        self.cached = cached
+        self.worker = worker
+        self.latency = latency  # submission to completion, seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def queue_time(self):
+        return self.latency - self.compile_time - self.run_time
+
+# --- Worker side ---
+
+_artifacts = OrderedDict()  # per-worker LRU cache: digest -> Module
+_artifacts_size = 0
+_artifacts_lock = threading.Lock()
+
+def _init_worker(cache_size):
+    # Warm-up: imports are done and the Lark parser is built once per worker
+    global _artifacts_size
+    _artifacts_size = cache_size
+    get_parser()
+
+def _cached_module(source, module, digest):
+    with _artifacts_lock:
+        if digest in _artifacts:
+            _artifacts.move_to_end(digest)
+            return _artifacts[digest], True
+    if module is None:
+        module = BytecodeCompiler().compile_program(compile_source(source, lower=True))
+    with _artifacts_lock:
+        _artifacts[digest] = module
+        if len(_artifacts) > _artifacts_size:
+            _artifacts.popitem(last=False)
+    return module, False
+
+def _run_job(job_id, tenant, source, module, digest, inputs, step_budget, snapshot=None):
+    worker = f"{os.getpid()}/{threading.get_ident()}"
+    start = time.perf_counter()
+    try:
+        module, cached = _cached_module(source, module, digest)
+    except Exception as e:
+        return JobResult(job_id, tenant, [], str(e), 0, time.perf_counter() - start, 0.0, False, worker)
+    compiled = time.perf_counter()
+
+    play_io = MemoryIO(inputs)
+    vm = VM(io=play_io, step_budget=step_budget)
+    output = []
+    error = None
+    try:
+        if snapshot is None:
+            vm.run(module)
+        else:
+            # Output and queued input lines of the saved session come first
+            (lines, _), output = load_vm(snapshot, module, vm)
+            play_io = vm.io = MemoryIO(lines + inputs)
+            try:
+                vm.resume()
+            finally:
+                play_io.flush()
+    except Exception as e:
+        error = str(e)
+    finished = time.perf_counter()
+    return JobResult(job_id, tenant, output + play_io.lines(), error, vm.steps,
+                     0.0 if cached else compiled - start, finished - compiled, cached, worker)
+
+# --- Scheduler ---
+
+class ExecutionService:
+    """
+    Runs Jobs on a pool of warm workers.
+
+    At most one job per worker is in flight; the others wait in one queue
+    per tenant, and a free worker takes the next job of the next tenant in
+    round-robin order, so a tenant with many jobs cannot starve the others.
+    use_processes=False runs the workers as threads of this process (same
+    scheduling, for tests and local use). Workers keep the last cache_size
+    compiled programs, keyed by source digest.
+    """
+    def __init__(self, workers=2, use_processes=True, cache_size=128):
+        self.workers = workers
+        if use_processes:
+            self._executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                 initargs=(cache_size,))
+        else:
+            _init_worker(cache_size)
+            self._executor = ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+        self._queues = {}          # tenant -> deque of (job, future, submitted at)
+        self._tenants = deque()    # tenants with queued jobs, in round-robin order
+        self._in_flight = 0
+        self._results = []
+        self._started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def compile(self, source_code):
+        """Compiles once in this process; the Artifact can be reused by many jobs."""
+        return compile_artifact(source_code)
+
+    def submit(self, job):
+        """Queues a job and returns a Future of its JobResult."""
+        future = Future()
+        with self._lock:
+            if self._started is None:
+                self._started = time.perf_counter()
+            queue = self._queues.setdefault(job.tenant, deque())
+            if not queue:
+                self._tenants.append(job.tenant)
+            queue.append((job, future, time.perf_counter()))
+            started = self._dispatch()
+        self._watch(started)
+        return future
+
+    def run_all(self, jobs):
+        futures = [self.submit(job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def _dispatch(self):
+        # Called with the lock held; the callbacks are attached by _watch once it is
+        # released, since a job that is already done runs its callback immediately
+        started = []
+        while self._in_flight < self.workers and self._tenants:
+            tenant = self._tenants.popleft()
+            queue = self._queues[tenant]
+            job, future, submitted = queue.popleft()
+            if queue:
+                self._tenants.append(tenant)
+
+            if job.artifact is not None:
+                source, module, digest = None, job.artifact.module, job.artifact.digest
+            else:
+                source, module, digest = job.source, None, source_digest(job.source)
+            self._in_flight += 1
+            worker_future = self._executor.submit(_run_job, job.job_id, job.tenant, source, module,
+                                                  digest, job.inputs, job.step_budget, job.snapshot)
+            started.append((worker_future, future, submitted))
+        return started
+
+    def _watch(self, started):
+        for worker_future, future, submitted in started:
+            worker_future.add_done_callback(
+                lambda done, future=future, submitted=submitted: self._finished(done, future, submitted))
+
+    def _finished(self, done, future, submitted):
+        try:
+            result = done.result()
+        except Exception as e:
+            future.set_exception(e)
+            result = None
+        with self._lock:
+            self._in_flight -= 1
+            if result is not None:
+                result.latency = time.perf_counter() - submitted
+                self._results.append(result)
+            started = self._dispatch()
+        self._watch(started)
+        if result is not None:
+            future.set_result(result)
+
+    def results(self):
+        """Results of the completed jobs, in completion order."""
+        with self._lock:
+            return list(self._results)
+
+    def metrics(self):
+        """Throughput and latency of the jobs completed so far."""
+        with self._lock:
+            results = list(self._results)
+            elapsed = time.perf_counter() - self._started if self._started else 0.0
+        latencies = sorted(r.latency for r in results)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        per_tenant = {}
+        for r in results:
+            per_tenant[r.tenant] = per_tenant.get(r.tenant, 0) + 1
+        return {
+            'completed': len(results),
+            'failed': sum(1 for r in results if not r.ok),
+            'throughput': len(results) / elapsed if elapsed else 0.0,  # jobs/s
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else 0.0,
+            'cache_hits': sum(1 for r in results if r.cached),
+            'per_tenant': per_tenant,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -8,34 +8,104 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
 from play_lang.frontend.transformer import PlayTransformer
 from play_lang.frontend.semantic_analysis import SemanticAnalyzer, SemanticError
+from play_lang.frontend.lowering import Lowerer
+from play_lang.frontend.recovery import SyntaxErrors, parse_with_recovery
+from play_lang.optimizer.pipeline import optimize_program
+from play_lang.optimizer.inlining import INLINE_SIZE
+from play_lang.optimizer.slots import frame_report
+from play_lang.optimizer.shaking import shake_program
+from play_lang.backend.interpreter import Interpreter
+from play_lang.backend.tiered import TieredInterpreter
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.backend.batch import BatchExecutor
+from play_lang.backend.library import Library, build_library, LIBRARY_SUFFIX
+from play_lang.backend.native import build_native, run_native
+from play_lang.runtime.io import PlayIO
 
-def get_parser():
-    """Loads the grammar and returns the Lark parser."""
+_parsers = {}
+
+def get_parser(start='program'):
+    """
+    Loads the grammar and returns the Lark parser of programs, or of library
+    sources with start='library' (each built once per process).
+    """
+    if start in _parsers:
+        return _parsers[start]
     grammar_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'play_lang', 'frontend', 'grammar.lark')
     with open(grammar_path, 'r') as f:
         grammar_src = f.read()
-    return Lark(grammar_src, start='program', parser='lalr')
+    _parsers[start] = Lark(grammar_src, start=start, parser='lalr')
+    return _parsers[start]
+
+def parse_source(source_code, start='program', libraries=()):
+    """
+    Parses the Play source code (a program, or a library with start='library')
+    and returns its Lark tree.
 
-def compile_source(source_code):
+    If the source has syntax errors it is parsed again with error recovery
+    (frontend.recovery) and SyntaxErrors is raised with all of them, together
+    with the semantic errors of the declarations, actions and statements that
+    parsed (libraries are linked for that analysis).
+    """
+    parser = get_parser(start)
+    try:
+        return parser.parse(source_code)
+    except Exception as e:
+        first_error = e
+    tree, errors = parse_with_recovery(parser, source_code)
+    if not errors:
+        raise Exception(f"Syntax Error: {first_error}")
+    semantic_errors = []
+    if tree is not None:
+        try:
+            ast = PlayTransformer().transform(tree)
+        except Exception:
+            ast = None
+        if ast is not None:
+            ast.libraries = list(libraries)
+            analyzer = SemanticAnalyzer(collect_errors=True)
+            try:
+                analyzer.visit(ast)
+            except Exception:
+                pass  # keep the errors found so far
+            semantic_errors = analyzer.errors
+    raise SyntaxErrors(errors, semantic_errors)
+
+def compile_source(source_code, optimize=False, lower=False, libraries=(), shake=False,
+                   check_all=True, stats=None, inline_size=INLINE_SIZE, no_inline=(), rank_overflow=False):
     """
     Compiles the Play source code through the Frontend pipeline.
     
     1. Parsing (Lexical + Syntax Analysis) -> Concrete Syntax Tree (CST)
     2. Transformation -> Abstract Syntax Tree (AST)
     3. Semantic Analysis -> Verified AST
+    4. Lowering (only if lower=True) -> Type-specialized lowered tree
+    5. Optimization (only if optimize=True) -> Optimized AST
+
+    libraries are precompiled Library objects (see compile_library) whose
+    actions the program can call: only their signatures are checked.
+
+    With shake=True the actions the play block never calls and the unused
+    globals are removed (optimizer.shaking) after the whole program has been
+    checked, or before the analysis with check_all=False, so that only the
+    reachable code is checked. If stats is a dict it receives the removed
+    names and the counters of the optimization passes.
+
+    With optimize=True actions whose body has at most inline_size nodes are
+    inlined at their call sites (0 disables it), except those in no_inline.
+    rank_overflow=True compiles for native code, whose ranks overflow: the
+    optimizations and shaking do not move or drop rank arithmetic.
     
     Returns:
-        ProgramNode: The root of the validated AST.
+        ProgramNode: The root of the validated AST, or LoweredProgramNode if lower=True.
     
     Raises:
-        Exception: If any stage fails (syntax error, semantic error, etc.)
+        SyntaxErrors: If the source does not parse (see parse_source)
+        Exception: If any other stage fails (semantic error, etc.)
     """
     # 1. Parsing
-    parser = get_parser()
-    try:
-        tree = parser.parse(source_code)
-    except Exception as e:
-        raise Exception(f"Syntax Error: {e}")
+    tree = parse_source(source_code, libraries=libraries)
 
     # 2. Transformation
     try:
@@ -43,21 +113,43 @@ def compile_source(source_code):
         ast = transformer.transform(tree)
     except Exception as e:
         raise Exception(f"AST Transformation Error: {e}")
+    ast.libraries = list(libraries)
+    if shake and not check_all:
+        # Unreachable code is dropped unchecked
+        shake_program(ast, stats, rank_overflow)
 
     # 3. Semantic Analysis
+    shake_checked = shake and check_all
     try:
-        analyzer = SemanticAnalyzer()
+        analyzer = SemanticAnalyzer(lower=lower and not shake_checked)
         analyzer.visit(ast)
     except SemanticError as e:
         raise Exception(f"Semantic Error: {e}")
     except Exception as e:
         raise Exception(f"Unexpected Semantic Error: {e}")
+    if shake_checked:
+        # Everything was checked: prune, then lower only what is left
+        shake_program(ast, stats, rank_overflow)
+        if lower:
+            analyzer.lowered_program = Lowerer(analyzer.expr_types).lower_program(ast)
 
     # 4. Intermediate Code Generation
     #    - Generate IR
+    #    - Lowered tree: type-specialized operators and explicit conversions
+    #      (built by the analyzer, see SemanticAnalyzer(lower=True))
     
     # 5. Optimization
     #    - Optimize the IR (Constant folding, Dead code elimination, etc.)
+    #    - Loop-invariant code motion and common subexpression elimination on the AST
+    if optimize:
+        ast = optimize_program(ast, stats, inline_size, no_inline, rank_overflow)
+        if lower:
+            # Lower the optimized tree instead of the original one
+            analyzer = SemanticAnalyzer(lower=True)
+            analyzer.visit(ast)
+
+    if lower:
+        return analyzer.lowered_program
     
     # 6. Final Code Generation / Execution
     #    - Generate Target Code (Assembly, Machine Code)
@@ -65,6 +157,67 @@ def compile_source(source_code):
 
     return ast
 
+def compile_library(source_code, name, optimize=False):
+    """
+    Compiles a library source (action definitions only, no globals and no
+    play block) into a Library: signatures, lowered actions, bytecode and
+    purity, ready to be saved and linked with compile_source(libraries=...).
+    """
+    tree = parse_source(source_code, start='library')
+    ast = PlayTransformer().transform(tree)
+    try:
+        analyzer = SemanticAnalyzer(lower=not optimize)
+        analyzer.visit(ast)
+        if optimize:
+            ast = optimize_program(ast)
+            analyzer = SemanticAnalyzer(lower=True)
+            analyzer.visit(ast)
+    except SemanticError as e:
+        raise Exception(f"Semantic Error: {e}")
+    signatures = {f.name: analyzer.symbol_table.lookup(f.name)['type'] for f in ast.functions}
+    return build_library(name, analyzer.lowered_program, signatures)
+
+def run_source(source_code, optimize=False, io=None, engine='interpreter', libraries=(), shake=False,
+               inline_size=INLINE_SIZE, no_inline=()):
+    """
+    Compiles the Play source code and executes its lowered tree with the
+    Interpreter (engine='interpreter'), as bytecode on the VM (engine='vm'),
+    as a native executable built with the C compiler (engine='native') or
+    with the TieredInterpreter, which compiles hot actions and loops to
+    Python code (engine='tiered').
+    io is the PlayIO used by drop/grab (default: buffered stdin/stdout).
+    """
+    ast = compile_source(source_code, optimize=optimize, lower=True, libraries=libraries, shake=shake,
+                         inline_size=inline_size, no_inline=no_inline, rank_overflow=engine == 'native')
+    if engine == 'vm':
+        VM(io=io or PlayIO()).run(BytecodeCompiler().compile_program(ast))
+    elif engine == 'native':
+        run_native(build_native(ast), io or PlayIO())
+    elif engine == 'tiered':
+        TieredInterpreter(io=io or PlayIO()).run(ast)
+    else:
+        Interpreter(io=io or PlayIO()).run(ast)
+    return ast
+
+def profile_source(source_code, optimize=False, io=None, libraries=()):
+    """
+    Runs the Play source code on the VM with profiling instructions and
+    returns the Profiler (call counts, times, loop iterations).
+    """
+    ast = compile_source(source_code, optimize=optimize, lower=True, libraries=libraries)
+    vm = VM(io=io or PlayIO())
+    vm.run(BytecodeCompiler(profile=True).compile_program(ast))
+    return vm.profiler
+
+def run_batch_source(source_code, columns, rows=None, optimize=False, libraries=()):
+    """
+    Runs the Play source code once per row of input columns (the k-th column
+    feeds the k-th grab of every row) with the vectorized BatchExecutor and
+    returns its BatchResult (drop lines and error of every row).
+    """
+    ast = compile_source(source_code, optimize=optimize, lower=True, libraries=libraries)
+    return BatchExecutor(ast).run(columns, rows)
+
 def print_ast(node, indent=""):
     """
     Recursively prints the AST node and its children.
@@ -97,20 +250,76 @@ def print_ast(node, indent=""):
             print(f"{indent}  {key}: {repr(value)}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python run_frontend.py <path_to_play_file>")
+    args = [a for a in sys.argv[1:] if not a.startswith('-')]
+    flags = [a for a in sys.argv[1:] if a.startswith('-')]
+    if len(args) < 1:
+        print("Usage: python run_compiler.py [-O [--no-inline[=a,b]]] [--shake[=reachable]] [--link=<lib.playlib>,...] [--run [--vm | --native | --tiered] | --native[=shared] | --profile | --frames | --library] <path_to_play_file>")
         sys.exit(1)
         
-    file_path = sys.argv[1]
+    file_path = args[0]
+    optimize = '-O' in flags
+    link_paths = [path for flag in flags if flag.startswith('--link=')
+                  for path in flag[len('--link='):].split(',') if path]
+    shake = '--shake' in flags or '--shake=reachable' in flags
+    check_all = '--shake=reachable' not in flags
+    # --no-inline disables inlining, --no-inline=a,b only for the named actions
+    inline_size = 0 if '--no-inline' in flags else INLINE_SIZE
+    no_inline = [name for flag in flags if flag.startswith('--no-inline=')
+                 for name in flag[len('--no-inline='):].split(',') if name]
     
     try:
         with open(file_path, 'r') as f:
             code = f.read()
+
+        if '--library' in flags:
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            library = compile_library(code, name, optimize=optimize)
+            library_path = os.path.splitext(file_path)[0] + LIBRARY_SUFFIX
+            library.save(library_path)
+            print(f"Library '{name}' with {len(library.functions)} actions written to '{library_path}'")
+            sys.exit(0)
+
+        libraries = [Library.load(path) for path in link_paths]
+
+        if '--profile' in flags:
+            profiler = profile_source(code, optimize=optimize, libraries=libraries)
+            collapsed_path = os.path.splitext(file_path)[0] + '.collapsed'
+            profiler.write_collapsed(collapsed_path)
+            print(profiler.report(), file=sys.stderr)
+            print(f"Collapsed stacks written to '{collapsed_path}'", file=sys.stderr)
+            sys.exit(0)
+
+        if '--frames' in flags:
+            compiler = BytecodeCompiler()
+            compiler.compile_program(compile_source(code, optimize=optimize, lower=True, libraries=libraries))
+            print(frame_report(compiler.slot_allocations))
+            sys.exit(0)
+
+        if '--run' in flags:
+            engine = ('vm' if '--vm' in flags else 'native' if '--native' in flags
+                      else 'tiered' if '--tiered' in flags else 'interpreter')
+            run_source(code, optimize=optimize, engine=engine,
+                       libraries=libraries, shake=shake, inline_size=inline_size, no_inline=no_inline)
+            sys.exit(0)
+
+        if '--native' in flags or '--native=shared' in flags:
+            kind = 'shared' if '--native=shared' in flags else 'executable'
+            build = build_native(compile_source(code, optimize=optimize, lower=True, libraries=libraries,
+                                                shake=shake, inline_size=inline_size, no_inline=no_inline,
+                                                rank_overflow=True),
+                                 kind=kind)
+            print(f"{'Cached' if build.cached else 'Built'} {kind} '{build.path}'")
+            sys.exit(0)
             
         print(f"Compiling '{file_path}'...")
-        ast = compile_source(code)
+        stats = {}
+        ast = compile_source(code, optimize=optimize, libraries=libraries, shake=shake,
+                             check_all=check_all, stats=stats, inline_size=inline_size, no_inline=no_inline)
         
         print("\n✅ Frontend Analysis Successful!")
+        if shake:
+            print(f"Removed {len(stats['shaken_functions'])} actions: {', '.join(stats['shaken_functions']) or '-'}")
+            print(f"Removed {len(stats['shaken_globals'])} globals: {', '.join(stats['shaken_globals']) or '-'}")
         print(f"Generated AST Root: {type(ast).__name__} with {len(ast.functions)} functions and {len(ast.global_decls)} globals.")
         print("\n[AST Structure]")
         print_ast(ast)
@@ -0,0 +1,76 @@
+import asyncio
+
+from ..runtime.errors import PlayRuntimeError
+from ..runtime.io import ChannelIO
+from .snapshot import load_vm, save_vm
+from .vm import VM
+
+class AsyncSession:
+    """
+    A Play program running as a coroutine on the VM.
+
+    grab is an await point: when its input lines are not there yet the VM
+    suspends and run() awaits the input channel (an asyncio.Queue of lines,
+    None closes it). drop lines and prompts are put on the output channel
+    (another asyncio.Queue) or, without one, collected in self.output.
+    A waiting session is just its suspended VM state, so thousands of them
+    can share one event loop.
+
+    slice_steps makes long computations yield to the event loop every
+    slice_steps steps (loop iterations and calls), so one busy session
+    doesn't stall the others.
+
+    A suspended session can be saved with snapshot() and continued by
+    AsyncSession.restore(), in this process or another one that has the
+    same compiled module.
+    """
+    def __init__(self, module, input_channel=None, output_channel=None, slice_steps=10000,
+                 echo_prompts=True, **vm_options):
+        self.module = module
+        self.input = input_channel if input_channel is not None else asyncio.Queue()
+        self.output_channel = output_channel
+        self.output = []
+        on_output = output_channel.put_nowait if output_channel is not None else self.output.append
+        self.io = ChannelIO(on_output, echo_prompts)
+        self.vm = VM(io=self.io, **vm_options)
+        self.slice_steps = slice_steps
+        self.started = False
+
+    def snapshot(self):
+        """VM state, queued input and collected output of a suspended session, as bytes."""
+        return save_vm(self.vm, (self.io.save_state(), self.output))
+
+    @classmethod
+    def restore(cls, data, module, input_channel=None, output_channel=None, slice_steps=10000,
+                echo_prompts=True, **vm_options):
+        session = cls(module, input_channel, output_channel, slice_steps, echo_prompts, **vm_options)
+        io_state, output = load_vm(data, module, session.vm)
+        session.io.load_state(io_state)
+        session.output.extend(output)
+        session.started = True
+        return session
+
+    async def send(self, line):
+        await self.input.put(line)
+
+    def close_input(self):
+        self.input.put_nowait(None)
+
+    async def run(self):
+        vm = self.vm
+        if not self.started:
+            vm.start(self.module)
+            self.started = True
+        while not vm.resume(self.slice_steps):
+            if vm.waiting is None:
+                # Time slice used up: let the other sessions run
+                await asyncio.sleep(0)
+                continue
+            prompt, count = vm.waiting
+            self.io.show_prompt(prompt)
+            while not self.io.lines_ready(count):
+                line = await self.input.get()
+                if line is None:
+                    raise PlayRuntimeError("grab: end of input")
+                self.io.feed(line)
+        return self.output
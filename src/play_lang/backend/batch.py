@@ -0,0 +1,546 @@
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy every row runs on the VM
+    np = None
+
+from ..frontend.ast_node import *
+from ..optimizer.ast_utils import linked_functions, recursive_functions
+from ..optimizer.cfg import build_cfg
+from ..optimizer.dataflow import maybe_undeclared_accesses
+from ..runtime.errors import PlayRuntimeError
+from ..runtime.io import MemoryIO, PARSERS
+from .bytecode import BytecodeCompiler
+from .interpreter import DEFAULT_VALUES, format_value, _RANK_OPS
+from .vm import VM
+
+# rank values are int64 columns; a row whose value leaves (-LIMIT, LIMIT)
+# runs on the VM, whose ints don't overflow
+RANK_LIMIT = 2 ** 62
+
+_DTYPES = {'rank': 'int64', 'rate': 'float64', 'flag': 'bool', 'label': 'object'}
+
+class _NotVectorizable(Exception):
+    pass
+
+def _flag(value):
+    # bool arrays stay arrays, a result computed from constants is a plain bool
+    if isinstance(value, np.ndarray) and value.ndim:
+        return value.astype(bool, copy=False)
+    return bool(value)
+
+def _skipped_declarations(program):
+    # A variable that may be read or assigned where its declaration did not
+    # run: the arrays would give such rows the default value, not the error
+    global_names = {name for decl in program.global_decls
+                    for var_init in decl.var_list for name in var_init.names}
+    main_body = BlockNode(list(program.global_decls) + list(program.main_block.statements))
+    if maybe_undeclared_accesses(build_cfg(main_body)):
+        return True
+    for fun_node in linked_functions(program):
+        cfg = build_cfg(fun_node.body, [p.name for p in fun_node.params])
+        # Before the declaration of a local that shadows it, a name is the global
+        if {name for _, name in maybe_undeclared_accesses(cfg)} - global_names:
+            return True
+    return False
+
+def input_line(value):
+    """Text of an input value as grab reads it (None: no more input)."""
+    if value is None:
+        return None
+    if np is not None and isinstance(value, np.generic):
+        value = value.item()
+    return format_value(value) if not isinstance(value, str) else value
+
+class BatchResult:
+    """
+    Outcome of a batch run: per row, the lines written by drop and the
+    error message if the row failed (None otherwise). vectorized and
+    fallback are the numbers of rows run on arrays and on the VM.
+    """
+    def __init__(self, rows, events, fallback_rows):
+        self.rows = rows
+        self._events = events  # (row indices, texts) per executed drop
+        self._fallback = fallback_rows  # row -> (output lines, error)
+        self._outputs = None
+        self.fallback = len(fallback_rows)
+        self.vectorized = rows - self.fallback
+
+    @property
+    def outputs(self):
+        if self._outputs is None:
+            outputs = [[] for _ in range(self.rows)]
+            for indices, texts in self._events:
+                for row, text in zip(indices.tolist(), texts):
+                    outputs[row].append(text)
+            for row, (lines, _) in self._fallback.items():
+                outputs[row] = lines
+            self._outputs = outputs
+        return self._outputs
+
+    @property
+    def errors(self):
+        errors = [None] * self.rows
+        for row, (_, error) in self._fallback.items():
+            errors[row] = error
+        return errors
+
+class BatchExecutor:
+    """
+    Runs one lowered program over many rows of input at once.
+
+    Row r reads columns[0][r], columns[1][r], ... with its successive grabs
+    (None ends the input of a row). Columns are lists of text lines or
+    NumPy arrays of values; numeric arrays are used as they are.
+
+    Execution is SIMT style over NumPy arrays: every variable holds one
+    value per row, rank/rate/flag/label expressions are array operations
+    and control flow works on a mask of the rows that are running. choice
+    runs each branch with its rows, stay and loop iterate while any row is
+    still in the loop, quit and reward take rows out of the mask.
+
+    Rows that the arrays can't run exactly (division by zero, rank values
+    near the int64 range, invalid input, calls to recursive actions) are
+    dropped from the mask and executed again from the start, alone, on
+    the VM, which also gives the error message of a failing row. Without
+    NumPy, or when a variable may be used where its declaration did not
+    run, all the rows run that way.
+    """
+    def __init__(self, program):
+        self.program = program
+        self.functions = {fun_node.name: fun_node for fun_node in linked_functions(program)}
+        self.recursive = recursive_functions(program)
+        self.skipped_declarations = _skipped_declarations(program)
+        self._module = None
+
+    def run(self, columns=(), rows=None):
+        columns = list(columns)
+        if rows is None:
+            if not columns:
+                raise ValueError("rows is required for a program without input columns")
+            rows = len(columns[0])
+        if np is None or self.skipped_declarations:
+            return self._run_all_on_vm(columns, rows)
+        try:
+            with np.errstate(all='ignore'):
+                events, deferred = _BatchRun(self, columns, rows).run()
+        except _NotVectorizable:
+            return self._run_all_on_vm(columns, rows)
+        fallback = {row: self._run_row(columns, row) for row in np.flatnonzero(deferred).tolist()}
+        return BatchResult(rows, events, fallback)
+
+    def _run_all_on_vm(self, columns, rows):
+        return BatchResult(rows, [], {row: self._run_row(columns, row) for row in range(rows)})
+
+    def _run_row(self, columns, row):
+        if self._module is None:
+            self._module = BytecodeCompiler().compile_program(self.program)
+        lines = []
+        for column in columns:
+            line = input_line(column[row])
+            if line is None:
+                break
+            lines.append(line)
+        play_io = MemoryIO(lines)
+        error = None
+        try:
+            VM(io=play_io).run(self._module)
+        except PlayRuntimeError as e:
+            error = str(e)
+        return play_io.lines(), error
+
+class _BatchRun:
+    # State of one vectorized run: variables, masks and input cursors
+    def __init__(self, executor, columns, rows):
+        self.functions = executor.functions
+        self.recursive = executor.recursive
+        self.program = executor.program
+        self.columns = columns
+        self.rows = rows
+        self.alive = np.ones(rows, dtype=bool)     # rows running the current statement
+        self.deferred = np.zeros(rows, dtype=bool)  # rows left to the VM
+        self.returned = np.zeros(rows, dtype=bool)  # rows past a reward in the current call
+        self.result = None
+        self.cursor = np.zeros(rows, dtype=np.int64)  # next input column of each row
+        self.globals = {}
+        self.locals = None
+        self.types = {}
+        self.local_types = None
+        self.events = []
+        self.parsed = {}
+
+    def run(self):
+        for decl in self.program.global_decls:
+            self.stmt(decl)
+        self.block(self.program.main_block)
+        return self.events, self.deferred
+
+    # --- Masks and variables ---
+
+    def defer(self, mask):
+        mask = mask & self.alive
+        self.deferred |= mask
+        self.alive = self.alive & ~mask
+
+    def full(self, value, type_name):
+        if isinstance(value, np.ndarray):
+            return value
+        array = np.empty(self.rows, dtype=_DTYPES[type_name])
+        array.fill(value)
+        return array
+
+    def merge(self, new, old):
+        # Rows outside the mask keep their value
+        if self.alive.all():
+            return new
+        return np.where(self.alive, new, old)
+
+    def scope_of(self, name):
+        if self.locals is not None and name in self.locals:
+            return self.locals, self.local_types
+        return self.globals, self.types
+
+    def store(self, name, value):
+        values, types = self.scope_of(name)
+        values[name] = self.full(self.merge(value, values[name]), types[name])
+
+    def declare(self, name, type_name, value):
+        values, types = (self.locals, self.local_types) if self.locals is not None \
+            else (self.globals, self.types)
+        old = values.get(name)
+        if old is None:
+            old = self.full(DEFAULT_VALUES[type_name], type_name)
+        types[name] = type_name
+        values[name] = self.full(self.merge(value, old), type_name)
+
+    # --- Statements ---
+
+    def block(self, node):
+        for stmt in node.statements:
+            if not self.alive.any():
+                return
+            self.stmt(stmt)
+
+    def stmt(self, node):
+        if isinstance(node, VarDeclNode):
+            for var_init in node.var_list:
+                if var_init.expr is not None:
+                    value = self.expr(var_init.expr)
+                else:
+                    value = DEFAULT_VALUES[node.type_name]
+                for name in var_init.names:
+                    self.declare(name, node.type_name, value)
+
+        elif isinstance(node, AssignNode):
+            self.store(node.target, self.expr(node.expr))
+
+        elif isinstance(node, MultiAssignNode):
+            value = self.expr(node.expr)
+            promoted = None
+            for target, type_name in zip(node.targets, node.target_types):
+                if type_name == 'rate' and 'rank' in node.target_types:
+                    if promoted is None:
+                        promoted = value.astype(np.float64) if isinstance(value, np.ndarray) else float(value)
+                    self.store(target, promoted)
+                else:
+                    self.store(target, value)
+
+        elif isinstance(node, BlockNode):
+            self.block(node)
+
+        elif isinstance(node, IfNode):
+            entry = self.alive
+            rest = entry
+            done = np.zeros(self.rows, dtype=bool)
+            branches = [(node.condition, node.then_block)]
+            branches += [(e.condition, e.block) for e in (node.elifs or [])]
+            for condition, block in branches:
+                self.alive = rest
+                condition = self.expr(condition)
+                taken = self.alive & condition
+                rest = self.alive & ~taken
+                self.alive = taken
+                self.block(block)
+                done |= self.alive
+            self.alive = rest
+            if node.else_block:
+                self.block(node.else_block)
+            self.alive = done | self.alive
+
+        elif isinstance(node, WhileNode):
+            self.loop(node.condition, node.block, None)
+
+        elif isinstance(node, ForNode):
+            self.stmt(node.init)
+            self.loop(node.condition, node.block, node.update)
+
+        elif isinstance(node, InputNode):
+            if node.prompt_expr is not None:
+                self.expr(node.prompt_expr)  # prompts are not shown, calls still run
+            for group, types in zip(node.target_groups, node.target_types):
+                for name, type_name in zip(group, types):
+                    self.store(name, self.read(type_name))
+                self.cursor = self.cursor + self.alive
+
+        elif isinstance(node, OutputNode):
+            value = self.expr(node.expr)
+            indices = np.flatnonzero(self.alive)
+            if isinstance(value, np.ndarray):
+                texts = value[indices].tolist()
+            else:
+                texts = [value] * len(indices)
+            self.events.append((indices, texts))
+
+        elif isinstance(node, ReturnNode):
+            if node.expr is not None:
+                self.result = self.merge(self.expr(node.expr), self.result)
+            self.returned |= self.alive
+            self.alive = np.zeros(self.rows, dtype=bool)
+
+        elif isinstance(node, BreakNode):
+            self.alive = np.zeros(self.rows, dtype=bool)
+
+        elif isinstance(node, FuncCallStmtNode):
+            self.call(node.name, node.args)
+
+        else:
+            raise _NotVectorizable(type(node).__name__)
+
+    def loop(self, condition, block, update):
+        entry = self.alive
+        while True:
+            running = self.expr(condition)
+            self.alive = self.alive & running
+            if not self.alive.any():
+                break
+            self.block(block)
+            if update is not None and self.alive.any():
+                if isinstance(update, ExprNode):
+                    self.expr(update)
+                else:
+                    self.stmt(update)
+        # quit only leaves the loop, reward and deferral end the row
+        self.alive = entry & ~self.returned & ~self.deferred
+
+    def call(self, name, args):
+        fun_node = self.functions[name]
+        values = [self.expr(arg) for arg in args]
+        if name in self.recursive:
+            # Recursion depth differs per row: not unrolled on arrays
+            self.defer(self.alive)
+        ret_type = fun_node.ret_type
+        if not self.alive.any():
+            return DEFAULT_VALUES.get(ret_type)
+
+        saved = (self.locals, self.local_types, self.returned, self.result)
+        entry = self.alive
+        self.locals = {}
+        self.local_types = {}
+        for param, value in zip(fun_node.params, values):
+            self.locals[param.name] = self.full(value, param.type_name)
+            self.local_types[param.name] = param.type_name
+        self.returned = np.zeros(self.rows, dtype=bool)
+        self.result = DEFAULT_VALUES.get(ret_type)
+        self.block(fun_node.body)
+        result = self.result
+        self.alive = entry & ~self.deferred
+        self.locals, self.local_types, self.returned, self.result = saved
+        return result
+
+    # --- Input ---
+
+    def read(self, type_name):
+        # Rows may be at different input columns (grab in loops)
+        cursors = np.unique(self.cursor[self.alive])
+        values = DEFAULT_VALUES[type_name]
+        invalid = np.zeros(self.rows, dtype=bool)
+        for index in cursors.tolist():
+            rows = self.alive & (self.cursor == index) if len(cursors) > 1 else self.alive
+            if index >= len(self.columns):
+                invalid |= rows
+                continue
+            column, bad = self.parse(index, type_name)
+            values = np.where(rows, column, values) if len(cursors) > 1 else column
+            invalid |= rows & bad
+        self.defer(invalid)
+        return values
+
+    def parse(self, index, type_name):
+        """Column index as values of type_name, with the mask of the rows that can't be parsed."""
+        key = (index, type_name)
+        if key not in self.parsed:
+            column = self.columns[index]
+            kind = column.dtype.kind if isinstance(column, np.ndarray) else 'O'
+            if type_name == 'rank' and kind in 'iu':
+                values = column.astype(np.int64)
+                bad = (column >= RANK_LIMIT) | (column <= -RANK_LIMIT)
+            elif type_name == 'rate' and kind in 'iuf':
+                values = column.astype(np.float64)
+                bad = np.zeros(self.rows, dtype=bool)
+            elif type_name == 'flag' and kind == 'b':
+                values = column.astype(bool)
+                bad = np.zeros(self.rows, dtype=bool)
+            else:
+                values, bad = self._parse_lines(column, type_name)
+            self.parsed[key] = (values, bad)
+        return self.parsed[key]
+
+    def _parse_lines(self, column, type_name):
+        parse = PARSERS[type_name]
+        default = DEFAULT_VALUES[type_name]
+        parsed = []
+        bad = np.zeros(self.rows, dtype=bool)
+        for row, value in enumerate(column):
+            line = input_line(value)
+            try:
+                value = parse(line) if line is not None else None
+            except PlayRuntimeError:
+                value = None
+            if value is None or (type_name == 'rank' and not -RANK_LIMIT < value < RANK_LIMIT):
+                bad[row] = True
+                value = default
+            parsed.append(value)
+        values = np.empty(self.rows, dtype=_DTYPES[type_name])
+        values[:] = parsed
+        return values, bad
+
+    # --- Expressions ---
+
+    def expr(self, node):
+        if isinstance(node, LiteralNode):
+            if type(node.value) is int and not -RANK_LIMIT < node.value < RANK_LIMIT:
+                raise _NotVectorizable("rank literal out of range")
+            return node.value
+
+        if isinstance(node, VarAccessNode):
+            return self.scope_of(node.name)[0][node.name]
+
+        if isinstance(node, FunCallExprNode):
+            return self.call(node.name, node.args)
+
+        if isinstance(node, RankBinOpNode):
+            return self.rank_op(node.op, self.expr(node.left), self.expr(node.right))
+
+        if isinstance(node, RateBinOpNode):
+            return self.rate_op(node.op, self.expr(node.left), self.expr(node.right))
+
+        if isinstance(node, (RankCompareNode, RateCompareNode, LabelCompareNode, FlagCompareNode)):
+            return self.compare(node.op, self.expr(node.left), self.expr(node.right))
+
+        if isinstance(node, LogicOpNode):
+            # Short-circuit: the right operand only runs on the rows that need it
+            left = self.expr(node.left)
+            entry = self.alive
+            self.alive = entry & (left if node.op == '&&' else np.logical_not(left))
+            right = self.expr(node.right) if self.alive.any() else False
+            self.alive = entry & ~self.deferred
+            if node.op == '&&':
+                return _flag(np.logical_and(left, right))
+            return _flag(np.logical_or(left, right))
+
+        if isinstance(node, NotNode):
+            return _flag(np.logical_not(self.expr(node.expr)))
+
+        if isinstance(node, RankNegNode):
+            return -self.expr(node.expr)
+
+        if isinstance(node, RateNegNode):
+            return -self.expr(node.expr)
+
+        if isinstance(node, RankToRateNode):
+            value = self.expr(node.expr)
+            return value.astype(np.float64) if isinstance(value, np.ndarray) else float(value)
+
+        if isinstance(node, (RankToLabelNode, RateToLabelNode, FlagToLabelNode)):
+            return self.to_label(self.expr(node.expr))
+
+        if isinstance(node, LabelConcatNode):
+            return self.concat([self.expr(node.left), self.expr(node.right)])
+
+        if isinstance(node, LabelJoinNode):
+            parts = []
+            for part in node.parts:
+                if isinstance(part, LiteralNode):
+                    parts.append(part.value)
+                else:
+                    parts.append(self.expr(part))
+            return self.concat(parts)
+
+        raise _NotVectorizable(type(node).__name__)
+
+    def rank_op(self, op, a, b):
+        if not isinstance(a, np.ndarray) and not isinstance(b, np.ndarray):
+            try:
+                value = _RANK_OPS[op](a, b)
+            except PlayRuntimeError:
+                self.defer(self.alive)
+                return 0
+            if not -RANK_LIMIT < value < RANK_LIMIT:
+                self.defer(self.alive)
+                return 0
+            return value
+
+        if op == '+':
+            value = a + b
+        elif op == '-':
+            value = a - b
+        elif op == '*':
+            # Products that could wrap around int64 are left to the VM
+            self.defer(np.abs(np.multiply(a, b, dtype=np.float64)) >= RANK_LIMIT)
+            value = np.multiply(a, b, dtype=np.int64)
+        else:
+            zero = np.asarray(b == 0)
+            self.defer(zero)
+            b = np.where(zero, 1, b)
+            # Truncation toward zero, as int_div
+            quotient = np.abs(a) // np.abs(b)
+            quotient = np.where((np.asarray(a) < 0) == (b < 0), quotient, -quotient)
+            value = quotient if op == '/' else a - b * quotient
+        self.defer((value >= RANK_LIMIT) | (value <= -RANK_LIMIT))
+        return value
+
+    def rate_op(self, op, a, b):
+        if op == '+':
+            return np.add(a, b)
+        if op == '-':
+            return np.subtract(a, b)
+        if op == '*':
+            return np.multiply(a, b)
+        zero = np.asarray(b == 0)
+        self.defer(zero)
+        b = np.where(zero, 1.0, b)
+        if op == '/':
+            return np.divide(a, b)
+        # a non-finite dividend is an error (float_mod)
+        self.defer(~np.isfinite(a))
+        return np.fmod(a, b)
+
+    def compare(self, op, a, b):
+        if op == '==':
+            value = a == b
+        elif op == '<>':
+            value = a != b
+        elif op == '<':
+            value = a < b
+        elif op == '<=':
+            value = a <= b
+        elif op == '>':
+            value = a > b
+        else:
+            value = a >= b
+        return _flag(value)
+
+    def to_label(self, value):
+        if not isinstance(value, np.ndarray):
+            return format_value(value)
+        # Only the running rows are converted, the others get ''
+        labels = np.full(self.rows, '', dtype=object)
+        indices = np.flatnonzero(self.alive)
+        labels[indices] = [format_value(v) for v in value[indices].tolist()]
+        return labels
+
+    def concat(self, parts):
+        value = parts[0]
+        for part in parts[1:]:
+            value = np.add(value, part, dtype=object) if isinstance(value, np.ndarray) \
+                or isinstance(part, np.ndarray) else value + part
+        return value
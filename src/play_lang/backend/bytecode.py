@@ -0,0 +1,542 @@
+from ..frontend.ast_node import *
+from .interpreter import DEFAULT_VALUES
+from ..optimizer.purity import memoizable_functions
+from ..optimizer.ast_utils import linked_functions
+from ..optimizer.slots import allocate_slots
+from ..optimizer.cfg import build_cfg
+from ..optimizer.dataflow import maybe_undeclared_accesses
+
+# --- Opcodes ---
+# Arithmetic opcodes are specialized on the lowered operand type, so the VM
+# never looks at runtime types. Comparisons and conversions have the same
+# Python implementation for every type and are not split further.
+
+OPCODE_NAMES = [
+    # Stack and variables
+    'CONST', 'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_GLOBAL', 'STORE_GLOBAL', 'POP',
+    # rank / rate arithmetic
+    'ADD_RANK', 'SUB_RANK', 'MUL_RANK', 'DIV_RANK', 'MOD_RANK', 'NEG_RANK',
+    'ADD_RATE', 'SUB_RATE', 'MUL_RATE', 'DIV_RATE', 'MOD_RATE', 'NEG_RATE',
+    # Comparisons and logic
+    'LT', 'LE', 'GT', 'GE', 'EQ', 'NE', 'NOT',
+    # Conversions and labels
+    'RANK_TO_RATE', 'TO_LABEL', 'FLAG_TO_LABEL', 'CONCAT', 'FORMAT',
+    # Control flow
+    'JUMP', 'LOOP', 'JUMP_IF_FALSE', 'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+    'CALL', 'CALL_PURE', 'TAIL_CALL', 'RETURN', 'HALT',
+    # I/O
+    'PRINT', 'INPUT',
+    # Profiling (only in code compiled with profile=True)
+    'PROF_ENTER', 'PROF_EXIT', 'PROF_LOOP',
+    # Superinstructions (see SUPERINSTRUCTIONS)
+    'INC_LOCAL', 'INC_GLOBAL', 'LOAD_LOCAL_ADD_CONST', 'LOAD_GLOBAL_ADD_CONST',
+    'LOAD_LOCAL2', 'LOAD_GLOBAL2', 'LOAD_LOCAL_CONST', 'LOAD_GLOBAL_CONST',
+    'JUMP_IF_NOT_LT', 'JUMP_IF_NOT_LE', 'JUMP_IF_NOT_GT', 'JUMP_IF_NOT_GE',
+    'JUMP_IF_NOT_EQ', 'JUMP_IF_NOT_NE',
+    # Declaration checks (names whose declaration may not have run)
+    'CHECK_LOCAL', 'CHECK_GLOBAL',
+]
+for _code, _name in enumerate(OPCODE_NAMES):
+    globals()[_name] = _code
+
+_RANK_OPS = {'+': ADD_RANK, '-': SUB_RANK, '*': MUL_RANK, '/': DIV_RANK, '%': MOD_RANK}
+_RATE_OPS = {'+': ADD_RATE, '-': SUB_RATE, '*': MUL_RATE, '/': DIV_RATE, '%': MOD_RATE}
+_COMPARE_OPS = {'<': LT, '<=': LE, '>': GT, '>=': GE, '==': EQ, '<>': NE}
+_COMPARE_JUMPS = {LT: JUMP_IF_NOT_LT, LE: JUMP_IF_NOT_LE, GT: JUMP_IF_NOT_GT,
+                  GE: JUMP_IF_NOT_GE, EQ: JUMP_IF_NOT_EQ, NE: JUMP_IF_NOT_NE}
+
+# Superinstructions, chosen from the opcode-pair statistics of the benchmark
+# programs (VM(collect_stats=True), benchmarks/bench_vm.py --pairs).
+# Entries are (pattern, fused opcode, function building the fused arg from the
+# args of the pattern, optional guard on those args); longer patterns first.
+SUPERINSTRUCTIONS = [
+    ((LOAD_LOCAL, CONST, ADD_RANK, STORE_LOCAL), INC_LOCAL, lambda a: (a[0], a[1]),
+     lambda a: a[0] == a[3]),
+    ((LOAD_GLOBAL, CONST, ADD_RANK, STORE_GLOBAL), INC_GLOBAL, lambda a: (a[0], a[1]),
+     lambda a: a[0] == a[3]),
+    ((LOAD_LOCAL, CONST, ADD_RANK), LOAD_LOCAL_ADD_CONST, lambda a: (a[0], a[1])),
+    ((LOAD_GLOBAL, CONST, ADD_RANK), LOAD_GLOBAL_ADD_CONST, lambda a: (a[0], a[1])),
+] + [
+    ((compare, JUMP_IF_FALSE), fused, lambda a: a[1])
+    for compare, fused in _COMPARE_JUMPS.items()
+] + [
+    ((LOAD_LOCAL, LOAD_LOCAL), LOAD_LOCAL2, lambda a: (a[0], a[1])),
+    ((LOAD_GLOBAL, LOAD_GLOBAL), LOAD_GLOBAL2, lambda a: (a[0], a[1])),
+    ((LOAD_LOCAL, CONST), LOAD_LOCAL_CONST, lambda a: (a[0], a[1])),
+    ((LOAD_GLOBAL, CONST), LOAD_GLOBAL_CONST, lambda a: (a[0], a[1])),
+]
+
+class Label:
+    """Jump target, resolved to an instruction index when the code is assembled."""
+    pass
+
+class CodeObject:
+    """
+    Bytecode of one function (or of the main block): parallel ops / args lists.
+
+    reset_slots are the locals declared inside a nested block: a reused frame
+    must clear them, since a path that skips the declaration can read them.
+    """
+    def __init__(self, name, ops, args, num_slots, num_params, ret_type, reset_slots=()):
+        self.name = name
+        self.ops = ops
+        self.args = args
+        self.num_slots = num_slots
+        self.num_params = num_params
+        self.ret_type = ret_type
+        self.reset_slots = reset_slots
+
+def link_code(libraries, memoize=True):
+    """
+    Bytecode of linked libraries placed one after the other: calls inside a
+    library are shifted by the index of its first action. With
+    memoize=False CALL_PURE becomes a plain CALL.
+    """
+    code = []
+    for library in libraries:
+        offset = len(code)
+        for code_object in library.code:
+            code.append(_relocate(code_object, offset, memoize))
+    return code
+
+def _relocate(code, offset, memoize):
+    if not offset and memoize:
+        return code
+    ops, args = [], []
+    for op, arg in zip(code.ops, code.args):
+        if op in (CALL, CALL_PURE, TAIL_CALL):
+            arg = (arg[0] + offset, arg[1])
+            if op == CALL_PURE and not memoize:
+                op = CALL
+        ops.append(op)
+        args.append(arg)
+    return CodeObject(code.name, ops, args, code.num_slots, code.num_params,
+                      code.ret_type, code.reset_slots)
+
+class Module:
+    """
+    A compiled program: main block, functions and global slots.
+
+    Profiled modules also name their loops: loop_names[i] describes the loop
+    counted by PROF_LOOP i. Function ids are the indexes in functions, the
+    main block has id len(functions).
+    """
+    def __init__(self, main, functions, function_index, global_names, loop_names=None):
+        self.main = main
+        self.functions = functions            # list of CodeObject
+        self.function_index = function_index  # name -> index in functions
+        self.global_names = global_names      # global slot -> name
+        self.loop_names = loop_names          # None if not compiled with profile=True
+
+def disassemble(code):
+    lines = [f"{code.name}: {code.num_slots} slots"]
+    for pc, (op, arg) in enumerate(zip(code.ops, code.args)):
+        lines.append(f"  {pc:4d} {OPCODE_NAMES[op]:22s} {'' if arg is None else repr(arg)}")
+    return "\n".join(lines)
+
+class BytecodeCompiler:
+    """
+    Compiles a lowered program (SemanticAnalyzer(lower=True)) to a Module.
+
+    Names are resolved to slots at compile time with the analyzer scoping:
+    a global scope (global declarations and the main block) and one scope per
+    function, where a name refers to a local only after its declaration.
+    Where that declaration may not have run (it is in a branch or a loop),
+    a CHECK_LOCAL / CHECK_GLOBAL before the access makes the VM fail with
+    "not defined" like the Interpreter.
+    With memoize=True calls to pure functions that return a value compile to
+    CALL_PURE, which the VM serves from its memo cache.
+    With profile=True function entries/exits and loop iterations are
+    marked by PROF_* instructions for the VM profiler.
+    With pack_slots=True locals whose live ranges don't overlap share a frame
+    slot (optimizer.slots.allocate_slots); slot_allocations keeps the layout
+    of every compiled function for frame_report.
+    """
+    def __init__(self, superinstructions=True, memoize=True, profile=False, pack_slots=True):
+        self.superinstructions = superinstructions
+        self.memoize = memoize
+        self.profile = profile
+        self.pack_slots = pack_slots
+        self.global_slots = {}
+        self.loop_names = []
+        self.slot_allocations = []
+        self.allocation = None
+
+    def compile_program(self, program):
+        # Linked library actions come first, their bytecode is reused as is
+        linked = linked_functions(program)
+        self.function_index = {f.name: i for i, f in enumerate(linked)}
+        self.memoized = memoizable_functions(program) if self.memoize else set()
+        if self.memoize:
+            for library in program.libraries:
+                self.memoized |= library.memoized
+        self.signatures = {f.name: f for f in linked}
+
+        # Global declarations run at the start of the main code
+        main_body = BlockNode(list(program.global_decls) + list(program.main_block.statements))
+        for decl in program.global_decls:
+            for var_init in decl.var_list:
+                for name in var_init.names:
+                    self._global_slot(name)
+
+        functions = link_code(program.libraries, self.memoize)
+        functions.extend(self._compile_function(f) for f in program.functions)
+        self.code_id = len(functions)
+        main = self._compile_code('<play>', main_body, params=[], ret_type='void', is_main=True)
+        global_names = sorted(self.global_slots, key=self.global_slots.get)
+        return Module(main, functions, self.function_index, global_names,
+                      self.loop_names if self.profile else None)
+
+    def _global_slot(self, name):
+        if name not in self.global_slots:
+            self.global_slots[name] = len(self.global_slots)
+        return self.global_slots[name]
+
+    def _compile_function(self, fun_node):
+        self.code_id = self.function_index[fun_node.name]
+        if self.pack_slots:
+            self.allocation = allocate_slots(fun_node)
+            self.slot_allocations.append(self.allocation)
+        try:
+            return self._compile_code(fun_node.name, fun_node.body, fun_node.params, fun_node.ret_type)
+        finally:
+            self.allocation = None
+
+    def _compile_code(self, name, body, params, ret_type, is_main=False):
+        self.is_main = is_main
+        self.code_name = name
+        self.locals = {p.name: i for i, p in enumerate(params)}
+        self.num_slots = self.allocation.num_slots if self.allocation is not None else len(params)
+        self.reset_slots = []
+        self.unsure = {name for _, name in maybe_undeclared_accesses(build_cfg(body, [p.name for p in params]))}
+        self.depth = 0
+        self.stream = []
+        self.break_labels = []
+        self.loop_count = 0
+
+        if self.profile:
+            self._emit(PROF_ENTER, self.code_id)
+        self._stmt(body)
+        if is_main:
+            self._emit_exit()
+            self._emit(HALT)
+        else:
+            self._emit(CONST, None)
+            self._emit_exit()
+            self._emit(RETURN)
+
+        stream = self._fuse(self.stream) if self.superinstructions else self.stream
+        ops, args = self._assemble(stream)
+        return CodeObject(name, ops, args, self.num_slots, len(params), ret_type,
+                          tuple(self.reset_slots))
+
+    # --- Emission ---
+
+    def _emit(self, op, arg=None):
+        self.stream.append((op, arg))
+
+    def _mark(self, label):
+        self.stream.append(label)
+
+    def _emit_exit(self):
+        if self.profile:
+            self._emit(PROF_EXIT, self.code_id)
+
+    def _loop_body(self, node, end):
+        if self.profile:
+            self.loop_count += 1
+            kind = 'stay' if isinstance(node, WhileNode) else 'loop'
+            self._emit(PROF_LOOP, len(self.loop_names))
+            self.loop_names.append(f"{self.code_name}: {kind} #{self.loop_count}")
+        self.break_labels.append(end)
+        self._stmt(node.block)
+        self.break_labels.pop()
+
+    def _load(self, name):
+        if name in self.locals:
+            self._emit(LOAD_LOCAL, self.locals[name])
+        else:
+            self._emit(LOAD_GLOBAL, self.global_slots[name])
+
+    def _store(self, name):
+        if name in self.locals:
+            self._emit(STORE_LOCAL, self.locals[name])
+        else:
+            self._emit(STORE_GLOBAL, self.global_slots[name])
+
+    def _store_all(self, names, promoted=()):
+        # Stores the value on the stack into every name (there is no DUP: the
+        # others are copied from the first), promoting it for the names in promoted
+        self._store(names[0])
+        for name in names[1:]:
+            self._load(names[0])
+            self._store(name)
+        for name in promoted:
+            self._load(names[0])
+            self._emit(RANK_TO_RATE)
+            self._store(name)
+
+    def _check_declared(self, name):
+        if name in self.unsure:
+            if name in self.locals:
+                self._emit(CHECK_LOCAL, (self.locals[name], name))
+            else:
+                self._emit(CHECK_GLOBAL, (self.global_slots[name], name))
+
+    def _target(self, name):
+        # (is_global, slot) for INPUT
+        if name in self.locals:
+            return (False, self.locals[name])
+        return (True, self.global_slots[name])
+
+    def _declare(self, name):
+        if self.is_main:
+            self._global_slot(name)
+        elif self.allocation is not None:
+            if name not in self.locals:
+                self.locals[name] = self.allocation.slots[name]
+                # Shared slots are written before every read, only own slots need a reset
+                if self.depth > 1 and name in self.allocation.own_slot:
+                    self.reset_slots.append(self.locals[name])
+        elif name not in self.locals:
+            self.locals[name] = self.num_slots
+            if self.depth > 1:
+                self.reset_slots.append(self.num_slots)
+            self.num_slots += 1
+
+    # --- Statements ---
+
+    def _stmt(self, node):
+        if isinstance(node, BlockNode):
+            self.depth += 1
+            for stmt in node.statements:
+                self._stmt(stmt)
+            self.depth -= 1
+
+        elif isinstance(node, VarDeclNode):
+            for var_init in node.var_list:
+                if var_init.expr is not None:
+                    self._expr(var_init.expr)
+                else:
+                    self._emit(CONST, DEFAULT_VALUES[node.type_name])
+                for name in var_init.names:
+                    self._declare(name)
+                self._store_all(var_init.names)
+
+        elif isinstance(node, AssignNode):
+            self._expr(node.expr)
+            self._check_declared(node.target)
+            self._store(node.target)
+
+        elif isinstance(node, MultiAssignNode):
+            self._expr(node.expr)
+            for name in node.targets:
+                self._check_declared(name)
+            promoted = [name for name, type_name in zip(node.targets, node.target_types)
+                        if type_name == 'rate' and 'rank' in node.target_types]
+            self._store_all([name for name in node.targets if name not in promoted], promoted)
+
+        elif isinstance(node, IfNode):
+            end = Label()
+            branches = [(node.condition, node.then_block)]
+            branches += [(e.condition, e.block) for e in (node.elifs or [])]
+            for condition, block in branches:
+                next_branch = Label()
+                self._expr(condition)
+                self._emit(JUMP_IF_FALSE, next_branch)
+                self._stmt(block)
+                self._emit(JUMP, end)
+                self._mark(next_branch)
+            if node.else_block:
+                self._stmt(node.else_block)
+            self._mark(end)
+
+        elif isinstance(node, WhileNode):
+            top, end = Label(), Label()
+            self._mark(top)
+            self._expr(node.condition)
+            self._emit(JUMP_IF_FALSE, end)
+            self._loop_body(node, end)
+            self._emit(LOOP, top)
+            self._mark(end)
+
+        elif isinstance(node, ForNode):
+            top, end = Label(), Label()
+            self._stmt(node.init)
+            self._mark(top)
+            self._expr(node.condition)
+            self._emit(JUMP_IF_FALSE, end)
+            self._loop_body(node, end)
+            if isinstance(node.update, ExprNode):
+                self._expr(node.update)
+                self._emit(POP)
+            else:
+                self._stmt(node.update)
+            self._emit(LOOP, top)
+            self._mark(end)
+
+        elif isinstance(node, BreakNode):
+            self._emit(JUMP, self.break_labels[-1])
+
+        elif isinstance(node, InputNode):
+            if node.prompt_expr is not None:
+                self._expr(node.prompt_expr)
+            else:
+                self._emit(CONST, '')
+            for group in node.target_groups:
+                for name in group:
+                    self._check_declared(name)
+            groups = tuple(
+                tuple(self._target(name) + (type_name,) for name, type_name in zip(group, types))
+                for group, types in zip(node.target_groups, node.target_types)
+            )
+            self._emit(INPUT, groups)
+
+        elif isinstance(node, OutputNode):
+            self._expr(node.expr)
+            self._emit(PRINT)
+
+        elif isinstance(node, ReturnNode):
+            if isinstance(node.expr, FunCallExprNode):
+                # 'reward f(...)' in tail position replaces the current frame
+                self._call(node.expr.name, node.expr.args, TAIL_CALL)
+                return
+            if node.expr is not None:
+                self._expr(node.expr)
+            else:
+                self._emit(CONST, None)
+            self._emit_exit()
+            self._emit(RETURN)
+
+        elif isinstance(node, FuncCallStmtNode):
+            self._call(node.name, node.args)
+            self._emit(POP)
+
+        else:
+            raise Exception(f"Cannot compile {type(node).__name__}")
+
+    def _call(self, name, args, opcode=CALL):
+        for arg in args:
+            self._expr(arg)
+        if opcode == CALL and name in self.memoized:
+            opcode = CALL_PURE
+        if opcode == TAIL_CALL:
+            self._emit_exit()
+        self._emit(opcode, (self.function_index[name], len(args)))
+
+    # --- Expressions ---
+
+    def _expr(self, node):
+        if isinstance(node, LiteralNode):
+            self._emit(CONST, node.value)
+        elif isinstance(node, VarAccessNode):
+            self._check_declared(node.name)
+            self._load(node.name)
+        elif isinstance(node, FunCallExprNode):
+            self._call(node.name, node.args)
+        elif isinstance(node, RankBinOpNode):
+            self._expr(node.left)
+            self._expr(node.right)
+            self._emit(_RANK_OPS[node.op])
+        elif isinstance(node, RateBinOpNode):
+            self._expr(node.left)
+            self._expr(node.right)
+            self._emit(_RATE_OPS[node.op])
+        elif isinstance(node, (RankCompareNode, RateCompareNode, LabelCompareNode, FlagCompareNode)):
+            self._expr(node.left)
+            self._expr(node.right)
+            self._emit(_COMPARE_OPS[node.op])
+        elif isinstance(node, LogicOpNode):
+            end = Label()
+            self._expr(node.left)
+            self._emit(JUMP_IF_FALSE_OR_POP if node.op == '&&' else JUMP_IF_TRUE_OR_POP, end)
+            self._expr(node.right)
+            self._mark(end)
+        elif isinstance(node, NotNode):
+            self._expr(node.expr)
+            self._emit(NOT)
+        elif isinstance(node, RankNegNode):
+            self._expr(node.expr)
+            self._emit(NEG_RANK)
+        elif isinstance(node, RateNegNode):
+            self._expr(node.expr)
+            self._emit(NEG_RATE)
+        elif isinstance(node, RankToRateNode):
+            if isinstance(node.expr, LiteralNode):
+                # Promotion of a constant (f(1) with a rate parameter) is done here
+                self._emit(CONST, float(node.expr.value))
+            else:
+                self._expr(node.expr)
+                self._emit(RANK_TO_RATE)
+        elif isinstance(node, (RankToLabelNode, RateToLabelNode)):
+            self._expr(node.expr)
+            self._emit(TO_LABEL)
+        elif isinstance(node, FlagToLabelNode):
+            self._expr(node.expr)
+            self._emit(FLAG_TO_LABEL)
+        elif isinstance(node, LabelConcatNode):
+            self._expr(node.left)
+            self._expr(node.right)
+            self._emit(CONCAT)
+        elif isinstance(node, LabelJoinNode):
+            self._join(node)
+        else:
+            raise Exception(f"Cannot compile {type(node).__name__}")
+
+    def _join(self, node):
+        # Same precompiled '%s' template as the Interpreter
+        pieces = []
+        count = 0
+        for part in node.parts:
+            if isinstance(part, LiteralNode):
+                pieces.append(part.value.replace('%', '%%'))
+                continue
+            if isinstance(part, (RankToLabelNode, RateToLabelNode)):
+                part = part.expr
+            self._expr(part)
+            pieces.append('%s')
+            count += 1
+        self._emit(FORMAT, (''.join(pieces), count))
+
+    # --- Superinstructions and assembly ---
+
+    def _fuse(self, stream):
+        # Patterns never span a Label, so jump targets stay instruction boundaries
+        result = []
+        i = 0
+        while i < len(stream):
+            for pattern, fused, make_arg, *guard in SUPERINSTRUCTIONS:
+                window = stream[i:i + len(pattern)]
+                if len(window) < len(pattern) or not all(
+                        not isinstance(item, Label) and item[0] == op
+                        for item, op in zip(window, pattern)):
+                    continue
+                window_args = [item[1] for item in window]
+                if guard and not guard[0](window_args):
+                    continue
+                result.append((fused, make_arg(window_args)))
+                i += len(pattern)
+                break
+            else:
+                result.append(stream[i])
+                i += 1
+        return result
+
+    def _assemble(self, stream):
+        positions = {}
+        index = 0
+        for item in stream:
+            if isinstance(item, Label):
+                positions[item] = index
+            else:
+                index += 1
+        ops, args = [], []
+        for item in stream:
+            if isinstance(item, Label):
+                continue
+            op, arg = item
+            if isinstance(arg, Label):
+                arg = positions[arg]
+            ops.append(op)
+            args.append(arg)
+        return ops, args
@@ -0,0 +1,407 @@
+import math
+import operator
+
+from ..frontend.ast_node import *
+from ..runtime.errors import PlayRuntimeError
+from ..runtime.io import PlayIO, parse_value
+from ..runtime.memo import MemoCache, MISSING, memo_key
+from ..optimizer.purity import memoizable_functions
+from ..optimizer.ast_utils import linked_functions
+
+class _BreakSignal(Exception):
+    pass
+
+class _ReturnSignal(Exception):
+    def __init__(self, value):
+        self.value = value
+
+# Value of a declared but not initialized variable
+DEFAULT_VALUES = {'rank': 0, 'rate': 0.0, 'flag': False, 'label': ''}
+
+def format_value(value):
+    """Converts a runtime value to its 'label' representation (used by '+' and drop)."""
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    return str(value)
+
+def int_div(a, b):
+    # rank division truncates toward zero (C semantics), not toward -inf like '//'
+    if b == 0:
+        raise PlayRuntimeError("Division by zero")
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def int_mod(a, b):
+    if b == 0:
+        raise PlayRuntimeError("Modulo by zero")
+    return a - b * int_div(a, b)
+
+def float_div(a, b):
+    if b == 0:
+        raise PlayRuntimeError("Division by zero")
+    return a / b
+
+def float_mod(a, b):
+    if b == 0:
+        raise PlayRuntimeError("Modulo by zero")
+    # math.fmod raises ValueError on an infinite dividend; C gives NaN
+    if not math.isfinite(a):
+        raise PlayRuntimeError("Modulo of a non-finite value")
+    return math.fmod(a, b)
+
+def to_rate(value):
+    # ranks are unbounded here, a double is not
+    try:
+        return float(value)
+    except OverflowError:
+        raise PlayRuntimeError("Rank too large for a rate") from None
+
+_RANK_OPS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': int_div, '%': int_mod}
+_RATE_OPS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': float_div, '%': float_mod}
+_ARITHMETIC = frozenset('+-*/%')
+_COMPARE_OPS = {'==': operator.eq, '<>': operator.ne, '<': operator.lt,
+                '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+class Scope:
+    """Variables of the global scope or of a single function activation."""
+    def __init__(self):
+        self.values = {}
+        self.types = {}
+
+    def declare(self, name, type_name, value):
+        self.types[name] = type_name
+        self.values[name] = value
+
+class Interpreter:
+    """
+    Tree-walking interpreter for a validated AST (step 6 of compile_source).
+
+    Variables follow the SemanticAnalyzer scoping: a global scope plus one
+    scope per function activation (blocks don't open a new scope).
+    I/O goes through a PlayIO (buffered drop, prefetched grab input), or
+    through plain input_fn / output_fn callables if given.
+
+    Both the AST and the lowered tree (SemanticAnalyzer(lower=True)) can be
+    run; on the lowered tree conversions are explicit nodes, so the rank -> rate
+    promotion checks done for the AST are skipped.
+
+    Calls to functions proven pure (optimizer.purity) are served from an LRU
+    cache of memo_size results (self.memo, None if memo_size is 0).
+    """
+    def __init__(self, input_fn=None, output_fn=None, io=None, memo_size=1024):
+        if io is None and input_fn is None and output_fn is None:
+            io = PlayIO()
+        self.io = io
+        self.input_fn = input_fn or (io.read_line if io else input)
+        self.output_fn = output_fn or (io.write_line if io else print)
+        self.globals = Scope()
+        self.locals = None  # Scope of the running function, None in main block
+        self.functions = {}
+        self.promote = True
+        self.templates = {}  # id(LabelJoinNode) -> (format string, argument nodes)
+        self.memo = MemoCache(memo_size) if memo_size else None
+        self.memoized = set()
+
+    def run(self, program):
+        try:
+            self.visit(program)
+        finally:
+            if self.io is not None:
+                self.io.flush()
+
+    def visit(self, node):
+        method_name = f'visit_{type(node).__name__}'
+        visitor = getattr(self, method_name, self.generic_visit)
+        return visitor(node)
+
+    def generic_visit(self, node):
+        raise Exception(f"No visit_{type(node).__name__} method")
+
+    def visit_ProgramNode(self, node):
+        for var_decl in node.global_decls:
+            self.visit(var_decl)
+        for fun_node in linked_functions(node):
+            self.functions[fun_node.name] = fun_node
+        if self.memo is not None:
+            self.memoized = memoizable_functions(node)
+            for library in node.libraries:
+                self.memoized |= library.memoized
+        self.visit(node.main_block)
+
+    def visit_LoweredProgramNode(self, node):
+        self.promote = False
+        self.visit_ProgramNode(node)
+
+    # --- Variables ---
+
+    def _scope_of(self, name):
+        if self.locals is not None and name in self.locals.values:
+            return self.locals
+        if name in self.globals.values:
+            return self.globals
+        raise PlayRuntimeError(f"Variable '{name}' not defined")
+
+    def _store(self, name, value):
+        scope = self._scope_of(name)
+        # Promotion rank -> rate, already validated by _check_type_compatibility
+        if self.promote and scope.types[name] == 'rate' and type(value) is int:
+            value = to_rate(value)
+        scope.values[name] = value
+
+    def visit_VarDeclNode(self, node):
+        scope = self.locals if self.locals is not None else self.globals
+        type_name = node.type_name
+        for var_init in node.var_list:
+            if var_init.expr is not None:
+                value = self.visit(var_init.expr)
+                if self.promote and type_name == 'rate' and type(value) is int:
+                    value = to_rate(value)
+            else:
+                value = DEFAULT_VALUES[type_name]
+            for name in var_init.names:
+                scope.declare(name, type_name, value)
+
+    # --- Statements ---
+
+    def visit_BlockNode(self, node):
+        for stmt in node.statements:
+            self.visit(stmt)
+
+    def visit_AssignNode(self, node):
+        self._store(node.target, self.visit(node.expr))
+
+    def visit_MultiAssignNode(self, node):
+        value = self.visit(node.expr)
+        for target in node.targets:
+            scope = self._scope_of(target)
+            # Per-target promotion, also in the lowered tree (see MultiAssignNode)
+            if scope.types[target] == 'rate' and type(value) is int:
+                scope.values[target] = to_rate(value)
+            else:
+                scope.values[target] = value
+
+    def visit_IfNode(self, node):
+        if self.visit(node.condition):
+            self.visit(node.then_block)
+            return
+        if node.elifs:
+            for elif_node in node.elifs:
+                if self.visit(elif_node.condition):
+                    self.visit(elif_node.block)
+                    return
+        if node.else_block:
+            self.visit(node.else_block)
+
+    def visit_WhileNode(self, node):
+        try:
+            while self.visit(node.condition):
+                self.visit(node.block)
+        except _BreakSignal:
+            pass
+
+    def visit_ForNode(self, node):
+        self.visit(node.init)
+        try:
+            while self.visit(node.condition):
+                self.visit(node.block)
+                self.visit(node.update)
+        except _BreakSignal:
+            pass
+
+    def visit_InputNode(self, node):
+        prompt = self.visit(node.prompt_expr) if node.prompt_expr else ''
+        # One line per comma separated group; every name of a chain gets the same value
+        for i, group in enumerate(node.target_groups):
+            text = self.input_fn(prompt)
+            prompt = ''
+            for j, var_name in enumerate(group):
+                scope = self._scope_of(var_name)
+                type_name = node.target_types[i][j] if node.target_types else scope.types[var_name]
+                scope.values[var_name] = parse_value(text, type_name)
+
+    def visit_OutputNode(self, node):
+        self.output_fn(self.visit(node.expr))
+
+    def visit_ReturnNode(self, node):
+        value = self.visit(node.expr) if node.expr else None
+        raise _ReturnSignal(value)
+
+    def visit_BreakNode(self, node):
+        raise _BreakSignal()
+
+    def visit_FuncCallStmtNode(self, node):
+        self._call(node.name, node.args)
+
+    # --- Expressions ---
+
+    def visit_LiteralNode(self, node):
+        return node.value
+
+    def visit_VarAccessNode(self, node):
+        return self._scope_of(node.name).values[node.name]
+
+    def visit_BinOpNode(self, node):
+        op = node.op
+        # Short-circuit logic
+        if op == '&&':
+            return self.visit(node.left) and self.visit(node.right)
+        if op == '||':
+            return self.visit(node.left) or self.visit(node.right)
+
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+
+        if op in _ARITHMETIC:
+            try:
+                if op == '+':
+                    if type(left) is str or type(right) is str:
+                        return format_value(left) + format_value(right)
+                    return left + right
+                if op == '-':
+                    return left - right
+                if op == '*':
+                    return left * right
+                if op == '/':
+                    if type(left) is int and type(right) is int:
+                        return int_div(left, right)
+                    return float_div(left, right)
+                if type(left) is int and type(right) is int:
+                    return int_mod(left, right)
+                return float_mod(left, right)
+            except OverflowError:
+                # rank promoted to rate by a mixed operation (not lowered tree)
+                raise PlayRuntimeError("Rank too large for a rate") from None
+        if op == '==':
+            return left == right
+        if op == '<>':
+            return left != right
+        if op == '<':
+            return left < right
+        if op == '<=':
+            return left <= right
+        if op == '>':
+            return left > right
+        if op == '>=':
+            return left >= right
+        raise PlayRuntimeError(f"Unknown operator {op}")
+
+    def visit_UnaryOpNode(self, node):
+        value = self.visit(node.expr)
+        op = node.op
+        if op == '!':
+            return not value
+        if op == '-':
+            return -value
+        # '+' and '-->' return the value unchanged
+        return value
+
+    def visit_FunCallExprNode(self, node):
+        return self._call(node.name, node.args)
+
+    def _call(self, name, args):
+        fun_node = self.functions[name]
+        # Arguments are evaluated in the caller's scope, left to right
+        values = [self.visit(arg) for arg in args]
+        if self.promote:
+            values = [to_rate(value) if param.type_name == 'rate' and type(value) is int else value
+                      for param, value in zip(fun_node.params, values)]
+        return self._invoke(fun_node, values)
+
+    def _invoke(self, fun_node, values):
+        # One activation of fun_node with already evaluated arguments
+        name = fun_node.name
+        key = None
+        if name in self.memoized:
+            key = memo_key(name, values)
+            result = self.memo.lookup(key)
+            if result is not MISSING:
+                return result
+
+        frame = Scope()
+        for param, value in zip(fun_node.params, values):
+            frame.declare(param.name, param.type_name, value)
+
+        saved_locals = self.locals
+        self.locals = frame
+        try:
+            self.visit(fun_node.body)
+            result = None
+        except _ReturnSignal as ret:
+            result = ret.value
+        finally:
+            self.locals = saved_locals
+
+        if self.promote and fun_node.ret_type == 'rate' and type(result) is int:
+            result = to_rate(result)
+        if key is not None:
+            self.memo.store(key, result)
+        return result
+
+    # --- Lowered tree ---
+
+    def visit_RankBinOpNode(self, node):
+        return _RANK_OPS[node.op](self.visit(node.left), self.visit(node.right))
+
+    def visit_RateBinOpNode(self, node):
+        return _RATE_OPS[node.op](self.visit(node.left), self.visit(node.right))
+
+    def visit_LabelConcatNode(self, node):
+        return self.visit(node.left) + self.visit(node.right)
+
+    def visit_LabelJoinNode(self, node):
+        template = self.templates.get(id(node))
+        if template is None:
+            template = self.templates[id(node)] = self._compile_template(node)
+        fmt, args = template
+        visit = self.visit
+        return fmt % tuple([visit(arg) for arg in args])
+
+    def _compile_template(self, node):
+        # One '%s' format per join: constants are baked into the format string,
+        # rank/rate conversions are left to '%s' (same text as str()).
+        pieces = []
+        args = []
+        for part in node.parts:
+            if isinstance(part, LiteralNode):
+                pieces.append(part.value.replace('%', '%%'))
+                continue
+            if isinstance(part, (RankToLabelNode, RateToLabelNode)):
+                part = part.expr
+            pieces.append('%s')
+            args.append(part)
+        return ''.join(pieces), args
+
+    def _compare(self, node):
+        return _COMPARE_OPS[node.op](self.visit(node.left), self.visit(node.right))
+
+    visit_RankCompareNode = _compare
+    visit_RateCompareNode = _compare
+    visit_LabelCompareNode = _compare
+    visit_FlagCompareNode = _compare
+
+    def visit_LogicOpNode(self, node):
+        if node.op == '&&':
+            return self.visit(node.left) and self.visit(node.right)
+        return self.visit(node.left) or self.visit(node.right)
+
+    def visit_NotNode(self, node):
+        return not self.visit(node.expr)
+
+    def _negate(self, node):
+        return -self.visit(node.expr)
+
+    visit_RankNegNode = _negate
+    visit_RateNegNode = _negate
+
+    def visit_RankToRateNode(self, node):
+        return to_rate(self.visit(node.expr))
+
+    def visit_RankToLabelNode(self, node):
+        return str(self.visit(node.expr))
+
+    visit_RateToLabelNode = visit_RankToLabelNode
+
+    def visit_FlagToLabelNode(self, node):
+        return 'true' if self.visit(node.expr) else 'false'
@@ -0,0 +1,46 @@
+import pickle
+
+from ..frontend.ast_node import ProgramNode, BlockNode
+from ..optimizer.purity import pure_functions, memoizable_functions
+from .bytecode import BytecodeCompiler
+
+LIBRARY_SUFFIX = '.playlib'
+
+class Library:
+    """
+    A set of actions compiled once: their signatures in the form registered
+    by the SemanticAnalyzer ({'params': [type codes], 'ret': type code}),
+    the lowered bodies run by the Interpreter, their bytecode for the VM and
+    which of them are pure.
+
+    A program lists the libraries it uses in ProgramNode.libraries: its
+    calls are checked against the signatures only and the bodies are linked
+    when it is run or compiled to bytecode (see link_code), so library code
+    is never parsed or analyzed again.
+    """
+    def __init__(self, name, signatures, functions, code, pure, memoized):
+        self.name = name
+        self.signatures = signatures  # action name -> signature, in definition order
+        self.functions = functions    # lowered FunNode, same order
+        self.code = code              # CodeObject, same order; calls index this list
+        self.pure = pure
+        self.memoized = memoized
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            library = pickle.load(f)
+        if not isinstance(library, Library):
+            raise ValueError(f"'{path}' is not a Play library")
+        return library
+
+def build_library(name, lowered, signatures):
+    """Library from the lowered tree of a library source (actions only)."""
+    functions = list(lowered.functions)
+    module = BytecodeCompiler().compile_program(ProgramNode([], functions, BlockNode([])))
+    return Library(name, signatures, functions, module.functions,
+                   pure_functions(lowered), memoizable_functions(lowered))
@@ -0,0 +1,671 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from ..frontend.ast_node import *
+from ..optimizer.ast_utils import iter_stmts, iter_expr, stmt_exprs, stmt_writes, linked_functions
+from ..optimizer.purity import memoizable_functions
+from ..optimizer.cfg import build_cfg
+from ..optimizer.dataflow import maybe_undeclared_accesses
+from ..runtime.errors import PlayRuntimeError
+
+_RUNTIME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'play_runtime.h')
+
+C_TYPES = {'rank': 'int64_t', 'rate': 'double', 'flag': 'bool', 'label': 'PlayLabel', 'void': 'void'}
+C_DEFAULTS = {'rank': '0', 'rate': '0.0', 'flag': 'false', 'label': 'PLAY_EMPTY'}
+CFLAGS = ['-O2', '-std=c99', '-ffp-contract=off']
+# Entries of the direct-mapped result cache of every memoized action
+MEMO_SIZE = 4096
+
+_RANK_FUNCTIONS = {'+': 'play_radd', '-': 'play_rsub', '*': 'play_rmul', '/': 'play_rdiv', '%': 'play_rmod'}
+_RATE_FUNCTIONS = {'/': 'play_fdiv', '%': 'play_fmod'}
+_C_COMPARE = {'==': '==', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_TO_LABEL = {RankToLabelNode: 'play_rank_label', RateToLabelNode: 'play_rate_label',
+             FlagToLabelNode: 'play_flag_label'}
+
+class NativeError(Exception):
+    pass
+
+def _type_of(node):
+    if isinstance(node, LiteralNode):
+        return node.type_tag
+    return node.type_name
+
+def _has_call(node):
+    return any(isinstance(sub, FunCallExprNode) for sub in iter_expr(node))
+
+def c_string(text):
+    """C literal of the UTF-8 bytes of text, and its length in bytes."""
+    data = text.encode('utf-8')
+    pieces = []
+    for byte in data:
+        char = chr(byte)
+        if char in '"\\?':
+            pieces.append('\\' + char)
+        elif 32 <= byte < 127:
+            pieces.append(char)
+        else:
+            pieces.append(f'\\{byte:03o}')
+    return '"' + ''.join(pieces) + '"', len(data)
+
+class CGenerator:
+    """
+    Translates a lowered program (SemanticAnalyzer(lower=True)) to one C
+    translation unit: the runtime (play_runtime.h), then one static
+    function per action and play_program for the global declarations and
+    the play block.
+
+    Names are resolved like the BytecodeCompiler: globals and variables of
+    the play block are g_<name>, in an action a name is the local l_<name>
+    only after its declaration. The operands of an operator or call are
+    evaluated left to right: when an operand calls an action or may fail
+    (division, rank overflow, undefined variable), the others but the last
+    go through temporaries (the order of C function arguments is
+    unspecified). A label global read by such an expression is copied,
+    since a call may reassign it.
+
+    Pure actions without label parameters or result are memoized, as by the
+    Interpreter and the VM: each has a direct-mapped cache of MEMO_SIZE
+    results in front of its body.
+
+    Statements that build labels or call actions release their scratch
+    memory when they end; labels stored in variables are heap copies owned
+    by the variable (label parameters only when the action assigns them).
+
+    A variable whose declaration may not have run when it is read or
+    assigned (declared in a branch or a loop) has a flag d_<name>, checked
+    before the access: it fails with "not defined" like the Interpreter.
+
+    drop and grab behave like PlayIO, with two differences: rank is a
+    64-bit integer (an overflow is the runtime error "rank overflow") and
+    grab only accepts ASCII digits. An optimized program must be compiled
+    with compile_source(rank_overflow=True), so that no pass moves rank
+    arithmetic where it would overflow sooner.
+    """
+    def generate(self, program):
+        self.functions = linked_functions(program)
+        self.leaky = self._leaky_functions()
+        memoized = memoizable_functions(program)
+        for library in program.libraries:
+            memoized |= library.memoized
+        self.memoized = [f for f in self.functions if f.name in memoized and f.ret_type != 'label'
+                         and all(p.type_name != 'label' for p in f.params)]
+        self.memoized_names = {f.name for f in self.memoized}
+        self.global_types = {}
+        for decl in program.global_decls:
+            for var_init in decl.var_list:
+                for name in var_init.names:
+                    self.global_types[name] = decl.type_name
+        for stmt in iter_stmts(program.main_block):
+            if isinstance(stmt, VarDeclNode):
+                for var_init in stmt.var_list:
+                    for name in var_init.names:
+                        self.global_types[name] = stmt.type_name
+
+        with open(_RUNTIME_PATH, 'r') as f:
+            out = [f.read(), '/* --- Program --- */', '']
+        for name, type_name in self.global_types.items():
+            initial = '{"", 0}' if type_name == 'label' else C_DEFAULTS[type_name]
+            out.append(f'static {C_TYPES[type_name]} g_{name} = {initial};')
+        out.append('')
+        for fun_node in self.functions:
+            out.append(self._signature(fun_node) + ';')
+            if fun_node in self.memoized:
+                out.append(self._signature(fun_node, '_body') + ';')
+        out.append('')
+        for fun_node in self.memoized:
+            out.extend(self._memo_table(fun_node))
+        out.append('')
+        for fun_node in self.functions:
+            out.extend(self._function(fun_node))
+            out.append('')
+
+        out.append('static void play_reset_globals(void) {')
+        for name, type_name in self.global_types.items():
+            if type_name == 'label':
+                out.append(f'    play_label_free(&g_{name});')
+            else:
+                out.append(f'    g_{name} = {C_DEFAULTS[type_name]};')
+        for fun_node in self.memoized:
+            out.append(f'    memset(m_{fun_node.name}, 0, sizeof m_{fun_node.name});')
+        out.append('}')
+        out.append('')
+        main_body = BlockNode(list(program.global_decls) + list(program.main_block.statements))
+        out.extend(self._code('static void play_program(void)', main_body, None))
+        return '\n'.join(out) + '\n'
+
+    def _allocates(self, node):
+        """The expression may leave label temporaries in the scratch arena."""
+        for sub in iter_expr(node):
+            if isinstance(sub, FunCallExprNode):
+                if sub.name in self.leaky:
+                    return True
+            elif _type_of(sub) == 'label' and not isinstance(sub, (LiteralNode, VarAccessNode)):
+                return True
+        return False
+
+    def _leaky_functions(self):
+        # Scratch memory of a reward survives the return: actions returning a
+        # label, or whose reward expressions allocate, leave it to the caller
+        self.leaky = {f.name for f in self.functions if f.ret_type == 'label'}
+        changed = True
+        while changed:
+            changed = False
+            for fun_node in self.functions:
+                if fun_node.name in self.leaky:
+                    continue
+                if any(isinstance(stmt, ReturnNode) and stmt.expr is not None and self._allocates(stmt.expr)
+                       for stmt in iter_stmts(fun_node.body)):
+                    self.leaky.add(fun_node.name)
+                    changed = True
+        return self.leaky
+
+    # --- Functions ---
+
+    def _signature(self, fun_node, suffix=''):
+        params = ', '.join(f'{C_TYPES[p.type_name]} l_{p.name}' for p in fun_node.params) or 'void'
+        return f'static {C_TYPES[fun_node.ret_type]} f_{fun_node.name}{suffix}({params})'
+
+    def _function(self, fun_node):
+        if fun_node not in self.memoized:
+            return self._code(self._signature(fun_node), fun_node.body, fun_node)
+        name = fun_node.name
+        params = [p.name for p in fun_node.params]
+        key = ' && '.join(f'play_same_rate(entry->a{i}, l_{p.name})' if p.type_name == 'rate'
+                          else f'entry->a{i} == l_{p.name}'
+                          for i, p in enumerate(fun_node.params)) or 'true'
+        lines = [self._signature(fun_node) + ' {',
+                 '    uint64_t hash = 0;']
+        for param in fun_node.params:
+            lines.append(f'    hash = play_hash_{param.type_name}(hash, l_{param.name});')
+        lines += [f'    struct m_{name}_entry *entry = &m_{name}[hash % {MEMO_SIZE}];',
+                  f'    if (entry->used && {key}) {{',
+                  '        return entry->result;',
+                  '    }',
+                  f"    {C_TYPES[fun_node.ret_type]} result = f_{name}_body({', '.join('l_' + p for p in params)});",
+                  '    entry->used = true;']
+        lines += [f'    entry->a{i} = l_{p};' for i, p in enumerate(params)]
+        lines += ['    entry->result = result;', '    return result;', '}', '']
+        return lines + self._code(self._signature(fun_node, '_body'), fun_node.body, fun_node)
+
+    def _memo_table(self, fun_node):
+        fields = ''.join(f' {C_TYPES[p.type_name]} a{i};' for i, p in enumerate(fun_node.params))
+        return [f'static struct m_{fun_node.name}_entry {{ bool used;{fields} '
+                f'{C_TYPES[fun_node.ret_type]} result; }} m_{fun_node.name}[{MEMO_SIZE}];']
+
+    def _code(self, header, body, fun_node):
+        self.fun_node = fun_node
+        self.temps = []
+        self.local_types = {}
+        self.locals = set()
+        self.owned = []  # label variables freed when the action returns
+        self.copy_globals = False
+        params = [p.name for p in fun_node.params] if fun_node is not None else []
+        self.unsure = {name for _, name in maybe_undeclared_accesses(build_cfg(body, params))}
+        prologue = []
+        self.entry_mark = None
+        if fun_node is not None:
+            assigned = set()
+            self_tail = False
+            for stmt in iter_stmts(body):
+                assigned |= stmt_writes(stmt)
+                if isinstance(stmt, ReturnNode) and isinstance(stmt.expr, FunCallExprNode) \
+                        and stmt.expr.name == fun_node.name:
+                    self_tail = True
+            for param in fun_node.params:
+                self.locals.add(param.name)
+                self.local_types[param.name] = param.type_name
+                if param.type_name == 'label' and (param.name in assigned or self_tail):
+                    prologue.append(f'l_{param.name} = play_label_dup(l_{param.name});')
+                    self.owned.append(f'l_{param.name}')
+            for stmt in iter_stmts(body):
+                if isinstance(stmt, VarDeclNode):
+                    for name in (name for var_init in stmt.var_list for name in var_init.names):
+                        if name not in self.local_types:
+                            self.local_types[name] = stmt.type_name
+                            if stmt.type_name == 'label':
+                                self.owned.append(f'l_{name}')
+            if self_tail:
+                self.entry_mark = self._temp('mark')
+                prologue += [f'{self.entry_mark} = play_mark();', 'play_tail:;']
+
+        lines = []
+        self._stmt(body, lines, 1)
+        if fun_node is not None and not (body.statements and isinstance(body.statements[-1], ReturnNode)):
+            lines.extend(self._return_lines(None, 1))
+
+        decls = []
+        for name, type_name in self.local_types.items():
+            if name not in params:
+                decls.append(f'    {C_TYPES[type_name]} l_{name} = {C_DEFAULTS[type_name]};')
+        for name in sorted(self.unsure):
+            decls.append(f'    bool d_{name} = false;')
+        for c_type, temp in self.temps:
+            decls.append(f'    {c_type} {temp};')
+        return [header + ' {'] + decls + ['    ' + line for line in prologue] + lines + ['}']
+
+    def _temp(self, type_name):
+        name = f't{len(self.temps)}'
+        self.temps.append(('PlayMark' if type_name == 'mark' else C_TYPES[type_name], name))
+        return name
+
+    def _var(self, name):
+        return f'l_{name}' if name in self.locals else f'g_{name}'
+
+    def _var_type(self, name):
+        if name in self.locals:
+            return self.local_types[name]
+        return self.global_types[name]
+
+    def _return_lines(self, node, depth):
+        pad = '    ' * depth
+        fun_node = self.fun_node
+        frees = [f'{pad}play_label_free(&{name});' for name in self.owned]
+        if node is None or node.expr is None:
+            if fun_node.ret_type == 'void':
+                return frees + [f'{pad}return;']
+            # Falling off the end of an action that returns a value
+            return frees + [f'{pad}return {C_DEFAULTS[fun_node.ret_type]};']
+        call = node.expr if isinstance(node.expr, FunCallExprNode) else None
+        if call is not None and call.name == fun_node.name:
+            return self._self_tail_call(call, depth)
+        if call is not None:
+            # Tail call: like the VM's TAIL_CALL it skips the memo cache, so
+            # the C compiler can turn it into a jump
+            value = self._call(call.name, call.args, tail=True)
+        else:
+            value = self._expr(node.expr)
+        if fun_node.ret_type == 'label':
+            # The result can be a local about to be freed: the copy lives until the caller's statement ends
+            value = f'play_label_temp({value})'
+        if not frees:
+            return [f'{pad}return {value};']
+        result = self._temp(fun_node.ret_type)
+        return [f'{pad}{result} = {value};'] + frees + [f'{pad}return {result};']
+
+    def _self_tail_call(self, call, depth):
+        # 'reward f(...)' inside f: new parameter values, then back to the top
+        pad = '    ' * depth
+        lines = []
+        temps = []
+        for param, arg in zip(self.fun_node.params, call.args):
+            temp = self._temp(param.type_name)
+            value = self._expr(arg)
+            if param.type_name == 'label':
+                value = f'play_label_dup({value})'
+            lines.append(f'{pad}{temp} = {value};')
+            temps.append(temp)
+        # Scratch memory of this activation is not needed any more
+        lines.append(f'{pad}play_reset({self.entry_mark});')
+        for param, temp in zip(self.fun_node.params, temps):
+            if param.type_name == 'label':
+                lines.append(f'{pad}play_label_free(&l_{param.name});')
+            lines.append(f'{pad}l_{param.name} = {temp};')
+        # Locals start over as in a new call
+        params = {p.name for p in self.fun_node.params}
+        for name, type_name in self.local_types.items():
+            if name in params:
+                continue
+            if type_name == 'label':
+                lines.append(f'{pad}play_label_free(&l_{name});')
+            else:
+                lines.append(f'{pad}l_{name} = {C_DEFAULTS[type_name]};')
+        for name in sorted(self.unsure):
+            lines.append(f'{pad}d_{name} = false;')
+        lines.append(f'{pad}goto play_tail;')
+        return lines
+
+    # --- Statements ---
+
+    def _stmt(self, node, lines, depth):
+        pad = '    ' * depth
+        if isinstance(node, BlockNode):
+            for stmt in node.statements:
+                self._stmt(stmt, lines, depth)
+            return
+
+        if isinstance(node, (IfNode, WhileNode, ForNode, BreakNode, ReturnNode)):
+            self._control(node, lines, depth)
+            return
+
+        exprs = stmt_exprs(node)
+        self.copy_globals = any(_has_call(expr) for expr in exprs)
+        body = []
+        if isinstance(node, VarDeclNode):
+            for var_init in node.var_list:
+                value = self._expr(var_init.expr) if var_init.expr is not None else C_DEFAULTS[node.type_name]
+                if self.fun_node is not None:
+                    self.locals.update(var_init.names)
+                body.extend(self._store_all(var_init.names, value))
+                body.extend(f'd_{name} = true;' for name in var_init.names if name in self.unsure)
+        elif isinstance(node, AssignNode):
+            body.append(self._store(node.target, self._expr(node.expr)))
+            body.extend(self._check_declared([node.target]))
+        elif isinstance(node, MultiAssignNode):
+            promoted = [name for name, type_name in zip(node.targets, node.target_types)
+                        if type_name == 'rate' and 'rank' in node.target_types]
+            names = [name for name in node.targets if name not in promoted]
+            body.extend(self._store_all(names, self._expr(node.expr), promoted))
+            body.extend(self._check_declared(node.targets))
+        elif isinstance(node, OutputNode):
+            body.append(f'play_drop({self._expr(node.expr)});')
+        elif isinstance(node, FuncCallStmtNode):
+            body.append(self._call(node.name, node.args) + ';')
+        elif isinstance(node, InputNode):
+            body.extend(self._input(node))
+        else:
+            raise NativeError(f"Cannot compile {type(node).__name__}")
+
+        if isinstance(node, InputNode) or any(self._allocates(expr) for expr in exprs):
+            mark = self._temp('mark')
+            body = [f'{mark} = play_mark();'] + body + [f'play_reset({mark});']
+        lines.extend(pad + line for line in body)
+
+    def _check_declared(self, names):
+        # After the store: the value is computed (with its side effects) first, as in the Interpreter
+        return [f'if (!d_{name}) play_undefined("{name}");' for name in names if self._unsure(name)]
+
+    def _unsure(self, name):
+        # In an action a name read before its declaration is the global
+        return name in self.unsure and (self.fun_node is None or name in self.locals)
+
+    def _store(self, name, value):
+        if self._var_type(name) == 'label':
+            return f'play_label_set(&{self._var(name)}, {value});'
+        return f'{self._var(name)} = {value};'
+
+    def _store_all(self, names, value, promoted=()):
+        # The value is computed once: the other names copy the first one
+        # (an owned label copy, even if the value was a scratch temporary)
+        first = self._var(names[0])
+        lines = [self._store(names[0], value)]
+        lines.extend(self._store(name, first) for name in names[1:])
+        lines.extend(f'{self._var(name)} = (double){first};' for name in promoted)
+        return lines
+
+    def _input(self, node):
+        prompt = self._expr(node.prompt_expr) if node.prompt_expr is not None else 'PLAY_EMPTY'
+        line = self._temp('label')
+        body = []
+        for i, (group, types) in enumerate(zip(node.target_groups, node.target_types)):
+            body.append(f'{line} = play_read_line({prompt if i == 0 else "PLAY_EMPTY"});')
+            for name, type_name in zip(group, types):
+                if type_name == 'label':
+                    body.append(self._store(name, line))
+                else:
+                    body.append(self._store(name, f'play_parse_{type_name}({line})'))
+            body.extend(self._check_declared(group))
+        return body
+
+    def _condition(self, node):
+        """(lines evaluating the condition, C expression of its value)."""
+        self.copy_globals = _has_call(node)
+        value = self._expr(node)
+        if not self._allocates(node):
+            return [], value
+        mark = self._temp('mark')
+        flag = self._temp('flag')
+        return [f'{mark} = play_mark();', f'{flag} = {value};', f'play_reset({mark});'], flag
+
+    def _control(self, node, lines, depth):
+        pad = '    ' * depth
+        if isinstance(node, BreakNode):
+            lines.append(f'{pad}break;')
+
+        elif isinstance(node, ReturnNode):
+            self.copy_globals = node.expr is not None and _has_call(node.expr)
+            lines.extend(self._return_lines(node, depth))
+
+        elif isinstance(node, IfNode):
+            branches = [(node.condition, node.then_block)]
+            branches += [(e.condition, e.block) for e in (node.elifs or [])]
+            closing = 0
+            for i, (condition, block) in enumerate(branches):
+                setup, value = self._condition(condition)
+                inner = '    ' * (depth + closing)
+                lines.extend(inner + line for line in setup)
+                lines.append(f'{inner}if ({value}) {{')
+                self._stmt(block, lines, depth + closing + 1)
+                if i + 1 < len(branches) or node.else_block:
+                    lines.append(f'{inner}}} else {{')
+                    closing += 1
+                else:
+                    lines.append(f'{inner}}}')
+            if node.else_block:
+                self._stmt(node.else_block, lines, depth + closing)
+            for level in range(closing - 1, -1, -1):
+                lines.append('    ' * (depth + level) + '}')
+
+        elif isinstance(node, WhileNode):
+            self._loop(node.condition, node.block, None, lines, depth)
+
+        elif isinstance(node, ForNode):
+            self._stmt(node.init, lines, depth)
+            self._loop(node.condition, node.block, node.update, lines, depth)
+
+    def _loop(self, condition, block, update, lines, depth):
+        pad = '    ' * depth
+        setup, value = self._condition(condition)
+        if setup:
+            lines.append(f'{pad}for (;;) {{')
+            lines.extend(f'{pad}    {line}' for line in setup)
+            lines.append(f'{pad}    if (!{value}) break;')
+        else:
+            lines.append(f'{pad}while ({value}) {{')
+        self._stmt(block, lines, depth + 1)
+        if isinstance(update, ExprNode):
+            self.copy_globals = _has_call(update)
+            body = [f'(void)({self._expr(update)});']
+            if self._allocates(update):
+                mark = self._temp('mark')
+                body = [f'{mark} = play_mark();'] + body + [f'play_reset({mark});']
+            lines.extend(f'{pad}    {line}' for line in body)
+        elif update is not None:
+            self._stmt(update, lines, depth + 1)
+        lines.append(f'{pad}}}')
+
+    # --- Expressions ---
+
+    def _operands(self, nodes):
+        """C expressions of nodes, evaluated left to right; returns (assignments, expressions)."""
+        codes = [self._expr(node) for node in nodes]
+        prefix = []
+        if not any(self._has_effect(node) for node in nodes):
+            return prefix, codes
+        calls = any(_has_call(node) for node in nodes)
+        for i, node in enumerate(nodes[:-1]):
+            if isinstance(node, LiteralNode):
+                continue
+            if (isinstance(node, VarAccessNode) and not self._unsure(node.name)
+                    and (node.name in self.locals or not calls)):
+                continue
+            temp = self._temp(_type_of(node))
+            prefix.append(f'{temp} = {codes[i]}')
+            codes[i] = temp
+        return prefix, codes
+
+    def _has_effect(self, node):
+        """Whether evaluating node may call an action or fail (division, rank overflow, undefined variable)."""
+        for sub in iter_expr(node):
+            if isinstance(sub, (FunCallExprNode, RankBinOpNode, RankNegNode)):
+                return True
+            if isinstance(sub, RateBinOpNode) and sub.op in _RATE_FUNCTIONS:
+                return True
+            if isinstance(sub, VarAccessNode) and self._unsure(sub.name):
+                return True
+        return False
+
+    @staticmethod
+    def _sequenced(prefix, code):
+        return f"({', '.join(prefix + [code])})" if prefix else code
+
+    def _call(self, name, args, tail=False):
+        prefix, codes = self._operands(args)
+        suffix = '_body' if tail and name in self.memoized_names else ''
+        return self._sequenced(prefix, f"f_{name}{suffix}({', '.join(codes)})")
+
+    def _binary(self, node, make):
+        prefix, (left, right) = self._operands([node.left, node.right])
+        return self._sequenced(prefix, make(left, right))
+
+    def _expr(self, node):
+        if isinstance(node, LiteralNode):
+            return self._literal(node)
+        if isinstance(node, VarAccessNode):
+            name = self._var(node.name)
+            if node.type_name == 'label' and self.copy_globals and node.name not in self.locals:
+                name = f'play_label_temp({name})'
+            if self._unsure(node.name):
+                return f'(d_{node.name} ? (void)0 : play_undefined("{node.name}"), {name})'
+            return name
+        if isinstance(node, FunCallExprNode):
+            return self._call(node.name, node.args)
+        if isinstance(node, RankBinOpNode):
+            function = _RANK_FUNCTIONS[node.op]
+            return self._binary(node, lambda a, b: f'{function}({a}, {b})')
+        if isinstance(node, RateBinOpNode):
+            if node.op in _RATE_FUNCTIONS:
+                function = _RATE_FUNCTIONS[node.op]
+                return self._binary(node, lambda a, b: f'{function}({a}, {b})')
+            return self._binary(node, lambda a, b: f'({a} {node.op} {b})')
+        if isinstance(node, LabelCompareNode):
+            op = _C_COMPARE[node.op]
+            return self._binary(node, lambda a, b: f'(play_label_cmp({a}, {b}) {op} 0)')
+        if isinstance(node, (RankCompareNode, RateCompareNode, FlagCompareNode)):
+            op = _C_COMPARE[node.op]
+            return self._binary(node, lambda a, b: f'({a} {op} {b})')
+        if isinstance(node, LogicOpNode):
+            # && and || are sequenced and short-circuit in C too
+            op = '&&' if node.op == '&&' else '||'
+            return f'({self._expr(node.left)} {op} {self._expr(node.right)})'
+        if isinstance(node, NotNode):
+            return f'(!{self._expr(node.expr)})'
+        if isinstance(node, RankNegNode):
+            return f'play_rneg({self._expr(node.expr)})'
+        if isinstance(node, RateNegNode):
+            return f'(-{self._expr(node.expr)})'
+        if isinstance(node, RankToRateNode):
+            if isinstance(node.expr, LiteralNode):
+                return self._rate_literal(float(node.expr.value))
+            return f'((double){self._expr(node.expr)})'
+        if type(node) in _TO_LABEL:
+            return f'{_TO_LABEL[type(node)]}({self._expr(node.expr)})'
+        if isinstance(node, LabelConcatNode):
+            return self._binary(node, lambda a, b: f'play_concat({a}, {b})')
+        if isinstance(node, LabelJoinNode):
+            prefix, codes = self._operands(node.parts)
+            parts = ', '.join(codes)
+            return self._sequenced(prefix, f'play_join({len(codes)}, (PlayLabel[]){{{parts}}})')
+        raise NativeError(f"Cannot compile {type(node).__name__}")
+
+    def _literal(self, node):
+        if node.type_tag == 'rank':
+            if not -2**63 < node.value < 2**63:
+                raise NativeError(f"rank constant {node.value} does not fit in 64 bits")
+            return f'INT64_C({node.value})'
+        if node.type_tag == 'rate':
+            return self._rate_literal(node.value)
+        if node.type_tag == 'flag':
+            return 'true' if node.value else 'false'
+        literal, length = c_string(node.value)
+        return f'((PlayLabel){{{literal}, {length}}})'
+
+    @staticmethod
+    def _rate_literal(value):
+        # repr() reads back as the same double; a C double literal needs '.' or an exponent
+        text = repr(value)
+        if text in ('inf', '-inf', 'nan'):
+            return {'inf': 'INFINITY', '-inf': '(-INFINITY)', 'nan': 'NAN'}[text]
+        if '.' not in text and 'e' not in text:
+            text += '.0'
+        return f'({text})' if text.startswith('-') else text
+
+# --- Build and run ---
+
+def default_cache_dir():
+    """PLAY_NATIVE_CACHE, or play_lang/native in the user cache directory."""
+    if os.environ.get('PLAY_NATIVE_CACHE'):
+        return os.environ['PLAY_NATIVE_CACHE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'play_lang', 'native')
+
+def find_compiler(cc=None):
+    compiler = shutil.which(cc or os.environ.get('CC', 'cc'))
+    if compiler is None:
+        raise NativeError(f"C compiler '{cc or os.environ.get('CC', 'cc')}' not found")
+    return compiler
+
+class NativeBuild:
+    """A compiled program: path of the executable or shared library, and whether it came from the cache."""
+    def __init__(self, path, kind, cached):
+        self.path = path
+        self.kind = kind
+        self.cached = cached
+
+def build_native(program, kind='executable', cache_dir=None, cc=None, source=None):
+    """
+    Compiles a lowered program to an executable (kind='executable', run with
+    run_native) or a shared library (kind='shared', exports
+    int play_run(int echo_prompts) and const char *play_last_error(void)).
+
+    Builds are cached in cache_dir (default_cache_dir()) under the SHA-256
+    of the C source, compiler and flags: compiling the same program again
+    only looks the file up. source is the C code if already generated.
+    """
+    if kind not in ('executable', 'shared'):
+        raise ValueError(f"Unknown native build kind '{kind}'")
+    if source is None:
+        source = CGenerator().generate(program)
+    compiler = find_compiler(cc)
+    flags = list(CFLAGS)
+    if kind == 'shared':
+        flags += ['-shared', '-fPIC', '-DPLAY_SHARED']
+    key = hashlib.sha256('\0'.join([source, compiler] + flags).encode('utf-8')).hexdigest()[:32]
+
+    cache_dir = cache_dir or default_cache_dir()
+    suffix = '.so' if kind == 'shared' else ('.exe' if sys.platform == 'win32' else '')
+    path = os.path.join(cache_dir, f'play_{key}{suffix}')
+    if os.path.exists(path):
+        return NativeBuild(path, kind, cached=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as work_dir:
+        c_path = os.path.join(work_dir, 'program.c')
+        with open(c_path, 'w') as f:
+            f.write(source)
+        output = os.path.join(work_dir, 'program' + suffix)
+        result = subprocess.run([compiler] + flags + ['-o', output, c_path, '-lm'],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise NativeError(f"C compilation failed:\n{result.stderr}")
+        # Atomic: a concurrent build of the same program writes the same file
+        os.replace(output, path)
+    return NativeBuild(path, kind, cached=False)
+
+def run_native(build, io):
+    """
+    Runs a native executable with the input and output of a PlayIO. Input
+    not read yet is passed on stdin (a terminal is used directly); output
+    and prompts are written to the PlayIO's output stream. A runtime error
+    of the program raises PlayRuntimeError after its output is written.
+    """
+    if build.kind != 'executable':
+        raise NativeError("run_native needs an executable build")
+    command = [build.path] if io.echo_prompts else [build.path, '--no-prompts']
+    io.flush()
+    lines = io.pending_lines()
+    if lines is None and io.output_stream is sys.stdout:
+        # Interactive session: the program talks to the terminal itself
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+    else:
+        stdin = ''.join(line + '\n' for line in lines or ())
+        result = subprocess.run(command, input=stdin.encode('utf-8'), capture_output=True)
+        io.output_stream.write(result.stdout.decode('utf-8', errors='replace'))
+        io.output_stream.flush()
+    if result.returncode == 2:
+        raise PlayRuntimeError(result.stderr.decode('utf-8', errors='replace').rstrip('\n'))
+    if result.returncode != 0:
+        raise NativeError(f"Native program failed with status {result.returncode}")
@@ -0,0 +1,642 @@
+/*
+ * Runtime of the Play native backend (play_lang.backend.native), pasted at
+ * the top of every generated C file.
+ *
+ * rank is int64_t (overflow is a runtime error), rate is double, flag is
+ * bool and label is PlayLabel: an immutable (pointer, length) pair of UTF-8
+ * bytes. Label temporaries live in a scratch arena released at the end of
+ * the statement that created them (play_mark / play_reset); variables own
+ * a heap copy of their value (play_label_set).
+ *
+ * Output and input follow play_lang.runtime.io.PlayIO: drop writes a line,
+ * grab shows its prompt and reads a line (the whole input at once when it
+ * is not a terminal, split like str.splitlines), and values are parsed like
+ * int() / float() / 'true' / 'false'. Runtime errors print their message
+ * and exit with status 2 (play_run returns 2 in a shared library).
+ */
+#define _POSIX_C_SOURCE 200809L
+#include <inttypes.h>
+#include <math.h>
+#include <setjmp.h>
+#include <stdarg.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#if defined(__unix__) || defined(__APPLE__)
+#include <unistd.h>
+#define PLAY_ISATTY(f) isatty(fileno(f))
+#else
+#define PLAY_ISATTY(f) 0
+#endif
+
+typedef struct { const char *data; size_t len; } PlayLabel;
+
+static const PlayLabel PLAY_EMPTY = {"", 0};
+
+/* --- Errors --- */
+
+static jmp_buf play_trap;
+static char play_error_text[512];
+
+static void play_error(const char *format, ...) {
+    va_list args;
+    va_start(args, format);
+    vsnprintf(play_error_text, sizeof play_error_text, format, args);
+    va_end(args);
+    longjmp(play_trap, 1);
+}
+
+static void play_undefined(const char *name) {
+    play_error("Variable '%s' not defined", name);
+}
+
+static void *play_alloc(size_t size) {
+    void *block = malloc(size ? size : 1);
+    if (block == NULL) {
+        play_error("out of memory");
+    }
+    return block;
+}
+
+/* --- Scratch arena --- */
+
+typedef struct PlayChunk {
+    struct PlayChunk *prev;
+    size_t size, used;
+    char data[];
+} PlayChunk;
+
+typedef struct { PlayChunk *chunk; size_t used; } PlayMark;
+
+static PlayChunk *play_arena = NULL;
+
+static PlayChunk *play_new_chunk(PlayChunk *prev, size_t size) {
+    PlayChunk *chunk = play_alloc(sizeof(PlayChunk) + size);
+    chunk->prev = prev;
+    chunk->size = size;
+    chunk->used = 0;
+    return chunk;
+}
+
+static char *play_scratch(size_t size) {
+    if (play_arena->used + size > play_arena->size) {
+        play_arena = play_new_chunk(play_arena, size > 65536 ? size : 65536);
+    }
+    char *block = play_arena->data + play_arena->used;
+    play_arena->used += size;
+    return block;
+}
+
+static PlayMark play_mark(void) {
+    PlayMark mark = {play_arena, play_arena->used};
+    return mark;
+}
+
+static void play_reset(PlayMark mark) {
+    while (play_arena != mark.chunk) {
+        PlayChunk *prev = play_arena->prev;
+        free(play_arena);
+        play_arena = prev;
+    }
+    play_arena->used = mark.used;
+}
+
+/* --- Labels --- */
+
+static PlayLabel play_label_temp(PlayLabel value) {
+    /* Scratch copy: the value stays valid if its variable is reassigned */
+    char *data = play_scratch(value.len);
+    memcpy(data, value.data, value.len);
+    PlayLabel copy = {data, value.len};
+    return copy;
+}
+
+static PlayLabel play_label_dup(PlayLabel value) {
+    if (value.len == 0) {
+        return PLAY_EMPTY;
+    }
+    char *data = play_alloc(value.len);
+    memcpy(data, value.data, value.len);
+    PlayLabel copy = {data, value.len};
+    return copy;
+}
+
+static void play_label_free(PlayLabel *target) {
+    if (target->len != 0) {
+        free((void *)target->data);
+    }
+    *target = PLAY_EMPTY;
+}
+
+static void play_label_set(PlayLabel *target, PlayLabel value) {
+    PlayLabel copy = play_label_dup(value);  /* before the free: value can be *target */
+    play_label_free(target);
+    *target = copy;
+}
+
+static PlayLabel play_join(size_t count, const PlayLabel *parts) {
+    size_t len = 0;
+    for (size_t i = 0; i < count; i++) {
+        len += parts[i].len;
+    }
+    char *data = play_scratch(len);
+    char *end = data;
+    for (size_t i = 0; i < count; i++) {
+        memcpy(end, parts[i].data, parts[i].len);
+        end += parts[i].len;
+    }
+    PlayLabel result = {data, len};
+    return result;
+}
+
+static PlayLabel play_concat(PlayLabel left, PlayLabel right) {
+    PlayLabel parts[2] = {left, right};
+    return play_join(2, parts);
+}
+
+static int play_label_cmp(PlayLabel left, PlayLabel right) {
+    /* Byte order of UTF-8 is code point order, as for Python str */
+    size_t len = left.len < right.len ? left.len : right.len;
+    int result = len ? memcmp(left.data, right.data, len) : 0;
+    if (result != 0) {
+        return result;
+    }
+    return (left.len > right.len) - (left.len < right.len);
+}
+
+static PlayLabel play_text(const char *text) {
+    size_t len = strlen(text);
+    char *data = play_scratch(len);
+    memcpy(data, text, len);
+    PlayLabel result = {data, len};
+    return result;
+}
+
+static PlayLabel play_rank_label(int64_t value) {
+    char buffer[32];
+    snprintf(buffer, sizeof buffer, "%" PRId64, value);
+    return play_text(buffer);
+}
+
+static PlayLabel play_flag_label(bool value) {
+    return value ? (PlayLabel){"true", 4} : (PlayLabel){"false", 5};
+}
+
+static PlayLabel play_rate_label(double value) {
+    /* repr(float): shortest digits that read back as the same double,
+       positional notation for exponents in [-5, 16), else d.ddde+XX */
+    if (isnan(value)) {
+        return (PlayLabel){"nan", 3};
+    }
+    if (isinf(value)) {
+        return value > 0 ? (PlayLabel){"inf", 3} : (PlayLabel){"-inf", 4};
+    }
+    char scientific[40];
+    for (int precision = 0; precision < 17; precision++) {
+        snprintf(scientific, sizeof scientific, "%.*e", precision, value);
+        if (strtod(scientific, NULL) == value) {
+            break;
+        }
+    }
+    char digits[24];
+    int ndigits = 0;
+    const char *p = scientific;
+    bool negative = *p == '-';
+    if (negative) {
+        p++;
+    }
+    for (; *p != 'e'; p++) {
+        if (*p != '.') {
+            digits[ndigits++] = *p;
+        }
+    }
+    int exponent = atoi(p + 1);
+    while (ndigits > 1 && digits[ndigits - 1] == '0') {
+        ndigits--;
+    }
+
+    char buffer[48];
+    char *out = buffer;
+    if (negative) {
+        *out++ = '-';
+    }
+    int point = exponent + 1;  /* digits before the decimal point */
+    if (point > -4 && point <= 16) {
+        if (point <= 0) {
+            *out++ = '0';
+            *out++ = '.';
+            for (int i = point; i < 0; i++) {
+                *out++ = '0';
+            }
+            memcpy(out, digits, ndigits);
+            out += ndigits;
+        } else if (point >= ndigits) {
+            memcpy(out, digits, ndigits);
+            out += ndigits;
+            for (int i = ndigits; i < point; i++) {
+                *out++ = '0';
+            }
+            *out++ = '.';
+            *out++ = '0';
+        } else {
+            memcpy(out, digits, point);
+            out += point;
+            *out++ = '.';
+            memcpy(out, digits + point, ndigits - point);
+            out += ndigits - point;
+        }
+        *out = '\0';
+    } else {
+        *out++ = digits[0];
+        if (ndigits > 1) {
+            *out++ = '.';
+            memcpy(out, digits + 1, ndigits - 1);
+            out += ndigits - 1;
+        }
+        snprintf(out, sizeof buffer - (out - buffer), "e%c%02d",
+                 exponent < 0 ? '-' : '+', exponent < 0 ? -exponent : exponent);
+    }
+    return play_text(buffer);
+}
+
+/* --- rank arithmetic --- */
+
+static void play_overflow(void) {
+    play_error("rank overflow");
+}
+
+static inline int64_t play_radd(int64_t a, int64_t b) {
+#if defined(__GNUC__) || defined(__clang__)
+    int64_t result;
+    if (__builtin_add_overflow(a, b, &result)) play_overflow();
+    return result;
+#else
+    if ((b > 0 && a > INT64_MAX - b) || (b < 0 && a < INT64_MIN - b)) play_overflow();
+    return a + b;
+#endif
+}
+
+static inline int64_t play_rsub(int64_t a, int64_t b) {
+#if defined(__GNUC__) || defined(__clang__)
+    int64_t result;
+    if (__builtin_sub_overflow(a, b, &result)) play_overflow();
+    return result;
+#else
+    if ((b < 0 && a > INT64_MAX + b) || (b > 0 && a < INT64_MIN + b)) play_overflow();
+    return a - b;
+#endif
+}
+
+static inline int64_t play_rmul(int64_t a, int64_t b) {
+#if defined(__GNUC__) || defined(__clang__)
+    int64_t result;
+    if (__builtin_mul_overflow(a, b, &result)) play_overflow();
+    return result;
+#else
+    if (a != 0 && b != 0) {
+        if ((a == -1 && b == INT64_MIN) || (b == -1 && a == INT64_MIN)) play_overflow();
+        if (a != -1 && b != -1) {
+            int64_t limit = ((a > 0) == (b > 0)) ? INT64_MAX : INT64_MIN;
+            if ((a > 0) == (b > 0) ? (a > 0 ? a > limit / b : a < limit / b)
+                                   : (a > 0 ? b < limit / a : a < limit / b)) play_overflow();
+        }
+    }
+    return a * b;
+#endif
+}
+
+static inline int64_t play_rneg(int64_t a) {
+    if (a == INT64_MIN) play_overflow();
+    return -a;
+}
+
+static inline int64_t play_rdiv(int64_t a, int64_t b) {
+    /* Truncates toward zero, as interpreter.int_div */
+    if (b == 0) play_error("Division by zero");
+    if (b == -1) return play_rneg(a);
+    return a / b;
+}
+
+static inline int64_t play_rmod(int64_t a, int64_t b) {
+    if (b == 0) play_error("Modulo by zero");
+    if (b == -1) return 0;
+    return a % b;
+}
+
+static inline double play_fdiv(double a, double b) {
+    if (b == 0) play_error("Division by zero");
+    return a / b;
+}
+
+static inline double play_fmod(double a, double b) {
+    if (b == 0) play_error("Modulo by zero");
+    if (!isfinite(a)) play_error("Modulo of a non-finite value");
+    return fmod(a, b);
+}
+
+/* --- Memoization keys --- */
+
+static inline uint64_t play_hash_rank(uint64_t hash, int64_t value) {
+    return (hash ^ (uint64_t)value) * UINT64_C(0x100000001b3) + UINT64_C(0x9e3779b97f4a7c15);
+}
+
+static inline uint64_t play_hash_rate(uint64_t hash, double value) {
+    uint64_t bits;
+    memcpy(&bits, &value, sizeof bits);
+    return play_hash_rank(hash, (int64_t)bits);
+}
+
+/* Memo keys compare rates bit by bit: 0.0 == -0.0, but 1.0 / -0.0 is not 1.0 / 0.0 */
+static inline bool play_same_rate(double a, double b) {
+    return memcmp(&a, &b, sizeof a) == 0;
+}
+
+static inline uint64_t play_hash_flag(uint64_t hash, bool value) {
+    return play_hash_rank(hash, value);
+}
+
+/* --- Output --- */
+
+static bool play_echo_prompts = true;
+
+static void play_drop(PlayLabel text) {
+    fwrite(text.data, 1, text.len, stdout);
+    fputc('\n', stdout);
+}
+
+/* --- Input --- */
+
+static char *play_input = NULL;  /* whole non-interactive input */
+static size_t play_input_len = 0, play_input_pos = 0;
+static bool play_input_read = false;
+
+static size_t play_line_break(const char *text, size_t len) {
+    /* Length of the str.splitlines() separator at text, 0 if none */
+    unsigned char c = (unsigned char)text[0];
+    if (c == '\r') return len > 1 && text[1] == '\n' ? 2 : 1;
+    if (c == '\n' || c == '\v' || c == '\f' || (c >= 0x1c && c <= 0x1e)) return 1;
+    if (c == 0xc2 && len > 1 && (unsigned char)text[1] == 0x85) return 2;
+    if (c == 0xe2 && len > 2 && (unsigned char)text[1] == 0x80
+            && ((unsigned char)text[2] == 0xa8 || (unsigned char)text[2] == 0xa9)) return 3;
+    return 0;
+}
+
+static void play_load_input(void) {
+    size_t capacity = 65536;
+    play_input = play_alloc(capacity);
+    size_t count;
+    while ((count = fread(play_input + play_input_len, 1, capacity - play_input_len, stdin)) > 0) {
+        play_input_len += count;
+        if (play_input_len == capacity) {
+            capacity *= 2;
+            char *grown = realloc(play_input, capacity);
+            if (grown == NULL) {
+                play_error("out of memory");
+            }
+            play_input = grown;
+        }
+    }
+    play_input_read = true;
+}
+
+static PlayLabel play_read_line(PlayLabel prompt) {
+    if (play_echo_prompts && prompt.len) {
+        fwrite(prompt.data, 1, prompt.len, stdout);
+    }
+    fflush(stdout);
+
+    if (!play_input_read && PLAY_ISATTY(stdin)) {
+        /* Terminal: one line at a time, like readline().rstrip('\r\n') */
+        size_t capacity = 256, len = 0;
+        char *line = play_scratch(capacity);
+        int c = EOF;
+        while ((c = getchar()) != EOF) {
+            if (len == capacity) {
+                char *grown = play_scratch(capacity * 2);
+                memcpy(grown, line, len);
+                line = grown;
+                capacity *= 2;
+            }
+            line[len++] = (char)c;
+            if (c == '\n') {
+                break;
+            }
+        }
+        if (len == 0) {
+            play_error("grab: end of input");
+        }
+        while (len > 0 && (line[len - 1] == '\n' || line[len - 1] == '\r')) {
+            len--;
+        }
+        return (PlayLabel){line, len};
+    }
+
+    if (!play_input_read) {
+        play_load_input();
+    }
+    if (play_input_pos >= play_input_len) {
+        play_error("grab: end of input");
+    }
+    size_t start = play_input_pos, end = start, separator = 0;
+    while (end < play_input_len && (separator = play_line_break(play_input + end, play_input_len - end)) == 0) {
+        end++;
+    }
+    play_input_pos = end + separator;
+    PlayLabel line = {play_input + start, end - start};
+    return play_label_temp(line);
+}
+
+/* --- Input parsing (int() / float() / flag) --- */
+
+static size_t play_space_at(const unsigned char *s, size_t len) {
+    /* Byte length of the str.isspace() character at s, 0 if none */
+    if (s[0] == ' ' || (s[0] >= '\t' && s[0] <= '\r') || (s[0] >= 0x1c && s[0] <= 0x1f)) return 1;
+    if (len >= 2 && s[0] == 0xc2 && (s[1] == 0x85 || s[1] == 0xa0)) return 2;
+    if (len >= 3) {
+        if (s[0] == 0xe1 && s[1] == 0x9a && s[2] == 0x80) return 3;
+        if (s[0] == 0xe2 && s[1] == 0x80 && (s[2] <= 0x8a || s[2] == 0xa8 || s[2] == 0xa9 || s[2] == 0xaf)) return 3;
+        if (s[0] == 0xe2 && s[1] == 0x81 && s[2] == 0x9f) return 3;
+        if (s[0] == 0xe3 && s[1] == 0x80 && s[2] == 0x80) return 3;
+    }
+    return 0;
+}
+
+static PlayLabel play_strip(PlayLabel text) {
+    const unsigned char *s = (const unsigned char *)text.data;
+    size_t start = 0, end = text.len, step;
+    while (start < end && (step = play_space_at(s + start, end - start)) > 0) {
+        start += step;
+    }
+    while (end > start) {
+        step = 0;
+        for (size_t size = 1; size <= 3 && size <= end - start; size++) {
+            if (play_space_at(s + end - size, size) == size) {
+                step = size;
+                break;
+            }
+        }
+        if (step == 0) {
+            break;
+        }
+        end -= step;
+    }
+    return (PlayLabel){text.data + start, end - start};
+}
+
+static void play_invalid(const char *type_name, PlayLabel text) {
+    PlayLabel stripped = play_strip(text);
+    play_error("Invalid %s input: '%.*s'", type_name, (int)stripped.len, stripped.data);
+}
+
+static size_t play_digits(const char *s, size_t len, size_t pos, char *out, size_t *out_len) {
+    /* Digits with single '_' between them (Python literal rules); returns the new position */
+    size_t start = pos;
+    while (pos < len) {
+        if (s[pos] >= '0' && s[pos] <= '9') {
+            out[(*out_len)++] = s[pos++];
+        } else if (s[pos] == '_' && pos > start && pos + 1 < len && s[pos + 1] >= '0' && s[pos + 1] <= '9') {
+            pos++;
+        } else {
+            break;
+        }
+    }
+    return pos;
+}
+
+static int64_t play_parse_rank(PlayLabel line) {
+    PlayLabel text = play_strip(line);
+    char *digits = play_scratch(text.len + 1);
+    size_t count = 0, pos = 0;
+    bool negative = false;
+    if (pos < text.len && (text.data[pos] == '+' || text.data[pos] == '-')) {
+        negative = text.data[pos++] == '-';
+    }
+    size_t start = pos;
+    pos = play_digits(text.data, text.len, pos, digits, &count);
+    if (pos == start || pos != text.len) {
+        play_invalid("rank", line);
+    }
+    uint64_t limit = negative ? (uint64_t)INT64_MAX + 1 : (uint64_t)INT64_MAX;
+    uint64_t value = 0;
+    for (size_t i = 0; i < count; i++) {
+        unsigned digit = digits[i] - '0';
+        if (value > (limit - digit) / 10) {
+            play_overflow();
+        }
+        value = value * 10 + digit;
+    }
+    if (negative) {
+        return value == (uint64_t)INT64_MAX + 1 ? INT64_MIN : -(int64_t)value;
+    }
+    return (int64_t)value;
+}
+
+static bool play_word(PlayLabel text, size_t pos, const char *word) {
+    size_t len = strlen(word);
+    if (text.len - pos != len) {
+        return false;
+    }
+    for (size_t i = 0; i < len; i++) {
+        char c = text.data[pos + i];
+        if (c >= 'A' && c <= 'Z') {
+            c += 'a' - 'A';
+        }
+        if (c != word[i]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+static double play_parse_rate(PlayLabel line) {
+    PlayLabel text = play_strip(line);
+    char *clean = play_scratch(text.len + 2);
+    size_t count = 0, pos = 0;
+    if (pos < text.len && (text.data[pos] == '+' || text.data[pos] == '-')) {
+        clean[count++] = text.data[pos++];
+    }
+    if (play_word(text, pos, "inf") || play_word(text, pos, "infinity")) {
+        return clean[0] == '-' && count ? -INFINITY : INFINITY;
+    }
+    if (play_word(text, pos, "nan")) {
+        return clean[0] == '-' && count ? -NAN : NAN;
+    }
+    size_t mantissa = count;
+    pos = play_digits(text.data, text.len, pos, clean, &count);
+    bool digits = count > mantissa;
+    if (pos < text.len && text.data[pos] == '.') {
+        clean[count++] = text.data[pos++];
+        size_t before = count;
+        pos = play_digits(text.data, text.len, pos, clean, &count);
+        digits = digits || count > before;
+    }
+    if (!digits) {
+        play_invalid("rate", line);
+    }
+    if (pos < text.len && (text.data[pos] == 'e' || text.data[pos] == 'E')) {
+        clean[count++] = text.data[pos++];
+        if (pos < text.len && (text.data[pos] == '+' || text.data[pos] == '-')) {
+            clean[count++] = text.data[pos++];
+        }
+        size_t before = count;
+        pos = play_digits(text.data, text.len, pos, clean, &count);
+        if (count == before) {
+            play_invalid("rate", line);
+        }
+    }
+    if (pos != text.len) {
+        play_invalid("rate", line);
+    }
+    clean[count] = '\0';
+    return strtod(clean, NULL);
+}
+
+static bool play_parse_flag(PlayLabel line) {
+    PlayLabel text = play_strip(line);
+    if (text.len == 4 && memcmp(text.data, "true", 4) == 0) return true;
+    if (text.len == 5 && memcmp(text.data, "false", 5) == 0) return false;
+    play_error("Invalid flag input: '%.*s'", (int)text.len, text.data);
+    return false;
+}
+
+/* --- Entry point --- */
+
+static void play_program(void);
+static void play_reset_globals(void);
+
+int play_run(int echo_prompts) {
+    play_echo_prompts = echo_prompts != 0;
+    if (play_arena == NULL) {
+        play_arena = play_new_chunk(NULL, 65536);
+    }
+    PlayMark start = play_mark();
+    int status = 0;
+    if (setjmp(play_trap) == 0) {
+        play_reset_globals();
+        play_program();
+    } else {
+        status = 2;
+    }
+    play_reset(start);
+    fflush(stdout);
+    return status;
+}
+
+const char *play_last_error(void) {
+    return play_error_text;
+}
+
+#ifndef PLAY_SHARED
+int main(int argc, char **argv) {
+    static char output_buffer[65536];
+    setvbuf(stdout, output_buffer, _IOFBF, sizeof output_buffer);
+    int echo_prompts = !(argc > 1 && strcmp(argv[1], "--no-prompts") == 0);
+    int status = play_run(echo_prompts);
+    if (status != 0) {
+        fprintf(stderr, "%s\n", play_error_text);
+    }
+    return status;
+}
+#endif
@@ -0,0 +1,108 @@
+import hashlib
+import marshal
+import zlib
+
+from ..runtime.errors import PlayRuntimeError
+
+# Snapshot layout: MAGIC, format version, marshal version, 32 byte module
+# fingerprint, 32 byte SHA-256 of the payload, payload = zlib(marshal(state)).
+# marshal keeps lists and tuples apart and is much faster than pickle on
+# these plain values; its format is tied to the Python version, like the
+# worker processes that exchange snapshots.
+MAGIC = b'PLAYSNP'
+_FORMAT_VERSION = 2
+_HEADER_SIZE = len(MAGIC) + 2 + 32 + 32
+
+# Types of the values held by variables and by the operand stack
+_VALUE_TYPES = (int, float, str, bool, type(None))
+
+def module_fingerprint(module):
+    """SHA-256 of the bytecode of a Module, cached on it: a snapshot only resumes on the same code."""
+    fingerprint = getattr(module, '_fingerprint', None)
+    if fingerprint is None:
+        codes = list(module.functions) + [module.main]
+        data = marshal.dumps([(code.name, code.ops, code.args, code.num_slots) for code in codes]
+                             + [module.global_names])
+        fingerprint = module._fingerprint = hashlib.sha256(data).digest()
+    return fingerprint
+
+def save_vm(vm, extra=None):
+    """
+    Serializes a suspended VM (after start()/resume() returned False) to
+    bytes: globals, operand stack, frames with their slots and pc, steps and
+    the pending grab. extra is any marshal-able value stored with it (the
+    I/O state of the caller). Memo cache and profiler are not saved.
+    """
+    if vm.state is None:
+        raise PlayRuntimeError("Only a suspended program can be saved")
+    state = (vm.globals, vm.stack, vm.frames, vm.state, vm.steps, vm.waiting, extra)
+    payload = zlib.compress(marshal.dumps(state), 1)
+    return (MAGIC + bytes([_FORMAT_VERSION, marshal.version]) + module_fingerprint(vm.module)
+            + hashlib.sha256(payload).digest() + payload)
+
+def load_vm(data, module, vm):
+    """
+    Restores a snapshot of save_vm into vm (a new VM for module); returns extra.
+
+    Header, checksum and the decoded state are checked, but the checksum
+    only detects damaged data: marshal is not meant for untrusted input, so
+    snapshots must come from a trusted source (the processes of the same
+    service), never from the users of a program.
+    """
+    if not data.startswith(MAGIC) or len(data) < _HEADER_SIZE:
+        raise PlayRuntimeError("Not a Play snapshot")
+    version, marshal_version = data[len(MAGIC)], data[len(MAGIC) + 1]
+    if version != _FORMAT_VERSION or marshal_version != marshal.version:
+        raise PlayRuntimeError(f"Unsupported snapshot version {version}.{marshal_version}")
+    start = len(MAGIC) + 2
+    if data[start:start + 32] != module_fingerprint(module):
+        raise PlayRuntimeError("Snapshot was taken from a different program")
+    payload = data[_HEADER_SIZE:]
+    if data[start + 32:_HEADER_SIZE] != hashlib.sha256(payload).digest():
+        raise PlayRuntimeError("Corrupted snapshot: checksum mismatch")
+    try:
+        state = marshal.loads(zlib.decompress(payload))
+    except (ValueError, EOFError, TypeError, zlib.error) as e:
+        raise PlayRuntimeError(f"Corrupted snapshot: {e}")
+    _check_state(module, state)
+    globals_, stack, frames, state, steps, waiting, extra = state
+
+    vm.start(module)
+    vm.globals = globals_
+    vm.stack = stack
+    vm.frames = frames
+    vm.state = state
+    vm.steps = steps
+    vm.waiting = waiting
+    return extra
+
+def _check_state(module, state):
+    # The VM trusts its state: a bad index or slot list would fail far from here
+    def check(condition, what):
+        if not condition:
+            raise PlayRuntimeError(f"Corrupted snapshot: {what}")
+
+    def values(items, size=None):
+        return type(items) is list and (size is None or len(items) == size) \
+            and all(type(value) in _VALUE_TYPES for value in items)
+
+    def frame(entry, size):
+        if type(entry) is not tuple or len(entry) != size:
+            return False
+        current, pc, slots = entry[:3]
+        if type(current) is not int or not 0 <= current < len(codes):
+            return False
+        code = codes[current]
+        return type(pc) is int and 0 <= pc < len(code.ops) and values(slots, code.num_slots)
+
+    codes = list(module.functions) + [module.main]
+    check(type(state) is tuple and len(state) == 7, "state")
+    globals_, stack, frames, running, steps, waiting, _ = state
+    check(values(globals_, len(module.global_names)), "globals")
+    check(values(stack), "operand stack")
+    check(type(frames) is list and all(frame(entry, 4) and (entry[3] is None or type(entry[3]) is tuple)
+                                       for entry in frames), "call frames")
+    check(frame(running, 3), "running frame")
+    check(type(steps) is int and steps >= 0, "steps")
+    check(waiting is None or (type(waiting) is tuple and len(waiting) == 2 and type(waiting[0]) is str
+                              and type(waiting[1]) is int), "pending grab")
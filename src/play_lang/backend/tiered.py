@@ -0,0 +1,538 @@
+import math
+import time
+from collections import namedtuple
+
+from ..frontend.ast_node import *
+from ..runtime.errors import PlayRuntimeError
+from ..runtime.io import parse_value
+from ..runtime.memo import MISSING, memo_key
+from ..optimizer.ast_utils import linked_functions, iter_stmts, stmt_exprs, stmt_writes, iter_expr
+from ..optimizer.cfg import build_cfg
+from ..optimizer.dataflow import maybe_undeclared_accesses
+from .interpreter import (Interpreter, DEFAULT_VALUES, int_div, int_mod, float_div, float_mod, to_rate,
+                          _BreakSignal, _ReturnSignal)
+
+# Default hotness thresholds: calls of an action, back-edges of a loop.
+# Compiling an action costs about as much as interpreting ten calls of it
+# (benchmarks/bench_tiered.py)
+CALL_THRESHOLD = 10
+LOOP_THRESHOLD = 100
+
+TierUp = namedtuple('TierUp', 'kind name count seconds')
+
+_COMPARE = {'==': '==', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_RANK_FUNCTIONS = {'/': 'int_div', '%': 'int_mod'}
+_RATE_FUNCTIONS = {'/': 'float_div', '%': 'float_mod'}
+
+class CodegenError(Exception):
+    pass
+
+class _Unbound:
+    """Value of a local of a compiled action before its declaration runs."""
+    def __repr__(self):
+        return '<unbound>'
+
+_UNBOUND = _Unbound()
+
+def region_names(stmts):
+    """(names read or written, names declared) by the statements, nested blocks included."""
+    used = set()
+    declared = set()
+    for stmt in iter_stmts(BlockNode(list(stmts))):
+        writes = stmt_writes(stmt)
+        used |= writes
+        if isinstance(stmt, VarDeclNode):
+            declared |= writes
+        for expr in stmt_exprs(stmt):
+            used.update(e.name for e in iter_expr(expr) if isinstance(e, VarAccessNode))
+    return used, declared
+
+class PythonGenerator:
+    """
+    Translates an action or a single loop of the lowered tree to Python
+    source, run by the TieredInterpreter in place of the tree walk.
+
+    Names are resolved like the Interpreter resolves them at run time, not
+    statically like the BytecodeCompiler: a name is local only once its
+    declaration has run. Where that is known in advance (parameters,
+    declarations earlier in the same block or in an enclosing one) the
+    local is accessed directly, and so is the global where no declaration
+    can have run yet; a name declared in an earlier branch or in the body
+    of an enclosing loop is checked when read or written ('maybe' names).
+    In a compiled loop, a global whose declaration may have been skipped
+    (in the play block, or in the action before the loop) goes through
+    read_global / write_global, which fail with "not defined".
+
+    In an action, locals are Python locals (_UNBOUND until declared). A
+    loop is compiled for on-stack replacement of a running activation: its
+    locals stay in the activation's Scope (L, LT), the play block ones in
+    the globals (G, GT), so the interpreter goes on with the same state
+    after the loop. The code returns None when the loop ends, (value,)
+    when a reward leaves the action.
+
+    Calls go through the entry table E of the engine, so every call runs
+    the current tier of the callee.
+    """
+    def action(self, fun_node, memoized=False):
+        params = [p.name for p in fun_node.params]
+        _, declared = region_names(fun_node.body.statements)
+        self._start('action', set(params), set())
+        self.lines = []
+        unbound = sorted(declared - set(params))
+        if unbound:
+            self.lines.append('    ' + ' = '.join(f'v_{name}' for name in unbound) + ' = _UNBOUND')
+        self._block(fun_node.body, 1)
+        if not fun_node.body.statements or not isinstance(fun_node.body.statements[-1], ReturnNode):
+            self.lines.append('    return None')
+        args = ', '.join(f'v_{name}' for name in params)
+        if not memoized:
+            return '\n'.join([f'def f_{fun_node.name}({args}):'] + self.lines) + '\n'
+        # Same cache and keys as the Interpreter: rate arguments go through
+        # memo_key, which tells -0.0 from 0.0
+        if any(p.type_name == 'rate' for p in fun_node.params):
+            key = f'memo_key({fun_node.name!r}, ({args},))'
+        else:
+            key = f'({fun_node.name!r}, {args})'
+        return '\n'.join([f'def b_{fun_node.name}({args}):'] + self.lines + [
+            f'def f_{fun_node.name}({args}):',
+            f'    key = {key}',
+            '    result = memo_lookup(key)',
+            '    if result is not MISSING:',
+            '        return result',
+            f'    result = b_{fun_node.name}({args})',
+            '    memo_store(key, result)',
+            '    return result',
+        ]) + '\n'
+
+    def loop(self, node, name, local_names=None, unsure=()):
+        """
+        Source of def <name>(L, LT); local_names is None in the play block.
+        unsure are the other names that may not be declared when the loop
+        reads or assigns them: they are checked like the globals of 'maybe'.
+        """
+        _, declared = region_names([node])
+        if local_names is None:
+            self._start('play', set(), set(), unsure)
+        else:
+            self._start('frame', set(local_names), declared - set(local_names), unsure)
+        self.lines = []
+        update = node.update if isinstance(node, ForNode) else None
+        self._loop(node.condition, node.block, update, 1)
+        self.lines.append('    return None')
+        return '\n'.join([f'def {name}(L, LT):'] + self.lines) + '\n'
+
+    def _start(self, mode, definite, maybe, unsure=()):
+        self.mode = mode        # 'action', 'frame' or 'play'
+        self.definite = definite  # names surely local here
+        self.maybe = maybe      # names local if a declaration ran, else global
+        self.unsure = set(unsure)  # globals that may not be declared yet
+        self.temps = 0
+
+    def _temp(self):
+        self.temps += 1
+        return f't{self.temps}'
+
+    def _emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    # --- Variables ---
+
+    def _local(self, name):
+        return f'v_{name}' if self.mode == 'action' else f'L[{name!r}]'
+
+    def _read(self, name):
+        if name in self.definite:
+            return self._local(name)
+        if name in self.maybe:
+            if self.mode == 'action':
+                return f'(v_{name} if v_{name} is not _UNBOUND else read_global({name!r}))'
+            return f'(L[{name!r}] if {name!r} in L else read_global({name!r}))'
+        if name in self.unsure:
+            return f'read_global({name!r})'
+        return f'G[{name!r}]'
+
+    def _store(self, name, value, depth):
+        if name in self.definite:
+            self._emit(depth, f'{self._local(name)} = {value}')
+        elif name in self.maybe:
+            test = f'v_{name} is not _UNBOUND' if self.mode == 'action' else f'{name!r} in L'
+            self._emit(depth, f'if {test}:')
+            self._emit(depth + 1, f'{self._local(name)} = {value}')
+            self._emit(depth, 'else:')
+            self._emit(depth + 1, f'write_global({name!r}, {value})')
+        elif name in self.unsure:
+            self._emit(depth, f'write_global({name!r}, {value})')
+        else:
+            self._emit(depth, f'G[{name!r}] = {value}')
+
+    def _declare(self, name, type_name, value, depth):
+        if self.mode == 'action':
+            self._emit(depth, f'v_{name} = {value}')
+        elif self.mode == 'frame':
+            self._emit(depth, f'L[{name!r}] = {value}')
+            self._emit(depth, f'LT[{name!r}] = {type_name!r}')
+        else:
+            self._emit(depth, f'G[{name!r}] = {value}')
+            self._emit(depth, f'GT[{name!r}] = {type_name!r}')
+        if self.mode != 'play':
+            self.definite.add(name)
+            self.maybe.add(name)
+
+    def _value(self, code, depth):
+        # Code used more than once is computed once into a temporary
+        if code.isidentifier() or code.startswith(("'", '"')):
+            return code
+        temp = self._temp()
+        self._emit(depth, f'{temp} = {code}')
+        return temp
+
+    # --- Statements ---
+
+    def _block(self, block, depth):
+        start = len(self.lines)
+        for stmt in block.statements:
+            self._stmt(stmt, depth)
+        if len(self.lines) == start:
+            self._emit(depth, 'pass')
+
+    def _nested(self, block, depth):
+        # Declarations in a nested block are not sure to have run after it
+        saved = set(self.definite)
+        self._block(block, depth)
+        self.definite = saved
+
+    def _stmt(self, node, depth):
+        if isinstance(node, BlockNode):
+            self._block(node, depth)
+        elif isinstance(node, VarDeclNode):
+            for var_init in node.var_list:
+                if var_init.expr is not None:
+                    value = self._expr(var_init.expr)
+                else:
+                    value = repr(DEFAULT_VALUES[node.type_name])
+                if len(var_init.names) > 1:
+                    value = self._value(value, depth)
+                for name in var_init.names:
+                    self._declare(name, node.type_name, value, depth)
+        elif isinstance(node, AssignNode):
+            self._store(node.target, self._expr(node.expr), depth)
+        elif isinstance(node, MultiAssignNode):
+            value = self._value(self._expr(node.expr), depth)
+            promote = 'rank' in node.target_types
+            for target, type_name in zip(node.targets, node.target_types):
+                self._store(target, f'to_rate({value})' if promote and type_name == 'rate' else value, depth)
+        elif isinstance(node, IfNode):
+            branches = [(node.condition, node.then_block)] + [(e.condition, e.block) for e in (node.elifs or [])]
+            for i, (condition, block) in enumerate(branches):
+                self._emit(depth, f"{'if' if i == 0 else 'elif'} {self._expr(condition)}:")
+                self._nested(block, depth + 1)
+            if node.else_block:
+                self._emit(depth, 'else:')
+                self._nested(node.else_block, depth + 1)
+        elif isinstance(node, WhileNode):
+            self._loop(node.condition, node.block, None, depth)
+        elif isinstance(node, ForNode):
+            self._stmt(node.init, depth)
+            self._loop(node.condition, node.block, node.update, depth)
+        elif isinstance(node, InputNode):
+            if node.target_types is None:
+                raise CodegenError("grab without target types (not a lowered tree)")
+            prompt = self._expr(node.prompt_expr) if node.prompt_expr is not None else "''"
+            line = self._temp()
+            for i, (group, types) in enumerate(zip(node.target_groups, node.target_types)):
+                self._emit(depth, f"{line} = input_fn({prompt if i == 0 else repr('')})")
+                for name, type_name in zip(group, types):
+                    self._store(name, f'parse_value({line}, {type_name!r})', depth)
+        elif isinstance(node, OutputNode):
+            self._emit(depth, f'output_fn({self._expr(node.expr)})')
+        elif isinstance(node, ReturnNode):
+            value = self._expr(node.expr) if node.expr is not None else 'None'
+            self._emit(depth, f'return {value}' if self.mode == 'action' else f'return ({value},)')
+        elif isinstance(node, BreakNode):
+            self._emit(depth, 'break')
+        elif isinstance(node, FuncCallStmtNode):
+            self._emit(depth, self._call(node.name, node.args))
+        elif isinstance(node, ExprNode):
+            self._emit(depth, self._expr(node))
+        else:
+            raise CodegenError(f"Cannot compile {type(node).__name__}")
+
+    def _loop(self, condition, block, update, depth):
+        # Names declared in the body are 'maybe' from the first condition on
+        if self.mode != 'play':
+            self.maybe |= region_names(block.statements)[1]
+        saved = set(self.definite)
+        self._emit(depth, f'while {self._expr(condition)}:')
+        self._block(block, depth + 1)
+        if update is not None:
+            self._stmt(update, depth + 1)
+        self.definite = saved
+
+    # --- Expressions ---
+
+    def _call(self, name, args):
+        return f"E[{name!r}]({', '.join(self._expr(arg) for arg in args)})"
+
+    def _expr(self, node):
+        if isinstance(node, LiteralNode):
+            if isinstance(node.value, float) and not math.isfinite(node.value):
+                return f"float('{node.value!r}')"
+            return repr(node.value)
+        if isinstance(node, VarAccessNode):
+            return self._read(node.name)
+        if isinstance(node, FunCallExprNode):
+            return self._call(node.name, node.args)
+        if isinstance(node, (RankBinOpNode, RateBinOpNode)):
+            left, right = self._expr(node.left), self._expr(node.right)
+            functions = _RANK_FUNCTIONS if isinstance(node, RankBinOpNode) else _RATE_FUNCTIONS
+            if node.op in functions:
+                return f'{functions[node.op]}({left}, {right})'
+            return f'({left} {node.op} {right})'
+        if isinstance(node, (RankCompareNode, RateCompareNode, LabelCompareNode, FlagCompareNode)):
+            return f'({self._expr(node.left)} {_COMPARE[node.op]} {self._expr(node.right)})'
+        if isinstance(node, LogicOpNode):
+            op = 'and' if node.op == '&&' else 'or'
+            return f'({self._expr(node.left)} {op} {self._expr(node.right)})'
+        if isinstance(node, NotNode):
+            return f'(not {self._expr(node.expr)})'
+        if isinstance(node, (RankNegNode, RateNegNode)):
+            return f'(-{self._expr(node.expr)})'
+        if isinstance(node, RankToRateNode):
+            return f'to_rate({self._expr(node.expr)})'
+        if isinstance(node, (RankToLabelNode, RateToLabelNode)):
+            return f'str({self._expr(node.expr)})'
+        if isinstance(node, FlagToLabelNode):
+            return f"('true' if {self._expr(node.expr)} else 'false')"
+        if isinstance(node, LabelConcatNode):
+            return f'({self._expr(node.left)} + {self._expr(node.right)})'
+        if isinstance(node, LabelJoinNode):
+            # One '%s' format per join, like Interpreter._compile_template
+            pieces = []
+            args = []
+            for part in node.parts:
+                if isinstance(part, LiteralNode):
+                    pieces.append(part.value.replace('%', '%%'))
+                    continue
+                if isinstance(part, (RankToLabelNode, RateToLabelNode)):
+                    part = part.expr
+                pieces.append('%s')
+                args.append(self._expr(part))
+            if not args:
+                return repr(''.join(pieces).replace('%%', '%'))
+            return f"({''.join(pieces)!r} % ({', '.join(args)},))"
+        raise CodegenError(f"Cannot compile {type(node).__name__}")
+
+class TieredInterpreter(Interpreter):
+    """
+    Interpreter that tiers up hot code (engine='tiered' of run_source).
+
+    Every action and loop of the lowered tree starts in the tree-walking
+    Interpreter, which counts the calls of each action and the back-edges
+    of each loop. An action called call_threshold times is translated to a
+    Python function (PythonGenerator) and swapped into the entry table
+    that every call goes through; a loop that takes loop_threshold
+    back-edges is compiled too and finishes on the running activation
+    (on-stack replacement), and its action is compiled as well. A
+    threshold of None never tiers up; call_threshold=1 compiles every
+    action at its first call, loop_threshold=0 every loop when it starts.
+    Only the lowered tree tiers up: the AST is just interpreted.
+
+    Swapping is safe while an action is on the stack: the tree is never
+    changed, activations already running keep walking it (or finish in
+    compiled loops) and only new calls take the compiled code.
+
+    Each tier-up is appended to tier_ups as a TierUp(kind, name, count,
+    seconds): kind 'action' (name of the action, calls so far) or 'loop'
+    (name 'action:loopN' or 'play:loopN', back-edges so far), with the
+    time spent generating and compiling the code; on_tier_up, if given,
+    is called with it. The generated source is kept in sources.
+    """
+    def __init__(self, input_fn=None, output_fn=None, io=None, memo_size=1024,
+                 call_threshold=CALL_THRESHOLD, loop_threshold=LOOP_THRESHOLD, on_tier_up=None):
+        super().__init__(input_fn, output_fn, io, memo_size)
+        self.call_threshold = call_threshold
+        self.loop_threshold = loop_threshold
+        self.on_tier_up = on_tier_up
+        self.tier_ups = []
+        self.sources = {}
+        self.entries = {}     # action name -> callable of its current tier
+        self.calls = {}       # action name -> calls in the interpreter
+        self.back_edges = {}  # id(loop) -> back-edges in the interpreter
+        self.loop_labels = {}
+        self.loop_names = {}  # id(loop) -> names it reads or writes
+        self.play_unsure = set()  # play block names that may be used undeclared
+        self.compiled = set()
+        self.compiled_loops = {}
+        self.not_compilable = set()
+        self.function = None  # action of the running interpreted activation
+        self.namespace = {
+            'E': self.entries, 'G': self.globals.values, 'GT': self.globals.types,
+            '_UNBOUND': _UNBOUND, 'MISSING': MISSING, 'memo_key': memo_key,
+            'int_div': int_div, 'int_mod': int_mod, 'float_div': float_div, 'float_mod': float_mod,
+            'to_rate': to_rate,
+            'parse_value': parse_value, 'input_fn': self.input_fn, 'output_fn': self.output_fn,
+            'read_global': self._read_global, 'write_global': self._write_global,
+        }
+        if self.memo is not None:
+            self.namespace['memo_lookup'] = self.memo.lookup
+            self.namespace['memo_store'] = self.memo.store
+
+    def visit_ProgramNode(self, node):
+        for fun_node in linked_functions(node):
+            self.entries[fun_node.name] = self._interpreted_entry(fun_node.name)
+            self.calls[fun_node.name] = 0
+            self._label_loops(fun_node.body, fun_node.name)
+        self._label_loops(node.main_block, 'play')
+        main_body = BlockNode(list(node.global_decls) + list(node.main_block.statements))
+        self.play_unsure = {name for _, name in maybe_undeclared_accesses(build_cfg(main_body))}
+        super().visit_ProgramNode(node)
+
+    def _label_loops(self, block, owner):
+        loops = [stmt for stmt in iter_stmts(block) if isinstance(stmt, (WhileNode, ForNode))]
+        for i, loop in enumerate(loops, 1):
+            self.loop_labels[id(loop)] = f'{owner}:loop{i}'
+
+    def _read_global(self, name):
+        if name not in self.globals.values:
+            raise PlayRuntimeError(f"Variable '{name}' not defined")
+        return self.globals.values[name]
+
+    def _write_global(self, name, value):
+        if name not in self.globals.values:
+            raise PlayRuntimeError(f"Variable '{name}' not defined")
+        self.globals.values[name] = value
+
+    # --- Actions ---
+
+    def _interpreted_entry(self, name):
+        def entry(*values):
+            return self._interpret(name, values)
+        return entry
+
+    def _call(self, name, args):
+        if self.promote:
+            return super()._call(name, args)
+        values = [self.visit(arg) for arg in args]
+        if name in self.compiled or self._hot(name):
+            return self.entries[name](*values)
+        # Inlined _interpret: no extra Python frame per interpreted call
+        saved = self.function
+        self.function = name
+        try:
+            return self._invoke(self.functions[name], values)
+        finally:
+            self.function = saved
+
+    def _interpret(self, name, values):
+        if self._hot(name):
+            return self.entries[name](*values)
+        saved = self.function
+        self.function = name
+        try:
+            return self._invoke(self.functions[name], values)
+        finally:
+            self.function = saved
+
+    def _hot(self, name):
+        """Counts a call of an interpreted action; True once it has been compiled."""
+        count = self.calls[name] = self.calls[name] + 1
+        threshold = self.call_threshold
+        return threshold is not None and count >= threshold and self._compile_action(name, count)
+
+    def _compile_action(self, name, count):
+        """Swaps the compiled code of the action into its entry; False if it cannot be compiled."""
+        if name in self.not_compilable:
+            return False
+        if name in self.compiled:
+            return True
+        start = time.perf_counter()
+        try:
+            source = PythonGenerator().action(self.functions[name], name in self.memoized)
+        except CodegenError:
+            self.not_compilable.add(name)
+            return False
+        self.entries[name] = self._exec(source, f'f_{name}', name)
+        self.compiled.add(name)
+        self._tier_up('action', name, count, start)
+        return True
+
+    def _exec(self, source, function_name, label):
+        self.sources[label] = source
+        exec(compile(source, f'<play {label}>', 'exec'), self.namespace)
+        return self.namespace[function_name]
+
+    def _tier_up(self, kind, name, count, start):
+        event = TierUp(kind, name, count, time.perf_counter() - start)
+        self.tier_ups.append(event)
+        if self.on_tier_up is not None:
+            self.on_tier_up(event)
+
+    # --- Loops ---
+
+    def visit_WhileNode(self, node):
+        self._loop(node, None)
+
+    def visit_ForNode(self, node):
+        self.visit(node.init)
+        self._loop(node, node.update)
+
+    def _loop(self, node, update):
+        key = id(node)
+        threshold = self.loop_threshold
+        if threshold is None or self.promote or key in self.not_compilable:
+            threshold = math.inf
+        visit = self.visit
+        count = self.back_edges.get(key, 0)
+        try:
+            while True:
+                if count >= threshold:
+                    self.back_edges[key] = count
+                    if self._replace_loop(node, count):
+                        return
+                    threshold = math.inf
+                if not visit(node.condition):
+                    break
+                visit(node.block)
+                if update is not None:
+                    visit(update)
+                count += 1
+        except _BreakSignal:
+            pass
+        finally:
+            self.back_edges[key] = count
+
+    def _replace_loop(self, node, count):
+        """Runs the rest of the loop as compiled code; False if it cannot be compiled."""
+        frame = self.locals
+        label = self.loop_labels.get(id(node), 'loop')
+        if frame is None:
+            names = None
+            unsure = self.play_unsure
+        else:
+            used = self.loop_names.get(id(node))
+            if used is None:
+                used = self.loop_names[id(node)] = region_names([node])[0]
+            names = frozenset(used & frame.values.keys())
+            # Declared in the action but not yet in the frame: a skipped declaration
+            unsure = region_names(self.functions[self.function].body.statements)[1] - names
+        loop_function = self.compiled_loops.get((id(node), names))
+        if loop_function is None:
+            start = time.perf_counter()
+            function_name = f'loop_{len(self.compiled_loops)}'
+            try:
+                source = PythonGenerator().loop(node, function_name, names, unsure)
+            except CodegenError:
+                self.not_compilable.add(id(node))
+                return False
+            loop_function = self.compiled_loops[(id(node), names)] = self._exec(source, function_name, label)
+            self._tier_up('loop', label, count, start)
+        if self.function is not None and self.call_threshold is not None:
+            # A hot loop makes its action hot: later calls run compiled code
+            self._compile_action(self.function, self.calls[self.function])
+        if frame is None:
+            result = loop_function(None, None)
+        else:
+            result = loop_function(frame.values, frame.types)
+        if result is not None:
+            raise _ReturnSignal(result[0])
+        return True
@@ -0,0 +1,423 @@
+from collections import Counter
+
+from ..runtime.errors import PlayRuntimeError
+from ..runtime.io import PlayIO, parse_value
+from ..runtime.memo import MemoCache, MISSING, memo_key
+from ..runtime.profiler import Profiler
+from .interpreter import int_div, int_mod, float_div, float_mod, to_rate
+from .bytecode import *
+
+class _PairCountingOps:
+    """Opcode list that records (previous opcode, opcode) on every fetch."""
+    __slots__ = ('ops', 'vm')
+
+    def __init__(self, ops, vm):
+        self.ops = ops
+        self.vm = vm
+
+    def __getitem__(self, pc):
+        op = self.ops[pc]
+        vm = self.vm
+        vm.pair_counts[vm.last_op, op] += 1
+        vm.last_op = op
+        return op
+
+class VM:
+    """
+    Stack machine for the bytecode of BytecodeCompiler.
+
+    Every opcode already knows the type of its operands (ADD_RANK, DIV_RATE,
+    JUMP_IF_NOT_LT, ...), so the dispatch loop does no type checks. Operands
+    live on one Python list, variables in per-call slot lists and in the
+    global slot list.
+
+    With collect_stats=True the VM counts every executed pair of consecutive
+    opcodes (pair_counts), the data used to pick the SUPERINSTRUCTIONS.
+    Counting is done by the ops list itself, so the dispatch loop is the
+    same whether statistics are collected or not.
+
+    Calls don't use Python recursion: the VM keeps its own stack of
+    suspended frames (function id, return pc, slots), every activation gets a
+    slot list preallocated from the function's num_slots, and
+    'reward f(...)' in tail position (TAIL_CALL) replaces the running frame
+    instead of pushing one. Deep Play recursion therefore runs in constant
+    Python stack space, up to max_depth active calls.
+
+    Slot lists of returned calls go to a free list per function and are
+    reused by the next call; arguments are bound by position into the first
+    slots. rank -> rate promotion of arguments is already compiled at the
+    call site (RANK_TO_RATE or a rate CONST), so the callee never converts.
+
+    CALL_PURE results are kept in an LRU cache of memo_size entries
+    (self.memo, None if memo_size is 0): a hit skips the call, a miss stores
+    the value when the call returns.
+
+    step_budget bounds the CPU work of a run: every loop back-edge (LOOP)
+    and every call is one step, and PlayRuntimeError is raised when the
+    budget is exhausted (self.steps is the number of steps taken).
+
+    A module compiled with profile=True is run with a Profiler (self.profiler)
+    fed by its PROF_* instructions; other modules don't contain them and run
+    the same loop without any profiling cost.
+
+    The whole execution state (frames, operand stack, globals, running
+    frame) lives on the VM, so a run can stop and continue later:
+    start(module) prepares it and resume() runs until the program ends
+    (True) or suspends (False), either on a grab whose input lines are not
+    ready yet (self.waiting = (prompt, lines needed)) or after max_steps
+    steps. run(module) does both in one go.
+    """
+    def __init__(self, io=None, collect_stats=False, max_depth=100000, memo_size=1024,
+                 step_budget=None):
+        self.io = io if io is not None else PlayIO()
+        self.collect_stats = collect_stats
+        self.max_depth = max_depth
+        self.step_budget = step_budget
+        self.steps = 0
+        self.memo = MemoCache(memo_size) if memo_size else None
+        self.pair_counts = Counter()
+        self.last_op = -1
+        self.globals = []
+        self.module = None
+        self.profiler = None
+        self.frames = []
+        self.stack = []
+        self.state = None  # running frame when suspended: (function id, pc, slots)
+        self.waiting = None
+        self.finished = False
+
+    def run(self, module):
+        self.start(module)
+        try:
+            self.resume()
+        finally:
+            self.io.flush()
+
+    def start(self, module):
+        self.module = module
+        self.globals = [None] * len(module.global_names)
+        if module.loop_names is not None:
+            names = [code.name for code in module.functions] + [module.main.name]
+            self.profiler = Profiler(names, module.loop_names)
+        self.frames = []
+        self.stack = []
+        # The main code has function id len(functions), as for the profiler
+        self.state = (len(module.functions), 0, [None] * module.main.num_slots)
+        self.steps = 0
+        self.waiting = None
+        self.finished = False
+
+    def resume(self, max_steps=None):
+        """Runs until the program ends (True) or suspends (False)."""
+        self.waiting = None
+        return self._execute(max_steps)
+
+    def top_pairs(self, n=10):
+        """Most executed opcode pairs, as (('OP1', 'OP2'), count)."""
+        return [((OPCODE_NAMES[a], OPCODE_NAMES[b]), count)
+                for (a, b), count in self.pair_counts.most_common(n)]
+
+    def _suspend(self, current, pc, slots, steps):
+        self.state = (current, pc, slots)
+        self.steps = steps
+        return False
+
+    def _check_budget(self, steps):
+        # Called when the step limit of a resume() is passed: error if it is the budget
+        if self.step_budget is not None and steps > self.step_budget:
+            self.steps = steps
+            raise PlayRuntimeError(f"Step budget exceeded ({self.step_budget})")
+
+    def _execute(self, max_steps):
+        glob = self.globals
+        module = self.module
+        functions = module.functions
+        write_line = self.io.write_line
+        lines_ready = self.io.lines_ready
+        max_depth = self.max_depth
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        pop_frame = frames.pop
+        push_frame = frames.append
+
+        # Code by function id, the main code last (counting wrappers if collecting stats)
+        code_ops = [code.ops for code in functions] + [module.main.ops]
+        if self.collect_stats:
+            code_ops = [_PairCountingOps(ops, self) for ops in code_ops]
+        code_args = [code.args for code in functions] + [module.main.args]
+        function_slots = [code.num_slots for code in functions]
+        function_resets = [code.reset_slots for code in functions]
+        free_frames = [[] for _ in functions]
+        memo = self.memo
+        profiler = self.profiler
+        steps = self.steps
+        step_limit = float('inf')
+        if self.step_budget is not None:
+            step_limit = self.step_budget
+        if max_steps is not None:
+            step_limit = min(step_limit, steps + max_steps)
+        if memo is not None:
+            memo_lookup = memo.lookup
+            memo_store = memo.store
+
+        current, pc, slots = self.state
+        ops = code_ops[current]
+        args = code_args[current]
+
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+
+            # Ordered by frequency on the benchmark programs
+            if op == LOAD_LOCAL:
+                push(slots[arg])
+            elif op == LOAD_GLOBAL:
+                push(glob[arg])
+            elif op == CONST:
+                push(arg)
+            elif op == STORE_LOCAL:
+                slots[arg] = pop()
+            elif op == STORE_GLOBAL:
+                glob[arg] = pop()
+            elif op == INC_LOCAL:
+                slots[arg[0]] += arg[1]
+            elif op == INC_GLOBAL:
+                glob[arg[0]] += arg[1]
+            elif op == LOAD_LOCAL_ADD_CONST:
+                push(slots[arg[0]] + arg[1])
+            elif op == LOAD_GLOBAL_ADD_CONST:
+                push(glob[arg[0]] + arg[1])
+            elif op == JUMP_IF_NOT_LT:
+                b = pop()
+                if not pop() < b:
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == LOOP:
+                pc = arg
+                steps += 1
+                if steps > step_limit:
+                    self._check_budget(steps)
+                    return self._suspend(current, pc, slots, steps)
+            elif op == LOAD_LOCAL2:
+                push(slots[arg[0]])
+                push(slots[arg[1]])
+            elif op == LOAD_GLOBAL2:
+                push(glob[arg[0]])
+                push(glob[arg[1]])
+            elif op == LOAD_LOCAL_CONST:
+                push(slots[arg[0]])
+                push(arg[1])
+            elif op == LOAD_GLOBAL_CONST:
+                push(glob[arg[0]])
+                push(arg[1])
+            elif op == ADD_RANK or op == ADD_RATE:
+                b = pop()
+                stack[-1] += b
+            elif op == SUB_RANK or op == SUB_RATE:
+                b = pop()
+                stack[-1] -= b
+            elif op == MUL_RANK or op == MUL_RATE:
+                b = pop()
+                stack[-1] *= b
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP_IF_NOT_LE:
+                b = pop()
+                if not pop() <= b:
+                    pc = arg
+            elif op == JUMP_IF_NOT_GT:
+                b = pop()
+                if not pop() > b:
+                    pc = arg
+            elif op == JUMP_IF_NOT_GE:
+                b = pop()
+                if not pop() >= b:
+                    pc = arg
+            elif op == JUMP_IF_NOT_EQ:
+                b = pop()
+                if not pop() == b:
+                    pc = arg
+            elif op == JUMP_IF_NOT_NE:
+                b = pop()
+                if not pop() != b:
+                    pc = arg
+            elif op == MOD_RANK:
+                b = pop()
+                stack[-1] = int_mod(stack[-1], b)
+            elif op == DIV_RANK:
+                b = pop()
+                stack[-1] = int_div(stack[-1], b)
+            elif op == DIV_RATE:
+                b = pop()
+                stack[-1] = float_div(stack[-1], b)
+            elif op == MOD_RATE:
+                b = pop()
+                stack[-1] = float_mod(stack[-1], b)
+            elif op == CALL or op == CALL_PURE:
+                index, nargs = arg
+                steps += 1
+                if steps > step_limit:
+                    self._check_budget(steps)
+                    # The call is executed again by the next resume()
+                    return self._suspend(current, pc - 1, slots, steps - 1)
+                key = None
+                if op == CALL_PURE and memo is not None:
+                    if nargs:
+                        values = stack[-nargs:]
+                        key = memo_key(index, values) if 0 in values else (index, *values)
+                    else:
+                        key = (index,)
+                    value = memo_lookup(key)
+                    if value is not MISSING:
+                        if nargs:
+                            del stack[-nargs:]
+                        push(value)
+                        continue
+                if len(frames) >= max_depth:
+                    raise PlayRuntimeError(f"Maximum call depth exceeded ({max_depth})")
+                free = free_frames[index]
+                frame = free.pop() if free else [None] * function_slots[index]
+                if nargs == 1:
+                    frame[0] = pop()
+                elif nargs == 2:
+                    frame[1] = pop()
+                    frame[0] = pop()
+                elif nargs:
+                    frame[:nargs] = stack[-nargs:]
+                    del stack[-nargs:]
+                push_frame((current, pc, slots, key))
+                ops = code_ops[index]
+                args = code_args[index]
+                slots = frame
+                current = index
+                pc = 0
+            elif op == RETURN:
+                # The return value stays on the operand stack
+                for slot in function_resets[current]:
+                    slots[slot] = None
+                free_frames[current].append(slots)
+                current, pc, slots, key = pop_frame()
+                ops = code_ops[current]
+                args = code_args[current]
+                if key is not None:
+                    memo_store(key, stack[-1])
+            elif op == TAIL_CALL:
+                index, nargs = arg
+                steps += 1
+                if steps > step_limit:
+                    self._check_budget(steps)
+                    return self._suspend(current, pc - 1, slots, steps - 1)
+                for slot in function_resets[current]:
+                    slots[slot] = None
+                free_frames[current].append(slots)
+                free = free_frames[index]
+                frame = free.pop() if free else [None] * function_slots[index]
+                if nargs == 1:
+                    frame[0] = pop()
+                elif nargs == 2:
+                    frame[1] = pop()
+                    frame[0] = pop()
+                elif nargs:
+                    frame[:nargs] = stack[-nargs:]
+                    del stack[-nargs:]
+                ops = code_ops[index]
+                args = code_args[index]
+                slots = frame
+                current = index
+                pc = 0
+            elif op == FORMAT:
+                fmt, nargs = arg
+                if nargs:
+                    values = tuple(stack[-nargs:])
+                    del stack[-nargs:]
+                    push(fmt % values)
+                else:
+                    push(fmt)
+            elif op == PRINT:
+                write_line(pop())
+            elif op == LT:
+                b = pop()
+                stack[-1] = stack[-1] < b
+            elif op == LE:
+                b = pop()
+                stack[-1] = stack[-1] <= b
+            elif op == GT:
+                b = pop()
+                stack[-1] = stack[-1] > b
+            elif op == GE:
+                b = pop()
+                stack[-1] = stack[-1] >= b
+            elif op == EQ:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op == NE:
+                b = pop()
+                stack[-1] = stack[-1] != b
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                else:
+                    pc = arg
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == NEG_RANK or op == NEG_RATE:
+                stack[-1] = -stack[-1]
+            elif op == RANK_TO_RATE:
+                stack[-1] = to_rate(stack[-1])
+            elif op == TO_LABEL:
+                stack[-1] = str(stack[-1])
+            elif op == FLAG_TO_LABEL:
+                stack[-1] = 'true' if stack[-1] else 'false'
+            elif op == CONCAT:
+                b = pop()
+                stack[-1] += b
+            elif op == POP:
+                pop()
+            elif op == INPUT:
+                if not lines_ready(len(arg)):
+                    # grab is executed again once the input lines are there
+                    self.waiting = (stack[-1], len(arg))
+                    return self._suspend(current, pc - 1, slots, steps)
+                self._input(pop(), arg, slots)
+            elif op == HALT:
+                self.steps = steps
+                self.state = None
+                self.finished = True
+                return True
+            elif op == PROF_LOOP:
+                profiler.loop_iterations[arg] += 1
+            elif op == PROF_ENTER:
+                profiler.enter(arg)
+            elif op == PROF_EXIT:
+                profiler.exit(arg)
+            elif op == CHECK_LOCAL:
+                if slots[arg[0]] is None:
+                    raise PlayRuntimeError(f"Variable '{arg[1]}' not defined")
+            elif op == CHECK_GLOBAL:
+                if glob[arg[0]] is None:
+                    raise PlayRuntimeError(f"Variable '{arg[1]}' not defined")
+            else:
+                raise PlayRuntimeError(f"Unknown opcode {op}")
+
+    def _input(self, prompt, groups, slots):
+        # One line per comma separated group; every name of a chain gets the same value
+        read_line = self.io.read_line
+        for group in groups:
+            text = read_line(prompt)
+            prompt = ''
+            for is_global, slot, type_name in group:
+                value = parse_value(text, type_name)
+                if is_global:
+                    self.globals[slot] = value
+                else:
+                    slots[slot] = value
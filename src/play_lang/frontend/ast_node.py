@@ -11,10 +11,11 @@ class ExprNode(AstNode):
 # --- Struttura Generale ---
 
 class ProgramNode(AstNode):
-    def __init__(self, global_decls, functions, main_block):
+    def __init__(self, global_decls, functions, main_block, libraries=None):
         self.global_decls = global_decls # list of VarDeclNode
         self.functions = functions       # list of FunNode
         self.main_block = main_block     # BlockNode
+        self.libraries = libraries if libraries is not None else []  # list of Library (backend.library)
 
 class BlockNode(StmtNode):
     def __init__(self, statements):
@@ -25,13 +26,24 @@ class BlockNode(StmtNode):
 class VarDeclNode(StmtNode):
     def __init__(self, type_name, var_list):
         self.type_name = type_name # str ('rank', 'flag', etc.)
-        self.var_list = var_list   # list of VarInitNode
+        self.var_list = var_list   # list of VarInitNode / MultiVarInitNode
 
 class VarInitNode(AstNode):
     def __init__(self, name, expr=None):
         self.name = name     # str
         self.expr = expr     # ExprNode or None
 
+    @property
+    def names(self):
+        return [self.name]
+
+class MultiVarInitNode(AstNode):
+    # Chained declaration (rank: a = b <-- expr): expr is evaluated once
+    # and its value declares every name, left to right
+    def __init__(self, names, expr):
+        self.names = names   # list of str (at least two)
+        self.expr = expr     # ExprNode
+
 class FunNode(AstNode):
     def __init__(self, name, params, ret_type, body):
         self.name = name
@@ -50,6 +62,28 @@ class AssignNode(StmtNode):
         self.target = target # str
         self.expr = expr     # ExprNode
 
+    @property
+    def targets(self):
+        return [self.target]
+
+class MultiAssignNode(StmtNode):
+    # Chained assignment (a = b <-- expr): expr is evaluated once and stored
+    # into every target, left to right. In the lowered tree expr already has
+    # the type of the targets, except that a rank expression stays rank when
+    # only some targets are rate: those are promoted when stored.
+    def __init__(self, targets, expr, target_types=None):
+        self.targets = targets           # list of str (at least two)
+        self.expr = expr                 # ExprNode
+        self.target_types = target_types # same length as targets (lowered tree only)
+
+class ErrorNode(StmtNode):
+    # Declaration, action or statement skipped by the syntax error recovery
+    # (see frontend/recovery.py), also in global_decls and functions
+    def __init__(self, line, column, text):
+        self.line = line     # int, position of the error
+        self.column = column # int
+        self.text = text     # str, source code skipped
+
 class IfNode(StmtNode):
     def __init__(self, condition, then_block, elifs=None, else_block=None):
         self.condition = condition
@@ -75,9 +109,10 @@ class ForNode(StmtNode): # Loop
         self.block = block
 
 class InputNode(StmtNode):
-    def __init__(self, target_groups, prompt_expr):
+    def __init__(self, target_groups, prompt_expr, target_types=None):
         self.target_groups = target_groups # list of list of str (each inner list is a chain)
         self.prompt_expr = prompt_expr
+        self.target_types = target_types   # same shape as target_groups (lowered tree only)
 
 class OutputNode(StmtNode):
     def __init__(self, expr):
@@ -116,10 +151,115 @@ class LiteralNode(ExprNode):
         self.type_tag = type_tag # 'int', 'float', 'bool', 'string'
 
 class VarAccessNode(ExprNode):
-    def __init__(self, name):
+    def __init__(self, name, type_name=None):
         self.name = name
+        self.type_name = type_name # set in the lowered tree
 
 class FunCallExprNode(ExprNode):
-    def __init__(self, name, args):
+    def __init__(self, name, args, type_name=None):
         self.name = name
         self.args = args
+        self.type_name = type_name # return type, set in the lowered tree
+
+# --- Albero Lowered ---
+# Produced by SemanticAnalyzer(lower=True). Operators are specialized on the
+# operand types and every implicit conversion is an explicit node, so an
+# executor never has to inspect types at runtime. type_name is the result type.
+
+class LoweredProgramNode(ProgramNode):
+    pass
+
+class RankBinOpNode(ExprNode): # + - * / % on rank
+    type_name = 'rank'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class RateBinOpNode(ExprNode): # + - * / % on rate
+    type_name = 'rate'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class LabelConcatNode(ExprNode): # + on label (only with Lowerer(join_labels=False))
+    type_name = 'label'
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+class LabelJoinNode(ExprNode): # chain of + on label, joined once
+    type_name = 'label'
+    def __init__(self, parts):
+        self.parts = parts # list of label ExprNode, no two adjacent LiteralNode
+
+class RankCompareNode(ExprNode):
+    type_name = 'flag'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class RateCompareNode(ExprNode):
+    type_name = 'flag'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class LabelCompareNode(ExprNode):
+    type_name = 'flag'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class FlagCompareNode(ExprNode):
+    type_name = 'flag'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class LogicOpNode(ExprNode): # && || (short-circuit)
+    type_name = 'flag'
+    def __init__(self, left, op, right):
+        self.left = left
+        self.op = op
+        self.right = right
+
+class NotNode(ExprNode):
+    type_name = 'flag'
+    def __init__(self, expr):
+        self.expr = expr
+
+class RankNegNode(ExprNode):
+    type_name = 'rank'
+    def __init__(self, expr):
+        self.expr = expr
+
+class RateNegNode(ExprNode):
+    type_name = 'rate'
+    def __init__(self, expr):
+        self.expr = expr
+
+class RankToRateNode(ExprNode): # promotion rank -> rate
+    type_name = 'rate'
+    def __init__(self, expr):
+        self.expr = expr
+
+class RankToLabelNode(ExprNode):
+    type_name = 'label'
+    def __init__(self, expr):
+        self.expr = expr
+
+class RateToLabelNode(ExprNode):
+    type_name = 'label'
+    def __init__(self, expr):
+        self.expr = expr
+
+class FlagToLabelNode(ExprNode):
+    type_name = 'label'
+    def __init__(self, expr):
+        self.expr = expr
@@ -0,0 +1,251 @@
+from .ast_node import *
+
+_COMPARE_NODES = {'rank': RankCompareNode, 'rate': RateCompareNode,
+                  'label': LabelCompareNode, 'flag': FlagCompareNode}
+_TO_LABEL_NODES = {'rank': RankToLabelNode, 'rate': RateToLabelNode, 'flag': FlagToLabelNode}
+
+class Lowerer:
+    """
+    Builds the lowered tree of a validated program from the types computed by
+    the SemanticAnalyzer (expr_types: id(expr node) -> type).
+
+    The original AST is not modified. Declarations are replayed with the same
+    scoping as the analyzer (global scope + one scope per function) to know
+    the type of assignment and grab targets.
+
+    Chains of label '+' ("a: " + a + " b: " + -->b) become one LabelJoinNode
+    whose adjacent constant parts are merged, so executors build the string
+    in one pass; join_labels=False keeps one LabelConcatNode per '+'.
+    """
+    def __init__(self, expr_types, join_labels=True):
+        self.expr_types = expr_types
+        self.join_labels = join_labels
+        self.scopes = [{}]
+        self.signatures = {}
+        self.ret_type = None
+
+    def lower_program(self, node):
+        global_decls = [self.lower_stmt(decl) for decl in node.global_decls]
+        for library in node.libraries:
+            for fun_node in library.functions:
+                self.signatures[fun_node.name] = fun_node
+        for fun_node in node.functions:
+            self.signatures[fun_node.name] = fun_node
+        functions = [self._lower_function(fun_node) for fun_node in node.functions]
+        main_block = self._lower_block(node.main_block)
+        return LoweredProgramNode(global_decls, functions, main_block, node.libraries)
+
+    # --- Helpers ---
+
+    def _lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def _type(self, expr):
+        return self.expr_types[id(expr)]
+
+    def convert(self, expr, from_type, to_type):
+        """Makes an implicit conversion explicit (already validated by the analyzer)."""
+        if from_type == to_type:
+            return expr
+        if to_type == 'rate' and from_type == 'rank':
+            return RankToRateNode(expr)
+        if to_type == 'label':
+            return _TO_LABEL_NODES[from_type](expr)
+        raise Exception(f"No conversion from {from_type} to {to_type}")
+
+    def _lower_converted(self, expr, to_type):
+        return self.convert(self.lower_expr(expr), self._type(expr), to_type)
+
+    def _lower_args(self, name, args):
+        params = self.signatures[name].params
+        return [self._lower_converted(arg, param.type_name) for arg, param in zip(args, params)]
+
+    # --- Statements ---
+
+    def _lower_function(self, node):
+        self.scopes.append({p.name: p.type_name for p in node.params})
+        self.ret_type = node.ret_type
+        body = self._lower_block(node.body)
+        self.ret_type = None
+        self.scopes.pop()
+        return FunNode(node.name, node.params, node.ret_type, body)
+
+    def _lower_block(self, node):
+        return BlockNode([self.lower_stmt(stmt) for stmt in node.statements])
+
+    def lower_stmt(self, node):
+        if isinstance(node, VarDeclNode):
+            var_list = []
+            for var_init in node.var_list:
+                expr = None
+                if var_init.expr is not None:
+                    expr = self._lower_converted(var_init.expr, node.type_name)
+                for name in var_init.names:
+                    self.scopes[-1][name] = node.type_name
+                if isinstance(var_init, MultiVarInitNode):
+                    var_list.append(MultiVarInitNode(var_init.names, expr))
+                else:
+                    var_list.append(VarInitNode(var_init.name, expr))
+            return VarDeclNode(node.type_name, var_list)
+
+        if isinstance(node, AssignNode):
+            return AssignNode(node.target, self._lower_converted(node.expr, self._lookup(node.target)))
+
+        if isinstance(node, MultiAssignNode):
+            # Converted once when all targets have the same type; a rank value
+            # stored into rank and rate targets is promoted per target instead
+            target_types = [self._lookup(target) for target in node.targets]
+            if len(set(target_types)) == 1:
+                expr = self._lower_converted(node.expr, target_types[0])
+            else:
+                expr = self.lower_expr(node.expr)
+            return MultiAssignNode(node.targets, expr, target_types)
+
+        if isinstance(node, BlockNode):
+            return self._lower_block(node)
+
+        if isinstance(node, IfNode):
+            # In source order: a branch may use a name declared in an earlier one
+            condition = self.lower_expr(node.condition)
+            then_block = self._lower_block(node.then_block)
+            elifs = []
+            for elif_node in node.elifs or []:
+                elif_condition = self.lower_expr(elif_node.condition)
+                elifs.append(ElifNode(elif_condition, self._lower_block(elif_node.block)))
+            else_block = self._lower_block(node.else_block) if node.else_block else None
+            return IfNode(condition, then_block, elifs, else_block)
+
+        if isinstance(node, WhileNode):
+            return WhileNode(self.lower_expr(node.condition), self._lower_block(node.block))
+
+        if isinstance(node, ForNode):
+            init = self.lower_stmt(node.init)
+            condition = self.lower_expr(node.condition)
+            if isinstance(node.update, ExprNode):
+                update = self.lower_expr(node.update)
+            else:
+                update = self.lower_stmt(node.update)
+            return ForNode(init, condition, update, self._lower_block(node.block))
+
+        if isinstance(node, InputNode):
+            prompt = self.lower_expr(node.prompt_expr) if node.prompt_expr else None
+            target_types = [[self._lookup(name) for name in group] for group in node.target_groups]
+            return InputNode(node.target_groups, prompt, target_types)
+
+        if isinstance(node, OutputNode):
+            return OutputNode(self.lower_expr(node.expr))
+
+        if isinstance(node, ReturnNode):
+            if node.expr is None:
+                return ReturnNode(None)
+            return ReturnNode(self._lower_converted(node.expr, self.ret_type))
+
+        if isinstance(node, BreakNode):
+            return BreakNode()
+
+        if isinstance(node, FuncCallStmtNode):
+            return FuncCallStmtNode(node.name, self._lower_args(node.name, node.args))
+
+        raise Exception(f"Cannot lower {type(node).__name__}")
+
+    # --- Expressions ---
+
+    def lower_expr(self, node):
+        if isinstance(node, LiteralNode):
+            return LiteralNode(node.value, node.type_tag)
+
+        if isinstance(node, VarAccessNode):
+            return VarAccessNode(node.name, self._type(node))
+
+        if isinstance(node, FunCallExprNode):
+            return FunCallExprNode(node.name, self._lower_args(node.name, node.args), self._type(node))
+
+        if isinstance(node, UnaryOpNode):
+            inner = self.lower_expr(node.expr)
+            if node.op == '!':
+                return NotNode(inner)
+            if node.op == '-':
+                return RankNegNode(inner) if self._type(node) == 'rank' else RateNegNode(inner)
+            # '+' and '-->' don't change the value
+            return inner
+
+        if isinstance(node, BinOpNode):
+            return self._lower_binop(node)
+
+        raise Exception(f"Cannot lower {type(node).__name__}")
+
+    def _lower_binop(self, node):
+        op = node.op
+        left_type = self._type(node.left)
+        right_type = self._type(node.right)
+        result_type = self._type(node)
+
+        if op in ('&&', '||'):
+            return LogicOpNode(self.lower_expr(node.left), op, self.lower_expr(node.right))
+
+        if result_type == 'flag':
+            # Comparison: numeric operands are compared as rate if either one is
+            operand_type = left_type
+            if left_type != right_type:
+                operand_type = 'rate'
+            left = self._lower_converted(node.left, operand_type)
+            right = self._lower_converted(node.right, operand_type)
+            return _COMPARE_NODES[operand_type](left, op, right)
+
+        if result_type == 'label':
+            if not self.join_labels:
+                return LabelConcatNode(self._lower_converted(node.left, 'label'),
+                                       self._lower_converted(node.right, 'label'))
+            return self._lower_label_chain(node)
+
+        left = self._lower_converted(node.left, result_type)
+        right = self._lower_converted(node.right, result_type)
+        if result_type == 'rank':
+            return RankBinOpNode(left, op, right)
+        return RateBinOpNode(left, op, right)
+
+    # --- Label chains ---
+
+    def _is_concat(self, node):
+        return isinstance(node, BinOpNode) and node.op == '+' and self._type(node) == 'label'
+
+    def _chain_operands(self, node, operands):
+        # String concatenation is associative: both sides of a label '+' are flattened
+        for side in (node.left, node.right):
+            if self._is_concat(side):
+                self._chain_operands(side, operands)
+            else:
+                operands.append(side)
+
+    def _lower_label_chain(self, node):
+        operands = []
+        self._chain_operands(node, operands)
+
+        parts = []
+        for operand in operands:
+            part = self._lower_converted(operand, 'label')
+            part = self._fold_to_label(part)
+            if isinstance(part, LiteralNode):
+                if part.value == '':
+                    continue
+                if parts and isinstance(parts[-1], LiteralNode):
+                    parts[-1] = LiteralNode(parts[-1].value + part.value, 'label')
+                    continue
+            parts.append(part)
+
+        if not parts:
+            return LiteralNode('', 'label')
+        if len(parts) == 1:
+            return parts[0]
+        return LabelJoinNode(parts)
+
+    def _fold_to_label(self, node):
+        # Constant conversions ("x = " + 5) are done once, here
+        if isinstance(node, (RankToLabelNode, RateToLabelNode)) and isinstance(node.expr, LiteralNode):
+            return LiteralNode(str(node.expr.value), 'label')
+        if isinstance(node, FlagToLabelNode) and isinstance(node.expr, LiteralNode):
+            return LiteralNode('true' if node.expr.value else 'false', 'label')
+        return node
@@ -0,0 +1,166 @@
+from collections import namedtuple
+
+from lark import Token, Tree
+from lark.exceptions import UnexpectedCharacters, UnexpectedToken
+from lark.lexer import PatternStr
+from lark.parsers.lalr_analysis import Shift
+
+ERROR_TERMINAL = 'SYNTAX_ERROR'
+# Errors found less than RESYNC_TOKENS tokens after a recovery are not
+# reported: they are usually caused by the previous one
+RESYNC_TOKENS = 3
+MAX_ERRORS = 100
+# Tokens inserted at the end of the input to close an unterminated program
+_CLOSING = ('RBRACE', 'GAMEOVER')
+
+ParseError = namedtuple('ParseError', 'line column message')
+
+class SyntaxErrors(Exception):
+    """
+    Every error of a source that does not parse: the syntax errors (ParseError,
+    in source order) and the semantic errors found in the parts that parsed.
+    """
+    def __init__(self, errors, semantic_errors=()):
+        self.errors = list(errors)
+        self.semantic_errors = list(semantic_errors)
+        lines = [f"Syntax Error: line {e.line}, column {e.column}: {e.message}" for e in self.errors]
+        lines.extend(f"Semantic Error: {message}" for message in self.semantic_errors)
+        super().__init__('\n'.join(lines))
+
+def parse_with_recovery(parser, text, max_errors=MAX_ERRORS):
+    """
+    Parses text with the LALR parser, recovering from syntax errors: the
+    declaration, action or statement where an error is found is replaced by
+    a syntax_error node, and parsing resumes at the first later token that
+    can follow it (a new statement, a '}', an action, ...).
+
+    Returns (tree, errors): tree is None when the input could not be
+    completed even by closing its open blocks, or after max_errors errors.
+    """
+    errors = []
+    tokens = _tokens(parser, text, errors, max_errors)
+    if tokens is None:
+        return None, errors
+    state = parser.parse_interactive('').parser_state
+    states = state.parse_conf.states
+    end_state = state.parse_conf.end_state
+    shifted = RESYNC_TOKENS  # tokens shifted since the last recovery
+    i = 0
+    while len(errors) < max_errors:
+        if i < len(tokens):
+            token = tokens[i]
+        else:
+            token = _end_token(tokens)
+        try:
+            if token.type == '$END':
+                return state.feed_token(token, is_end=True), sorted(errors)
+            state.feed_token(token)
+            i += 1
+            shifted += 1
+            continue
+        except UnexpectedToken:
+            pass
+
+        if shifted >= RESYNC_TOKENS:
+            errors.append(ParseError(token.line, token.column, _describe(parser, states, state.state_stack, token)))
+        shifted = 0
+        i = _recover(states, end_state, state, tokens, i, text)
+        if i is None:
+            if token.type == '$END' and _close(states, end_state, state, token):
+                return state.feed_token(token, is_end=True), sorted(errors)
+            return None, sorted(errors)
+    return None, sorted(errors)
+
+def _tokens(parser, text, errors, max_errors):
+    # Characters that no terminal matches are reported, then lexed as blanks
+    while len(errors) < max_errors:
+        try:
+            return list(parser.lex(text))
+        except UnexpectedCharacters as e:
+            errors.append(ParseError(e.line, e.column, f"unexpected character {text[e.pos_in_stream]!r}"))
+            text = text[:e.pos_in_stream] + ' ' + text[e.pos_in_stream + 1:]
+    return None
+
+def _end_token(tokens):
+    if tokens:
+        return Token.new_borrow_pos('$END', '', tokens[-1])
+    return Token('$END', '', 0, 1, 1)
+
+def _accepts(states, end_state, stack, token_type):
+    """Whether the parser with this state stack can shift token_type (or end the input)."""
+    stack = list(stack)
+    while True:
+        action = states[stack[-1]].get(token_type)
+        if action is None:
+            return False
+        if action[0] is Shift:
+            return True
+        rule = action[1]
+        if rule.expansion:
+            del stack[-len(rule.expansion):]
+        stack.append(states[stack[-1]][rule.origin.name][1])
+        if token_type == '$END' and stack[-1] == end_state:
+            return True
+
+def _recover(states, end_state, state, tokens, i, text):
+    """
+    Pops the state stack to the innermost declaration, action or statement
+    list, pushes a syntax_error there and skips tokens until one can follow
+    it; when no list can be resumed (after the play block) the tokens are
+    just skipped. Returns the index of the next token to feed, or None.
+    """
+    stack = state.state_stack
+    # Only where a list can take a new item: no partial construct is completed
+    depths = [d for d in range(len(stack), 0, -1)
+              if states[stack[d - 1]].get(ERROR_TERMINAL, (None,))[0] is Shift]
+    after_error = {d: stack[:d] + [states[stack[d - 1]][ERROR_TERMINAL][1]] for d in depths}
+    for j in range(i, len(tokens) + 1):
+        token_type = tokens[j].type if j < len(tokens) else '$END'
+        for d in depths:
+            if _accepts(states, end_state, after_error[d], token_type):
+                position = tokens[i] if i < len(tokens) else _end_token(tokens)
+                # The syntax_error token holds the source code it replaces
+                popped = [t for value in state.value_stack[d - 1:] for t in _leaves(value)]
+                start = popped[0].start_pos if popped else position.start_pos
+                end = tokens[j - 1].end_pos if j > i else (popped[-1].end_pos if popped else start)
+                del state.state_stack[d:]
+                del state.value_stack[d - 1:]
+                state.feed_token(Token.new_borrow_pos(ERROR_TERMINAL, text[start:end], position))
+                return j
+        if j > i and _accepts(states, end_state, stack, token_type):
+            return j
+    return None
+
+def _leaves(value):
+    if isinstance(value, Token):
+        yield value
+    elif isinstance(value, Tree):
+        for child in value.children:
+            yield from _leaves(child)
+
+def _close(states, end_state, state, token):
+    # Unterminated input: insert the '}' and gameover it is missing
+    for _ in range(len(state.state_stack)):
+        if _accepts(states, end_state, state.state_stack, '$END'):
+            return True
+        for token_type in _CLOSING:
+            if _accepts(states, end_state, state.state_stack, token_type):
+                state.feed_token(Token.new_borrow_pos(token_type, '', token))
+                break
+        else:
+            return False
+    return False
+
+def _describe(parser, states, stack, token):
+    found = 'end of input' if token.type == '$END' else repr(token.value)
+    expected = sorted({_terminal(parser, name) for name in states[stack[-1]]
+                       if name.isupper() and name != ERROR_TERMINAL})
+    if len(expected) > 2:
+        return f"unexpected {found}, expected one of {', '.join(expected)}"
+    return f"unexpected {found}, expected {' or '.join(expected)}"
+
+def _terminal(parser, name):
+    if name == '$END':
+        return 'end of input'
+    pattern = parser.get_terminal(name).pattern
+    return repr(pattern.value) if isinstance(pattern, PatternStr) else name
@@ -1,10 +1,72 @@
 import sys
 import os
+import re
 
 from .ast_node import *
+from .lowering import Lowerer
 
 class SemanticError(Exception):
-    pass
+    def __init__(self, message, undefined=None):
+        super().__init__(message)
+        self.undefined = undefined  # the name, for errors about undeclared names
+
+# Identifiers, as the ID terminal of the grammar
+_IDENTIFIER = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+
+# --- Type codes ---
+# Types are small integers inside the analyzer; names are only used in
+# error messages and in expr_types. Numeric types come first (see _is_numeric).
+
+RANK, RATE, FLAG, LABEL, VOID = range(5)
+TYPE_NAMES = ('rank', 'rate', 'flag', 'label', 'void')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+LOGIC_OPS = frozenset(['&&', '||'])
+COMPARE_OPS = frozenset(['==', '<>', '<', '<=', '>', '>='])
+ARITH_OPS = frozenset(['-', '*', '/', '%'])
+
+def _compatible(expected, actual):
+    # Promotion: rank -> rate (expected=rate, actual=rank is OK)
+    return expected == actual or (expected == RATE and actual == RANK)
+
+def _binop_rule(op, left, right):
+    """Result type of 'left op right', or None if the operands are invalid."""
+    if VOID in (left, right):
+        return None  # the call of an action without result has no value
+    numeric = left <= RATE and right <= RATE
+    # Logic: &&, ||
+    if op in LOGIC_OPS:
+        return FLAG if left == FLAG and right == FLAG else None
+    # Comparison: both numeric or both of the same type (e.g. label == label)
+    if op in COMPARE_OPS:
+        if _compatible(left, right) or _compatible(right, left):
+            if numeric or left == right:
+                return FLAG
+        return None
+    # Arithmetic: + is also label concatenation
+    if op == '+' and (left == LABEL or right == LABEL):
+        return LABEL
+    if op == '+' or op in ARITH_OPS:
+        if numeric:
+            return RATE if RATE in (left, right) else RANK
+    return None
+
+# (op, left, right) -> result type, for every valid combination
+BINOP_TABLE = {
+    (op, left, right): _binop_rule(op, left, right)
+    for op in LOGIC_OPS | COMPARE_OPS | ARITH_OPS | {'+'}
+    for left in range(len(TYPE_NAMES))
+    for right in range(len(TYPE_NAMES))
+    if _binop_rule(op, left, right) is not None
+}
+
+# (expected, actual) pairs accepted by assignments, arguments and returns
+COMPATIBLE = frozenset(
+    (expected, actual)
+    for expected in range(len(TYPE_NAMES))
+    for actual in range(len(TYPE_NAMES))
+    if _compatible(expected, actual)
+)
 
 class SymbolTable:
     def __init__(self):
@@ -21,7 +83,7 @@ class SymbolTable:
 
     def define(self, name, type_info, kind):
         """
-        type_info: 'rank', 'rate', 'flag', 'label', or function signature
+        type_info: type code (RANK, RATE, FLAG, LABEL), or function signature
         kind: 'var' or 'func'
         """
         current_scope = self.scopes[-1]
@@ -37,44 +99,111 @@ class SymbolTable:
         return None
 
 class SemanticAnalyzer:
-    def __init__(self):
+    """
+    Checks scopes and types of a ProgramNode, recording the type of every
+    expression in expr_types.
+
+    With collect_errors=True a SemanticError does not stop the analysis: it
+    is appended to errors and the analysis goes on with the next global
+    declaration, action or statement (used on the partial AST of a source
+    with syntax errors). Names that appear in the code skipped by an
+    ErrorNode are not reported as undeclared after it, since the skipped
+    code may have declared them. Nothing is lowered when there are errors.
+    """
+    def __init__(self, lower=False, collect_errors=False):
         self.symbol_table = SymbolTable()
         self.in_output = False
+        # Type computed for every expression: id(expr node) -> type name
+        self.expr_types = {}
+        # With lower=True, visiting a ProgramNode also builds the lowered tree
+        self.lower = lower
+        self.lowered_program = None
+        self.collect_errors = collect_errors
+        self.errors = []
+        self.skipped_names = set()
+        self.block_depth = 0
+        # Visitor cache: node class -> (bound visit method, is expression)
+        self._visitors = {}
         # Initialize embedded functions or constants if needed
-    
+
     def visit(self, node):
-        method_name = f'visit_{type(node).__name__}'
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        """Visits a node; expressions return their type code."""
+        cls = node.__class__
+        entry = self._visitors.get(cls)
+        if entry is None:
+            visitor = getattr(self, f'visit_{cls.__name__}', self.generic_visit)
+            entry = self._visitors[cls] = (visitor, issubclass(cls, ExprNode))
+        visitor, is_expr = entry
+        result = visitor(node)
+        if is_expr:
+            self.expr_types[id(node)] = TYPE_NAMES[result] if result is not None else None
+        return result
 
     def generic_visit(self, node):
         raise Exception(f"No visit_{type(node).__name__} method")
 
     def visit_ProgramNode(self, node):
+        check = self._check if self.collect_errors else self._call
         # 1. Register global variables
         for var_decl in node.global_decls:
-            self.visit(var_decl)
-        
-        # 2. Register function signatures first (to allow forward refs / recursion if supported, or just standard def)
+            check(self.visit, var_decl)
+
+        # 2. Register the signatures of linked library actions (their bodies
+        #    were analyzed when the library was built) and of the program's
+        #    functions (to allow forward refs / recursion if supported, or just standard def)
+        for library in node.libraries:
+            for name, sig in library.signatures.items():
+                check(self._register_library_function, library, name, sig)
         for fun_node in node.functions:
-            self._register_function(fun_node)
+            if isinstance(fun_node, ErrorNode):
+                self.visit(fun_node)
+            else:
+                check(self._register_function, fun_node)
 
         # 3. Analyze function bodies
         for fun_node in node.functions:
-            self.visit(fun_node)
+            if not isinstance(fun_node, ErrorNode):
+                check(self.visit, fun_node)
 
         # 4. Analyze main block
         self.visit(node.main_block)
 
+        # 5. Optional lowering, now that every expression has a type
+        if self.lower and not self.errors:
+            self.lowered_program = Lowerer(self.expr_types).lower_program(node)
+
+    @staticmethod
+    def _call(function, *args):
+        function(*args)
+
+    def _check(self, function, *args):
+        # collect_errors: records a SemanticError and restores the analyzer
+        # state (scopes, loop and output flags) of before the failed node
+        scopes = len(self.symbol_table.scopes)
+        flags = (self.in_output, getattr(self, 'loop_depth', 0), getattr(self, 'in_loop', False),
+                 getattr(self, 'current_function_ret_type', None))
+        try:
+            function(*args)
+        except SemanticError as e:
+            if e.undefined not in self.skipped_names:
+                self.errors.append(str(e))
+            del self.symbol_table.scopes[scopes:]
+            self.in_output, self.loop_depth, self.in_loop, self.current_function_ret_type = flags
+
+    def _register_library_function(self, library, name, sig):
+        if self.symbol_table.lookup(name):
+            raise SemanticError(f"Function '{name}' already defined (library '{library.name}').")
+        self.symbol_table.define(name, sig, 'func')
+
     def _register_function(self, node):
         # Check if already defined
         if self.symbol_table.lookup(node.name):
              raise SemanticError(f"Function '{node.name}' already defined.")
-        
+
         # Build signature: (param_types, return_type)
-        param_types = [p.type_name for p in node.params]
-        sig = {'params': param_types, 'ret': node.ret_type}
-        
+        param_types = [TYPE_CODES[p.type_name] for p in node.params]
+        sig = {'params': param_types, 'ret': TYPE_CODES[node.ret_type]}
+
         # Define in GLOBAL scope (assumed to be current scope at this point or strictly scope[0])
         # Since we are in visit_ProgramNode, we should be in global scope.
         self.symbol_table.define(node.name, sig, 'func')
@@ -82,82 +211,124 @@ class SemanticAnalyzer:
     # --- Declarations ---
 
     def visit_VarDeclNode(self, node):
-        type_name = node.type_name
+        type_code = TYPE_CODES[node.type_name]
         for var_init in node.var_list:
-            self._visit_VarInitNode(var_init, type_name)
-
-    def _visit_VarInitNode(self, node, type_name):
-        # Check init expr type if present
+            if not self.collect_errors:
+                self._visit_VarInitNode(var_init, type_code)
+                continue
+            # A wrong initializer is reported, its names are still declared
+            self._check(self._visit_VarInitNode, var_init, type_code)
+            for name in var_init.names:
+                if name not in self.symbol_table.scopes[-1]:
+                    self.symbol_table.define(name, type_code, 'var')
+
+    def _visit_VarInitNode(self, node, type_code):
+        # Check init expr type if present (once for a chain: rank: a = b <-- expr)
         if node.expr:
             expr_type = self.visit(node.expr)
-            if not self._check_type_compatibility(type_name, expr_type):
-                raise SemanticError(f"Type mismatchin declaration of '{node.name}': expected {type_name}, got {expr_type}")
-        
-        self.symbol_table.define(node.name, type_name, 'var')
+            if (type_code, expr_type) not in COMPATIBLE:
+                raise SemanticError(f"Type mismatchin declaration of '{node.names[0]}': expected {TYPE_NAMES[type_code]}, got {_name(expr_type)}")
+
+        for name in node.names:
+            self._check_shadowing(name)
+            self.symbol_table.define(name, type_code, 'var')
+
+    def _check_shadowing(self, name):
+        # Names are resolved when the code runs: a local declared in a nested
+        # block may not be declared yet where a later read expects it, and
+        # the read would see the global instead (or a static slot in the VM)
+        if getattr(self, 'current_function_ret_type', None) is None or self.block_depth <= 1:
+            return
+        outer = self.symbol_table.scopes[0].get(name)
+        if outer is not None and outer['kind'] == 'var':
+            raise SemanticError(f"Local '{name}' shadows a global: declare it in the top-level block of the action")
 
     # --- Functions ---
 
     def visit_FunNode(self, node):
         # Function signature already registered in visit_ProgramNode
         self.symbol_table.enter_scope()
-        
+
         # Define parameters
         for param in node.params:
-            self.symbol_table.define(param.name, param.type_name, 'var')
-            
+            self.symbol_table.define(param.name, TYPE_CODES[param.type_name], 'var')
+
         # Visit body
         # We need to pass expected return type to check returns inside block?
         # Or store it in instance var.
-        self.current_function_ret_type = node.ret_type
+        self.current_function_ret_type = TYPE_CODES[node.ret_type]
         self.visit(node.body)
         self.current_function_ret_type = None
-        
+
         self.symbol_table.exit_scope()
 
     # --- Statements ---
 
     def visit_BlockNode(self, node):
-        for stmt in node.statements:
-            self.visit(stmt)
+        self.block_depth += 1
+        try:
+            if self.collect_errors:
+                for stmt in node.statements:
+                    self._check(self.visit, stmt)
+                return
+            visit = self.visit
+            for stmt in node.statements:
+                visit(stmt)
+        finally:
+            self.block_depth -= 1
+
+    def visit_ErrorNode(self, node):
+        # The code did not parse: its syntax error is already reported
+        self.skipped_names.update(_IDENTIFIER.findall(node.text))
 
     def visit_AssignNode(self, node):
-        target_name = node.target
+        target_type = self._assign_target(node.target)
+        expr_type = self.visit(node.expr)
+        self._check_assign(node.target, target_type, expr_type)
+
+    def visit_MultiAssignNode(self, node):
+        # The expression is checked once against every target
+        target_types = [self._assign_target(target) for target in node.targets]
+        expr_type = self.visit(node.expr)
+        for target, target_type in zip(node.targets, target_types):
+            self._check_assign(target, target_type, expr_type)
+
+    def _assign_target(self, target_name):
         target_info = self.symbol_table.lookup(target_name)
         if not target_info:
-            raise SemanticError(f"Variable '{target_name}' not declared.")
+            raise SemanticError(f"Variable '{target_name}' not declared.", target_name)
         if target_info['kind'] != 'var':
              raise SemanticError(f"Cannot assign to '{target_name}' which is a {target_info['kind']}")
-        
-        target_type = target_info['type']
-        expr_type = self.visit(node.expr)
-        
-        if not self._check_type_compatibility(target_type, expr_type):
-             raise SemanticError(f"Type mismatch in assignment to '{target_name}': expected {target_type}, got {expr_type}")
+        return target_info['type']
+
+    def _check_assign(self, target_name, target_type, expr_type):
+        if (target_type, expr_type) not in COMPATIBLE:
+             raise SemanticError(f"Type mismatch in assignment to '{target_name}': expected {TYPE_NAMES[target_type]}, got {_name(expr_type)}")
 
     def visit_IfNode(self, node):
         cond_type = self.visit(node.condition)
-        if cond_type != 'flag':
-             raise SemanticError(f"If condition must be 'flag', got {cond_type}")
-        
+        if cond_type != FLAG:
+             raise SemanticError(f"If condition must be 'flag', got {_name(cond_type)}")
+
         self.visit(node.then_block)
-        
+
         if node.elifs:
             for elif_node in node.elifs:
                 self.visit(elif_node)
-        
+
         if node.else_block:
             self.visit(node.else_block)
 
     def visit_ElifNode(self, node):
         cond_type = self.visit(node.condition)
-        if cond_type != 'flag':
-             raise SemanticError(f"Elif condition must be 'flag', got {cond_type}")
+        if cond_type != FLAG:
+             raise SemanticError(f"Elif condition must be 'flag', got {_name(cond_type)}")
         self.visit(node.block)
 
     def visit_WhileNode(self, node):
         cond_type = self.visit(node.condition)
-        if cond_type != 'flag':
-             raise SemanticError(f"While condition must be 'flag', got {cond_type}")
+        if cond_type != FLAG:
+             raise SemanticError(f"While condition must be 'flag', got {_name(cond_type)}")
         self._enter_loop()
         self.visit(node.block)
         self._exit_loop()
@@ -166,18 +337,18 @@ class SemanticAnalyzer:
         # New scope for loop var? The specs don't explicitly say for-loop vars are local to loop,
         # but typically init is a statement. If it's a declaration, we might need a scope.
         # Our grammar: `for_stat: LOOP LPAR assign_stmt SEMI expr SEMI (assign_stmt | expr) ...`
-        # `assign_stmt` uses existing vars. So no new scope needed for vars, 
+        # `assign_stmt` uses existing vars. So no new scope needed for vars,
         # but we need to verify the parts.
-        
+
         self.visit(node.init)
-        
+
         cond_type = self.visit(node.condition)
-        if cond_type != 'flag':
-             raise SemanticError(f"For condition must be 'flag', got {cond_type}")
-             
+        if cond_type != FLAG:
+             raise SemanticError(f"For condition must be 'flag', got {_name(cond_type)}")
+
         # Update can be Stmt (Assign) or Expr
         self.visit(node.update)
-        
+
         self._enter_loop()
         self.visit(node.block)
         self._exit_loop()
@@ -186,38 +357,38 @@ class SemanticAnalyzer:
         # node.prompt_expr
         if node.prompt_expr:
             p_type = self.visit(node.prompt_expr)
-            if p_type != 'label':
-                raise SemanticError(f"Input prompt must be 'label', got {p_type}")
-        
+            if p_type != LABEL:
+                raise SemanticError(f"Input prompt must be 'label', got {_name(p_type)}")
+
         # node.target_groups is list of lists.
         # "flattened" check as per spec
         for group in node.target_groups:
             for var_name in group:
                 info = self.symbol_table.lookup(var_name)
                 if not info:
-                    raise SemanticError(f"Input target '{var_name}' not declared")
+                    raise SemanticError(f"Input target '{var_name}' not declared", var_name)
 
     def visit_OutputNode(self, node):
         self.in_output = True
         expr_type = self.visit(node.expr)
         self.in_output = False
-        
-        if expr_type != 'label':
-             raise SemanticError(f"Output requires 'label', got {expr_type}")
+
+        if expr_type != LABEL:
+             raise SemanticError(f"Output requires 'label', got {_name(expr_type)}")
 
     def visit_ReturnNode(self, node):
         if not hasattr(self, 'current_function_ret_type') or self.current_function_ret_type is None:
              raise SemanticError("Return statement outside function")
-             
+
         ret_type = self.current_function_ret_type
-        
+
         if node.expr:
             expr_type = self.visit(node.expr)
-            if not self._check_type_compatibility(ret_type, expr_type):
-                 raise SemanticError(f"Invalid return type: expected {ret_type}, got {expr_type}")
+            if (ret_type, expr_type) not in COMPATIBLE:
+                 raise SemanticError(f"Invalid return type: expected {TYPE_NAMES[ret_type]}, got {_name(expr_type)}")
         else:
-            if ret_type != 'void':
-                 raise SemanticError(f"Return value expected for non-void function (expected {ret_type})")
+            if ret_type != VOID:
+                 raise SemanticError(f"Return value expected for non-void function (expected {TYPE_NAMES[ret_type]})")
 
     def visit_BreakNode(self, node):
         if not getattr(self, 'in_loop', False):
@@ -229,14 +400,13 @@ class SemanticAnalyzer:
     # --- Expressions ---
 
     def visit_LiteralNode(self, node):
-        # Mappings: 'int'->'rank', 'float'->'rate', 'string'->'label', 'bool'->'flag'
         # node.type_tag comes from transformer: 'rank', 'rate', 'label', 'flag'
-        return node.type_tag
+        return TYPE_CODES[node.type_tag]
 
     def visit_VarAccessNode(self, node):
         info = self.symbol_table.lookup(node.name)
         if not info:
-             raise SemanticError(f"Variable '{node.name}' not defined")
+             raise SemanticError(f"Variable '{node.name}' not defined", node.name)
         return info['type']
 
     def visit_BinOpNode(self, node):
@@ -244,55 +414,38 @@ class SemanticAnalyzer:
         right = self.visit(node.right)
         op = node.op
 
-        # Logic: &&, ||
-        if op in ['&&', '||']:
-            if left == 'flag' and right == 'flag':
-                return 'flag'
-            raise SemanticError(f"Logical op {op} requires flags, got {left}, {right}")
+        result = BINOP_TABLE.get((op, left, right))
+        if result is not None:
+            return result
 
-        # Comparison: ==, <>, <, <=, >, >=
-        if op in ['==', '<>', '<', '<=', '>', '>=']:
-            if self._check_type_compatibility(left, right) or self._check_type_compatibility(right, left):
-                 # Loose check: strict check would be both numeric OR both string OR both flag
-                 if self._is_numeric(left) and self._is_numeric(right): return 'flag'
-                 if left == right: return 'flag' # e.g. label == label
-                 # Allow cross-numeric comparison? Rule says 9: "compatible"
-                 pass
+        # Invalid combination: same messages as the rule that rejected it
+        if VOID in (left, right):
+            raise SemanticError(f"Operator {op} cannot use a void value (an action without result)")
+        left, right = _name(left), _name(right)
+        if op in LOGIC_OPS:
+            raise SemanticError(f"Logical op {op} requires flags, got {left}, {right}")
+        if op in COMPARE_OPS:
             raise SemanticError(f"Comparison {op} types incompatible: {left}, {right}")
-            return 'flag'
-
-        # Arithmetic: +, -, *, /, %
         if op == '+':
-            # Special case: String concat
-            if left == 'label' or right == 'label':
-                return 'label'
-            # Numeric sum
-            if self._is_numeric(left) and self._is_numeric(right):
-                if left == 'rate' or right == 'rate': return 'rate'
-                return 'rank'
             raise SemanticError(f"Operator + incompatible types: {left}, {right}")
-            
-        if op in ['-', '*', '/', '%']:
-            if self._is_numeric(left) and self._is_numeric(right):
-                if left == 'rate' or right == 'rate': return 'rate'
-                return 'rank'
+        if op in ARITH_OPS:
             raise SemanticError(f"Operator {op} requires numeric, got {left}, {right}")
 
     def visit_UnaryOpNode(self, node):
         op = node.op
         expr_type = self.visit(node.expr)
-        
+
         if op == '!':
-            if expr_type == 'flag': return 'flag'
-            raise SemanticError(f"Not (!) requires flag, got {expr_type}")
-        
-        if op in ['-', '+']:
+            if expr_type == FLAG: return FLAG
+            raise SemanticError(f"Not (!) requires flag, got {_name(expr_type)}")
+
+        if op == '-' or op == '+':
             if self._is_numeric(expr_type): return expr_type
-            raise SemanticError(f"Unary {op} requires numeric, got {expr_type}")
-            
+            raise SemanticError(f"Unary {op} requires numeric, got {_name(expr_type)}")
+
         if op == '-->':
             # Rule 2: Operator --> can only be used in Output (Drop)
-            if not getattr(self, 'in_output', False):
+            if not self.in_output:
                  raise SemanticError("Operator '-->' can only be used in 'drop' statements")
             return expr_type
 
@@ -304,34 +457,28 @@ class SemanticAnalyzer:
     def _check_func_call(self, name, args):
         info = self.symbol_table.lookup(name)
         if not info:
-             raise SemanticError(f"Function '{name}' not defined")
+             raise SemanticError(f"Function '{name}' not defined", name)
         if info['kind'] != 'func':
              raise SemanticError(f"'{name}' is not a function")
-        
+
         sig = info['type'] # {params: [...], ret: ...}
         param_types = sig['params']
-        
+
         if len(args) != len(param_types):
              raise SemanticError(f"Function '{name}' expects {len(param_types)} args, got {len(args)}")
-             
+
         for i, arg_expr in enumerate(args):
             arg_type = self.visit(arg_expr)
-            if not self._check_type_compatibility(param_types[i], arg_type):
-                 raise SemanticError(f"Argument {i+1} of '{name}' type mismatch: expected {param_types[i]}, got {arg_type}")
-                 
+            if (param_types[i], arg_type) not in COMPATIBLE:
+                 raise SemanticError(f"Argument {i+1} of '{name}' type mismatch: expected {TYPE_NAMES[param_types[i]]}, got {_name(arg_type)}")
+
         return sig['ret']
 
     def _check_type_compatibility(self, expected, actual):
-        if expected == actual:
-            return True
-        # Promotion: rank -> rate (assignment of rank to rate variable is ok?)
-        # Usually: expected=rate, actual=rank is OK.
-        if expected == 'rate' and actual == 'rank':
-            return True
-        return False
+        return (expected, actual) in COMPATIBLE
 
     def _is_numeric(self, t):
-        return t in ['rank', 'rate']
+        return t is not None and t <= RATE
 
     def _enter_loop(self):
         if not hasattr(self, 'loop_depth'): self.loop_depth = 0
@@ -342,3 +489,7 @@ class SemanticAnalyzer:
         self.loop_depth -= 1
         if self.loop_depth == 0:
             self.in_loop = False
+
+def _name(type_code):
+    # Type name for error messages (None for ill-formed expressions)
+    return TYPE_NAMES[type_code] if type_code is not None else None
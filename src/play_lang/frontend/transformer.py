@@ -20,12 +20,17 @@ class PlayTransformer(Transformer):
         # main_block è un BlockNode
         return ProgramNode(items[0], items[1], items[2])
 
+    def library(self, items):
+        # items: [function_defs] -> programma senza globali né blocco play
+        return ProgramNode([], items[0], BlockNode([]))
+
     def decl_list(self, items):
         # items è già una lista di VarDeclNode grazie alla regola var_decl*
+        # (ed ErrorNode per le dichiarazioni saltate dal recupero degli errori)
         return items
 
     def function_defs(self, items):
-        # items è una lista di FunNode
+        # items è una lista di FunNode (ed ErrorNode, come in decl_list)
         return items
 
     def main_block(self, items):
@@ -52,6 +57,10 @@ class PlayTransformer(Transformer):
         # Pass-through: restituisce direttamente il figlio (es. AssignNode, IfNode...)
         return items[0]
 
+    def syntax_error(self, items):
+        # items: [SYNTAX_ERROR], inserito solo dal recupero degli errori (recovery.py)
+        return ErrorNode(items[0].line, items[0].column, str(items[0]))
+
     # --- Dichiarazioni ---
 
     def var_decl(self, items):
@@ -82,18 +91,15 @@ class PlayTransformer(Transformer):
         
         # Caso 3: ID = var_item (dichiarazione a catena: rank a = b <-- 10)
         elif len(items) == 3 and items[1].type == 'EQUALS':
-            child_list = items[2] # Lista di VarInitNode del figlio
-            # Prendiamo l'espressione dal primo nodo della lista figlia 
-            # (che corrisponde alla variabile immediatamente a destra)
-            first_child = child_list[0]
+            # La lista figlia contiene un solo nodo: la variabile (o la catena) a destra
+            first_child = items[2][0]
             
             # Rule 1: Chains must have an assigned value
             if first_child.expr is None:
                 raise Exception(f"Invalid chain: '{name}' cannot be equated to '{first_child.name}' without a value assignment.")
 
-            # Creiamo il nodo per la variabile corrente copiando l'espressione
-            current_node = VarInitNode(name, first_child.expr)
-            return [current_node] + child_list
+            # Un solo nodo per tutta la catena: l'espressione viene valutata una volta sola
+            return [MultiVarInitNode([name] + first_child.names, first_child.expr)]
         
         return []
 
@@ -140,8 +146,10 @@ class PlayTransformer(Transformer):
             
         target_group = groups[-1] # Es. ['b', 'c'] in "a, b=c <-- 10"
         
-        # Crea un AssignNode per ogni variabile nella catena target
-        return [AssignNode(name, expr) for name in target_group]
+        # Una catena diventa un solo MultiAssignNode: l'espressione viene valutata una volta sola
+        if len(target_group) == 1:
+            return [AssignNode(target_group[0], expr)]
+        return [MultiAssignNode(target_group, expr)]
 
     def input_stat(self, items):
         # items: [lvalue_list, ASSIGN, GRAB, expr]
@@ -190,7 +198,7 @@ class PlayTransformer(Transformer):
 
     def for_stat(self, items):
         # items: [LOOP, LPAR, assign_stmt, SEMI, expr, SEMI, update, RPAR, ARROW, block]
-        # init (assign_stmt) restituisce una lista di AssignNode.
+        # init (assign_stmt) restituisce una lista con un AssignNode o un MultiAssignNode.
         # ForNode richiede un singolo StmtNode o BlockNode per init.
         init_nodes = items[2]
         if len(init_nodes) == 1:
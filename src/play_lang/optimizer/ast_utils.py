@@ -0,0 +1,349 @@
+from ..frontend.ast_node import *
+from ..frontend.semantic_analysis import SemanticAnalyzer
+
+# --- Expression helpers ---
+
+def expr_key(node):
+    """
+    Structural key of an expression: two expressions with the same key
+    compute the same value when they read the same variable values.
+    Returns None for expressions that must not be shared (function calls).
+    """
+    if isinstance(node, LiteralNode):
+        return ('lit', node.type_tag, node.value)
+    if isinstance(node, VarAccessNode):
+        return ('var', node.name)
+    if isinstance(node, BinOpNode):
+        left = expr_key(node.left)
+        right = expr_key(node.right)
+        if left is None or right is None:
+            return None
+        return ('bin', node.op, left, right)
+    if isinstance(node, UnaryOpNode):
+        inner = expr_key(node.expr)
+        if inner is None:
+            return None
+        return ('un', node.op, inner)
+    return None
+
+def expr_vars(node):
+    """Set of variable names read by an expression (arguments included)."""
+    names = set()
+    for sub in iter_expr(node):
+        if isinstance(sub, VarAccessNode):
+            names.add(sub.name)
+    return names
+
+def iter_expr(node):
+    """
+    Yields the expression and all its sub-expressions (pre-order).
+    Works on the AST and on the lowered tree.
+    """
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current is None:
+            continue
+        yield current
+        if isinstance(current, FunCallExprNode):
+            stack.extend(reversed(current.args))
+        elif isinstance(current, LabelJoinNode):
+            stack.extend(reversed(current.parts))
+        elif hasattr(current, 'left'):
+            # BinOpNode and the lowered binary nodes
+            stack.append(current.right)
+            stack.append(current.left)
+        elif hasattr(current, 'expr'):
+            # UnaryOpNode and the lowered unary / conversion nodes
+            stack.append(current.expr)
+
+def may_raise(node, rank_types=None):
+    """
+    True if the operator at the root of the expression may raise: division
+    or modulo by a non-constant. rank_types are the expression types of a
+    program whose ranks are 64-bit (native code, see
+    optimize_program(rank_overflow=True)): there rank + - *, negation and
+    division by -1 can overflow, unless their operands are literals whose
+    result fits.
+    """
+    if isinstance(node, BinOpNode):
+        if node.op in ('/', '%'):
+            divisor = node.right
+            if not (isinstance(divisor, LiteralNode) and divisor.value != 0):
+                return True
+            if divisor.value != -1:
+                return False
+        elif node.op not in ('+', '-', '*'):
+            return False
+        if rank_types is None or rank_types.get(id(node)) != 'rank':
+            return False
+        if isinstance(node.left, LiteralNode) and isinstance(node.right, LiteralNode):
+            a, b = node.left.value, node.right.value
+            value = {'+': a + b, '-': a - b, '*': a * b}.get(node.op, -a)
+            return not -2**63 <= value < 2**63
+        return True
+    if isinstance(node, UnaryOpNode) and node.op == '-':
+        return (rank_types is not None and rank_types.get(id(node)) == 'rank'
+                and not isinstance(node.expr, LiteralNode))
+    return False
+
+def is_trapping(node, rank_types=None):
+    """True if evaluating the expression may raise (see may_raise)."""
+    return any(may_raise(sub, rank_types) for sub in iter_expr(node))
+
+def is_movable(node, rank_types=None):
+    """
+    An expression can be evaluated at another point of the program if it has
+    no side effects, cannot raise and is not restricted to drop ('-->').
+    Variable reads are not checked: a local whose declaration may not have
+    run at the new point can fail there (see dataflow.DeclaredLocals).
+    """
+    for sub in iter_expr(node):
+        if isinstance(sub, FunCallExprNode):
+            return False
+        if isinstance(sub, UnaryOpNode) and sub.op == '-->':
+            return False
+    return not is_trapping(node, rank_types)
+
+def is_compound(node):
+    """Only expressions that actually compute something are worth a temporary."""
+    if isinstance(node, BinOpNode):
+        return True
+    if isinstance(node, UnaryOpNode):
+        return is_compound(node.expr)
+    return False
+
+# --- Statement helpers ---
+
+def child_blocks(stmt):
+    """BlockNodes directly nested in a statement."""
+    if isinstance(stmt, IfNode):
+        blocks = [stmt.then_block]
+        blocks.extend(elif_node.block for elif_node in (stmt.elifs or []))
+        if stmt.else_block:
+            blocks.append(stmt.else_block)
+        return blocks
+    if isinstance(stmt, (WhileNode, ForNode)):
+        return [stmt.block]
+    if isinstance(stmt, BlockNode):
+        return [stmt]
+    return []
+
+def iter_stmts(block):
+    """Yields every statement nested in a block, ForNode init/update included."""
+    stack = list(reversed(block.statements))
+    while stack:
+        stmt = stack.pop()
+        yield stmt
+        if isinstance(stmt, ForNode):
+            for part in (stmt.block, stmt.update, stmt.init):
+                if isinstance(part, StmtNode):
+                    stack.append(part)
+        elif isinstance(stmt, BlockNode):
+            stack.extend(reversed(stmt.statements))
+        else:
+            for child in reversed(child_blocks(stmt)):
+                stack.append(child)
+
+def stmt_exprs(stmt):
+    """Expressions evaluated directly by a statement (nested blocks excluded)."""
+    if isinstance(stmt, (AssignNode, MultiAssignNode)):
+        return [stmt.expr]
+    if isinstance(stmt, VarDeclNode):
+        return [v.expr for v in stmt.var_list if v.expr is not None]
+    if isinstance(stmt, (OutputNode, ReturnNode)):
+        return [stmt.expr] if stmt.expr is not None else []
+    if isinstance(stmt, InputNode):
+        return [stmt.prompt_expr] if stmt.prompt_expr is not None else []
+    if isinstance(stmt, FuncCallStmtNode):
+        return list(stmt.args)
+    if isinstance(stmt, IfNode):
+        return [stmt.condition] + [e.condition for e in (stmt.elifs or [])]
+    if isinstance(stmt, WhileNode):
+        return [stmt.condition]
+    if isinstance(stmt, ForNode):
+        exprs = [stmt.condition]
+        if isinstance(stmt.update, ExprNode):
+            exprs.append(stmt.update)
+        return exprs
+    return []
+
+def stmt_writes(stmt):
+    """Names a single statement assigns or declares (nested blocks excluded)."""
+    if isinstance(stmt, (AssignNode, MultiAssignNode)):
+        return set(stmt.targets)
+    if isinstance(stmt, VarDeclNode):
+        return {name for v in stmt.var_list for name in v.names}
+    if isinstance(stmt, InputNode):
+        return {name for group in stmt.target_groups for name in group}
+    return set()
+
+def called_functions(stmt):
+    """Names of the functions called by a single statement (nested blocks excluded)."""
+    names = set()
+    if isinstance(stmt, FuncCallStmtNode):
+        names.add(stmt.name)
+    for expr in stmt_exprs(stmt):
+        for sub in iter_expr(expr):
+            if isinstance(sub, FunCallExprNode):
+                names.add(sub.name)
+    return names
+
+def function_writes(program):
+    """
+    Maps every function to the set of names it may assign, directly or
+    through the functions it calls. Parameters are excluded (they are always
+    local), everything else is conservatively treated as a possible global.
+    """
+    direct = {}
+    calls = {}
+    for fun_node in program.functions:
+        params = {p.name for p in fun_node.params}
+        writes = set()
+        callees = set()
+        for stmt in iter_stmts(fun_node.body):
+            if not isinstance(stmt, VarDeclNode):
+                writes |= stmt_writes(stmt)
+            callees |= called_functions(stmt)
+        direct[fun_node.name] = writes - params
+        calls[fun_node.name] = callees
+
+    # Fixed point over the call graph (recursion allowed)
+    result = {name: set(writes) for name, writes in direct.items()}
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in calls.items():
+            for callee in callees:
+                extra = result.get(callee, set()) - result[name]
+                if extra:
+                    result[name] |= extra
+                    changed = True
+    return result
+
+def linked_functions(program):
+    """Actions of the linked libraries followed by the program's own (bytecode function order)."""
+    functions = []
+    for library in program.libraries:
+        functions.extend(library.functions)
+    functions.extend(program.functions)
+    return functions
+
+def recursive_functions(program):
+    """Names of the functions that can call themselves, directly or not."""
+    callees = {}
+    for fun_node in linked_functions(program):
+        names = set()
+        for stmt in iter_stmts(fun_node.body):
+            names |= called_functions(stmt)
+        callees[fun_node.name] = names
+
+    recursive = set()
+    for name in callees:
+        seen = set()
+        todo = list(callees[name])
+        while todo:
+            callee = todo.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee not in seen:
+                seen.add(callee)
+                todo.extend(callees.get(callee, ()))
+    return recursive
+
+def collect_names(program):
+    """Every identifier used in the program (to generate fresh temporaries)."""
+    names = {f.name for f in linked_functions(program)}
+    blocks = [program.main_block] + [f.body for f in program.functions]
+    for fun_node in program.functions:
+        names |= {p.name for p in fun_node.params}
+    for decl in program.global_decls:
+        names |= stmt_writes(decl)
+    for block in blocks:
+        for stmt in iter_stmts(block):
+            names |= stmt_writes(stmt)
+            for expr in stmt_exprs(stmt):
+                names |= expr_vars(expr)
+    return names
+
+class NameGenerator:
+    def __init__(self, used_names, prefix='_t'):
+        self.used_names = set(used_names)
+        self.prefix = prefix
+        self.counter = 0
+
+    def fresh(self):
+        while True:
+            name = f'{self.prefix}{self.counter}'
+            self.counter += 1
+            if name not in self.used_names:
+                self.used_names.add(name)
+                return name
+
+# --- Types ---
+
+def expression_types(program):
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(program)
+    return analyzer.expr_types
+
+# --- Rewriting ---
+
+def map_expr(node, fn, types=None):
+    """
+    Rebuilds an expression bottom-up: fn(node) may return a replacement
+    (its children are then not visited) or None to keep going. Nodes are
+    copied instead of mutated because the transformer shares the same
+    expression object between the targets of a chain ('a = b <-- expr').
+    If types is given, copies inherit the type of the node they replace.
+    """
+    replacement = fn(node)
+    if replacement is not None:
+        return replacement
+
+    new_node = node
+    if isinstance(node, BinOpNode):
+        left = map_expr(node.left, fn, types)
+        right = map_expr(node.right, fn, types)
+        if left is not node.left or right is not node.right:
+            new_node = BinOpNode(left, node.op, right)
+    elif isinstance(node, UnaryOpNode):
+        inner = map_expr(node.expr, fn, types)
+        if inner is not node.expr:
+            new_node = UnaryOpNode(node.op, inner)
+    elif isinstance(node, FunCallExprNode):
+        args = [map_expr(arg, fn, types) for arg in node.args]
+        if any(new is not old for new, old in zip(args, node.args)):
+            new_node = FunCallExprNode(node.name, args)
+
+    if types is not None and new_node is not node and id(node) in types:
+        types[id(new_node)] = types[id(node)]
+    return new_node
+
+def rewrite_stmt_exprs(stmt, fn, types=None):
+    """Applies map_expr to every expression evaluated directly by a statement."""
+    if isinstance(stmt, (AssignNode, MultiAssignNode)):
+        stmt.expr = map_expr(stmt.expr, fn, types)
+    elif isinstance(stmt, VarDeclNode):
+        for var_init in stmt.var_list:
+            if var_init.expr is not None:
+                var_init.expr = map_expr(var_init.expr, fn, types)
+    elif isinstance(stmt, (OutputNode, ReturnNode)):
+        if stmt.expr is not None:
+            stmt.expr = map_expr(stmt.expr, fn, types)
+    elif isinstance(stmt, InputNode):
+        if stmt.prompt_expr is not None:
+            stmt.prompt_expr = map_expr(stmt.prompt_expr, fn, types)
+    elif isinstance(stmt, FuncCallStmtNode):
+        stmt.args = [map_expr(arg, fn, types) for arg in stmt.args]
+    elif isinstance(stmt, IfNode):
+        stmt.condition = map_expr(stmt.condition, fn, types)
+        for elif_node in (stmt.elifs or []):
+            elif_node.condition = map_expr(elif_node.condition, fn, types)
+    elif isinstance(stmt, WhileNode):
+        stmt.condition = map_expr(stmt.condition, fn, types)
+    elif isinstance(stmt, ForNode):
+        stmt.condition = map_expr(stmt.condition, fn, types)
+        if isinstance(stmt.update, ExprNode):
+            stmt.update = map_expr(stmt.update, fn, types)
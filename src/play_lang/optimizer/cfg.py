@@ -0,0 +1,268 @@
+from ..frontend.ast_node import *
+from .ast_utils import iter_expr, iter_stmts, stmt_exprs, stmt_writes
+
+def bit_indexes(mask):
+    """Positions of the set bits of a bitset, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class BasicBlock:
+    """
+    Straight-line run of items: simple statements (assignments, declarations,
+    grab, drop, calls, reward) and the branch conditions that end a block.
+    reads / writes / assigns are parallel to items and are variable bitsets
+    (see ControlFlowGraph.bit); assigns excludes declarations without an
+    initializer, which store the default value.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.items = []
+        self.reads = []
+        self.writes = []
+        self.assigns = []
+        self.succs = []
+        self.preds = []
+
+class ControlFlowGraph:
+    """
+    Basic blocks of one function (or of the main code) with a single entry
+    and a single exit block; reward jumps to the exit, quit to the block
+    after the innermost loop. Code after a jump starts a block without
+    predecessors.
+
+    Variables are numbered in order of appearance: bit i of a set stands
+    for variables[i]. local_mask holds the parameters and the names declared
+    in the body, every other name is a global. A call may read and write any
+    global: its item reads all of them (writes are only possible, so they
+    do not kill definitions, see dataflow.reaching_definitions).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.blocks = []
+        self.variables = []
+        self.var_bits = {}
+        self.local_mask = 0
+        self.param_mask = 0
+        self.call_items = set()  # (block index, item index) of items that call a function
+        self.entry = self.new_block()
+        self.exit = None
+
+    def new_block(self):
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def bit(self, name):
+        """Bitset of a single variable (numbered on first use)."""
+        index = self.var_bits.get(name)
+        if index is None:
+            index = self.var_bits[name] = len(self.variables)
+            self.variables.append(name)
+        return 1 << index
+
+    def mask(self, names):
+        result = 0
+        for name in names:
+            result |= self.bit(name)
+        return result
+
+    def names(self, mask):
+        """Variable names of a bitset, in numbering order."""
+        return [self.variables[index] for index in bit_indexes(mask)]
+
+    @property
+    def global_mask(self):
+        return ((1 << len(self.variables)) - 1) & ~self.local_mask
+
+    def reverse_postorder(self):
+        """Blocks reachable from the entry, each after its predecessors (back edges aside)."""
+        order = []
+        visited = {self.entry.index}
+        stack = [(self.entry, iter(self.entry.succs))]
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ.index not in visited:
+                    visited.add(succ.index)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+class _CfgBuilder:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.loop_exits = []
+        self.returns = []  # blocks that end with reward, linked to the exit at the end
+
+    @staticmethod
+    def _link(source, target):
+        source.succs.append(target)
+        target.preds.append(source)
+
+    def build(self, body, params):
+        cfg = self.cfg
+        cfg.param_mask = cfg.mask(params)
+        cfg.local_mask = cfg.param_mask
+        for stmt in iter_stmts(body):
+            if isinstance(stmt, VarDeclNode):
+                cfg.local_mask |= cfg.mask(name for v in stmt.var_list for name in v.names)
+        end = self._block(body.statements, cfg.entry)
+        cfg.exit = cfg.new_block()
+        if end is not None:
+            self._link(end, cfg.exit)
+        for block in self.returns:
+            self._link(block, cfg.exit)
+        # Now that every variable is numbered: a call may read any global
+        global_mask = cfg.global_mask
+        for block_index, item_index in cfg.call_items:
+            cfg.blocks[block_index].reads[item_index] |= global_mask
+        return cfg
+
+    def _add(self, block, item, reads, writes, assigns):
+        cfg = self.cfg
+        if any(isinstance(sub, FunCallExprNode) for expr in _item_exprs(item) for sub in iter_expr(expr)) \
+                or isinstance(item, FuncCallStmtNode):
+            cfg.call_items.add((block.index, len(block.items)))
+        block.items.append(item)
+        block.reads.append(cfg.mask(reads))
+        block.writes.append(cfg.mask(writes))
+        block.assigns.append(cfg.mask(assigns))
+
+    def _add_expr(self, block, expr):
+        self._add(block, expr, _reads(expr), (), ())
+
+    def _block(self, statements, current):
+        """Appends statements to current; returns the block where control continues (None after a jump)."""
+        for stmt in statements:
+            if current is None:
+                current = self.cfg.new_block()  # unreachable code
+            current = self._stmt(stmt, current)
+        return current
+
+    def _stmt(self, stmt, current):
+        cfg = self.cfg
+        if isinstance(stmt, BlockNode):
+            return self._block(stmt.statements, current)
+
+        if isinstance(stmt, IfNode):
+            join = None
+            branches = [(stmt.condition, stmt.then_block)]
+            branches.extend((e.condition, e.block) for e in (stmt.elifs or []))
+            ends = []
+            test = current
+            for condition, block in branches:
+                self._add_expr(test, condition)
+                taken = cfg.new_block()
+                self._link(test, taken)
+                ends.append(self._block(block.statements, taken))
+                not_taken = cfg.new_block()
+                self._link(test, not_taken)
+                test = not_taken
+            if stmt.else_block:
+                ends.append(self._block(stmt.else_block.statements, test))
+            else:
+                ends.append(test)
+            for end in ends:
+                if end is not None:
+                    if join is None:
+                        join = cfg.new_block()
+                    self._link(end, join)
+            return join
+
+        if isinstance(stmt, WhileNode):
+            header = cfg.new_block()
+            self._link(current, header)
+            self._add_expr(header, stmt.condition)
+            return self._loop(header, stmt.block, None)
+
+        if isinstance(stmt, ForNode):
+            current = self._stmt(stmt.init, current)
+            header = cfg.new_block()
+            self._link(current, header)
+            self._add_expr(header, stmt.condition)
+            return self._loop(header, stmt.block, stmt.update)
+
+        if isinstance(stmt, ReturnNode):
+            self._add(current, stmt, _reads(stmt.expr) if stmt.expr is not None else (), (), ())
+            self.returns.append(current)
+            return None
+
+        if isinstance(stmt, BreakNode):
+            if self.loop_exits:
+                self._link(current, self.loop_exits[-1])
+            else:
+                self.returns.append(current)
+            return None
+
+        if isinstance(stmt, ExprNode):  # ForNode update written as an expression
+            self._add_expr(current, stmt)
+            return current
+
+        self._add(current, stmt, _stmt_reads(stmt), stmt_writes(stmt), _stmt_assigns(stmt))
+        return current
+
+    def _loop(self, header, body, update):
+        cfg = self.cfg
+        body_start = cfg.new_block()
+        after = cfg.new_block()
+        self._link(header, body_start)
+        self._link(header, after)
+        self.loop_exits.append(after)
+        end = self._block(body.statements, body_start)
+        self.loop_exits.pop()
+        if end is not None:
+            if update is not None:
+                end = self._stmt(update, end)
+            self._link(end, header)
+        return after
+
+def _item_exprs(item):
+    if isinstance(item, ExprNode):
+        return [item]
+    return stmt_exprs(item)
+
+def _reads(expr):
+    return [sub.name for sub in iter_expr(expr) if isinstance(sub, VarAccessNode)]
+
+def _stmt_reads(stmt):
+    """Variables read before the statement writes anything."""
+    if isinstance(stmt, VarDeclNode):
+        # rank: a <-- 1, b <-- a reads the a just declared
+        reads, declared = [], set()
+        for var_init in stmt.var_list:
+            if var_init.expr is not None:
+                reads.extend(name for name in _reads(var_init.expr) if name not in declared)
+            declared.update(var_init.names)
+        return reads
+    reads = []
+    for expr in stmt_exprs(stmt):
+        reads.extend(_reads(expr))
+    return reads
+
+def _stmt_assigns(stmt):
+    if isinstance(stmt, VarDeclNode):
+        return {name for v in stmt.var_list if v.expr is not None for name in v.names}
+    return stmt_writes(stmt)
+
+def build_cfg(body, params=(), name='<play>'):
+    """
+    Control-flow graph of a BlockNode (AST or lowered tree). params are the
+    names assigned on entry.
+    """
+    return _CfgBuilder(ControlFlowGraph(name)).build(body, params)
+
+def program_cfgs(program):
+    """
+    CFG of every function (by name) and of the main code under '<play>',
+    where the global declarations run first as in the bytecode.
+    """
+    cfgs = {f.name: build_cfg(f.body, [p.name for p in f.params], f.name) for f in program.functions}
+    main_body = BlockNode(list(program.global_decls) + list(program.main_block.statements))
+    cfgs['<play>'] = build_cfg(main_body)
+    return cfgs
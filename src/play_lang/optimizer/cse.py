@@ -0,0 +1,245 @@
+from ..frontend.ast_node import *
+from .ast_utils import *
+from .dataflow import DeclaredLocals
+
+# Statements that never transfer control: a basic block is a run of these,
+# optionally terminated by a choice whose condition it still evaluates.
+_STRAIGHT_LINE = (AssignNode, MultiAssignNode, VarDeclNode, OutputNode, InputNode, FuncCallStmtNode, ReturnNode)
+
+class CommonSubexpressionEliminator:
+    """
+    Reuses the value of repeated identical subexpressions inside a basic block.
+
+    Expressions are visited in evaluation order. An occurrence joins the
+    current window of its key while none of the variables it reads has been
+    written since the start of the statement that opened the window (writes
+    include the globals a called function may assign). Every window with at
+    least two occurrences becomes a temporary declared before its first
+    statement; larger expressions are shared first. The temporary is
+    evaluated even where an occurrence was not (the right operand of && or
+    ||), so the locals it reads must be surely declared before that
+    statement (dataflow.DeclaredLocals). With rank_overflow (native code)
+    rank arithmetic can raise and is not shared.
+    """
+    def __init__(self, program, expr_types, names, rank_overflow=False):
+        self.program = program
+        self.expr_types = expr_types
+        self.names = names
+        self.rank_types = expr_types if rank_overflow else None
+        self.writes_of = function_writes(program)
+        self.eliminated = 0
+
+    def run(self):
+        main_body = BlockNode(list(self.program.global_decls) + list(self.program.main_block.statements))
+        self._find_undeclared(DeclaredLocals(main_body), self.program.main_block)
+        self._visit_block(self.program.main_block)
+        for fun_node in self.program.functions:
+            self._find_undeclared(DeclaredLocals(fun_node.body, [p.name for p in fun_node.params]), fun_node.body)
+            self._visit_block(fun_node.body)
+        return self.eliminated
+
+    def _find_undeclared(self, declared, body):
+        self.undeclared = {id(stmt): declared.undeclared_before(stmt) for stmt in iter_stmts(body)}
+        self.all_locals = declared.locals
+
+    def _visit_block(self, block):
+        segment = []
+        new_statements = []
+        for stmt in block.statements:
+            if isinstance(stmt, _STRAIGHT_LINE):
+                segment.append(stmt)
+                continue
+            if isinstance(stmt, IfNode):
+                segment.append(stmt)
+                new_statements.extend(self._process_segment(segment))
+            else:
+                new_statements.extend(self._process_segment(segment))
+                new_statements.append(stmt)
+            segment = []
+            for child in child_blocks(stmt):
+                self._visit_block(child)
+        new_statements.extend(self._process_segment(segment))
+        block.statements = new_statements
+
+    # --- Occurrence collection ---
+
+    def _segment_exprs(self, stmt):
+        # Only the first condition of a choice is evaluated unconditionally
+        if isinstance(stmt, IfNode):
+            return [stmt.condition]
+        return stmt_exprs(stmt)
+
+    def _collect(self, segment):
+        self.seq = 0
+        self.pos = 0
+        self.last_write = {}
+        self.open_windows = {}
+        self.windows = []
+        self.seq_stmt = {}   # seq -> index of its statement in the segment
+        self.nested = {}     # seq -> seqs of the occurrences it contains
+        self.enclosing = []  # seqs of the occurrences being scanned
+        self.seq_pos = {}    # seq -> evaluation position
+        self.write_log = {}  # name -> positions of its writes
+        self.decl_of = {}    # seq -> (name, type) if it is a whole declaration initializer
+        self.init_root = None
+
+        for index, stmt in enumerate(segment):
+            self.stmt_start = self.pos
+            self.stmt_index = index
+            self.stmt_undeclared = self.undeclared.get(id(stmt), self.all_locals)
+            if isinstance(stmt, VarDeclNode):
+                # Each initializer sees the names declared before it
+                for var_init in stmt.var_list:
+                    if var_init.expr is not None:
+                        self.init_root = (var_init.expr, var_init.names[0], stmt.type_name)
+                        self._scan(var_init.expr)
+                        self.init_root = None
+                    self._write(set(var_init.names))
+                continue
+            for expr in self._segment_exprs(stmt):
+                self._scan(expr)
+            if isinstance(stmt, FuncCallStmtNode):
+                self._write(self.writes_of.get(stmt.name, set()))
+            self._write(stmt_writes(stmt))
+
+        self.windows.extend(self.open_windows.values())
+        return [w for w in self.windows if len(w['seqs']) >= 2]
+
+    def _write(self, names):
+        self.pos += 1
+        for name in names:
+            self.last_write[name] = self.pos
+            self.write_log.setdefault(name, []).append(self.pos)
+
+    def _is_candidate(self, node):
+        return is_compound(node) and is_movable(node, self.rank_types)
+
+    def _scan(self, node):
+        # Same pre-order as map_expr, so sequence numbers match when rewriting
+        candidate = self._is_candidate(node)
+        if candidate:
+            seq = self._occurrence(node)
+            self.enclosing.append(seq)
+        if isinstance(node, BinOpNode):
+            self._scan(node.left)
+            self._scan(node.right)
+        elif isinstance(node, UnaryOpNode):
+            self._scan(node.expr)
+        elif isinstance(node, FunCallExprNode):
+            for arg in node.args:
+                self._scan(arg)
+            self._write(self.writes_of.get(node.name, set()))
+        if candidate:
+            self.enclosing.pop()
+
+    def _occurrence(self, node):
+        seq = self.seq
+        self.seq += 1
+        self.pos += 1
+        self.seq_stmt[seq] = self.stmt_index
+        self.seq_pos[seq] = self.pos
+        self.nested[seq] = set()
+        if self.init_root is not None and self.init_root[0] is node:
+            self.decl_of[seq] = self.init_root[1:]
+        for outer in self.enclosing:
+            self.nested[outer].add(seq)
+
+        key = expr_key(node)
+        names = expr_vars(node)
+
+        def valid_since(start):
+            return all(self.last_write.get(name, -1) < start for name in names)
+
+        window = self.open_windows.get(key)
+        if window is not None and valid_since(window['start']):
+            window['seqs'].append(seq)
+            return seq
+        if window is not None:
+            self.windows.append(window)
+            del self.open_windows[key]
+        # A window can only open if the value is still valid at the start of
+        # the statement, where the temporary will be declared.
+        if valid_since(self.stmt_start) and not names & self.stmt_undeclared:
+            self.open_windows[key] = {
+                'node': node, 'start': self.stmt_start, 'seqs': [seq],
+                'size': sum(1 for _ in iter_expr(node)),
+            }
+        return seq
+
+    # --- Rewriting ---
+
+    def _process_segment(self, segment):
+        if not segment:
+            return []
+        windows = self._collect(segment)
+        if not windows:
+            return segment
+
+        replaced = {}  # seq -> temp name
+        dead = set()   # seqs inside an already replaced occurrence
+        decls_before = {}
+        for window in sorted(windows, key=lambda w: -w['size']):
+            live = [s for s in window['seqs'] if s not in dead]
+            if len(live) < 2:
+                continue
+            type_name = self.expr_types[id(window['node'])]
+            name = self._reusable_decl(live, type_name)
+            if name is not None:
+                # 'type: v <-- expr' already holds the value: the first occurrence stays
+                for s in live[1:]:
+                    replaced[s] = name
+                    dead |= self.nested[s]
+            else:
+                name = self.names.fresh()
+                decl = VarDeclNode(type_name, [VarInitNode(name, window['node'])])
+                decls_before.setdefault(self.seq_stmt[live[0]], []).append(decl)
+                for s in live:
+                    replaced[s] = name
+                    dead |= self.nested[s]
+            self.eliminated += len(live) - 1
+
+        counter = [0]
+
+        def replace(expr):
+            if not self._is_candidate(expr):
+                return None
+            seq = counter[0]
+            counter[0] += 1
+            name = replaced.get(seq)
+            if name is None:
+                return None
+            # Skip the sequence numbers of the replaced subtree
+            counter[0] += len(self.nested[seq])
+            access = VarAccessNode(name)
+            self.expr_types[id(access)] = self.expr_types.get(id(expr))
+            return access
+
+        result = []
+        for index, stmt in enumerate(segment):
+            result.extend(decls_before.get(index, []))
+            self._rewrite(stmt, replace)
+            result.append(stmt)
+        return result
+
+    def _reusable_decl(self, live, type_name):
+        # The declared variable can stand for the expression if it has the same
+        # type (no rank -> rate promotion) and is not written again before the
+        # last occurrence; its only write is the declaration itself.
+        if live[0] not in self.decl_of:
+            return None
+        name, decl_type = self.decl_of[live[0]]
+        if decl_type != type_name:
+            return None
+        first, last = self.seq_pos[live[0]], self.seq_pos[live[-1]]
+        writes = [p for p in self.write_log.get(name, []) if first < p <= last]
+        return name if len(writes) == 1 else None
+
+    def _rewrite(self, stmt, replace):
+        if isinstance(stmt, VarDeclNode):
+            for var_init in stmt.var_list:
+                if var_init.expr is not None:
+                    var_init.expr = map_expr(var_init.expr, replace, self.expr_types)
+        elif isinstance(stmt, IfNode):
+            stmt.condition = map_expr(stmt.condition, replace, self.expr_types)
+        else:
+            rewrite_stmt_exprs(stmt, replace, self.expr_types)
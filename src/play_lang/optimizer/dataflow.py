@@ -0,0 +1,272 @@
+from collections import deque
+
+from ..frontend.ast_node import VarDeclNode, IfNode, WhileNode, ForNode
+from .cfg import bit_indexes, build_cfg
+
+class DataflowResult:
+    """Facts at the start (ins) and at the end (outs) of every block, as bitsets indexed by block."""
+    def __init__(self, ins, outs):
+        self.ins = ins
+        self.outs = outs
+
+def solve(cfg, gen, kill, forward=True, meet_all=False, boundary=0, universe=0):
+    """
+    Worklist solver of a gen/kill problem on a ControlFlowGraph:
+
+        out = gen | (in & ~kill)    (forward; in and out swap for backward)
+
+    gen and kill are bitsets indexed by block. The meet is the union of the
+    neighbours' facts, or their intersection with meet_all=True (then every
+    fact starts as universe). boundary is the fact at the entry (forward)
+    or at the exit (backward).
+
+    Facts are Python ints, so a meet or a transfer is a few word operations
+    per 64 variables. Blocks are visited in reverse postorder (postorder for
+    backward problems) and only revisited when a neighbour changes: an
+    acyclic graph is solved in one pass, loops in a few more.
+    """
+    blocks = cfg.blocks
+    count = len(blocks)
+    order = [block.index for block in cfg.reverse_postorder()]
+    reached = set(order)
+    order.extend(index for index in range(count) if index not in reached)
+    if forward:
+        # Unreachable blocks are left out of the meet
+        start = cfg.entry.index
+        sources = [[pred.index for pred in block.preds if pred.index in reached] for block in blocks]
+        targets = [[succ.index for succ in block.succs] for block in blocks]
+    else:
+        order.reverse()
+        start = cfg.exit.index
+        sources = [[succ.index for succ in block.succs] for block in blocks]
+        targets = [[pred.index for pred in block.preds] for block in blocks]
+
+    initial = universe if meet_all else 0
+    facts_in = [initial] * count
+    facts_out = [gen[i] | (initial & ~kill[i]) for i in range(count)]
+    keep = [~k for k in kill]
+
+    queue = deque(order)
+    queued = [True] * count
+    while queue:
+        index = queue.popleft()
+        queued[index] = False
+        if index == start:
+            fact = boundary
+        elif meet_all:
+            fact = universe
+            for source in sources[index]:
+                fact &= facts_out[source]
+            if not sources[index]:
+                fact = 0
+        else:
+            fact = 0
+            for source in sources[index]:
+                fact |= facts_out[source]
+        facts_in[index] = fact
+        out = gen[index] | (fact & keep[index])
+        if out != facts_out[index]:
+            facts_out[index] = out
+            for target in targets[index]:
+                if not queued[target]:
+                    queued[target] = True
+                    queue.append(target)
+
+    if forward:
+        return DataflowResult(facts_in, facts_out)
+    return DataflowResult(facts_out, facts_in)
+
+def _universe(cfg):
+    return (1 << len(cfg.variables)) - 1
+
+# --- Liveness ---
+
+def liveness(cfg, live_at_exit=None):
+    """
+    Variables that may be read before being written again, at the start and
+    end of every block. By default the globals are live at the exit (the
+    caller or the rest of the program may read them) and the locals are not.
+    """
+    gen = []
+    kill = []
+    for block in cfg.blocks:
+        used = 0
+        defined = 0
+        for reads, writes in zip(block.reads, block.writes):
+            used |= reads & ~defined
+            defined |= writes
+        gen.append(used)
+        kill.append(defined)
+    if live_at_exit is None:
+        live_at_exit = cfg.global_mask
+    return solve(cfg, gen, kill, forward=False, boundary=live_at_exit)
+
+def live_after_items(cfg, live):
+    """For every block, the variables live right after each of its items (from a liveness result)."""
+    result = []
+    for block in cfg.blocks:
+        fact = live.outs[block.index]
+        after = [0] * len(block.items)
+        for i in range(len(block.items) - 1, -1, -1):
+            after[i] = fact
+            fact = block.reads[i] | (fact & ~block.writes[i])
+        result.append(after)
+    return result
+
+# --- Reaching definitions ---
+
+class Definitions:
+    """
+    Numbered definitions of a CFG: definition d is (block index, item index,
+    variable name). of_variable maps a variable name to the bitset of its
+    definitions. A call defines every global without killing its other
+    definitions (it may not assign them).
+    """
+    def __init__(self, cfg):
+        self.sites = []
+        self.of_variable = {}
+        self.gen = []
+        global_names = cfg.names(cfg.global_mask)
+        surely_written = []
+        for block in cfg.blocks:
+            last = {}  # variable -> its definitions that reach the end of the block
+            written = 0
+            for i, writes in enumerate(block.writes):
+                for name in cfg.names(writes):
+                    last[name] = self._define(block.index, i, name)
+                if (block.index, i) in cfg.call_items:
+                    for name in global_names:
+                        last[name] = last.get(name, 0) | self._define(block.index, i, name)
+                written |= writes
+            gen = 0
+            for mask in last.values():
+                gen |= mask
+            self.gen.append(gen)
+            surely_written.append(written)
+
+        # A block kills the other definitions of the variables it surely writes
+        self.kill = []
+        for block, written in zip(cfg.blocks, surely_written):
+            kill = 0
+            for name in cfg.names(written):
+                kill |= self.of_variable[name]
+            self.kill.append(kill & ~self.gen[block.index])
+
+    def _define(self, block_index, item_index, name):
+        mask = 1 << len(self.sites)
+        self.sites.append((block_index, item_index, name))
+        self.of_variable[name] = self.of_variable.get(name, 0) | mask
+        return mask
+
+    def sites_of(self, mask):
+        return [self.sites[index] for index in bit_indexes(mask)]
+
+def reaching_definitions(cfg):
+    """
+    Definitions that may reach the start and end of every block. Returns
+    (Definitions, DataflowResult); the result bitsets index Definitions.sites.
+    """
+    definitions = Definitions(cfg)
+    return definitions, solve(cfg, definitions.gen, definitions.kill, forward=True)
+
+# --- Definite assignment ---
+
+def definite_assignment(cfg):
+    """
+    Variables assigned an explicit value on every path from the entry to the
+    start and end of every block: parameters, initialized declarations,
+    assignments and grab. A local read where it is not definitely assigned
+    may see the default value of its declaration.
+    """
+    gen = []
+    for block in cfg.blocks:
+        assigned = 0
+        for assigns in block.assigns:
+            assigned |= assigns
+        gen.append(assigned)
+    kill = [0] * len(cfg.blocks)
+    return solve(cfg, gen, kill, forward=True, meet_all=True,
+                 boundary=cfg.param_mask, universe=_universe(cfg))
+
+def maybe_unassigned_reads(cfg, assigned=None):
+    """(item, variable name) of the local reads that may see the default value."""
+    if assigned is None:
+        assigned = definite_assignment(cfg)
+    result = []
+    for block in cfg.blocks:
+        fact = assigned.ins[block.index]
+        for item, reads, assigns in zip(block.items, block.reads, block.assigns):
+            for name in cfg.names(reads & cfg.local_mask & ~fact):
+                result.append((item, name))
+            fact |= assigns
+    return result
+
+# --- Definite declaration ---
+
+def definite_declaration(cfg):
+    """
+    Variables declared on every path from the entry to the start and end of
+    every block (parameters included). A local is resolved at run time: where
+    its declaration may not have run, a read sees the global of the same
+    name or fails with "not defined".
+    """
+    gen = []
+    for block in cfg.blocks:
+        declared = 0
+        for item, writes in zip(block.items, block.writes):
+            if isinstance(item, VarDeclNode):
+                declared |= writes
+        gen.append(declared)
+    kill = [0] * len(cfg.blocks)
+    return solve(cfg, gen, kill, forward=True, meet_all=True,
+                 boundary=cfg.param_mask, universe=_universe(cfg))
+
+def maybe_undeclared_accesses(cfg, declared=None):
+    """
+    (item, variable name) of the local reads and assignments that may run
+    where the declaration of the local did not: they fail with "not defined".
+    """
+    if declared is None:
+        declared = definite_declaration(cfg)
+    result = []
+    for block in cfg.blocks:
+        fact = declared.ins[block.index]
+        for item, reads, writes in zip(block.items, block.reads, block.writes):
+            if isinstance(item, VarDeclNode):
+                accessed = reads & ~writes
+                declared_here = writes
+            else:
+                accessed = reads | writes
+                declared_here = 0
+            for name in cfg.names(accessed & cfg.local_mask & ~fact):
+                result.append((item, name))
+            fact |= declared_here
+    return result
+
+class DeclaredLocals:
+    """
+    Locals of a body that may be undeclared right before each of its
+    statements, for the passes that evaluate an expression at another point
+    (LICM, CSE): reading such a local there could fail or see a global.
+    """
+    def __init__(self, body, params=()):
+        cfg = build_cfg(body, params)
+        declared = definite_declaration(cfg)
+        self.locals = set(cfg.names(cfg.local_mask))
+        self.undeclared = {}  # id(item) -> locals that may be undeclared before it
+        for block in cfg.blocks:
+            fact = declared.ins[block.index]
+            for item, writes in zip(block.items, block.writes):
+                self.undeclared[id(item)] = set(cfg.names(cfg.local_mask & ~fact))
+                if isinstance(item, VarDeclNode):
+                    fact |= writes
+
+    def undeclared_before(self, stmt):
+        """Locals that may be undeclared right before stmt (all of them for an unknown statement)."""
+        if isinstance(stmt, ForNode):
+            item = stmt.init
+        elif isinstance(stmt, (IfNode, WhileNode)):
+            item = stmt.condition
+        else:
+            item = stmt
+        return self.undeclared.get(id(item), self.locals)
@@ -0,0 +1,402 @@
+import copy
+
+from ..frontend.ast_node import *
+from .ast_utils import *
+from .cfg import build_cfg
+from .dataflow import maybe_undeclared_accesses
+
+# Largest body (statements + expression nodes) inlined by default
+INLINE_SIZE = 24
+
+class _Callee:
+    """An action that can be inlined: its body split into statements and the final reward expression."""
+    def __init__(self, fun_node, statements, result, free_names, assigned):
+        self.fun_node = fun_node
+        self.statements = statements  # body without the final reward
+        self.result = result          # expression of the final reward, None for void actions
+        self.free_names = free_names  # globals the body reads or writes
+        self.assigned = assigned      # parameters the body assigns
+
+class _Prefix:
+    """What a statement evaluates before the call being inlined."""
+    def __init__(self):
+        self.movable = True
+        self.reads = set()
+
+class Inliner:
+    """
+    Replaces calls to small non-recursive actions with their bodies.
+
+    An action is inlined if its body has at most max_size statements and
+    expression nodes, it is not in keep (the per-action opt-out) and its
+    only reward is the last statement of the body. Parameters and locals
+    are renamed to fresh names, so the expanded code cannot capture the
+    caller's variables; an action whose free globals the caller shadows
+    with locals is not inlined there, nor one that may use a local whose
+    declaration did not run (the error would show the fresh name).
+
+    Arguments are evaluated once, in order, into temporaries declared with
+    the parameter types, so rank arguments of rate parameters are promoted
+    as in a call; the result goes through a temporary of the return type.
+    Those statements are hoisted before the statement holding the call,
+    which is only done when everything the statement evaluates before the
+    call has no side effects, cannot raise and reads nothing the inlined
+    code may write, and when the call is evaluated exactly once at that
+    point (not in a loop condition, an elif condition or the right operand
+    of && / ||).
+
+    An action whose body is just 'reward e' with arguments that are
+    variables or literals of the parameter types (and e of the return type)
+    is expanded in place to e, wherever the call is.
+
+    Actions are processed callees first, so a small action calling another
+    one is inlined already expanded. With rank_overflow (native code) rank
+    arithmetic can raise like a division.
+    """
+    def __init__(self, program, expr_types, names, max_size=INLINE_SIZE, keep=(), rank_overflow=False):
+        self.program = program
+        self.expr_types = expr_types
+        self.names = names
+        self.rank_types = expr_types if rank_overflow else None
+        self.max_size = max_size
+        self.keep = set(keep)
+        self.functions = {f.name: f for f in program.functions}
+        self.writes_of = function_writes(program)
+        self.global_names = {name for decl in program.global_decls for v in decl.var_list for name in v.names}
+        self.callees = {}
+        self.caller_locals = set()
+        self._last_result = None
+        self.inlined = 0
+
+    def run(self):
+        recursive = recursive_functions(self.program)
+        for fun_node in self._callees_first():
+            self.caller_locals = _local_names(fun_node)
+            self._visit_block(fun_node.body)
+            if fun_node.name not in recursive and fun_node.name not in self.keep:
+                callee = self._callee(fun_node)
+                if callee is not None:
+                    self.callees[fun_node.name] = callee
+        self.caller_locals = set()
+        self._visit_block(self.program.main_block)
+        return self.inlined
+
+    def _callees_first(self):
+        order = []
+        seen = set()
+        for root in self.program.functions:
+            if root.name in seen:
+                continue
+            seen.add(root.name)
+            stack = [(root, iter(_callee_names(root)))]
+            while stack:
+                fun_node, callees = stack[-1]
+                for name in callees:
+                    if name in self.functions and name not in seen:
+                        seen.add(name)
+                        stack.append((self.functions[name], iter(_callee_names(self.functions[name]))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(fun_node)
+        return order
+
+    def _callee(self, fun_node):
+        statements = list(fun_node.body.statements)
+        result = None
+        if statements and isinstance(statements[-1], ReturnNode):
+            result = statements.pop().expr
+        if fun_node.ret_type != 'void' and result is None:
+            return None
+        size = 0 if result is None else sum(1 for _ in iter_expr(result))
+        for stmt in iter_stmts(BlockNode(statements)):
+            if isinstance(stmt, ReturnNode):
+                return None
+            size += 1
+            for expr in stmt_exprs(stmt):
+                size += sum(1 for _ in iter_expr(expr))
+        if size > self.max_size or _has_stray_break(statements):
+            return None
+
+        own = _local_names(fun_node)
+        if own & self.global_names:
+            return None  # a local that shadows a global: renaming would need source-order scoping
+        cfg = build_cfg(fun_node.body, [p.name for p in fun_node.params])
+        if maybe_undeclared_accesses(cfg):
+            return None  # its "Variable 'x' not defined" error would name the renamed local
+        used = set()
+        for stmt in iter_stmts(BlockNode(statements)):
+            used |= stmt_writes(stmt)
+            for expr in stmt_exprs(stmt):
+                used |= expr_vars(expr)
+        if result is not None:
+            used |= expr_vars(result)
+        assigned = set()
+        for stmt in iter_stmts(BlockNode(statements)):
+            assigned |= stmt_writes(stmt)
+        params = {p.name for p in fun_node.params}
+        return _Callee(fun_node, statements, result, used - own, assigned & params)
+
+    def _inlinable(self, name):
+        callee = self.callees.get(name)
+        if callee is None or callee.free_names & self.caller_locals:
+            return None
+        return callee
+
+    # --- Statements ---
+
+    def _visit_block(self, block):
+        new_statements = []
+        for stmt in block.statements:
+            if isinstance(stmt, ForNode):
+                self._visit_block(stmt.block)
+            else:
+                for child in child_blocks(stmt):
+                    self._visit_block(child)
+            new_statements.extend(self._expand(stmt))
+        block.statements = new_statements
+
+    def _expand(self, stmt):
+        """Statements replacing stmt: hoisted inlined code, then stmt itself (rewritten)."""
+        hoisted = []
+        if isinstance(stmt, VarDeclNode) and len(stmt.var_list) > 1 \
+                and any(self._has_candidate(v.expr) for v in stmt.var_list[1:]):
+            # rank: a <-- 1, b <-- f(a) -> one declaration per variable, so the
+            # code of f lands after a is declared
+            result = []
+            for var_init in stmt.var_list:
+                result.extend(self._expand(VarDeclNode(stmt.type_name, [var_init])))
+            return result
+
+        if isinstance(stmt, FuncCallStmtNode):
+            prefix = _Prefix()
+            stmt.args = [self._rewrite(arg, hoisted, prefix) for arg in stmt.args]
+            callee = self._inlinable(stmt.name)
+            if callee is not None:
+                hoisted.extend(self._inline(callee, stmt.args))
+                return hoisted
+            return hoisted + [stmt]
+
+        if isinstance(stmt, ForNode):
+            # The init runs once before the loop: its inlined code goes before the loop too
+            parts = stmt.init.statements if isinstance(stmt.init, BlockNode) else [stmt.init]
+            init = [new for part in parts for new in self._expand(part)]
+            if len(init) > len(parts):
+                stmt.init = init.pop()
+                hoisted.extend(init)
+            self._rewrite_in_place(stmt, None)
+            return hoisted + [stmt]
+
+        self._rewrite_in_place(stmt, hoisted)
+        return hoisted + [stmt]
+
+    def _rewrite_in_place(self, stmt, hoisted):
+        # Expressions evaluated once when the statement starts can hoist
+        prefix = _Prefix()
+        if isinstance(stmt, BlockNode):
+            for part in stmt.statements:
+                self._rewrite_in_place(part, hoisted)
+        elif isinstance(stmt, (AssignNode, MultiAssignNode)):
+            stmt.expr = self._rewrite(stmt.expr, hoisted, prefix)
+        elif isinstance(stmt, VarDeclNode):
+            for var_init in stmt.var_list:
+                if var_init.expr is not None:
+                    var_init.expr = self._rewrite(var_init.expr, hoisted, prefix)
+        elif isinstance(stmt, (OutputNode, ReturnNode)):
+            if stmt.expr is not None:
+                stmt.expr = self._rewrite(stmt.expr, hoisted, prefix)
+        elif isinstance(stmt, InputNode):
+            if stmt.prompt_expr is not None:
+                stmt.prompt_expr = self._rewrite(stmt.prompt_expr, hoisted, prefix)
+        elif isinstance(stmt, IfNode):
+            stmt.condition = self._rewrite(stmt.condition, hoisted, prefix)
+            for elif_node in (stmt.elifs or []):
+                elif_node.condition = self._rewrite(elif_node.condition, None, _Prefix())
+        elif isinstance(stmt, WhileNode):
+            stmt.condition = self._rewrite(stmt.condition, None, prefix)
+        elif isinstance(stmt, ForNode):
+            stmt.condition = self._rewrite(stmt.condition, None, prefix)
+            if isinstance(stmt.update, ExprNode):
+                stmt.update = self._rewrite(stmt.update, None, _Prefix())
+            elif stmt.update is not None:
+                self._rewrite_in_place(stmt.update, None)
+
+    # --- Expressions (evaluation order) ---
+
+    def _has_candidate(self, expr):
+        if expr is None:
+            return False
+        return any(isinstance(sub, FunCallExprNode) and sub.name in self.callees for sub in iter_expr(expr))
+
+    def _rewrite(self, node, hoisted, prefix):
+        """
+        Returns node with its inlinable calls expanded. hoisted receives the
+        statements to run before the statement (None: nothing may be hoisted);
+        prefix describes what was evaluated so far.
+        """
+        if isinstance(node, LiteralNode):
+            return node
+        if isinstance(node, VarAccessNode):
+            prefix.reads.add(node.name)
+            return node
+        if isinstance(node, UnaryOpNode):
+            inner = self._rewrite(node.expr, hoisted, prefix)
+            if may_raise(node, self.rank_types):
+                prefix.movable = False
+            return node if inner is node.expr else self._typed(UnaryOpNode(node.op, inner), node)
+        if isinstance(node, BinOpNode):
+            left = self._rewrite(node.left, hoisted, prefix)
+            # The right operand of && / || may not be evaluated at all
+            right = self._rewrite(node.right, None if node.op in ('&&', '||') else hoisted, prefix)
+            if may_raise(node, self.rank_types):
+                prefix.movable = False
+            if left is node.left and right is node.right:
+                return node
+            return self._typed(BinOpNode(left, node.op, right), node)
+        if isinstance(node, FunCallExprNode):
+            args = [self._rewrite(arg, hoisted, prefix) for arg in node.args]
+            callee = self._inlinable(node.name)
+            if callee is not None:
+                replacement = self._substitute(callee, args)
+                if replacement is not None:
+                    self.inlined += 1
+                    return self._rewrite(replacement, hoisted, prefix)
+                if hoisted is not None and self._can_hoist(callee, args, prefix):
+                    hoisted.extend(self._inline(callee, args))
+                    result = self._last_result
+                    prefix.reads.add(result.name)
+                    return result
+            prefix.movable = False
+            if any(new is not old for new, old in zip(args, node.args)):
+                return self._typed(FunCallExprNode(node.name, args), node)
+            return node
+        return node
+
+    def _typed(self, new_node, old_node):
+        if id(old_node) in self.expr_types:
+            self.expr_types[id(new_node)] = self.expr_types[id(old_node)]
+        return new_node
+
+    def _can_hoist(self, callee, args, prefix):
+        if not prefix.movable:
+            return False
+        writes = set(self.writes_of.get(callee.fun_node.name, ()))
+        for arg in args:
+            for sub in iter_expr(arg):
+                if isinstance(sub, FunCallExprNode):
+                    writes |= self.writes_of.get(sub.name, set())
+        return not prefix.reads & writes
+
+    # --- Expansion ---
+
+    def _clone(self, node, mapping):
+        """Copy of an expression with the variables in mapping replaced (copies keep their types)."""
+        if isinstance(node, VarAccessNode) and node.name in mapping:
+            return self._clone(mapping[node.name], {})
+        if isinstance(node, BinOpNode):
+            new_node = BinOpNode(self._clone(node.left, mapping), node.op, self._clone(node.right, mapping))
+        elif isinstance(node, UnaryOpNode):
+            new_node = UnaryOpNode(node.op, self._clone(node.expr, mapping))
+        elif isinstance(node, FunCallExprNode):
+            new_node = FunCallExprNode(node.name, [self._clone(arg, mapping) for arg in node.args])
+        else:
+            new_node = copy.copy(node)
+        return self._typed(new_node, node)
+
+    def _renamed(self, node, mapping):
+        if isinstance(node, VarAccessNode) and node.name in mapping:
+            return self._clone(node, mapping)
+        return None
+
+    def _simple_arg(self, callee, param, arg):
+        """An argument that can replace its parameter everywhere, without a temporary."""
+        if param.name in callee.assigned or self.expr_types.get(id(arg)) != param.type_name:
+            return False
+        if isinstance(arg, LiteralNode):
+            return True
+        return isinstance(arg, VarAccessNode) \
+            and arg.name not in self.writes_of.get(callee.fun_node.name, ())
+
+    def _rename_stmt(self, stmt, mapping):
+        rewrite_stmt_exprs(stmt, lambda sub: self._renamed(sub, mapping))
+        # Targets: locals are mapped to fresh variables (assigned parameters always are)
+        if isinstance(stmt, AssignNode) and stmt.target in mapping:
+            stmt.target = mapping[stmt.target].name
+        elif isinstance(stmt, MultiAssignNode):
+            stmt.targets = [mapping[name].name if name in mapping else name for name in stmt.targets]
+        elif isinstance(stmt, VarDeclNode):
+            for var_init in stmt.var_list:
+                if isinstance(var_init, MultiVarInitNode):
+                    var_init.names = [mapping[name].name if name in mapping else name for name in var_init.names]
+                elif var_init.name in mapping:
+                    var_init.name = mapping[var_init.name].name
+        elif isinstance(stmt, InputNode):
+            stmt.target_groups = [[mapping[name].name if name in mapping else name for name in group]
+                                  for group in stmt.target_groups]
+
+    def _substitute(self, callee, args):
+        """The call as one expression (body 'reward e', simple arguments), or None."""
+        fun_node = callee.fun_node
+        if callee.statements or callee.result is None:
+            return None
+        if self.expr_types.get(id(callee.result)) != fun_node.ret_type:
+            return None
+        if not all(self._simple_arg(callee, p, a) for p, a in zip(fun_node.params, args)):
+            return None
+        mapping = {p.name: arg for p, arg in zip(fun_node.params, args)}
+        return self._clone(callee.result, mapping)
+
+    def _inline(self, callee, args):
+        """Statements running the body of callee on args; the result is left in self._last_result."""
+        fun_node = callee.fun_node
+        statements = []
+        mapping = {}
+        for param, arg in zip(fun_node.params, args):
+            if self._simple_arg(callee, param, arg):
+                mapping[param.name] = arg
+                continue
+            temp = self.names.fresh()
+            statements.append(VarDeclNode(param.type_name, [VarInitNode(temp, arg)]))
+            mapping[param.name] = VarAccessNode(temp)
+        for name in _local_names(fun_node) - set(mapping):
+            mapping[name] = VarAccessNode(self.names.fresh())
+
+        body = copy.deepcopy(callee.statements)
+        for stmt in iter_stmts(BlockNode(body)):
+            self._rename_stmt(stmt, mapping)
+        statements.extend(body)
+
+        self._last_result = None
+        if callee.result is not None:
+            result = self._clone(callee.result, mapping)
+            temp = self.names.fresh()
+            statements.append(VarDeclNode(fun_node.ret_type, [VarInitNode(temp, result)]))
+            self._last_result = VarAccessNode(temp)
+        self.inlined += 1
+        return statements
+
+def _local_names(fun_node):
+    names = {p.name for p in fun_node.params}
+    for stmt in iter_stmts(fun_node.body):
+        if isinstance(stmt, VarDeclNode):
+            names |= {name for v in stmt.var_list for name in v.names}
+    return names
+
+def _callee_names(fun_node):
+    names = set()
+    for stmt in iter_stmts(fun_node.body):
+        names |= called_functions(stmt)
+    return sorted(names)
+
+def _has_stray_break(statements):
+    """A quit outside every loop of the body (it would leave a loop of the caller)."""
+    stack = list(statements)
+    while stack:
+        stmt = stack.pop()
+        if isinstance(stmt, BreakNode):
+            return True
+        if isinstance(stmt, (WhileNode, ForNode)):
+            continue
+        for child in child_blocks(stmt):
+            stack.extend(child.statements)
+    return False
@@ -0,0 +1,103 @@
+from ..frontend.ast_node import *
+from .ast_utils import *
+from .dataflow import DeclaredLocals
+
+class LoopInvariantCodeMotion:
+    """
+    Hoists loop-invariant expressions out of WhileNode (stay) and ForNode (loop)
+    bodies into temporaries declared right before the loop.
+
+    An expression is hoisted when it is movable (no calls, no '-->', cannot
+    raise) and none of the variables it reads is written by the loop: the
+    assignments, grabs and declarations of the loop itself, its ForNode init,
+    and the names the called functions may write. The locals it reads must
+    also be surely declared before the loop (dataflow.DeclaredLocals): the
+    loop may not run, and the Interpreter would not read them at all.
+    Loops are processed outermost first, so an expression lands before the
+    outermost loop it is invariant in. With rank_overflow (native code) rank
+    arithmetic can raise, so it stays in the loop.
+    """
+    def __init__(self, program, expr_types, names, rank_overflow=False):
+        self.program = program
+        self.expr_types = expr_types
+        self.names = names
+        self.rank_types = expr_types if rank_overflow else None
+        self.writes_of = function_writes(program)
+        self.hoisted = 0
+
+    def run(self):
+        main_body = BlockNode(list(self.program.global_decls) + list(self.program.main_block.statements))
+        self._find_undeclared(DeclaredLocals(main_body), self.program.main_block)
+        self._visit_block(self.program.main_block)
+        for fun_node in self.program.functions:
+            self._find_undeclared(DeclaredLocals(fun_node.body, [p.name for p in fun_node.params]), fun_node.body)
+            self._visit_block(fun_node.body)
+        return self.hoisted
+
+    def _find_undeclared(self, declared, body):
+        # Before any rewriting, which may replace the loop conditions
+        self.undeclared = {id(stmt): declared.undeclared_before(stmt)
+                           for stmt in iter_stmts(body) if isinstance(stmt, (WhileNode, ForNode))}
+
+    def _visit_block(self, block):
+        new_statements = []
+        for stmt in block.statements:
+            if isinstance(stmt, (WhileNode, ForNode)):
+                new_statements.extend(self._hoist(stmt))
+            new_statements.append(stmt)
+            for child in child_blocks(stmt):
+                self._visit_block(child)
+        block.statements = new_statements
+
+    def _loop_writes(self, loop):
+        statements = list(iter_stmts(loop.block))
+        if isinstance(loop, ForNode):
+            for part in (loop.init, loop.update):
+                if isinstance(part, BlockNode):
+                    statements.extend(iter_stmts(part))
+                elif isinstance(part, StmtNode):
+                    statements.append(part)
+
+        writes = set()
+        callees = set()
+        for stmt in statements + [loop]:
+            writes |= stmt_writes(stmt)
+            callees |= called_functions(stmt)
+        for callee in callees:
+            writes |= self.writes_of.get(callee, set())
+        return writes
+
+    def _hoist(self, loop):
+        blocked = self._loop_writes(loop) | self.undeclared[id(loop)]
+        temps = {}  # expr_key -> temp name
+        decls = []
+
+        def replace(expr):
+            if not is_compound(expr) or not is_movable(expr, self.rank_types):
+                return None
+            if expr_vars(expr) & blocked:
+                return None
+            key = expr_key(expr)
+            name = temps.get(key)
+            if name is None:
+                name = self.names.fresh()
+                temps[key] = name
+                type_name = self.expr_types[id(expr)]
+                decls.append(VarDeclNode(type_name, [VarInitNode(name, expr)]))
+            access = VarAccessNode(name)
+            self.expr_types[id(access)] = self.expr_types[id(expr)]
+            return access
+
+        body = list(iter_stmts(loop.block))
+        if isinstance(loop, ForNode) and isinstance(loop.update, StmtNode):
+            # The update runs once per iteration, like the body
+            body.append(loop.update)
+            if isinstance(loop.update, BlockNode):
+                body.extend(iter_stmts(loop.update))
+
+        rewrite_stmt_exprs(loop, replace, self.expr_types)
+        for stmt in body:
+            rewrite_stmt_exprs(stmt, replace, self.expr_types)
+
+        self.hoisted += len(decls)
+        return decls
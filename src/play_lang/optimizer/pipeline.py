@@ -0,0 +1,47 @@
+from ..frontend.semantic_analysis import SemanticAnalyzer
+from .ast_utils import collect_names, expression_types, NameGenerator
+from .inlining import Inliner, INLINE_SIZE
+from .licm import LoopInvariantCodeMotion
+from .reduction import CountingLoopReducer
+from .cse import CommonSubexpressionEliminator
+
+def optimize_program(program, stats=None, inline_size=INLINE_SIZE, no_inline=(), rank_overflow=False):
+    """
+    Runs the AST optimization passes on a validated program (step 5 of compile_source).
+
+    The program is modified in place and returned. If stats is a dict it
+    receives the number of rewrites done by each pass. The result is checked
+    again by the SemanticAnalyzer so that a faulty pass cannot produce an
+    invalid program.
+
+    Small actions are inlined first (inline_size is the largest body
+    expanded, 0 disables inlining; no_inline lists actions never expanded),
+    so that the following passes see their code at the call sites.
+
+    rank_overflow=True optimizes for native code, where rank + - * are
+    64-bit and fail with "rank overflow": the passes then treat them like a
+    division and do not move them where they could raise sooner, or where
+    the original code did not evaluate them.
+    """
+    expr_types = expression_types(program)
+    names = NameGenerator(collect_names(program))
+
+    inlined = 0
+    if inline_size > 0:
+        inlined = Inliner(program, expr_types, names, inline_size, no_inline, rank_overflow).run()
+        if inlined:
+            expr_types = expression_types(program)
+
+    hoisted = LoopInvariantCodeMotion(program, expr_types, names, rank_overflow).run()
+    # After LICM, whose temporaries are invariant operands of the accumulations
+    reduced = CountingLoopReducer(program, expr_types, names, rank_overflow).run()
+    eliminated = CommonSubexpressionEliminator(program, expr_types, names, rank_overflow).run()
+
+    if stats is not None:
+        stats['inlined'] = inlined
+        stats['licm_hoisted'] = hoisted
+        stats['loops_reduced'] = reduced
+        stats['cse_eliminated'] = eliminated
+
+    SemanticAnalyzer().visit(program)
+    return program
@@ -0,0 +1,79 @@
+from ..frontend.ast_node import *
+from .ast_utils import iter_expr, iter_stmts, stmt_exprs, stmt_writes, called_functions
+
+def _function_effects(fun_node):
+    """
+    Replays the scoping of a function body in source order (a name is local
+    after its declaration) and returns (has_side_effects, global reads,
+    global writes, callees).
+    """
+    local_names = {p.name for p in fun_node.params}
+    reads = set()
+    writes = set()
+    callees = set()
+    side_effects = False
+
+    for stmt in iter_stmts(fun_node.body):
+        if isinstance(stmt, (InputNode, OutputNode)):
+            side_effects = True
+        callees |= called_functions(stmt)
+
+        if isinstance(stmt, VarDeclNode):
+            for var_init in stmt.var_list:
+                if var_init.expr is not None:
+                    reads |= _names_read(var_init.expr) - local_names
+                local_names.update(var_init.names)
+            continue
+
+        for expr in stmt_exprs(stmt):
+            reads |= _names_read(expr) - local_names
+        writes |= stmt_writes(stmt) - local_names
+
+    return side_effects or bool(writes), reads, writes, callees
+
+def _names_read(expr):
+    return {sub.name for sub in iter_expr(expr) if isinstance(sub, VarAccessNode)}
+
+def pure_functions(program):
+    """
+    Names of the functions whose result depends only on their arguments:
+    no grab or drop, no assignment to globals, reads only of globals that
+    are never assigned after their declaration, and calls only to pure
+    functions (recursion included). Works on the AST and on the lowered tree.
+    Actions of linked libraries are pure if their library says so.
+    """
+    global_names = {name for decl in program.global_decls for v in decl.var_list for name in v.names}
+
+    # Globals assigned or grabbed anywhere after their declaration
+    mutated = set()
+    for stmt in iter_stmts(program.main_block):
+        if not isinstance(stmt, VarDeclNode):
+            mutated |= stmt_writes(stmt)
+
+    effects = {}
+    for fun_node in program.functions:
+        effects[fun_node.name] = _function_effects(fun_node)
+        mutated |= effects[fun_node.name][2]
+    constant_globals = global_names - mutated
+
+    pure = {name for name, (side_effects, reads, writes, callees) in effects.items()
+            if not side_effects and reads <= constant_globals}
+
+    linked = set()
+    for library in program.libraries:
+        linked |= library.pure
+
+    # Greatest fixed point: drop functions that call an impure one
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not effects[name][3] <= pure | linked:
+                pure.discard(name)
+                changed = True
+    return pure
+
+def memoizable_functions(program):
+    """Pure functions that return a value: their calls can be served from a cache."""
+    pure = pure_functions(program)
+    return {f.name for f in program.functions if f.name in pure and f.ret_type != 'void'}
@@ -0,0 +1,405 @@
+from ..frontend.ast_node import *
+from .ast_utils import *
+
+# Highest power of the induction variable with a closed-form sum
+MAX_DEGREE = 3
+# Largest rank of native code (64-bit)
+RANK_MAX = 2**63 - 1
+
+class CountingLoopReducer:
+    """
+    Replaces counting loops that only accumulate into rank variables with
+    closed forms:
+
+        loop (i <-- a; i < n; i <-- i + s) -> { acc <-- acc + p(i) }
+
+    becomes the iteration count N (0 if a >= n), acc <-- acc + sum of p(a + s*k)
+    for k in [0, N) written with the formulas of sum k^d (d <= 3) and the
+    final i <-- a + N * s.
+
+    The loop must have a rank induction variable, a positive constant step,
+    an invariant bound and a body made only of acc <-- acc + expr on rank
+    accumulators (acc added once in a chain of + and -), where expr is a
+    polynomial in i whose other variables are not written by the loop. Rank arithmetic is exact
+    and a division in the closed form is either exact or multiplied by 0,
+    so the results are the same. rate accumulations are left alone: float
+    additions in another order round differently.
+
+    With rank_overflow (native code) the terms of the closed form can
+    overflow where the loop does not (sum i^3 and sum i^2 of a mixed body
+    cancel out): each product and sum is then computed into a temporary
+    only after checking that it fits in RANK_MAX, and the loop runs as
+    written when one does not (or when it does not iterate).
+    """
+    def __init__(self, program, expr_types, names, rank_overflow=False):
+        self.program = program
+        self.expr_types = expr_types
+        self.names = names
+        self.rank_overflow = rank_overflow
+        self.reduced = 0
+        self.steps = None  # (temporary, expression, condition) of the checked operations
+
+    def run(self):
+        self._visit_block(self.program.main_block)
+        for fun_node in self.program.functions:
+            self._visit_block(fun_node.body)
+        return self.reduced
+
+    def _visit_block(self, block):
+        new_statements = []
+        for stmt in block.statements:
+            replacement = self._reduce(stmt) if isinstance(stmt, ForNode) else None
+            if replacement is not None:
+                new_statements.extend(replacement)
+                self.reduced += 1
+                continue
+            new_statements.append(stmt)
+            for child in child_blocks(stmt):
+                self._visit_block(child)
+        block.statements = new_statements
+
+    def _type(self, node):
+        return self.expr_types.get(id(node))
+
+    # --- Pattern ---
+
+    def _reduce(self, loop):
+        init, condition, update = loop.init, loop.condition, loop.update
+        if not isinstance(init, AssignNode) or not isinstance(update, AssignNode):
+            return None
+        var = init.target
+        if update.target != var or not isinstance(condition, BinOpNode):
+            return None
+
+        # i < n, i <= n, n > i, n >= i
+        if isinstance(condition.left, VarAccessNode) and condition.left.name == var \
+                and condition.op in ('<', '<='):
+            bound, inclusive, access = condition.right, condition.op == '<=', condition.left
+        elif isinstance(condition.right, VarAccessNode) and condition.right.name == var \
+                and condition.op in ('>', '>='):
+            bound, inclusive, access = condition.left, condition.op == '>=', condition.right
+        else:
+            return None
+        if self._type(access) != 'rank' or self._type(bound) != 'rank' \
+                or self._type(init.expr) != 'rank':
+            return None
+
+        step = self._step(update, var)
+        if step is None:
+            return None
+
+        accumulations = []
+        for stmt in loop.block.statements:
+            accumulation = self._accumulation(stmt)
+            if accumulation is None:
+                return None
+            accumulations.append(accumulation)
+
+        writes = {var} | {target for target, _ in accumulations}
+        if len(writes) != len(accumulations) + 1:
+            return None  # two updates of the same accumulator, or of i
+        if not is_movable(bound) or expr_vars(bound) & writes:
+            return None
+
+        # The coefficients are computed by the closed form too: checked from here
+        self.steps = [] if self.rank_overflow else None
+        polynomials = self._polynomials(accumulations, var, writes)
+        if polynomials is None:
+            self.steps = None
+            return None
+        return self._closed_form(loop, var, bound, inclusive, step, polynomials)
+
+    def _polynomials(self, accumulations, var, writes):
+        polynomials = []
+        for target, terms in accumulations:
+            poly = {}
+            for sign, term in terms:
+                if not is_movable(term) or expr_vars(term) & (writes - {var}):
+                    return None
+                term_poly = self._polynomial(term, var)
+                if term_poly is None:
+                    return None
+                if sign < 0:
+                    term_poly = {d: self._neg(c) for d, c in term_poly.items()}
+                poly = self._poly_add(poly, term_poly)
+            polynomials.append((target, poly))
+        return polynomials
+
+    def _step(self, update, var):
+        expr = update.expr
+        if not isinstance(expr, BinOpNode) or expr.op != '+':
+            return None
+        for this, other in ((expr.left, expr.right), (expr.right, expr.left)):
+            if isinstance(this, VarAccessNode) and this.name == var and _is_int(other) \
+                    and other.value > 0:
+                return other.value
+        return None
+
+    def _accumulation(self, stmt):
+        # acc <-- <sum of terms> where acc is one of the terms, added once
+        if not isinstance(stmt, AssignNode) or self._type(stmt.expr) != 'rank':
+            return None
+        terms = []
+        self._additive_terms(stmt.expr, 1, terms)
+        own = [(sign, term) for sign, term in terms
+               if isinstance(term, VarAccessNode) and term.name == stmt.target]
+        if len(own) != 1 or own[0][0] != 1:
+            return None
+        return stmt.target, [(sign, term) for sign, term in terms if term is not own[0][1]]
+
+    def _additive_terms(self, node, sign, terms):
+        if isinstance(node, BinOpNode) and node.op in ('+', '-'):
+            self._additive_terms(node.left, sign, terms)
+            self._additive_terms(node.right, sign if node.op == '+' else -sign, terms)
+        elif isinstance(node, UnaryOpNode) and node.op in ('+', '-'):
+            self._additive_terms(node.expr, sign if node.op == '+' else -sign, terms)
+        else:
+            terms.append((sign, node))
+
+    # --- Polynomials: {degree: coefficient expression} ---
+
+    def _polynomial(self, node, var):
+        if isinstance(node, LiteralNode):
+            return {0: node} if _is_int(node) else None
+        if isinstance(node, VarAccessNode):
+            if self._type(node) != 'rank':
+                return None
+            return {1: self._literal(1)} if node.name == var else {0: node}
+        if isinstance(node, UnaryOpNode) and node.op in ('+', '-'):
+            inner = self._polynomial(node.expr, var)
+            if inner is None or node.op == '+':
+                return inner
+            return {d: self._neg(c) for d, c in inner.items()}
+        if isinstance(node, BinOpNode) and node.op in ('+', '-', '*'):
+            left = self._polynomial(node.left, var)
+            right = self._polynomial(node.right, var)
+            if left is None or right is None:
+                return None
+            if node.op == '+':
+                return self._poly_add(left, right)
+            if node.op == '-':
+                return self._poly_add(left, {d: self._neg(c) for d, c in right.items()})
+            return self._poly_mul(left, right)
+        return None
+
+    def _poly_add(self, a, b):
+        result = dict(a)
+        for degree, coefficient in b.items():
+            result[degree] = self._add(result[degree], coefficient) if degree in result else coefficient
+        return result
+
+    def _poly_mul(self, a, b):
+        result = {}
+        for da, ca in a.items():
+            for db, cb in b.items():
+                product = self._mul(ca, cb)
+                if _is_int(product) and product.value == 0:
+                    continue
+                if da + db > MAX_DEGREE:
+                    return None
+                result = self._poly_add(result, {da + db: product})
+        return result
+
+    # --- Closed form ---
+
+    def _closed_form(self, loop, var, bound, inclusive, step, polynomials):
+        start = self.names.fresh()
+        limit = self.names.fresh()
+        count = self.names.fresh()
+        statements = [
+            VarDeclNode('rank', [VarInitNode(start, loop.init.expr)]),
+            VarDeclNode('rank', [VarInitNode(limit, bound)]),
+            VarDeclNode('rank', [VarInitNode(count, self._literal(0))]),
+        ]
+        # N = ceil((n - a) / s) for '<', (n - a) / s + 1 for '<=', when the loop runs at all
+        steps, self.steps = self.steps, None
+        span = self._sub(self._var(limit), self._var(start))
+        if inclusive:
+            iterations = self._add(self._div(span, step), self._literal(1))
+        else:
+            iterations = self._div(self._add(span, self._literal(step - 1)), step)
+        runs = self._compare(self._var(start), '<=' if inclusive else '<', self._var(limit))
+        statements.append(IfNode(runs, BlockNode([AssignNode(count, iterations)]), [], None))
+
+        # i = a + s*k: p(i) becomes a polynomial in k, summed with sum k^d
+        self.steps = steps
+        index = {0: self._var(start), 1: self._literal(step)}
+        in_ks = []
+        for target, poly in polynomials:
+            in_k = {}
+            power = {0: self._literal(1)}
+            for degree in range(MAX_DEGREE + 1):
+                if degree in poly:
+                    in_k = self._poly_add(in_k, self._poly_mul(power, {0: poly[degree]}))
+                if degree < max(poly, default=0):
+                    power = self._poly_mul(power, index)
+            in_ks.append((target, in_k))
+        # Only the sums used: a higher one can overflow where the result fits
+        sums = self._power_sums(count, max((max(in_k, default=0) for _, in_k in in_ks), default=0))
+        reduced = []
+        for target, in_k in in_ks:
+            total = self._literal(0)
+            for degree, coefficient in sorted(in_k.items()):
+                total = self._add(total, self._mul(coefficient, sums[degree]))
+            # Overflows only where the loop would end with the same overflow
+            reduced.append(AssignNode(target, self._typed(BinOpNode(self._var(target), '+', total))))
+        steps, self.steps = self.steps, None
+
+        reduced.append(AssignNode(var, self._add(self._var(start),
+                                                 self._mul(self._var(count), self._literal(step)))))
+        if steps is None:
+            return statements + reduced
+
+        # Each step runs while all the previous ones fit; nothing runs when the loop does not iterate
+        fits = self.names.fresh()
+        statements.append(VarDeclNode('flag', [VarInitNode(fits, self._compare(self._var(count), '>',
+                                                                               self._literal(0)))]))
+        if steps:
+            statements.append(VarDeclNode('rank', [VarInitNode(temp, self._literal(0)) for temp, _, _ in steps]))
+        for temp, expr, condition in steps:
+            statements.append(IfNode(self._all(self._var(fits), condition),
+                                     BlockNode([AssignNode(temp, expr)]), [],
+                                     BlockNode([AssignNode(fits, self._typed(LiteralNode(False, 'flag'), 'flag'))])))
+        # Otherwise the loop itself, from the bounds already evaluated
+        condition = self._compare(self._var(var), '<=' if inclusive else '<', self._var(limit))
+        fallback = ForNode(AssignNode(var, self._var(start)), condition, loop.update, loop.block)
+        statements.append(IfNode(self._var(fits, 'flag'), BlockNode(reduced), [], BlockNode([fallback])))
+        return statements
+
+    def _power_sums(self, count, max_degree):
+        # sum k^d for k in [0, N), N >= 0 and d <= max_degree. Every product
+        # is divided first, so no intermediate value exceeds the sum itself:
+        # of N and N - 1 one is even, and 3 divides T or 2N - 1
+        n = self._var(count)
+        sums = {0: n}
+        if max_degree >= 1:
+            n_minus_1 = self._sub(n, self._literal(1))
+            # T = N(N-1)/2 = (N/2)(N-1) + (N%2)((N-1)/2)
+            sums[1] = triangle = self._add(self._mul(self._div(n, 2), n_minus_1),
+                                           self._mul(self._mod(n, 2), self._div(n_minus_1, 2)))
+        if max_degree >= 2:
+            odd = self._sub(self._mul(self._literal(2), n), self._literal(1))
+            # (N-1)N(2N-1)/6 = T(2N-1)/3 = (T/3)(2N-1) + (T%3)((2N-1)/3)
+            sums[2] = self._add(self._mul(self._div(triangle, 3), odd),
+                                self._mul(self._mod(triangle, 3), self._div(odd, 3)))
+        if max_degree >= 3:
+            sums[3] = self._mul(triangle, triangle)
+        return sums
+
+    # --- Rank expression builders (literal operands are folded) ---
+    # While self.steps is a list (rank_overflow), + - * and negation are
+    # computed into temporaries, each with the condition that it fits
+
+    def _typed(self, node, type_name='rank'):
+        self.expr_types[id(node)] = type_name
+        return node
+
+    def _literal(self, value):
+        return self._typed(LiteralNode(value, 'rank'))
+
+    def _var(self, name, type_name='rank'):
+        return self._typed(VarAccessNode(name), type_name)
+
+    def _compare(self, a, op, b):
+        return self._typed(BinOpNode(a, op, b), 'flag')
+
+    def _all(self, *conditions):
+        result = conditions[0]
+        for condition in conditions[1:]:
+            result = self._typed(BinOpNode(result, '&&', condition), 'flag')
+        return result
+
+    def _any(self, *conditions):
+        result = conditions[0]
+        for condition in conditions[1:]:
+            result = self._typed(BinOpNode(result, '||', condition), 'flag')
+        return result
+
+    def _checked(self, node, fits, *operands):
+        if self.steps is None:
+            return node
+        temp = self.names.fresh()
+        self.steps.append((temp, node, fits(*operands)))
+        return self._var(temp)
+
+    def _within(self, a, low, high):
+        # low <= a <= high, without the bounds a rank always satisfies
+        conditions = []
+        if low > -RANK_MAX - 1:
+            conditions.append(self._compare(a, '>=', self._literal(low)))
+        if high < RANK_MAX:
+            conditions.append(self._compare(a, '<=', self._literal(high)))
+        return self._all(*conditions) if conditions else self._typed(LiteralNode(True, 'flag'), 'flag')
+
+    def _sum_fits(self, a, b, sign):
+        # a + b (sign 1) or a - b (sign -1) in [-RANK_MAX, RANK_MAX]
+        if _is_int(b):
+            return self._within(a, -RANK_MAX - sign * b.value, RANK_MAX - sign * b.value)
+        if _is_int(a):
+            if sign > 0:
+                return self._within(b, -RANK_MAX - a.value, RANK_MAX - a.value)
+            return self._within(b, a.value - RANK_MAX, a.value + RANK_MAX)
+        zero, top, bottom = self._literal(0), self._literal(RANK_MAX), self._literal(-RANK_MAX)
+        up, down = self._compare(b, '>=', zero), self._compare(b, '<', zero)
+        if sign < 0:
+            up, down = down, up
+        op = '-' if sign > 0 else '+'
+        return self._any(self._all(up, self._compare(a, '<=', self._typed(BinOpNode(top, op, b)))),
+                         self._all(down, self._compare(a, '>=', self._typed(BinOpNode(bottom, op, b)))))
+
+    def _product_fits(self, a, b):
+        # |a| <= RANK_MAX / |b| (rank division truncates toward zero)
+        for this, other in ((b, a), (a, b)):
+            if _is_int(this):
+                bound = RANK_MAX // abs(this.value)
+                return self._within(other, -bound, bound)
+        zero = self._literal(0)
+        high = self._typed(BinOpNode(self._literal(RANK_MAX), '/', b))
+        low = self._typed(BinOpNode(self._literal(-RANK_MAX), '/', b))
+        return self._any(
+            self._compare(b, '==', zero),
+            self._all(self._compare(b, '>', zero), self._compare(a, '>=', low), self._compare(a, '<=', high)),
+            self._all(self._compare(b, '<', zero), self._compare(a, '>=', high), self._compare(a, '<=', low)))
+
+    def _add(self, a, b):
+        if _is_int(a) and _is_int(b):
+            return self._literal(a.value + b.value)
+        if _is_int(a) and a.value == 0:
+            return b
+        if _is_int(b) and b.value == 0:
+            return a
+        return self._checked(self._typed(BinOpNode(a, '+', b)), self._sum_fits, a, b, 1)
+
+    def _sub(self, a, b):
+        if _is_int(a) and _is_int(b):
+            return self._literal(a.value - b.value)
+        if _is_int(b) and b.value == 0:
+            return a
+        return self._checked(self._typed(BinOpNode(a, '-', b)), self._sum_fits, a, b, -1)
+
+    def _mul(self, a, b):
+        if _is_int(a) and _is_int(b):
+            return self._literal(a.value * b.value)
+        for this, other in ((a, b), (b, a)):
+            if _is_int(this) and this.value == 0:
+                return self._literal(0)
+            if _is_int(this) and this.value == 1:
+                return other
+        return self._checked(self._typed(BinOpNode(a, '*', b)), self._product_fits, a, b)
+
+    def _div(self, a, divisor):
+        if divisor == 1:
+            return a
+        return self._typed(BinOpNode(a, '/', self._literal(divisor)))
+
+    def _mod(self, a, divisor):
+        return self._typed(BinOpNode(a, '%', self._literal(divisor)))
+
+    def _neg(self, a):
+        if _is_int(a):
+            return self._literal(-a.value)
+        return self._checked(self._typed(UnaryOpNode('-', a)),
+                             lambda a: self._compare(a, '>=', self._literal(-RANK_MAX)), a)
+
+def _is_int(node):
+    return isinstance(node, LiteralNode) and type(node.value) is int
@@ -0,0 +1,93 @@
+from ..frontend.ast_node import *
+from .ast_utils import iter_expr, iter_stmts, stmt_exprs, stmt_writes, called_functions, expr_vars, is_trapping
+
+def _block_uses(block):
+    """(called function names, variable names read or written) of a block."""
+    calls = set()
+    names = set()
+    for stmt in iter_stmts(block):
+        calls |= called_functions(stmt)
+        names |= stmt_writes(stmt)
+        for expr in stmt_exprs(stmt):
+            names |= expr_vars(expr)
+    return calls, names
+
+def reachable_functions(program):
+    """Names of the program's actions reachable from the play block through the call graph."""
+    functions = {f.name: f for f in program.functions}
+    calls, _ = _block_uses(program.main_block)
+    reached = set()
+    todo = [name for name in calls if name in functions]
+    while todo:
+        name = todo.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        callees, _ = _block_uses(functions[name].body)
+        todo.extend(callee for callee in callees if callee in functions and callee not in reached)
+    return reached
+
+def _may_overflow(expr):
+    # Without types any arithmetic on a variable may be on ranks
+    for sub in iter_expr(expr):
+        if isinstance(sub, BinOpNode) and sub.op in ('+', '-', '*', '/') \
+                and not (isinstance(sub.left, LiteralNode) and isinstance(sub.right, LiteralNode)):
+            return True
+        if isinstance(sub, UnaryOpNode) and sub.op == '-' and not isinstance(sub.expr, LiteralNode):
+            return True
+    return False
+
+def shake_program(program, stats=None, rank_overflow=False):
+    """
+    Removes the actions that the play block can never call and the global
+    declarations that no remaining code reads or writes. Works on the AST,
+    before or after the SemanticAnalyzer, and on the lowered tree.
+
+    Names are matched syntactically: a local that shadows a global keeps the
+    global alive, which is only conservative. A global whose initializer
+    reads another global keeps that one too, and an initializer that may
+    raise (division by a variable, or with rank_overflow any arithmetic,
+    which overflows in native code) is always kept, so the program fails the
+    same way. Calls to linked library actions are left alone.
+
+    The program is modified in place and returned. If stats is a dict it
+    receives the removed names in source order under 'shaken_functions'
+    and 'shaken_globals'.
+    """
+    reached = reachable_functions(program)
+    removed_functions = [f.name for f in program.functions if f.name not in reached]
+    program.functions = [f for f in program.functions if f.name in reached]
+
+    _, used = _block_uses(program.main_block)
+    for fun_node in program.functions:
+        used |= _block_uses(fun_node.body)[1]
+
+    # Initializers of kept globals can read earlier globals: walk back in source order
+    inits = [(decl, var_init) for decl in program.global_decls for var_init in decl.var_list]
+    kept = set()
+    for decl, var_init in reversed(inits):
+        expr = var_init.expr
+        raises = expr is not None and (is_trapping(expr) or (rank_overflow and _may_overflow(expr)))
+        if not used.isdisjoint(var_init.names) or raises:
+            kept.add(id(var_init))
+            if var_init.expr is not None:
+                used |= expr_vars(var_init.expr)
+
+    removed_globals = []
+    global_decls = []
+    for decl in program.global_decls:
+        var_list = []
+        for var_init in decl.var_list:
+            if id(var_init) in kept:
+                var_list.append(var_init)
+            else:
+                removed_globals.extend(var_init.names)
+        if var_list:
+            decl.var_list = var_list
+            global_decls.append(decl)
+    program.global_decls = global_decls
+
+    if stats is not None:
+        stats['shaken_functions'] = removed_functions
+        stats['shaken_globals'] = removed_globals
+    return program
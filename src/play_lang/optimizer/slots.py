@@ -0,0 +1,104 @@
+from ..frontend.ast_node import *
+from .ast_utils import iter_stmts
+from .cfg import build_cfg, bit_indexes
+from .dataflow import liveness, live_after_items, maybe_undeclared_accesses
+
+class SlotAllocation:
+    """
+    Frame layout of one action: slot of every parameter and local (by name,
+    names are unique in an action), number of slots with one slot per
+    declared name (declared) and after packing (num_slots). own_slot holds
+    the locals that keep a slot of their own (see allocate_slots).
+    """
+    def __init__(self, name, slots, declared, num_slots, own_slot):
+        self.name = name
+        self.slots = slots
+        self.declared = declared
+        self.num_slots = num_slots
+        self.own_slot = own_slot
+
+def allocate_slots(fun_node):
+    """
+    Packs the locals of an action (AST or lowered tree) into shared frame
+    slots from their live ranges (optimizer.dataflow.liveness).
+
+    Two variables interfere when one is written while the other is live:
+    that covers dead stores, which still write their slot. Variables written
+    by the same statement (rank: a <-- 1, b <-- a, or a chain of grab
+    targets) also interfere with each other and with what the statement
+    reads. Parameters keep their positional slots 0..n-1; the other names
+    are colored greedily in declaration order with the lowest slot of their
+    type that holds no interfering variable.
+
+    A local that may be read or assigned on a path that skipped its
+    declaration keeps a slot of its own: the VM checks that such a slot is
+    not empty, and a shared slot would hold another variable's value.
+    """
+    params = [p.name for p in fun_node.params]
+    types = {p.name: p.type_name for p in fun_node.params}
+    for stmt in iter_stmts(fun_node.body):
+        if isinstance(stmt, VarDeclNode):
+            for var_init in stmt.var_list:
+                for name in var_init.names:
+                    types[name] = stmt.type_name
+    names = list(types)  # parameters, then locals in declaration order
+
+    cfg = build_cfg(fun_node.body, params, fun_node.name)
+    bits = {name: cfg.bit(name) for name in names}
+    live_after = live_after_items(cfg, liveness(cfg))
+
+    own_slot = {name for _, name in maybe_undeclared_accesses(cfg) if name not in params}
+
+    interference = {name: 0 for name in names}
+    index_names = cfg.variables
+    for block in cfg.blocks:
+        for i, (reads, writes) in enumerate(zip(block.reads, block.writes)):
+            if not writes:
+                continue
+            busy = live_after[block.index][i]
+            if writes & (writes - 1):  # several targets in one statement
+                busy |= writes | reads
+            for index in bit_indexes(writes):
+                name = index_names[index]
+                if name in interference:
+                    interference[name] |= busy & ~(1 << index)
+    # Symmetric closure: a variable live at the write of another interferes with it
+    for name in names:
+        for index in bit_indexes(interference[name]):
+            other = index_names[index]
+            if other in interference:
+                interference[other] |= bits[name]
+    # Parameters are all written on entry
+    param_mask = cfg.param_mask
+    for name in params:
+        interference[name] |= param_mask & ~bits[name]
+
+    slots = {name: i for i, name in enumerate(params)}
+    slot_types = [types[name] for name in params]
+    slot_members = [bits[name] for name in params]
+    for name in names[len(params):]:
+        slot = None
+        if name not in own_slot:
+            for candidate, slot_type in enumerate(slot_types):
+                if slot_type == types[name] and not slot_members[candidate] & interference[name] \
+                        and not any(index_names[m] in own_slot for m in bit_indexes(slot_members[candidate])):
+                    slot = candidate
+                    break
+        if slot is None:
+            slot = len(slot_types)
+            slot_types.append(types[name])
+            slot_members.append(0)
+        slots[name] = slot
+        slot_members[slot] |= bits[name]
+    return SlotAllocation(fun_node.name, slots, len(names), len(slot_types), own_slot)
+
+def frame_report(allocations):
+    """Text table of frame sizes before and after slot packing."""
+    lines = [f"{'action':24s} {'declared':>8s} {'packed':>8s}"]
+    total_before = total_after = 0
+    for allocation in allocations:
+        lines.append(f"{allocation.name:24s} {allocation.declared:8d} {allocation.num_slots:8d}")
+        total_before += allocation.declared
+        total_after += allocation.num_slots
+    lines.append(f"{'total':24s} {total_before:8d} {total_after:8d}")
+    return "\n".join(lines)
@@ -0,0 +1,2 @@
+class PlayRuntimeError(Exception):
+    pass
@@ -0,0 +1,196 @@
+import io
+import sys
+from collections import deque
+
+from .errors import PlayRuntimeError
+
+# --- Typed input parsing ---
+# int() / float() already parse the literal forms accepted by Play, no regex needed.
+
+def parse_rank(text):
+    try:
+        return int(text)
+    except ValueError:
+        raise PlayRuntimeError(f"Invalid rank input: '{text.strip()}'")
+
+def parse_rate(text):
+    try:
+        return float(text)
+    except ValueError:
+        raise PlayRuntimeError(f"Invalid rate input: '{text.strip()}'")
+
+def parse_flag(text):
+    text = text.strip()
+    if text == 'true':
+        return True
+    if text == 'false':
+        return False
+    raise PlayRuntimeError(f"Invalid flag input: '{text}'")
+
+def parse_label(text):
+    return text
+
+PARSERS = {'rank': parse_rank, 'rate': parse_rate, 'flag': parse_flag, 'label': parse_label}
+
+def parse_value(text, type_name):
+    """Converts a line read by grab to the declared type of its target."""
+    return PARSERS[type_name](text)
+
+# --- I/O layer ---
+
+class PlayIO:
+    """
+    Runtime I/O for drop and grab.
+
+    Output lines are collected in a buffer and written in one call when it
+    reaches buffer_size characters, before every grab prompt and on flush()/close().
+    Input from a non-interactive stream (file, pipe, StringIO) is read in one
+    go on the first grab and served line by line; a terminal is read one line
+    at a time. Any text streams can be plugged in.
+    """
+    def __init__(self, input_stream=None, output_stream=None, buffer_size=64 * 1024, echo_prompts=True):
+        self.input_stream = input_stream if input_stream is not None else sys.stdin
+        self.output_stream = output_stream if output_stream is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self.echo_prompts = echo_prompts
+        self._buffer = []
+        self._buffered = 0
+        self._lines = None  # prefetched input lines (non-interactive input)
+        self._next_line = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Output ---
+
+    def write_line(self, text):
+        self._buffer.append(text)
+        self._buffer.append('\n')
+        self._buffered += len(text) + 1
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.output_stream.write(''.join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+        self.output_stream.flush()
+
+    def close(self):
+        self.flush()
+
+    # --- Input ---
+
+    def _is_interactive(self):
+        isatty = getattr(self.input_stream, 'isatty', None)
+        return bool(isatty and isatty())
+
+    def read_line(self, prompt=''):
+        """Returns the next input line (without newline) after showing the prompt."""
+        if self.echo_prompts and prompt:
+            self._buffer.append(prompt)
+        self.flush()
+
+        if self._lines is None and not self._is_interactive():
+            self._lines = self.input_stream.read().splitlines()
+
+        if self._lines is not None:
+            if self._next_line >= len(self._lines):
+                raise PlayRuntimeError("grab: end of input")
+            line = self._lines[self._next_line]
+            self._next_line += 1
+            return line
+
+        line = self.input_stream.readline()
+        if not line:
+            raise PlayRuntimeError("grab: end of input")
+        return line.rstrip('\r\n')
+
+    def pending_lines(self):
+        """
+        Input lines not read yet, which are then marked as read (for a program
+        run outside this process). None if the input is a terminal.
+        """
+        if self._lines is None:
+            if self._is_interactive():
+                return None
+            self._lines = self.input_stream.read().splitlines()
+        lines = self._lines[self._next_line:]
+        self._next_line = len(self._lines)
+        return lines
+
+    def read_value(self, type_name, prompt=''):
+        return parse_value(self.read_line(prompt), type_name)
+
+    def lines_ready(self, count):
+        # Blocking input: read_line waits for its line (or reports the end of input)
+        return True
+
+class MemoryIO(PlayIO):
+    """PlayIO over in-memory streams: inputs is a list of lines, output is in getvalue()/lines()."""
+    def __init__(self, inputs=(), buffer_size=64 * 1024, echo_prompts=False):
+        super().__init__(io.StringIO(), io.StringIO(), buffer_size, echo_prompts)
+        self._lines = list(inputs)
+
+    def getvalue(self):
+        self.flush()
+        return self.output_stream.getvalue()
+
+    def lines(self):
+        return self.getvalue().splitlines()
+
+class ChannelIO:
+    """
+    I/O of a suspendable session: input lines are queued with feed() and
+    grab only runs when enough of them are ready (lines_ready), drop lines
+    and prompts go to the output callback as soon as they are written.
+
+    A prompt already shown while the session was waiting (show_prompt) is
+    not shown again when the line is read.
+    """
+    def __init__(self, on_output, echo_prompts=True):
+        self.on_output = on_output
+        self.echo_prompts = echo_prompts
+        self.lines = deque()
+        self._prompt_shown = False
+
+    def feed(self, line):
+        self.lines.append(line)
+
+    def lines_ready(self, count):
+        return len(self.lines) >= count
+
+    def show_prompt(self, prompt):
+        if self.echo_prompts and prompt and not self._prompt_shown:
+            self.on_output(prompt)
+        self._prompt_shown = True
+
+    def read_line(self, prompt=''):
+        if not self._prompt_shown:
+            if self.echo_prompts and prompt:
+                self.on_output(prompt)
+        self._prompt_shown = False
+        if not self.lines:
+            raise PlayRuntimeError("grab: end of input")
+        return self.lines.popleft()
+
+    def write_line(self, text):
+        self.on_output(text)
+
+    def save_state(self):
+        """Queued input lines and whether the pending prompt is shown, for snapshots."""
+        return list(self.lines), self._prompt_shown
+
+    def load_state(self, state):
+        lines, self._prompt_shown = state
+        self.lines = deque(lines)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
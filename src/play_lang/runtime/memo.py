@@ -0,0 +1,46 @@
+import math
+from collections import OrderedDict
+
+MISSING = object()
+
+def memo_key(function, values):
+    """
+    Cache key of a call: (function, *values), followed by the sign of every
+    rate argument when one of the values is zero. -0.0 == 0.0, but a call
+    with -0.0 can give another result (1.0 / -0.0, drop of a label).
+    """
+    key = (function, *values)
+    if 0 in values:
+        key += tuple(math.copysign(1.0, value) for value in values if type(value) is float)
+    return key
+
+class MemoCache:
+    """
+    LRU cache of the results of pure function calls, shared by all the
+    functions of a run. Keys are built by memo_key; max_size bounds the
+    number of entries.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Returns the cached result or MISSING."""
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries), 'max_size': self.max_size}
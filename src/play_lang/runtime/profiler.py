@@ -0,0 +1,96 @@
+import time
+
+class Profiler:
+    """
+    Counters of a profiled run, filled by the PROF_* instructions of a module
+    compiled with BytecodeCompiler(profile=True).
+
+    Everything is kept in lists indexed by node id (function index, with the
+    main block last, and loop index): call counts, inclusive and exclusive
+    time per function, iterations per loop. Inclusive time of a recursive
+    function is only counted for its outermost activation. Exclusive time is
+    also accumulated per call path, for the collapsed-stack report.
+    """
+    def __init__(self, function_names, loop_names, clock=time.perf_counter):
+        self.function_names = list(function_names)
+        self.loop_names = list(loop_names)
+        self.clock = clock
+        count = len(self.function_names)
+        self.calls = [0] * count
+        self.inclusive = [0.0] * count
+        self.exclusive = [0.0] * count
+        self.loop_iterations = [0] * len(self.loop_names)
+        self._active = [0] * count
+        # Call paths: path id -> (parent path id, function id), time per path id
+        self._paths = []
+        self._path_ids = {}
+        self._path_time = []
+        self._stack = []  # [function id, start, time of children, path id]
+
+    def enter(self, function_id):
+        parent = self._stack[-1][3] if self._stack else -1
+        path_id = self._path_ids.get((parent, function_id))
+        if path_id is None:
+            path_id = self._path_ids[parent, function_id] = len(self._paths)
+            self._paths.append((parent, function_id))
+            self._path_time.append(0.0)
+        self.calls[function_id] += 1
+        self._active[function_id] += 1
+        self._stack.append([function_id, self.clock(), 0.0, path_id])
+
+    def exit(self, function_id):
+        now = self.clock()
+        function_id, start, children, path_id = self._stack.pop()
+        elapsed = now - start
+        self.exclusive[function_id] += elapsed - children
+        self._path_time[path_id] += elapsed - children
+        self._active[function_id] -= 1
+        if not self._active[function_id]:
+            self.inclusive[function_id] += elapsed
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    # --- Reports ---
+
+    def report(self):
+        """Text report: functions by exclusive time, then loops by iterations."""
+        lines = [f"{'function':24s} {'calls':>10s} {'inclusive ms':>13s} {'exclusive ms':>13s}"]
+        order = sorted(range(len(self.function_names)), key=lambda i: -self.exclusive[i])
+        for i in order:
+            if self.calls[i]:
+                lines.append(f"{self.function_names[i]:24s} {self.calls[i]:10d} "
+                             f"{self.inclusive[i] * 1000:13.3f} {self.exclusive[i] * 1000:13.3f}")
+        if self.loop_names:
+            lines.append("")
+            lines.append(f"{'loop':24s} {'iterations':>10s}")
+            order = sorted(range(len(self.loop_names)), key=lambda i: -self.loop_iterations[i])
+            for i in order:
+                lines.append(f"{self.loop_names[i]:24s} {self.loop_iterations[i]:10d}")
+        return "\n".join(lines)
+
+    def collapsed_stacks(self):
+        """
+        Lines 'outer;inner;leaf <microseconds>' of exclusive time per call path,
+        the input format of flamegraph.pl and speedscope.
+        """
+        lines = []
+        for path_id, elapsed in enumerate(self._path_time):
+            micros = round(elapsed * 1e6)
+            if micros <= 0:
+                continue
+            names = []
+            node = path_id
+            while node != -1:
+                node, function_id = self._paths[node]
+                names.append(self.function_names[function_id])
+            lines.append(f"{';'.join(reversed(names))} {micros}")
+        return lines
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            f.write(self.report() + "\n")
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for line in self.collapsed_stacks():
+                f.write(line + "\n")
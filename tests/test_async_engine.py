@@ -0,0 +1,108 @@
+import unittest
+import asyncio
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.async_engine import AsyncSession
+from play_lang.runtime.errors import PlayRuntimeError
+
+CALCULATOR = """
+rank: op_choice
+rate: n1, n2
+flag: running <-- true
+
+action add(rate a, rate b) -> rate { reward a + b }
+action mul(rate a, rate b) -> rate { reward a * b }
+
+play {
+    stay (running) -> {
+        op_choice <-- grab "Operazione (0-2): "
+        choice (op_choice == 0) -> {
+            running <-- false
+            drop "Uscita."
+        } fail -> {
+            n1, n2 <-- grab "Due numeri: "
+            choice (op_choice == 1) -> { drop "Risultato: " + add(n1, n2) }
+            fail -> { drop "Risultato: " + mul(n1, n2) }
+        }
+    }
+} gameover
+"""
+
+def compile_module(code):
+    return BytecodeCompiler().compile_program(compile_source(code, lower=True))
+
+class TestAsyncEngine(unittest.TestCase):
+    def test_grab_awaits_input(self):
+        async def scenario():
+            session = AsyncSession(compile_module(CALCULATOR))
+            task = asyncio.create_task(session.run())
+            await asyncio.sleep(0)
+            self.assertEqual(session.vm.waiting, ("Operazione (0-2): ", 1))
+            self.assertFalse(task.done())
+            for line in ["1", "2", "3.5", "2", "4", "5", "0"]:
+                await session.send(line)
+            return await task
+
+        output = asyncio.run(scenario())
+        self.assertEqual(output, ["Operazione (0-2): ", "Due numeri: ", "Risultato: 5.5",
+                                  "Operazione (0-2): ", "Due numeri: ", "Risultato: 20.0",
+                                  "Operazione (0-2): ", "Uscita."])
+
+    def test_many_sessions_and_output_channel(self):
+        module = compile_module(CALCULATOR)
+
+        async def scenario():
+            outputs = [asyncio.Queue() for _ in range(200)]
+            sessions = [AsyncSession(module, output_channel=out, echo_prompts=False) for out in outputs]
+            tasks = [asyncio.create_task(s.run()) for s in sessions]
+            await asyncio.sleep(0)
+            for n, session in reversed(list(enumerate(sessions))):
+                for line in ["1", str(n), "1", "0"]:
+                    await session.send(line)
+            await asyncio.gather(*tasks)
+            return [[q.get_nowait() for _ in range(q.qsize())] for q in outputs]
+
+        for n, lines in enumerate(asyncio.run(scenario())):
+            self.assertEqual(lines, [f"Risultato: {n + 1.0}", "Uscita."])
+
+    def test_busy_session_yields(self):
+        busy = """
+        rank: i
+        play {
+            loop (i <-- 0; i < 200000; i <-- i + 1) -> { }
+            drop "busy"
+        } gameover
+        """
+        done = []
+
+        async def scenario():
+            async def track(name, session):
+                await session.run()
+                done.append(name)
+            slow = AsyncSession(compile_module(busy), slice_steps=1000)
+            fast = AsyncSession(compile_module(CALCULATOR), echo_prompts=False)
+            fast.input.put_nowait("0")
+            await asyncio.gather(track('busy', slow), track('calculator', fast))
+
+        asyncio.run(scenario())
+        self.assertEqual(done, ['calculator', 'busy'])
+
+    def test_closed_input(self):
+        async def scenario():
+            session = AsyncSession(compile_module(CALCULATOR))
+            session.close_input()
+            await session.run()
+
+        with self.assertRaisesRegex(PlayRuntimeError, "end of input"):
+            asyncio.run(scenario())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, run_batch_source
+from play_lang.backend import batch
+from play_lang.backend.batch import BatchExecutor, input_line
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+SCORING = """
+rank: n, i, acc
+rate: w
+label: name
+flag: vip
+
+action score(rank a, rate b) -> rate {
+    rate: s
+    s <-- a * b
+    choice (s > 100.0) -> { reward 100.0 }
+    reward s / 2.0
+}
+
+play {
+    name <-- grab "nome"
+    n <-- grab "n"
+    w <-- grab "w"
+    vip <-- grab "vip"
+    acc <-- 0
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        choice (i % 3 == 0) -> { acc <-- acc + i * i }
+        retry (i == 7) -> { quit }
+        fail -> { acc <-- acc - 1 }
+    }
+    drop name + ": " + acc + " " + score(acc, w) + " " + (vip && acc / (n - 5) > 2)
+    choice (vip) -> { drop "vip " + (acc % 7) }
+} gameover
+"""
+
+MENU = """
+rank: op_choice, count
+rate: n1, n2
+flag: running <-- true
+
+action fact(rank n) -> rank {
+    choice (n <= 1) -> { reward 1 }
+    reward n * fact(n - 1)
+}
+
+play {
+    stay (running) -> {
+        op_choice <-- grab "Operazione: "
+        count <-- count + 1
+        choice (op_choice == 0) -> { running <-- false }
+        retry (op_choice == 3) -> { drop "fatt " + fact(count) }
+        fail -> {
+            n1, n2 <-- grab "Due numeri: "
+            choice (op_choice == 1) -> { drop "somma " + (n1 + n2) }
+            fail -> { drop "resto " + (n1 % n2) }
+        }
+    }
+    drop "operazioni " + count
+} gameover
+"""
+
+def scoring_columns(rows):
+    names = [f"u{r}" for r in range(rows)]
+    counts = [str((r * 7) % 17 - 3) for r in range(rows)]
+    weights = [str((r % 13) * 0.75) for r in range(rows)]
+    flags = ["true" if r % 3 else "false" for r in range(rows)]
+    return [names, counts, weights, flags]
+
+def run_rows_on_vm(source, columns, rows):
+    module = BytecodeCompiler().compile_program(compile_source(source, lower=True))
+    outputs, errors = [], []
+    for row in range(rows):
+        lines = []
+        for column in columns:
+            line = input_line(column[row])
+            if line is None:
+                break
+            lines.append(line)
+        play_io = MemoryIO(lines)
+        error = None
+        try:
+            VM(io=play_io).run(module)
+        except Exception as e:
+            error = str(e)
+        outputs.append(play_io.lines())
+        errors.append(error)
+    return outputs, errors
+
+class TestBatch(unittest.TestCase):
+    def assertSameAsVM(self, source, columns, rows):
+        result = run_batch_source(source, columns)
+        outputs, errors = run_rows_on_vm(source, columns, rows)
+        self.assertEqual(result.outputs, outputs)
+        self.assertEqual(result.errors, errors)
+        return result
+
+    def test_scoring_matches_vm(self):
+        result = self.assertSameAsVM(SCORING, scoring_columns(300), 300)
+        self.assertEqual(result.outputs[1], ["u1: 7 2.625 false", "vip 0"])
+        if batch.np is not None:
+            # Only the vip rows dividing by n - 5 == 0 run on the VM (&& short-circuits)
+            self.assertEqual(result.fallback, 12)
+            self.assertEqual(result.vectorized, 288)
+
+    def test_input_per_row_and_fallbacks(self):
+        # Rows grab a different number of lines; recursion, a bad line and
+        # a missing line are left to the VM
+        rows = [["1", "2", "3.5", "3", "0"], ["2", "7", "2", "0"], ["2", "1", "0", "0"],
+                ["1", "x", "1", "0"], ["1", "4", "4", "1"], ["0"]]
+        width = max(len(row) for row in rows)
+        columns = [[row[k] if k < len(row) else None for row in rows] for k in range(width)]
+        result = self.assertSameAsVM(MENU, columns, len(rows))
+        self.assertEqual(result.outputs[0], ["somma 5.5", "fatt 2", "operazioni 3"])
+        self.assertEqual(result.outputs[1], ["resto 1.0", "operazioni 2"])
+        self.assertEqual(result.errors[2], "Modulo by zero")
+        self.assertIn("Invalid rate input", result.errors[3])
+        self.assertEqual(result.errors[4], "grab: end of input")
+        self.assertEqual(result.outputs[5], ["operazioni 1"])
+        if batch.np is not None:
+            self.assertEqual(result.vectorized, 2)
+
+    @unittest.skipIf(batch.np is None, "NumPy is not installed")
+    def test_numeric_columns_and_rank_overflow(self):
+        np = batch.np
+        source = """
+        rank: a, i
+        play {
+            a <-- grab ""
+            loop (i <-- 0; i < 6; i <-- i + 1) -> { a <-- a * 1000 - 1 }
+            drop "a " + a + " " + (a / -7) + " " + (a % 10)
+        } gameover
+        """
+        values = np.array([3, -4, 0, 10 ** 6, -(10 ** 5)], dtype=np.int64)
+        result = self.assertSameAsVM(source, [values], len(values))
+        # Past 2**62 rank values are exact Python ints on the VM
+        a = 10 ** 6
+        for _ in range(6):
+            a = a * 1000 - 1
+        self.assertEqual(result.outputs[3], [f"a {a} {-(a // 7)} {a % 10}"])
+        self.assertEqual(result.fallback, 2)
+
+    def test_without_numpy(self):
+        saved = batch.np
+        batch.np = None
+        try:
+            result = self.assertSameAsVM(SCORING, scoring_columns(20), 20)
+        finally:
+            batch.np = saved
+        self.assertEqual(result.fallback, 20)
+
+    def test_skipped_declaration_runs_on_vm(self):
+        source = """
+        rank: n
+        action half(rank v) -> rank {
+            choice (v % 2 == 0) -> { rank: h <-- v / 2 }
+            reward h
+        }
+        play {
+            n <-- grab ""
+            drop "h " + half(n)
+        } gameover
+        """
+        result = self.assertSameAsVM(source, [["4", "3", "10"]], 3)
+        self.assertEqual(result.outputs[0], ["h 2"])
+        self.assertEqual(result.errors[1], "Variable 'h' not defined")
+        self.assertEqual(result.fallback, 3)
+
+    def test_non_finite_modulo_and_big_rank(self):
+        # Both are errors of their row, not of the whole batch
+        source = """
+        rate: x
+        rank: r
+        play {
+            x <-- grab ""
+            r <-- grab ""
+            drop "m " + x % 2.0 + " " + (r + 0.5)
+        } gameover
+        """
+        columns = [["7.5", "inf", "nan", "1"], ["3", "3", "3", "1" + "0" * 400]]
+        result = self.assertSameAsVM(source, columns, 4)
+        self.assertEqual(result.outputs[0], ["m 1.5 3.5"])
+        self.assertEqual(result.errors[1:], ["Modulo of a non-finite value"] * 2 + ["Rank too large for a rate"])
+
+    def test_no_input(self):
+        result = BatchExecutor(compile_source('play { drop "ciao" } gameover', lower=True)).run(rows=3)
+        self.assertEqual(result.outputs, [["ciao"]] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
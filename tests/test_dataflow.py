@@ -0,0 +1,152 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.frontend.ast_node import *
+from play_lang.optimizer.cfg import build_cfg, program_cfgs
+from play_lang.optimizer.dataflow import (liveness, live_after_items, reaching_definitions,
+                                          definite_assignment, maybe_unassigned_reads,
+                                          maybe_undeclared_accesses)
+
+SOURCE = """
+rank: g
+action f(rank n) -> rank {
+    rank: a, b <-- n, c
+    loop (a <-- 0; a < n; a <-- a + 1) -> {
+        choice (a == 3) -> { quit }
+        retry (a == 2) -> { c <-- c + b }
+        fail -> { b <-- b + 1 }
+    }
+    choice (n > 5) -> { reward c }
+    g <-- g + 1
+    reward b
+}
+play {
+    g <-- f(3)
+    drop "g " + g
+} gameover
+"""
+
+def item_named(cfg, predicate):
+    for block in cfg.blocks:
+        for i, item in enumerate(block.items):
+            if predicate(item):
+                return block, i
+    raise AssertionError("item not found")
+
+class TestDataflow(unittest.TestCase):
+    def setUp(self):
+        self.cfgs = program_cfgs(compile_source(SOURCE))
+        self.cfg = self.cfgs['f']
+
+    def test_cfg_shape(self):
+        cfg = self.cfg
+        self.assertEqual(set(self.cfgs), {'f', '<play>'})
+        header, _ = item_named(cfg, lambda item: isinstance(item, BinOpNode) and item.op == '<')
+        # Loop header: into the body and out of the loop, reached from the entry and the update
+        self.assertEqual(len(header.succs), 2)
+        self.assertEqual(len(header.preds), 2)
+        # Both rewards and the end of the code reach the single exit
+        self.assertEqual(len(cfg.exit.preds), 2)
+        self.assertFalse(cfg.exit.succs)
+        # quit jumps to the block after the loop
+        quit_test, _ = item_named(cfg, lambda item: isinstance(item, BinOpNode) and item.op == '=='
+                                  and item.right.value == 3)
+        after_loop = header.succs[1]
+        self.assertIn(after_loop, quit_test.succs[0].succs)
+        order = cfg.reverse_postorder()
+        self.assertIs(order[0], cfg.entry)
+        self.assertEqual(len(order), len(cfg.blocks))
+
+    def test_liveness(self):
+        cfg = self.cfg
+        live = liveness(cfg)
+        self.assertEqual(set(cfg.names(live.ins[cfg.entry.index])), {'n', 'g'})
+        self.assertEqual(cfg.names(live.ins[cfg.exit.index]), ['g'])
+        # After the update a <-- a + 1 the loop goes back to its test: all live
+        block, i = item_named(cfg, lambda item: isinstance(item, AssignNode) and item.target == 'a'
+                              and isinstance(item.expr, BinOpNode))
+        self.assertEqual(set(cfg.names(live_after_items(cfg, live)[block.index][i])),
+                         {'a', 'b', 'c', 'n', 'g'})
+        # Nothing is live after the last drop of the main code
+        main = self.cfgs['<play>']
+        main_live = live_after_items(main, liveness(main, live_at_exit=0))
+        self.assertEqual(main.names(main_live[main.entry.index][-1]), [])
+
+    def test_reaching_definitions(self):
+        cfg = self.cfg
+        definitions, reaching = reaching_definitions(cfg)
+        at_exit = definitions.sites_of(reaching.ins[cfg.exit.index])
+        c_defs = {site for site in at_exit if site[2] == 'c'}
+        # The declaration (default value) and the assignment in the loop
+        self.assertEqual(len(c_defs), 2)
+        at_entry = definitions.sites_of(reaching.outs[cfg.entry.index])
+        self.assertEqual(sorted(site[2] for site in at_entry), ['a', 'b', 'c'])
+
+    def test_calls_define_globals(self):
+        source = """
+        rank: g, h
+        action bump() -> void { g <-- g + 1 }
+        play {
+            g <-- 1
+            h <-- 2
+            bump()
+            drop "g " + g + " " + h
+        } gameover
+        """
+        program = compile_source(source)
+        cfg = build_cfg(program.main_block)
+        definitions, reaching = reaching_definitions(cfg)
+        sites = definitions.sites_of(reaching.outs[cfg.entry.index])
+        # g may come from the assignment or from the call, h from the assignment
+        self.assertEqual(sorted((name, item) for _, item, name in sites),
+                         [('g', 0), ('g', 2), ('h', 1), ('h', 2)])
+        live = live_after_items(cfg, liveness(cfg, live_at_exit=0))
+        # The call reads the globals: h is live before it although bump() ignores it
+        self.assertEqual(set(cfg.names(live[cfg.entry.index][1])), {'g', 'h'})
+
+    def test_definite_assignment(self):
+        cfg = self.cfg
+        assigned = definite_assignment(cfg)
+        self.assertEqual(cfg.names(assigned.ins[cfg.entry.index]), ['n'])
+        self.assertEqual(set(cfg.names(assigned.ins[cfg.exit.index])), {'n', 'a', 'b'})
+        reads = {(type(item).__name__, name) for item, name in maybe_unassigned_reads(cfg)}
+        self.assertEqual(reads, {('AssignNode', 'c'), ('ReturnNode', 'c')})
+
+    def test_maybe_undeclared_accesses(self):
+        code = """
+        action f(flag c) -> rank {
+            choice (c) -> { rank: y <-- 1 }
+            rank: a <-- 2, b <-- a
+            y <-- y + a
+            reward b
+        }
+        play { drop "" + f(true) } gameover
+        """
+        cfg = program_cfgs(compile_source(code))['f']
+        # a is read by its own declaration after being declared; y may never be
+        accesses = [(type(item).__name__, name) for item, name in maybe_undeclared_accesses(cfg)]
+        self.assertEqual(accesses, [('AssignNode', 'y')])
+
+    def test_many_blocks(self):
+        statements = ["rank: " + ", ".join(f"v{k}" for k in range(50))]
+        for k in range(1500):
+            statements.append(f"choice (v{k % 50} > {k}) -> {{ v{(k + 1) % 50} <-- v{k % 50} }} "
+                              f"fail -> {{ v{k % 50} <-- v{(k + 7) % 50} + 1 }}")
+        source = "play {\n" + "\n".join(statements) + "\ndrop \"v \" + v0\n} gameover"
+        cfg = build_cfg(compile_source(source).main_block)
+        self.assertGreater(len(cfg.blocks), 4500)
+        live = liveness(cfg, live_at_exit=0)
+        assigned = definite_assignment(cfg)
+        # Nothing is live after the final drop; no variable is assigned on every path
+        self.assertEqual(cfg.names(live.outs[cfg.exit.preds[0].index]), [])
+        self.assertEqual(assigned.ins[cfg.exit.index], 0)
+
+if __name__ == '__main__':
+    unittest.main()
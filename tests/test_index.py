@@ -0,0 +1,127 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from play_index import SymbolIndex, Symbol, index_source
+
+MATH = """
+action fact(rank n) -> rank {
+    choice (n <= 1) -> { reward 1 }
+    reward n * fact(n - 1)
+}
+action mean(rate a, rate b) -> rate { reward (a + b) / 2.0 }
+action greet(label who) -> void { drop "ciao " + who }
+"""
+
+MAIN = """
+rank: total <-- 0
+action add(rank n) -> rank {
+    total <-- total + n
+    rank: total <-- 5
+    total <-- total + 1
+    reward total
+}
+play {
+    rank: i, k
+    loop (i <-- 0; i < 3; i <-- i + 1) -> {
+        k <-- add(fact(i))
+    }
+    drop "t " + total + " " + -->k
+} gameover
+"""
+
+OTHER = """
+rank: total
+play {
+    total <-- grab "n "
+    greet("x" + total)
+} gameover
+"""
+
+class TestSymbolIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.write('lib/math.play', MATH)
+        self.write('main.play', MAIN)
+        self.write('other.play', OTHER)
+        self.index = SymbolIndex(os.path.join(self.root, '.index.db'))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(text)
+
+    def test_queries(self):
+        stats = self.index.update(self.root)
+        self.assertEqual((stats.parsed, stats.unchanged, stats.removed), (3, 0, 0))
+        self.assertEqual(self.index.definitions('fact'),
+                         [Symbol(os.path.join('lib', 'math.play'), 2, 'action', 'fact', '(rank) -> rank')])
+        self.assertEqual([s.signature for s in self.index.definitions('greet')], ['(label) -> void'])
+        self.assertEqual([(s.path, s.line, s.signature) for s in self.index.definitions('total')],
+                         [('main.play', 2, 'rank'), ('other.play', 2, 'rank')])
+        self.assertEqual(self.index.definitions('k', kind='action'), [])
+        self.assertEqual([(r.path, r.line, r.scope) for r in self.index.callers('fact')],
+                         [(os.path.join('lib', 'math.play'), 4, 'fact'), ('main.play', 12, None)])
+        self.assertEqual([(r.path, r.scope) for r in self.index.callers('greet')], [('other.play', None)])
+        self.assertEqual(self.index.users('total'), ['main.play', 'other.play'])
+
+    def test_locals_are_not_globals(self):
+        self.index.update(self.root)
+        # In add, total is the global until the local declaration
+        self.assertEqual([(r.path, r.line, r.kind, r.scope) for r in self.index.references('total')],
+                         [('main.play', 4, 'write', 'add'), ('main.play', 4, 'read', 'add'),
+                          ('main.play', 14, 'read', None),
+                          ('other.play', 4, 'write', None), ('other.play', 5, 'read', None)])
+        self.assertEqual(self.index.users('n'), [])
+        self.assertEqual(self.index.definitions('i'), [Symbol('main.play', 10, 'global', 'i', 'rank')])
+        self.assertEqual([r.kind for r in self.index.references('k')], ['write', 'read'])
+
+    def test_incremental_update(self):
+        self.index.update(self.root)
+        stats = self.index.update(self.root)
+        self.assertEqual((stats.parsed, stats.unchanged, stats.removed), (0, 3, 0))
+
+        # Touched without changes: hashed, not parsed
+        path = os.path.join(self.root, 'main.play')
+        os.utime(path, ns=(0, 10 ** 9))
+        self.assertEqual(self.index.update(self.root).parsed, 0)
+
+        self.write('main.play', MAIN.replace('add(fact(i))', 'add(i)'))
+        os.remove(os.path.join(self.root, 'other.play'))
+        stats = self.index.update(self.root)
+        self.assertEqual((stats.parsed, stats.unchanged, stats.removed), (1, 1, 1))
+        self.assertEqual([r.path for r in self.index.callers('fact')], [os.path.join('lib', 'math.play')])
+        self.assertEqual(self.index.users('total'), ['main.play'])
+        self.assertEqual(self.index.callers('greet'), [])
+
+    def test_errors(self):
+        self.write('broken.play', 'play { drop } gameover')
+        self.index.update(self.root)
+        errors = dict(self.index.errors())
+        self.assertTrue(errors['broken.play'].startswith('Syntax Error'))
+        # main.play and other.play call actions of another file (linked as a library)
+        self.assertIn("Function 'fact' not defined", errors['main.play'])
+        self.assertIn("Function 'greet' not defined", errors['other.play'])
+        self.assertNotIn(os.path.join('lib', 'math.play'), errors)
+        self.assertEqual(index_source('play { drop } gameover')[:2], ([], []))
+
+    def test_transformer_error(self):
+        self.write('chain.play', 'rank: x = y, z\nplay { drop "" + x } gameover')
+        self.index.update(self.root)
+        self.assertIn("Invalid chain", dict(self.index.errors())['chain.play'])
+        self.assertEqual([s.name for s in self.index.definitions('x')], ['x'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, run_source
+from play_lang.frontend.ast_node import FunCallExprNode, FuncCallStmtNode
+from play_lang.optimizer.ast_utils import iter_stmts, stmt_exprs, iter_expr
+from play_lang.runtime.errors import PlayRuntimeError
+from play_lang.runtime.io import MemoryIO
+
+CODE = """
+rank: g <-- 2
+action add(rate a, rate b) -> rate { reward a + b }
+action sq(rank n) -> rank { reward n * n }
+action say(rank n) -> rank { drop "say " + n  g <-- g + n  reward n }
+action pair(rank a, rank b) -> rank { reward a * 10 + b }
+action clamp(rank n, rank hi) -> rank {
+    rank: m <-- n
+    choice (m > hi) -> { m <-- hi }
+    reward m
+}
+action hello(label who) -> void { drop "ciao " + who }
+action fact(rank n) -> rank { choice (n < 2) -> { reward 1 } reward n * fact(n - 1) }
+play {
+    rank: i, s
+    rate: t
+    loop (i <-- 0; i < 5; i <-- i + 1) -> {
+        t <-- add(i, 1)
+        s <-- s + sq(i) + clamp(i * 3, 7)
+    }
+    drop "t " + t + " s " + s
+    drop "p " + pair(say(1), say(2))
+    drop "q " + (fact(3) + say(4)) + " g " + g
+    rank: k <-- 1, m <-- clamp(k + 5, 4)
+    hello("x" + m)
+    stay (sq(k) < 50) -> { k <-- k + 1 }
+    choice (g > 100) -> { drop "no" } retry (clamp(g, 3) == 3) -> { drop "si" }
+    drop "k " + k + " " + add(1, 2)
+} gameover
+"""
+
+def run(code, engine='vm', **options):
+    play_io = MemoryIO([])
+    run_source(code, optimize=True, io=play_io, engine=engine, **options)
+    return play_io.lines()
+
+def called(program):
+    names = []
+    for block in [program.main_block] + [f.body for f in program.functions]:
+        for stmt in iter_stmts(block):
+            if isinstance(stmt, FuncCallStmtNode):
+                names.append(stmt.name)
+            for expr in stmt_exprs(stmt):
+                names.extend(sub.name for sub in iter_expr(expr) if isinstance(sub, FunCallExprNode))
+    return names
+
+class TestInlining(unittest.TestCase):
+    def test_same_output(self):
+        expected = run(CODE, inline_size=0)
+        self.assertEqual(expected, ['t 5.0 s 53', 'say 1', 'say 2', 'p 12', 'say 4', 'q 10 g 9',
+                                    'ciao x4', 'si', 'k 8 3.0'])
+        self.assertEqual(run(CODE), expected)
+        self.assertEqual(run(CODE, engine='interpreter'), expected)
+
+    def test_calls_replaced(self):
+        stats = {}
+        program = compile_source(CODE, optimize=True, stats=stats)
+        self.assertGreater(stats['inlined'], 0)
+        # fact is recursive; say is evaluated after the call to fact and the
+        # body of clamp cannot be hoisted out of an elif condition
+        self.assertEqual(sorted(called(program)), ['clamp', 'fact', 'fact', 'say'])
+
+    def test_rank_arguments_promoted(self):
+        code = """
+        action half(rate x) -> rate { reward x / 2 }
+        action twice(rank n) -> rate { reward n * 2 }
+        play { drop "r " + half(3) + " " + twice(4) } gameover
+        """
+        self.assertEqual(run(code), ["r 1.5 8.0"])
+        self.assertEqual(called(compile_source(code, optimize=True)), [])
+
+    def test_hygiene(self):
+        code = """
+        rank: total <-- 100
+        action bump(rank n) -> rank {
+            rank: total2 <-- n + total
+            n <-- n + 1
+            reward total2 + n
+        }
+        play {
+            rank: n <-- 1, total2 <-- 5
+            drop "r " + bump(n) + " " + n + " " + total2
+        } gameover
+        """
+        self.assertEqual(run(code), run(code, inline_size=0))
+        self.assertEqual(run(code), ["r 103 1 5"])
+        self.assertEqual(called(compile_source(code, optimize=True)), [])
+
+    def test_skipped_declaration_not_inlined(self):
+        code = """
+        action f(flag c) -> rank {
+            choice (c) -> { rank: y <-- 5 }
+            reward y + 1
+        }
+        play { drop "r" + f(true)  drop "r" + f(false) } gameover
+        """
+        self.assertEqual(called(compile_source(code, optimize=True)), ['f', 'f'])
+        for engine in ('vm', 'interpreter'):
+            with self.assertRaisesRegex(PlayRuntimeError, "^Variable 'y' not defined$"):
+                run(code, engine=engine)
+
+    def test_opt_out_and_size_limit(self):
+        stats = {}
+        program = compile_source(CODE, optimize=True, stats=stats, no_inline=['sq', 'clamp'])
+        self.assertIn('sq', called(program))
+        self.assertIn('clamp', called(program))
+        self.assertNotIn('add', called(program))
+
+        program = compile_source(CODE, optimize=True, inline_size=4)
+        # add and sq fit (3 nodes), clamp does not
+        self.assertNotIn('sq', called(program))
+        self.assertIn('clamp', called(program))
+        self.assertEqual(run(CODE, no_inline=['sq', 'clamp']), run(CODE, inline_size=0))
+
+if __name__ == '__main__':
+    unittest.main()
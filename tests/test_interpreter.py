@@ -0,0 +1,121 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter, PlayRuntimeError
+
+class TestInterpreter(unittest.TestCase):
+    def run_play(self, code, inputs=()):
+        ast = compile_source(code)
+        output = []
+        pending = list(inputs)
+        interpreter = Interpreter(input_fn=lambda prompt: pending.pop(0), output_fn=output.append)
+        interpreter.run(ast)
+        return output
+
+    def test_output_and_value_operator(self):
+        code = """
+        rank: d <-- 5
+        play {
+            rank: c <-- 2
+            label: a <-- "Ciao"
+            drop "La somma è " + -->(d+c) + " " + --> a
+        } gameover
+        """
+        self.assertEqual(self.run_play(code), ["La somma è 7 Ciao"])
+
+    def test_promotion_and_formatting(self):
+        code = """
+        rate: r <-- 7
+        flag: f <-- 1 < 2
+        play {
+            drop "r=" + r + " f=" + f + " d=" + 7 / 2 + " m=" + -7 % 3
+        } gameover
+        """
+        self.assertEqual(self.run_play(code), ["r=7.0 f=true d=3 m=-1"])
+
+    def test_loops_and_break(self):
+        code = """
+        rank: i, s <-- 0
+        play {
+            loop (i <-- 0; i < 10; i <-- i + 1) -> {
+                choice (i == 5) -> { quit }
+                s <-- s + i
+            }
+            stay (true) -> { s <-- s * 2 quit }
+            drop "s=" + s
+        } gameover
+        """
+        self.assertEqual(self.run_play(code), ["s=20"])
+
+    def test_recursion_and_locals(self):
+        code = """
+        action fact(rank n) -> rank {
+            choice (n <= 1) -> { reward 1 }
+            reward n * fact(n - 1)
+        }
+        play {
+            drop "fact=" + fact(10)
+        } gameover
+        """
+        self.assertEqual(self.run_play(code), ["fact=3628800"])
+
+    def test_memoized_pure_recursion(self):
+        code = """
+        action fib(rank n) -> rank {
+            choice (n < 2) -> { reward n }
+            reward fib(n - 1) + fib(n - 2)
+        }
+        play {
+            drop "fib=" + fib(90)
+        } gameover
+        """
+        output = []
+        interpreter = Interpreter(output_fn=output.append, memo_size=64)
+        interpreter.run(compile_source(code))
+        self.assertEqual(output, ["fib=2880067194370816120"])
+        self.assertEqual(interpreter.memo.stats()['misses'], 91)
+        self.assertEqual(interpreter.memo.stats()['hits'], 88)
+
+    def test_grab(self):
+        code = """
+        rank: a, d
+        label: s
+        play {
+            a = d <-- grab "Numero: "
+            s, a <-- grab "Due valori: "
+            drop s + " " + -->a + " " + -->d
+        } gameover
+        """
+        self.assertEqual(self.run_play(code, ["4", "ciao", "9"]), ["ciao 9 4"])
+
+    def test_division_by_zero(self):
+        code = """
+        rank: z <-- 0
+        play {
+            drop "x" + 1 / z
+        } gameover
+        """
+        with self.assertRaisesRegex(PlayRuntimeError, "Division by zero"):
+            self.run_play(code)
+
+    def test_big_rank_in_mixed_operation(self):
+        code = """
+        rank: r
+        play {
+            r <-- grab ""
+            drop "" + (r * 0.5)
+        } gameover
+        """
+        self.assertEqual(self.run_play(code, ["3"]), ["1.5"])
+        with self.assertRaisesRegex(PlayRuntimeError, "Rank too large for a rate"):
+            self.run_play(code, ["1" + "0" * 400])
+
+if __name__ == '__main__':
+    unittest.main()
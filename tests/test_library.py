@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, compile_library, run_source, run_batch_source
+from play_lang.backend.library import Library
+from play_lang.backend.bytecode import BytecodeCompiler, CALL_PURE
+from play_lang.runtime.io import MemoryIO
+
+MATH = """
+action fact(rank n) -> rank {
+    choice (n <= 1) -> { reward 1 }
+    reward n * fact(n - 1)
+}
+
+action fib(rank n) -> rank {
+    choice (n < 2) -> { reward n }
+    reward fib(n - 1) + fib(n - 2)
+}
+
+action mean(rate a, rate b) -> rate {
+    reward (a + b) / 2.0
+}
+
+action greet(label name) -> void {
+    drop "ciao " + name
+}
+"""
+
+PROGRAM = """
+rank: n, i
+play {
+    n <-- grab "n"
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        drop "fact " + fact(i) + " fib " + fib(i) + " media " + mean(i, n)
+    }
+    greet("mondo")
+} gameover
+"""
+
+def run(source, engine, libraries=(), inputs=("6",)):
+    play_io = MemoryIO(list(inputs))
+    run_source(source, io=play_io, engine=engine, libraries=libraries)
+    return play_io.lines()
+
+class TestLibrary(unittest.TestCase):
+    def setUp(self):
+        self.math = compile_library(MATH, "math")
+
+    def test_linked_same_as_inline(self):
+        # The library source pasted before the play block is the reference
+        inline = PROGRAM.replace("rank: n, i", "rank: n, i\n" + MATH)
+        expected = run(inline, 'interpreter')
+        self.assertEqual(expected[-1], "ciao mondo")
+        for engine in ('interpreter', 'vm'):
+            self.assertEqual(run(PROGRAM, engine, [self.math]), expected)
+
+    def test_program_actions_after_library(self):
+        source = """
+        rank: r
+        action twice(rank n) -> rank { reward 2 * fact(n) }
+        play {
+            r <-- twice(5)
+            drop "r " + r
+        } gameover
+        """
+        other = compile_library("action fact(rank n) -> rank { reward n }", "other")
+        for engine in ('interpreter', 'vm'):
+            self.assertEqual(run(source, engine, [self.math]), ["r 240"])
+            self.assertEqual(run(source, engine, [other]), ["r 10"])
+
+    def test_signatures_are_checked(self):
+        with self.assertRaisesRegex(Exception, "Semantic Error"):
+            compile_source('play { drop fact("tre") } gameover', libraries=[self.math])
+        with self.assertRaisesRegex(Exception, "already defined"):
+            compile_source('action fib(rank n) -> rank { reward n } play { drop fib(3) } gameover',
+                           libraries=[self.math])
+        with self.assertRaisesRegex(Exception, "Semantic Error"):
+            compile_source('play { drop fact(3) } gameover')
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "math.playlib")
+            self.math.save(path)
+            loaded = Library.load(path)
+        self.assertEqual(loaded.signatures, self.math.signatures)
+        self.assertEqual(run(PROGRAM, 'vm', [loaded]), run(PROGRAM, 'vm', [self.math]))
+
+    def test_pure_actions_are_memoized(self):
+        self.assertEqual(self.math.memoized, {"fact", "fib", "mean"})
+        program = compile_source("rank: r\naction sq(rank n) -> rank { reward fib(n) * fib(n) }\n"
+                                 "play { r <-- sq(30) drop \"r \" + r } gameover", lower=True, libraries=[self.math])
+        module = BytecodeCompiler().compile_program(program)
+        sq = module.functions[module.function_index["sq"]]
+        self.assertIn(CALL_PURE, sq.ops)
+        self.assertEqual(run("play { drop \"fib \" + fib(60) } gameover", 'vm', [self.math]), ["fib 1548008755920"])
+
+    def test_batch_with_library(self):
+        result = run_batch_source(PROGRAM, [["3", "0", "2"]], libraries=[self.math])
+        self.assertEqual(result.outputs[2], ["fact 1 fib 0 media 1.0", "fact 1 fib 1 media 1.5", "ciao mondo"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.frontend.ast_node import *
+from play_lang.backend.interpreter import Interpreter
+from play_lang.runtime.errors import PlayRuntimeError
+
+class TestLowering(unittest.TestCase):
+    def lower(self, code):
+        return compile_source(code, lower=True)
+
+    def test_specialized_operators(self):
+        code = """
+        rank: a <-- 1
+        rate: b <-- 2.0
+        flag: f
+        play {
+            a <-- a * 2
+            b <-- a + b
+            f <-- a < b
+        } gameover
+        """
+        ast = self.lower(code)
+        self.assertIsInstance(ast, LoweredProgramNode)
+        stmts = ast.main_block.statements
+        self.assertIsInstance(stmts[0].expr, RankBinOpNode)
+
+        add = stmts[1].expr
+        self.assertIsInstance(add, RateBinOpNode)
+        self.assertIsInstance(add.left, RankToRateNode)
+        self.assertEqual(add.left.expr.type_name, 'rank')
+
+        compare = stmts[2].expr
+        self.assertIsInstance(compare, RateCompareNode)
+        self.assertIsInstance(compare.left, RankToRateNode)
+
+    def test_explicit_conversions(self):
+        code = """
+        rate: r <-- 3
+        action half(rate x) -> rate { reward x / 2 }
+        play {
+            flag: f <-- true
+            drop "v=" + half(4) + " " + -->f
+        } gameover
+        """
+        ast = self.lower(code)
+        self.assertIsInstance(ast.global_decls[0].var_list[0].expr, RankToRateNode)
+
+        ret = ast.functions[0].body.statements[0]
+        self.assertIsInstance(ret.expr, RateBinOpNode)
+        self.assertIsInstance(ret.expr.right, RankToRateNode)
+
+        join = ast.main_block.statements[1].expr
+        self.assertIsInstance(join, LabelJoinNode)
+        self.assertEqual(len(join.parts), 4)
+        self.assertIsInstance(join.parts[3], FlagToLabelNode)
+        call = join.parts[1].expr
+        self.assertIsInstance(call, FunCallExprNode)
+        self.assertIsInstance(call.args[0], RankToRateNode)
+
+    def test_label_chain_flattening(self):
+        code = """
+        rank: x <-- 3
+        label: s
+        play {
+            s <-- "a" + 1 + ("b" + -x) + "c" + 2.5 + true
+            s <-- "n=" + (x + 1) + "%"
+        } gameover
+        """
+        ast = self.lower(code)
+        first = ast.main_block.statements[0].expr
+        self.assertIsInstance(first, LabelJoinNode)
+        # Constants are merged: "a1b", -x, "c2.5true"
+        self.assertEqual([type(p).__name__ for p in first.parts],
+                         ['LiteralNode', 'RankToLabelNode', 'LiteralNode'])
+        self.assertEqual(first.parts[0].value, "a1b")
+        self.assertEqual(first.parts[2].value, "c2.5true")
+        # Numeric '+' inside the chain is not part of it
+        second = ast.main_block.statements[1].expr
+        self.assertIsInstance(second.parts[1].expr, RankBinOpNode)
+
+    def test_original_ast_untouched(self):
+        code = """
+        rate: r
+        play { r <-- 1 + 2 } gameover
+        """
+        ast = compile_source(code)
+        self.assertIsInstance(ast.main_block.statements[0].expr, BinOpNode)
+
+    def test_declaration_in_earlier_branch(self):
+        code = """
+        play { choice (false) -> { rank: v <-- 1 } retry (false) -> { v <-- 2 } drop "ok" } gameover
+        """
+        output = []
+        Interpreter(output_fn=output.append).run(self.lower(code))
+        self.assertEqual(output, ['ok'])
+        # The assignment runs without the declaration: an error at run time, not in the lowering
+        ast = self.lower(code.replace('retry (false)', 'fail'))
+        self.assertIsInstance(ast.main_block.statements[0].else_block.statements[0], AssignNode)
+        with self.assertRaisesRegex(PlayRuntimeError, "Variable 'v' not defined"):
+            Interpreter(output_fn=output.append).run(ast)
+
+    def test_same_output_as_ast(self):
+        code = """
+        rank: i, n <-- 7
+        rate: avg <-- 0
+        label: s <-- ""
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> {
+                avg <-- avg + i / 2
+                s <-- s + i + (i % 2 == 0)
+            }
+            drop s + " " + -->avg + "% " + (1 < 1.5) + " " + -(2.5 * -2)
+        } gameover
+        """
+        results = []
+        for lower in (False, True):
+            output = []
+            Interpreter(output_fn=output.append).run(compile_source(code, lower=lower))
+            results.append(output)
+        self.assertEqual(results[0], results[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import ctypes
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, run_source
+from play_lang.backend.native import CGenerator, build_native, run_native, c_string
+from play_lang.runtime.errors import PlayRuntimeError
+from play_lang.runtime.io import MemoryIO
+
+CODE = """
+rank: g <-- 2
+label: tag <-- "t"
+action fib(rank n) -> rank { choice (n < 2) -> { reward n } reward fib(n - 1) + fib(n - 2) }
+action bump(rank n) -> rank { g <-- g * 10 + n  tag <-- tag + n  reward n }
+action odd(rank n) -> flag { choice (n == 0) -> { reward false } reward even(n - 1) }
+action even(rank n) -> flag { choice (n == 0) -> { reward true } reward odd(n - 1) }
+action count(rank n, rank acc) -> rank { choice (n == 0) -> { reward acc } reward count(n - 1, acc + 1) }
+action shout(label s) -> label { s <-- s + "!"  reward s + s }
+play {
+    rate: r <-- 1.0 / 3.0
+    drop "r " + r + " " + (r * 3.0) + " " + (1.0 * 10000000000000000) + " " + 0.1 + " " + (-7.5 % 2.0)
+    drop "q " + (-7 / 2) + " " + (-7 % 2) + " " + (7 % -2)
+    drop "f " + fib(80) + " " + odd(7) + " " + even(100001)
+    drop "c " + count(200000, 0)
+    drop "o " + (g + bump(3)) + " " + g + " " + tag + bump(4) + " " + tag
+    drop shout("è") + " " + ("ab" < "b")
+} gameover
+"""
+
+def run(code, inputs=(), engine='vm'):
+    play_io = MemoryIO(list(inputs))
+    try:
+        run_source(code, io=play_io, engine=engine)
+    except PlayRuntimeError as e:
+        return play_io.lines(), str(e)
+    return play_io.lines(), None
+
+@unittest.skipUnless(shutil.which(os.environ.get('CC', 'cc')), "no C compiler")
+class TestNative(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        os.environ['PLAY_NATIVE_CACHE'] = self.cache_dir
+
+    def tearDown(self):
+        del os.environ['PLAY_NATIVE_CACHE']
+        shutil.rmtree(self.cache_dir)
+
+    def assertSameAsVM(self, code, inputs=()):
+        expected = run(code, inputs)
+        self.assertEqual(run(code, inputs, engine='native'), expected)
+        return expected
+
+    def test_same_output(self):
+        lines, error = self.assertSameAsVM(CODE)
+        self.assertIsNone(error)
+        self.assertEqual(lines[:2], ['r 0.3333333333333333 1.0 1e+16 0.1 -1.5', 'q -3 -1 1'])
+        self.assertEqual(lines[2:], ['f 23416728348467685 true false', 'c 200000',
+                                     'o 5 23 t34 t34', 'è!è! true'])
+
+    def test_grab(self):
+        code = """
+        play {
+            rank: a
+            rate: b
+            flag: c
+            label: d
+            a, b <-- grab "two "
+            c <-- grab ""
+            d <-- grab "d "
+            drop "" + a + " " + b + " " + c + " [" + d + "]"
+            a <-- grab ""
+        } gameover
+        """
+        lines, error = self.assertSameAsVM(code, [' 1_000 ', '-2.5e1\t', 'true', '  x y ', '12a'])
+        self.assertEqual(lines, ['1000 -25.0 true [  x y ]'])
+        self.assertEqual(error, "Invalid rank input: '12a'")
+        self.assertSameAsVM(code, ['1', 'nan', 'false', ''])
+        self.assertSameAsVM(code, ['1', 'inf', 'True'])
+
+    def test_chained_assignment(self):
+        code = """
+        rank: calls, g = h <-- 7
+        action tick(rank n) -> rank { calls <-- calls + 1  reward n * 2 }
+        action chain(rank n) -> rate {
+            rank: a = b <-- tick(n)
+            rate: r
+            label: s = t <-- "p" + a
+            a = r = b <-- tick(a) + 1
+            t = s <-- s + t
+            drop s + " " + t
+            reward a + b + r + calls
+        }
+        play { drop "" + chain(2) + " " + calls + " " + g + h } gameover
+        """
+        self.assertEqual(self.assertSameAsVM(code), (['p4p4 p4p4', '29.0 2 77'], None))
+
+    def test_runtime_errors(self):
+        code = 'play { rank: a <-- 5, b  drop "x " + a  drop "y " + a / b } gameover'
+        self.assertEqual(self.assertSameAsVM(code), (['x 5'], 'Division by zero'))
+        code = 'play { rank: a <-- 9223372036854775807  drop "" + (a + 1) } gameover'
+        self.assertEqual(run(code, engine='native'), ([], 'rank overflow'))
+        code = 'play { rate: x  x <-- grab ""  drop "m " + x % 2.0 } gameover'
+        self.assertEqual(self.assertSameAsVM(code, ['-7.5']), (['m -1.5'], None))
+        for value in ('inf', 'nan'):
+            self.assertEqual(self.assertSameAsVM(code, [value]), ([], 'Modulo of a non-finite value'))
+
+    def test_operand_order(self):
+        code = """
+        rank: g, z
+        action bump() -> rank { g <-- g + 10 reward 1 }
+        play { drop "" + (bump() + g) + " " + (g + bump())  drop "" + (1 / z) * (1 % z) } gameover
+        """
+        self.assertEqual(self.assertSameAsVM(code), (['11 11'], 'Division by zero'))
+
+    def test_optimized_overflow_not_hoisted(self):
+        # The loop never runs: big * big must not be computed before it
+        code = """
+        rank: big <-- 3037000500, k
+        action square(rank n) -> rank { reward n * n }
+        play {
+            stay (k > 0) -> { k <-- big * big }
+            drop "ok"
+            drop "" + (k + square(big))
+        } gameover
+        """
+        for optimize in (False, True):
+            play_io = MemoryIO([])
+            with self.assertRaisesRegex(PlayRuntimeError, "rank overflow"):
+                run_source(code, optimize=optimize, io=play_io, engine='native')
+            self.assertEqual(play_io.lines(), ['ok'])
+
+    def test_skipped_declaration(self):
+        code = """
+        rank: x <-- 100
+        action g(flag c) -> rank {
+            drop "x=" + x
+            rank: x <-- 5, k <-- 0
+            stay (k < 2) -> {
+                choice (c) -> { label: y <-- "y" + k }
+                drop y + " x=" + x
+                k <-- k + 1
+            }
+            reward x
+        }
+        play {
+            drop "" + g(true)
+            choice (false) -> { label: s <-- "s" }
+            drop "" + g(TARGET)
+            drop s
+        } gameover
+        """
+        self.assertEqual(self.assertSameAsVM(code.replace('TARGET', 'false')),
+                         (['x=100', 'y0 x=5', 'y1 x=5', '5', 'x=100'], "Variable 'y' not defined"))
+        self.assertEqual(self.assertSameAsVM(code.replace('TARGET', 'true'))[1], "Variable 's' not defined")
+
+    def test_reduced_loop_overflow_boundary(self):
+        # The closed form of sum i^d must not overflow before the sum does
+        code = """
+        rank: i, n <-- LIMIT, acc
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> { acc <-- acc + TERM }
+            drop "" + acc
+        } gameover
+        """
+        for term, limit in (('i * i', 3024617), ('i * i * i', 77936)):
+            power = term.count('i')
+            source = code.replace('TERM', term)
+            for optimize in (False, True):
+                play_io = MemoryIO([])
+                run_source(source.replace('LIMIT', str(limit)), optimize=optimize, io=play_io, engine='native')
+                self.assertEqual(play_io.lines(), [str(sum(k ** power for k in range(limit)))])
+                with self.assertRaisesRegex(PlayRuntimeError, "rank overflow"):
+                    run_source(source.replace('LIMIT', str(limit + 1)), optimize=optimize,
+                               io=MemoryIO([]), engine='native')
+
+    def test_reduced_loop_mixed_degrees(self):
+        # sum i^3 alone overflows at 100000 iterations; with the i^2 term the total fits
+        code = """
+        rank: i, n <-- LIMIT, acc
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> { acc <-- acc + i * i * i - 99999 * i * i }
+            drop "" + acc + " " + i
+        } gameover
+        """
+        for limit in (1000, 100000):
+            expected = f"{sum(k ** 3 - 99999 * k ** 2 for k in range(limit))} {limit}"
+            for optimize in (False, True):
+                play_io = MemoryIO([])
+                run_source(code.replace('LIMIT', str(limit)), optimize=optimize, io=play_io, engine='native')
+                self.assertEqual(play_io.lines(), [expected])
+
+    def test_memo_keys_keep_zero_sign(self):
+        code = """
+        rate: z <-- 0.0
+        action twice(rate x) -> rate { reward x * 2 }
+        play { drop "" + twice(z) + " " + twice(-z) + " " + twice(-z) + " " + twice(z) } gameover
+        """
+        self.assertEqual(self.assertSameAsVM(code), (["0.0 -0.0 -0.0 0.0"], None))
+
+    def test_build_cache(self):
+        program = compile_source(CODE, lower=True)
+        first = build_native(program, cache_dir=self.cache_dir)
+        second = build_native(compile_source(CODE, lower=True), cache_dir=self.cache_dir)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(first.path, second.path)
+        play_io = MemoryIO([])
+        run_native(second, play_io)
+        self.assertEqual(play_io.lines()[-1], 'è!è! true')
+
+    def test_shared_library(self):
+        program = compile_source('play { drop "hi" } gameover', lower=True)
+        build = build_native(program, kind='shared', cache_dir=self.cache_dir)
+        self.assertTrue(build.path.endswith('.so'))
+        library = ctypes.CDLL(build.path)
+        self.assertTrue(hasattr(library, 'play_run'))
+        self.assertTrue(hasattr(library, 'play_last_error'))
+
+    def test_c_types(self):
+        source = CGenerator().generate(compile_source(CODE, lower=True))
+        self.assertIn('static int64_t g_g = 0;', source)
+        self.assertIn('static PlayLabel g_tag', source)
+        self.assertIn('static bool f_odd', source)
+        self.assertEqual(c_string('a"è'), ('"a\\"\\303\\250"', 4))
+
+if __name__ == '__main__':
+    unittest.main()
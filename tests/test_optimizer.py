@@ -0,0 +1,186 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.frontend.ast_node import *
+from play_lang.optimizer.pipeline import optimize_program
+from play_lang.optimizer.purity import pure_functions, memoizable_functions
+from play_lang.backend.interpreter import Interpreter
+
+class TestOptimizer(unittest.TestCase):
+    def optimize(self, code):
+        ast = compile_source(code)
+        stats = {}
+        optimize_program(ast, stats)
+        return ast, stats
+
+    def outputs(self, code):
+        results = []
+        for optimize in (False, True):
+            output = []
+            Interpreter(output_fn=output.append).run(compile_source(code, optimize=optimize))
+            results.append(output)
+        return results
+
+    def test_licm_hoists_invariant(self):
+        code = """
+        rank: i, n <-- 10, k <-- 3, acc <-- 0
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> {
+                acc <-- acc + n * k
+                drop "giro"
+            }
+        } gameover
+        """
+        ast, stats = self.optimize(code)
+        self.assertEqual(stats['licm_hoisted'], 1)
+        hoisted = ast.main_block.statements[0]
+        self.assertIsInstance(hoisted, VarDeclNode)
+        self.assertEqual(hoisted.type_name, 'rank')
+        self.assertIsInstance(ast.main_block.statements[1], ForNode)
+
+    def test_licm_keeps_variant_and_unsafe(self):
+        code = """
+        rank: i, n <-- 10, k <-- 3, acc <-- 0
+        action bump() -> rank { k <-- k + 1 reward k }
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> {
+                acc <-- acc + n * i + n / k
+            }
+            stay (acc > 0) -> {
+                acc <-- acc - k * k - bump()
+            }
+        } gameover
+        """
+        ast, stats = self.optimize(code)
+        # n * i depends on i, n / k may divide by zero, k is written by bump()
+        self.assertEqual(stats['licm_hoisted'], 0)
+
+    def test_cse_in_basic_block(self):
+        code = """
+        rank: a <-- 4, b <-- 5, x, y
+        play {
+            x <-- (a * b + 1) * 2
+            y <-- (a * b + 1) - x
+            a <-- 1
+            y <-- a * b
+        } gameover
+        """
+        ast, stats = self.optimize(code)
+        self.assertEqual(stats['cse_eliminated'], 1)
+
+    def test_maybe_undeclared_locals_stay(self):
+        # y is declared only if c: y + 1 must not move before a loop that
+        # does not run, nor be computed where && skips it
+        licm = """
+        action f(flag c) -> rank {
+            choice (c) -> { rank: y <-- 5 }
+            rank: i <-- 0
+            stay (i < 0) -> { drop "v" + (y + 1)  i <-- i + 1 }
+            reward 1
+        }
+        play { drop "r" + f(false) } gameover
+        """
+        cse = """
+        action f(flag c) -> rank {
+            choice (c) -> { rank: y <-- 5 }
+            flag: b <-- c && y * 2 > 3 || c && y * 2 > 3
+            reward 1
+        }
+        play { drop "r" + f(false) + f(true) } gameover
+        """
+        for code, expected in ((licm, ['r1']), (cse, ['r11'])):
+            ast = compile_source(code)
+            stats = {}
+            optimize_program(ast, stats, inline_size=0)
+            self.assertEqual((stats['licm_hoisted'], stats['cse_eliminated']), (0, 0))
+            self.assertEqual(self.outputs(code), [expected, expected])
+
+    def test_same_output(self):
+        code = """
+        rank: i, j, n <-- 12, total <-- 0
+        rate: g <-- 0.5
+        action add(rank a, rank b) -> rank { reward a + b }
+        play {
+            loop (i <-- 0; i < n; i <-- i + 1) -> {
+                j <-- 0
+                stay (j < n * 2) -> {
+                    total <-- add(total, (n * n) % 5 + j * (n - 1)) + (n * n) % 5
+                    j <-- j + 1
+                }
+                drop "riga " + -->i + ": " + (g * n + 1.0) + " " + -->total
+            }
+        } gameover
+        """
+        unoptimized, optimized = self.outputs(code)
+        self.assertEqual(unoptimized, optimized)
+
+    def test_counting_loops_reduced(self):
+        code = """
+        rank: i, j, n, start, acc <-- 7, sq <-- 0, k <-- 3, hits <-- 0
+        rate: total <-- 0.0
+        play {
+            loop (n <-- -3; n < 12; n <-- n + 1) -> {
+                loop (start <-- -4; start < 5; start <-- start + 3) -> {
+                    loop (i <-- start; i <= n; i <-- i + 2) -> {
+                        acc <-- acc + i
+                        sq <-- sq - (i * i - k * i + 2) * (i + 1)
+                    }
+                    drop "" + n + " " + start + ": " + i + " " + acc + " " + sq
+                }
+            }
+            loop (j <-- 0; j < 10; j <-- j + 1) -> { total <-- total + j * 0.1 }
+            loop (j <-- 0; j < 10; j <-- j + 1) -> { hits <-- hits + j % 3 }
+            drop "" + total + " " + hits
+        } gameover
+        """
+        ast, stats = self.optimize(code)
+        # Only the innermost loop: the others drop, accumulate a rate or use %
+        self.assertEqual(stats['loops_reduced'], 1)
+        unoptimized, optimized = self.outputs(code)
+        self.assertEqual(unoptimized, optimized)
+        self.assertEqual(len(optimized), 15 * 3 + 1)
+
+    def test_purity_analysis(self):
+        code = """
+        rank: limit <-- 10, counter
+        action fib(rank n) -> rank {
+            choice (n < 2) -> { reward n }
+            reward fib(n - 1) + fib(n - 2)
+        }
+        action capped(rank n) -> rank {
+            rank: counter <-- n
+            choice (counter > limit) -> { reward limit }
+            reward counter
+        }
+        action even(rank n) -> flag {
+            choice (n == 0) -> { reward true }
+            reward odd(n - 1)
+        }
+        action odd(rank n) -> flag {
+            choice (n == 0) -> { reward false }
+            reward even(n - 1)
+        }
+        action log(rank n) -> void { drop "n=" + n }
+        action logged(rank n) -> rank { log(n) reward n }
+        action bump() -> rank { counter <-- counter + 1 reward counter }
+        action peek() -> rank { reward counter }
+        action nothing() -> void { rank: x <-- 1 }
+        play {
+            drop "" + fib(5) + capped(3) + even(2) + logged(1) + bump() + peek()
+            nothing()
+        } gameover
+        """
+        ast = compile_source(code)
+        self.assertEqual(pure_functions(ast), {'fib', 'capped', 'even', 'odd', 'nothing'})
+        self.assertEqual(memoizable_functions(ast), {'fib', 'capped', 'even', 'odd'})
+        self.assertEqual(pure_functions(compile_source(code, lower=True)), pure_functions(ast))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import get_parser, compile_source, compile_library
+from play_lang.frontend.recovery import parse_with_recovery, SyntaxErrors, ParseError
+from play_lang.frontend.transformer import PlayTransformer
+from play_lang.frontend.semantic_analysis import SemanticAnalyzer
+from play_lang.frontend.ast_node import ErrorNode, OutputNode, AssignNode
+
+BROKEN = """
+rank: a <-- 1 +
+rank: b
+action f(rank n) -> rank {
+    rank: x <-- n * 2
+    x <-- x +* 1
+    drop "x" + y
+    reward x
+}
+action g( -> void { drop "g" }
+play {
+    drop "a" + a + b
+    b <-- f(2
+    drop "" + b
+    b <-- @ 3
+} gameover
+"""
+
+VALID = """
+rank: g <-- 1, total
+label: log <-- ""
+action step(rank n) -> rank {
+    choice (n % 3 == 0) -> { reward n / 2 } retry (n < 0) -> { quit } fail -> { reward -->n }
+    reward n + g
+}
+play {
+    rank: i = k <-- 0
+    stay (i < 10) -> { total <-- total + step(i)  i <-- i + 1 }
+    loop (i <-- 0; i < 3; i <-- i + 1) -> { log <-- log + i }
+    i, k <-- grab "n: "
+    drop "t " + total + " " + log
+} gameover
+"""
+
+class TestRecovery(unittest.TestCase):
+    def recover(self, code, start='program'):
+        return parse_with_recovery(get_parser(start), code)
+
+    def test_all_errors_in_one_pass(self):
+        tree, errors = self.recover(BROKEN)
+        self.assertEqual([(e.line, e.column) for e in errors], [(3, 1), (6, 14), (10, 11), (14, 5), (15, 11)])
+        self.assertTrue(errors[0].message.startswith("unexpected 'rank', expected one of"))
+        self.assertEqual(errors[4].message, "unexpected character '@'")
+
+        # Partial AST: the broken statements are error nodes, the rest is kept
+        ast = PlayTransformer().transform(tree)
+        self.assertEqual([d.text if isinstance(d, ErrorNode) else d.var_list[0].name for d in ast.global_decls],
+                         ['rank: a <-- 1 +', 'b'])
+        self.assertEqual([f.text if isinstance(f, ErrorNode) else f.name for f in ast.functions],
+                         ['f', 'action g( -> void { drop "g" }'])
+        statements = ast.main_block.statements
+        self.assertEqual([type(s) for s in statements], [OutputNode, ErrorNode, OutputNode, AssignNode])
+        self.assertEqual((statements[1].line, statements[1].column, statements[1].text), (14, 5, 'b <-- f(2'))
+
+    def test_compile_reports_syntax_and_semantic_errors(self):
+        with self.assertRaises(SyntaxErrors) as context:
+            compile_source(BROKEN)
+        e = context.exception
+        self.assertEqual(len(e.errors), 5)
+        # The parts that parsed are still analyzed; a, g and b appear in
+        # skipped code, so they are not reported as undeclared
+        self.assertEqual(e.semantic_errors, ["Variable 'y' not defined"])
+        lines = str(e).splitlines()
+        self.assertEqual(lines[0], "Syntax Error: line 3, column 1: " + e.errors[0].message)
+        self.assertEqual(lines[-1], "Semantic Error: Variable 'y' not defined")
+
+    def test_valid_source_unchanged(self):
+        tree, errors = self.recover(VALID)
+        self.assertEqual(errors, [])
+        self.assertEqual(tree, get_parser().parse(VALID))
+
+    def test_unterminated_and_extra_braces(self):
+        tree, errors = self.recover('play { drop "x"')
+        self.assertEqual([(e.line, e.column) for e in errors], [(1, 13)])
+        self.assertIsNotNone(tree)
+        _, errors = self.recover('play { drop "x" } } gameover')
+        self.assertEqual(errors, [ParseError(1, 19, "unexpected '}', expected 'gameover'")])
+        self.assertEqual(self.recover('')[1][0].message,
+                         "unexpected end of input, expected one of 'action', 'flag', 'label', 'play', 'rank', 'rate'")
+
+    def test_library(self):
+        code = "action f(rank n) -> rank { reward n * }\naction g() -> rank { reward f(1) + h() }"
+        with self.assertRaises(SyntaxErrors) as context:
+            compile_library(code, 'lib')
+        self.assertEqual([e.line for e in context.exception.errors], [1])
+        self.assertEqual(context.exception.semantic_errors, ["Function 'h' not defined"])
+
+    def test_analyzer_collects_errors(self):
+        code = """
+        rank: a <-- "x", b
+        action f(rank n) -> rank { drop n  reward n }
+        play {
+            drop 1
+            stay (a) -> { quit }
+            quit
+            b <-- f(b) + c
+            drop "ok " + b
+        } gameover
+        """
+        analyzer = SemanticAnalyzer(collect_errors=True, lower=True)
+        analyzer.visit(PlayTransformer().transform(get_parser().parse(code)))
+        self.assertEqual(len(analyzer.errors), 6)
+        self.assertIn("Type mismatchin declaration of 'a'", analyzer.errors[0])
+        self.assertEqual(analyzer.errors[3:], ["While condition must be 'flag', got rank", 'Quit used outside loop',
+                                               "Variable 'c' not defined"])
+        self.assertIsNone(analyzer.lowered_program)
+        # A failed drop does not leave the analyzer inside an output
+        self.assertFalse(analyzer.in_output)
+
+if __name__ == '__main__':
+    unittest.main()
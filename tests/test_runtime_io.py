@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+import io
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import run_source
+from play_lang.runtime.errors import PlayRuntimeError
+from play_lang.runtime.io import PlayIO, MemoryIO, parse_value
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+class TestRuntimeIO(unittest.TestCase):
+    def test_write_buffer_threshold(self):
+        out = CountingStream()
+        play_io = PlayIO(io.StringIO(), out, buffer_size=20)
+        for _ in range(10):
+            play_io.write_line("12345")  # 6 characters with the newline
+        self.assertEqual(out.writes, 2)
+        play_io.close()
+        self.assertEqual(out.getvalue(), "12345\n" * 10)
+
+    def test_flush_before_prompt(self):
+        out = io.StringIO()
+        play_io = PlayIO(io.StringIO("42\n"), out)
+        play_io.write_line("menu")
+        self.assertEqual(out.getvalue(), "")
+        self.assertEqual(play_io.read_value('rank', "> "), 42)
+        self.assertEqual(out.getvalue(), "menu\n> ")
+
+    def test_bulk_input(self):
+        play_io = PlayIO(io.StringIO("1\n2.5\ntrue\nciao mondo\n"), io.StringIO())
+        values = [play_io.read_value(t) for t in ('rank', 'rate', 'flag', 'label')]
+        self.assertEqual(values, [1, 2.5, True, "ciao mondo"])
+        with self.assertRaisesRegex(PlayRuntimeError, "end of input"):
+            play_io.read_line()
+
+    def test_typed_parsing(self):
+        self.assertEqual(parse_value(" -7 ", 'rank'), -7)
+        self.assertEqual(parse_value("3", 'rate'), 3.0)
+        with self.assertRaisesRegex(PlayRuntimeError, "Invalid rank input: '1.5'"):
+            parse_value("1.5", 'rank')
+        with self.assertRaisesRegex(PlayRuntimeError, "Invalid flag input"):
+            parse_value("yes", 'flag')
+
+    def test_run_with_memory_io(self):
+        code = """
+        rank: a, b
+        play {
+            a, b <-- grab "Due numeri: "
+            drop "Somma: " + (a + b)
+        } gameover
+        """
+        play_io = MemoryIO(["3", "4"])
+        run_source(code, io=play_io)
+        self.assertEqual(play_io.lines(), ["Somma: 7"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__f
 from lark import Lark
 from play_lang.frontend.transformer import PlayTransformer
 from play_lang.frontend.semantic_analysis import SemanticAnalyzer, SemanticError
+from play_lang.frontend.semantic_analysis import BINOP_TABLE, RANK, RATE, FLAG, LABEL, VOID
 
 
 class TestSemanticAnalysis(unittest.TestCase):
@@ -38,6 +39,23 @@ class TestSemanticAnalysis(unittest.TestCase):
         with self.assertRaisesRegex(Exception, "Invalid chain"):
             self.analyze(code)
 
+    def test_multi_target_types(self):
+        self.analyze("""
+        rank: n
+        rate: r
+        play {
+            rank: a = b <-- 4
+            a = r = b <-- n + 1
+        } gameover
+        """)
+        # Each target is checked against the one expression
+        with self.assertRaisesRegex(SemanticError, "assignment to 'a': expected rank, got rate"):
+            self.analyze("""
+            rank: a
+            rate: r
+            play { r = a <-- 1.5 } gameover
+            """)
+
     def test_invalid_output_operator(self):
         code = """
         rank: x
@@ -181,6 +199,22 @@ class TestSemanticAnalysis(unittest.TestCase):
         with self.assertRaisesRegex(SemanticError, "Variable 'local_var' not declared"):
             self.analyze(code)
 
+    def test_nested_local_shadowing_global(self):
+        code = """
+        rank: x <-- 100
+        action g(flag c) -> rank {
+            choice (c) -> { rank: x <-- 5 }
+            drop "x=" + x
+            reward 0
+        }
+        play { drop "" + g(false) } gameover
+        """
+        # x would be the global or the local depending on the branch taken
+        with self.assertRaisesRegex(SemanticError, "Local 'x' shadows a global"):
+            self.analyze(code)
+        # In the top-level block of the action the declaration always runs
+        self.analyze(code.replace("choice (c) -> { rank: x <-- 5 }", "rank: x <-- 5"))
+
     def test_function_arg_mismatch(self):
         code = """
         action foo(rank a) -> void {}
@@ -231,5 +265,24 @@ class TestSemanticAnalysis(unittest.TestCase):
         with self.assertRaisesRegex(SemanticError, "Input prompt must be 'label'"):
             self.analyze(code)
 
+    def test_operator_table(self):
+        self.assertEqual(BINOP_TABLE[('+', RANK, RATE)], RATE)
+        self.assertEqual(BINOP_TABLE[('+', FLAG, LABEL)], LABEL)
+        self.assertEqual(BINOP_TABLE[('<', RANK, RATE)], FLAG)
+        self.assertEqual(BINOP_TABLE[('==', LABEL, LABEL)], FLAG)
+        self.assertNotIn(('-', LABEL, RANK), BINOP_TABLE)
+        self.assertNotIn(('&&', FLAG, RANK), BINOP_TABLE)
+        self.assertNotIn(('==', FLAG, RANK), BINOP_TABLE)
+        self.assertNotIn(('+', LABEL, VOID), BINOP_TABLE)
+        self.assertNotIn(('==', VOID, VOID), BINOP_TABLE)
+
+    def test_void_operand(self):
+        code = """
+        action log() -> void { drop "log" }
+        play { drop "x" + log() } gameover
+        """
+        with self.assertRaisesRegex(SemanticError, "Operator \\+ cannot use a void value"):
+            self.analyze(code)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from play_service import ExecutionService, Job
+
+ECHO = """
+rank: n
+play {
+    n <-- grab "n? "
+    drop "doppio=" + (n * 2)
+} gameover
+"""
+
+SLOW = """
+rank: i
+play {
+    loop (i <-- 0; i < 100000; i <-- i + 1) -> { }
+    drop "fine"
+} gameover
+"""
+
+class TestExecutionService(unittest.TestCase):
+    def test_jobs_with_source_and_artifact(self):
+        with ExecutionService(workers=2, use_processes=False) as service:
+            artifact = service.compile(ECHO)
+            results = service.run_all([Job(source=ECHO, inputs=["4"]),
+                                       Job(artifact=artifact, inputs=["5"]),
+                                       Job(artifact=artifact, inputs=["x"]),
+                                       Job(source="play { drop 1 } gameover")])
+            self.assertEqual(results[0].output, ["doppio=8"])
+            self.assertEqual(results[1].output, ["doppio=10"])
+            self.assertIn("Invalid rank input", results[2].error)
+            self.assertIn("Semantic Error", results[3].error)
+            metrics = service.metrics()
+            self.assertEqual((metrics['completed'], metrics['failed']), (4, 2))
+            self.assertGreaterEqual(metrics['cache_hits'], 1)
+            self.assertGreater(metrics['throughput'], 0)
+
+    def test_step_budget(self):
+        code = "play { stay (true) -> { } } gameover"
+        with ExecutionService(workers=1, use_processes=False) as service:
+            result = service.submit(Job(source=code, step_budget=1000)).result()
+        self.assertIn("Step budget exceeded", result.error)
+        self.assertEqual(result.steps, 1001)
+
+    def test_round_robin_between_tenants(self):
+        with ExecutionService(workers=1, use_processes=False) as service:
+            bulk = [service.submit(Job(source=SLOW, tenant='bulk')) for _ in range(5)]
+            small = service.submit(Job(source=ECHO, inputs=["1"], tenant='small'))
+            for future in bulk + [small]:
+                future.result()
+            order = [r.tenant for r in service.results()]
+        # bulk jobs 1 and 2 were dispatched/queued first, then tenants alternate
+        self.assertEqual(order.index('small'), 2)
+
+    def test_process_workers(self):
+        with ExecutionService(workers=2) as service:
+            results = service.run_all([Job(source=ECHO, inputs=[str(i)]) for i in range(4)])
+        self.assertEqual([r.output for r in results], [[f"doppio={2 * i}"] for i in range(4)])
+
+if __name__ == '__main__':
+    unittest.main()
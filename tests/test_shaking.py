@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, run_source
+from play_lang.runtime.io import MemoryIO
+
+CODE = """
+rank: a <-- 3, b <-- a * 2, c, d <-- 5
+rate: unused <-- 1.5
+label: z <-- "z"
+action used(rank n) -> rank { reward n + b + helper(n) }
+action helper(rank n) -> rank { reward n * 2 }
+action dead(rank n) -> rank { reward dead2(n) + c }
+action dead2(rank n) -> rank { reward dead(n) }
+action shadow(rank z) -> rank { reward z }
+play {
+    rank: r <-- used(d)
+    drop "r " + r
+} gameover
+"""
+
+def run(code, **options):
+    play_io = MemoryIO([])
+    run_source(code, io=play_io, engine='vm', **options)
+    return play_io.lines()
+
+class TestShaking(unittest.TestCase):
+    def test_removed_names(self):
+        stats = {}
+        program = compile_source(CODE, shake=True, stats=stats)
+        self.assertEqual(stats['shaken_functions'], ['dead', 'dead2', 'shadow'])
+        # a stays for the initializer of b
+        self.assertEqual(stats['shaken_globals'], ['c', 'unused', 'z'])
+        self.assertEqual([f.name for f in program.functions], ['used', 'helper'])
+        self.assertEqual([v.name for decl in program.global_decls for v in decl.var_list], ['a', 'b', 'd'])
+
+    def test_same_output(self):
+        self.assertEqual(run(CODE, shake=True), run(CODE))
+        self.assertEqual(run(CODE), ["r 21"])
+        lowered = compile_source(CODE, lower=True, shake=True, optimize=True)
+        self.assertEqual(len(lowered.functions), 2)
+
+    def test_trapping_initializer_kept(self):
+        code = """
+        rank: zero, bad <-- 1 / zero
+        play { drop "mai" } gameover
+        """
+        stats = {}
+        compile_source(code, shake=True, stats=stats)
+        self.assertEqual(stats['shaken_globals'], [])
+        with self.assertRaisesRegex(Exception, "Division by zero"):
+            run(code, shake=True)
+
+    def test_check_only_reachable(self):
+        broken = CODE.replace("reward dead2(n) + c", 'reward "testo"')
+        with self.assertRaisesRegex(Exception, "Semantic Error"):
+            compile_source(broken, shake=True)
+        stats = {}
+        program = compile_source(broken, shake=True, check_all=False, lower=True, stats=stats)
+        self.assertEqual(stats['shaken_functions'], ['dead', 'dead2', 'shadow'])
+        self.assertEqual(len(program.functions), 2)
+        # Reachable code is still checked
+        with self.assertRaisesRegex(Exception, "Semantic Error"):
+            compile_source(CODE.replace("reward n * 2", 'reward "x"'), shake=True, check_all=False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.vm import VM
+from play_lang.optimizer.slots import allocate_slots, frame_report
+from play_lang.runtime.io import MemoryIO
+from play_lang.runtime.errors import PlayRuntimeError
+
+CODE = """
+action f(rank n) -> rank {
+    choice (n > 2) -> { rank: a <-- n * 2  drop "a " + a }
+    rank: b <-- n + 1
+    rank: y <-- b * 3, x <-- 7, z <-- y
+    drop "b " + b + " z " + z + " x " + x
+    rank: c
+    loop (c <-- 0; c < n; c <-- c + 1) -> { rank: t <-- c * c  b <-- b + t }
+    choice (n > 1) -> { rank: u, v <-- 3  u, v <-- grab "" } fail -> { rank: w <-- 1 }
+    rate: r <-- b / 2.0
+    reward b
+}
+action g(rank n, rank acc) -> rank {
+    choice (n == 0) -> { reward acc }
+    rank: k <-- n * 2
+    rank: m <-- k + acc
+    reward g(n - 1, m)
+}
+play { drop "r " + f(3) + " " + f(1) + " " + g(5, 0) + " " + f(4) } gameover
+"""
+
+def run_vm(code, pack_slots, inputs=()):
+    module = BytecodeCompiler(pack_slots=pack_slots).compile_program(compile_source(code, lower=True))
+    play_io = MemoryIO(list(inputs))
+    VM(io=play_io).run(module)
+    return play_io.lines()
+
+class TestSlotAllocation(unittest.TestCase):
+    def setUp(self):
+        program = compile_source(CODE, lower=True)
+        self.f = allocate_slots(program.functions[0])
+        self.g = allocate_slots(program.functions[1])
+
+    def test_packed_frames(self):
+        self.assertEqual((self.f.declared, self.g.declared), (12, 4))
+        self.assertLess(self.f.num_slots, 7)
+        # m is computed from k and acc, then only passed on: it takes the slot of acc
+        self.assertEqual(self.g.slots, {'n': 0, 'acc': 1, 'k': 2, 'm': 1})
+        self.assertEqual(self.g.num_slots, 3)
+
+    def test_interference(self):
+        slots = self.f.slots
+        # Parameters keep their positions
+        self.assertEqual(slots['n'], 0)
+        # Written by the same declaration: y is read by z after x is stored
+        self.assertEqual(len({slots['y'], slots['x'], slots['z']}), 3)
+        # Live across the loop together
+        self.assertEqual(len({slots['b'], slots['c'], slots['t'], slots['n']}), 4)
+        # Chain of grab targets
+        self.assertNotEqual(slots['u'], slots['v'])
+        # Only variables of the same type share a slot
+        self.assertNotIn(slots['r'], [slot for name, slot in slots.items() if name != 'r'])
+
+    def test_same_output(self):
+        self.assertEqual(run_vm(CODE, True, ["4", "5", "6", "7"]), run_vm(CODE, False, ["4", "5", "6", "7"]))
+
+    def test_skipped_declaration_keeps_own_slot(self):
+        code = """
+        action h(rank n) -> rank {
+            rank: p <-- n * 2
+            drop "p " + p
+            choice (n > 0) -> { rank: q <-- 5 }
+            drop "q " + q
+            choice (n > 1) -> { reward h(n - 2) }
+            reward n
+        }
+        play { drop "h " + h(2) } gameover
+        """
+        allocation = allocate_slots(compile_source(code, lower=True).functions[0])
+        self.assertEqual(allocation.own_slot, {'q'})
+        module = BytecodeCompiler().compile_program(compile_source(code, lower=True))
+        self.assertEqual(module.functions[0].reset_slots, (allocation.slots['q'],))
+        # h(2) tail-calls h(0) in the same frame: q is reset, not left at 5,
+        # and reading it fails as in the Interpreter
+        for pack_slots in (True, False):
+            with self.assertRaisesRegex(PlayRuntimeError, "Variable 'q' not defined"):
+                run_vm(code, pack_slots)
+
+    def test_frame_report(self):
+        compiler = BytecodeCompiler()
+        compiler.compile_program(compile_source(CODE, lower=True))
+        report = frame_report(compiler.slot_allocations).splitlines()
+        self.assertEqual(len(report), 4)
+        self.assertEqual(report[-1].split()[:2], ['total', '16'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import asyncio
+import hashlib
+import marshal
+import sys
+import os
+import zlib
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_service import ExecutionService, Job, compile_artifact
+from play_lang.backend.bytecode import BytecodeCompiler
+from play_lang.backend.async_engine import AsyncSession
+from play_lang.backend import snapshot
+from play_lang.backend.snapshot import load_vm, save_vm
+from play_lang.backend.vm import VM
+from play_lang.runtime.errors import PlayRuntimeError
+from play_lang.runtime.io import MemoryIO
+from tests.test_async_engine import CALCULATOR
+
+RECURSIVE = """
+rank: total
+
+action fib(rank n) -> rank {
+    choice (n < 2) -> { reward n }
+    reward fib(n - 1) + fib(n - 2)
+}
+
+action sum(rank n) -> rank {
+    rank: k
+    choice (n == 0) -> { reward 0 }
+    k <-- n * 2
+    reward k + sum(n - 1)
+}
+
+play {
+    total <-- sum(30) + fib(12)
+    drop "totale=" + total
+    loop (total <-- 0; total < 3; total <-- total + 1) -> { drop "giro " + total }
+} gameover
+"""
+
+def compile_module(code):
+    return BytecodeCompiler().compile_program(compile_source(code, lower=True))
+
+def suspended_session(module, lines):
+    """A calculator session fed with lines and suspended on its next grab."""
+    async def scenario():
+        session = AsyncSession(module)
+        for line in lines:
+            session.input.put_nowait(line)
+        task = asyncio.create_task(session.run())
+        while session.vm.waiting is None or not session.input.empty():
+            await asyncio.sleep(0)
+        task.cancel()
+        return session
+    return asyncio.run(scenario())
+
+class TestSnapshot(unittest.TestCase):
+    def test_session_resumes_from_snapshot(self):
+        module = compile_module(CALCULATOR)
+        session = suspended_session(module, ["1", "2", "3.5", "2"])
+        self.assertEqual(session.vm.waiting, ("Due numeri: ", 2))
+        data = session.snapshot()
+
+        async def scenario():
+            restored = AsyncSession.restore(data, compile_module(CALCULATOR))
+            for line in ["4", "5", "0"]:
+                restored.input.put_nowait(line)
+            return await restored.run()
+
+        # The prompt shown before the snapshot is not shown twice
+        self.assertEqual(asyncio.run(scenario()),
+                         ["Operazione (0-2): ", "Due numeri: ", "Risultato: 5.5",
+                          "Operazione (0-2): ", "Due numeri: ", "Risultato: 20.0",
+                          "Operazione (0-2): ", "Uscita."])
+
+    def test_vm_resumes_inside_calls(self):
+        module = compile_module(RECURSIVE)
+        expected = MemoryIO()
+        VM(io=expected).run(module)
+
+        # Cut the run at every few steps, each time continuing on a new VM
+        vm = VM(io=MemoryIO())
+        vm.start(module)
+        output = []
+        snapshots = 0
+        while not vm.resume(3):
+            if vm.frames:
+                snapshots += 1
+            data = save_vm(vm, output + vm.io.lines())
+            vm = VM(io=MemoryIO())
+            output = load_vm(data, module, vm)
+        output += vm.io.lines()
+        self.assertGreater(snapshots, 10)
+        self.assertEqual(output, expected.lines())
+        self.assertEqual(output[0], f"totale={930 + 144}")
+
+    def test_snapshot_checks(self):
+        module = compile_module(CALCULATOR)
+        vm = VM(io=MemoryIO(["0"]))
+        vm.run(module)
+        with self.assertRaisesRegex(PlayRuntimeError, "suspended"):
+            save_vm(vm)
+
+        data = suspended_session(module, []).snapshot()
+        with self.assertRaisesRegex(PlayRuntimeError, "different program"):
+            load_vm(data, compile_module(RECURSIVE), VM())
+        with self.assertRaisesRegex(PlayRuntimeError, "Not a Play snapshot"):
+            load_vm(b"garbage", module, VM())
+
+    def test_damaged_snapshots(self):
+        module = compile_module(CALCULATOR)
+        data = suspended_session(module, []).snapshot()
+        header = len(snapshot.MAGIC) + 2 + 32 + 32
+        damaged = data[:-1] + bytes([data[-1] ^ 1])
+        with self.assertRaisesRegex(PlayRuntimeError, "checksum mismatch"):
+            load_vm(damaged, module, VM())
+        with self.assertRaisesRegex(PlayRuntimeError, "Unsupported snapshot version"):
+            load_vm(data[:7] + b"\x01" + data[8:], module, VM())
+        with self.assertRaisesRegex(PlayRuntimeError, "Not a Play snapshot"):
+            load_vm(data[:header - 1], module, VM())
+
+        def resealed(state):
+            payload = zlib.compress(marshal.dumps(state))
+            return data[:header - 32] + hashlib.sha256(payload).digest() + payload
+
+        state = marshal.loads(zlib.decompress(data[header:]))
+        vm = VM()
+        self.assertEqual(load_vm(resealed(state), module, vm), state[-1])
+        globals_, stack, frames, (current, pc, slots), steps, waiting, extra = state
+        for bad, what in [((globals_[:-1], stack, frames, (current, pc, slots), steps, waiting, extra), "globals"),
+                          ((globals_, stack, frames, (current, 10 ** 6, slots), steps, waiting, extra), "running frame"),
+                          ((globals_, stack, [(99, 0, [], None)], (current, pc, slots), steps, waiting, extra), "call frames"),
+                          ((globals_, [[1]], frames, (current, pc, slots), steps, waiting, extra), "operand stack"),
+                          (state[:-1], "state")]:
+            with self.assertRaisesRegex(PlayRuntimeError, f"Corrupted snapshot: {what}"):
+                load_vm(resealed(bad), module, VM())
+        with self.assertRaisesRegex(PlayRuntimeError, "Corrupted snapshot"):
+            load_vm(resealed(state)[:header - 32] + hashlib.sha256(b"xx").digest() + b"xx", module, VM())
+
+    def test_resume_in_worker_process(self):
+        artifact = compile_artifact(CALCULATOR)
+        session = suspended_session(artifact.module, ["2"])
+        session.io.feed("6")  # one of the two lines of the pending grab is already there
+        data = session.snapshot()
+        with ExecutionService(workers=1) as service:
+            result = service.submit(Job(artifact=artifact, snapshot=data, inputs=["7", "0"])).result()
+        self.assertIsNone(result.error)
+        self.assertEqual(result.output, ["Operazione (0-2): ", "Due numeri: ", "Risultato: 42.0", "Uscita."])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source, run_source
+from play_lang.backend.interpreter import Interpreter, PlayRuntimeError
+from play_lang.backend.tiered import TieredInterpreter, TierUp
+from play_lang.runtime.io import MemoryIO
+from tests.test_vm import SIGNED_ZEROS
+
+PROGRAM = """
+rank: g <-- 1, total
+rate: avg
+label: log <-- ""
+
+action step(rank n, rate w) -> rate {
+    rank: g <-- n * 2
+    choice (g % 3 == 0) -> { reward w / 2 }
+    reward w + g
+}
+
+action count(rank n) -> rank {
+    rank: i, c <-- 0
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        choice (i == 7) -> { quit }
+        c <-- c + i
+    }
+    reward c
+}
+
+play {
+    rank: i
+    stay (i < 40) -> {
+        avg <-- avg + step(i, g)
+        total <-- total + count(i) - -i / 3 + i % 4
+        log <-- log + i % 10 + (i > 4 && g <> 2 || !true)
+        i <-- i + 1
+    }
+    drop "avg=" + -->avg + " total=" + -->total + " log=" + log + " 10%"
+} gameover
+"""
+
+class TestTiered(unittest.TestCase):
+    def run_tiered(self, code, inputs=(), **options):
+        play_io = MemoryIO(inputs)
+        engine = TieredInterpreter(io=play_io, **options)
+        engine.run(compile_source(code, lower=True))
+        return play_io.lines(), engine
+
+    def run_interpreter(self, code, inputs=()):
+        play_io = MemoryIO(inputs)
+        Interpreter(io=play_io).run(compile_source(code, lower=True))
+        return play_io.lines()
+
+    def test_same_output_as_interpreter(self):
+        expected = self.run_interpreter(PROGRAM)
+        for call_threshold, loop_threshold in [(None, None), (1, 0), (5, 20), (None, 0), (1, None)]:
+            lines, _ = self.run_tiered(PROGRAM, call_threshold=call_threshold, loop_threshold=loop_threshold)
+            self.assertEqual(lines, expected, (call_threshold, loop_threshold))
+
+    def test_thresholds_and_events(self):
+        _, engine = self.run_tiered(PROGRAM, call_threshold=None, loop_threshold=None)
+        self.assertEqual(engine.tier_ups, [])
+
+        events = []
+        _, engine = self.run_tiered(PROGRAM, call_threshold=10, loop_threshold=None, on_tier_up=events.append)
+        self.assertEqual([(e.kind, e.name, e.count) for e in engine.tier_ups],
+                         [('action', 'step', 10), ('action', 'count', 10)])
+        self.assertEqual(events, engine.tier_ups)
+        self.assertIsInstance(events[0], TierUp)
+        self.assertIn('def f_count(v_n):', engine.sources['count'])
+        # Compiled actions are not counted any more
+        self.assertEqual(engine.calls, {'step': 10, 'count': 10})
+
+    def test_hot_loop_replaced_on_stack(self):
+        code = """
+        rank: n <-- 0
+        label: s <-- ""
+        play {
+            stay (n < 100) -> {
+                rank: sq <-- n * n
+                choice (sq % 7 == 1) -> { s <-- s + n + "," }
+                n <-- n + 1
+            }
+            drop s + " " + sq
+        } gameover
+        """
+        lines, engine = self.run_tiered(code, loop_threshold=30)
+        self.assertEqual(lines, self.run_interpreter(code))
+        self.assertEqual(engine.tier_ups[0][:3], ('loop', 'play:loop1', 30))
+        # The rest of the loop ran compiled: the interpreter saw 30 back-edges
+        self.assertEqual(list(engine.back_edges.values()), [30])
+
+    def test_loop_in_running_action(self):
+        # The loop is replaced inside an interpreted activation: it reads
+        # and declares locals of that activation and rewards from inside
+        code = """
+        rank: x <-- 5, last <-- 1000
+        action find(rank limit) -> rank {
+            rank: i <-- 0
+            stay (true) -> {
+                rank: step <-- i * 3
+                x <-- x + last
+                last <-- step
+                choice (step > limit) -> { reward i * 1000 + x }
+                i <-- i + 1
+            }
+            reward -1
+        }
+        play {
+            drop "" + find(50) + " " + find(200) + " " + x + " " + last
+        } gameover
+        """
+        lines, engine = self.run_tiered(code, call_threshold=None, loop_threshold=4)
+        self.assertEqual(lines, self.run_interpreter(code))
+        # One version per set of locals at entry: 'step' is declared when
+        # the first call gets hot, not yet when the second one starts
+        self.assertEqual([(e.kind, e.name, e.count) for e in engine.tier_ups],
+                         [('loop', 'find:loop1', 4), ('loop', 'find:loop1', 4)])
+        self.assertEqual(len(engine.compiled_loops), 2)
+
+    def test_swap_while_on_stack(self):
+        # fib tiers up while its first activations are still being interpreted
+        code = """
+        rank: calls
+        action fib(rank n) -> rank {
+            calls <-- calls + 1
+            choice (n < 2) -> { reward n }
+            reward fib(n - 1) + fib(n - 2)
+        }
+        play { drop "" + fib(15) + " " + calls } gameover
+        """
+        lines, engine = self.run_tiered(code, call_threshold=8, memo_size=0)
+        self.assertEqual(lines, ["610 1973"])
+        self.assertEqual([(e.kind, e.name, e.count) for e in engine.tier_ups], [('action', 'fib', 8)])
+
+    def test_runtime_errors_and_grab(self):
+        code = """
+        action div(rank a, rank b) -> rank { reward a / b }
+        play {
+            rank: k, v
+            loop (k <-- 0; k < 3; k <-- k + 1) -> {
+                v <-- grab "n: "
+                drop "" + div(100, v)
+            }
+        } gameover
+        """
+        lines, _ = self.run_tiered(code, ["4", "-3", "7"], call_threshold=1, loop_threshold=0)
+        self.assertEqual(lines, ["25", "-33", "14"])
+        with self.assertRaisesRegex(PlayRuntimeError, "Division by zero"):
+            self.run_tiered(code, ["4", "0", "7"], call_threshold=1, loop_threshold=0)
+
+    def test_skipped_declaration_after_tier_up(self):
+        programs = ["""
+        play {
+            rank: k
+            stay (k < 300) -> {
+                choice (k == 500) -> { rank: y <-- 1 }
+                choice (k > 200) -> { ACCESS }
+                k <-- k + 1
+            }
+            drop "done"
+        } gameover
+        """, """
+        action run(flag c) -> void {
+            rank: k
+            choice (c) -> { rank: y <-- 1 }
+            stay (k < 300) -> {
+                choice (k > 200) -> { ACCESS }
+                k <-- k + 1
+            }
+        }
+        play { run(false) drop "done" } gameover
+        """]
+        for access in ('drop "" + y', 'y <-- k'):
+            for code in programs:
+                code = code.replace('ACCESS', access)
+                with self.assertRaisesRegex(PlayRuntimeError, "Variable 'y' not defined"):
+                    self.run_interpreter(code)
+                with self.assertRaisesRegex(PlayRuntimeError, "Variable 'y' not defined"):
+                    self.run_tiered(code)
+
+    def test_memo_keys_keep_zero_sign(self):
+        # Compiled and interpreted calls share the cache and its keys
+        expected = self.run_interpreter(SIGNED_ZEROS)
+        for call_threshold in (1, 2):
+            lines, _ = self.run_tiered(SIGNED_ZEROS, call_threshold=call_threshold)
+            self.assertEqual(lines, expected)
+
+    def test_run_source(self):
+        play_io = MemoryIO()
+        run_source(PROGRAM, optimize=True, io=play_io, engine='tiered')
+        self.assertEqual(play_io.lines(), self.run_interpreter(PROGRAM))
+
+if __name__ == '__main__':
+    unittest.main()
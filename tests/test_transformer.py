@@ -54,6 +54,23 @@ class TestTransformer(unittest.TestCase):
         self.assertIsInstance(assign_node.expr, LiteralNode)
         self.assertEqual(assign_node.expr.value, 10)
 
+    def test_multi_target_chain(self):
+        # "a = b <-- expr" and "rank: a = b <-- expr" keep one expression for all names
+        code = """
+        play {
+            rank: a = b = c <-- 1 + 2
+            a = b <-- c * 2
+        } gameover
+        """
+        decl, assign = self.transform(code).main_block.statements
+        var_init = decl.var_list[0]
+        self.assertIsInstance(var_init, MultiVarInitNode)
+        self.assertEqual(var_init.names, ['a', 'b', 'c'])
+        self.assertIsInstance(var_init.expr, BinOpNode)
+        self.assertIsInstance(assign, MultiAssignNode)
+        self.assertEqual(assign.targets, ['a', 'b'])
+        self.assertEqual(assign.expr.op, '*')
+
     def test_binary_ops_precedence(self):
         # 1 + 2 * 3 -> 1 + (2 * 3)
         # Tree should be Sum(1, Prod(2, 3))
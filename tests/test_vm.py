@@ -0,0 +1,326 @@
+import unittest
+import sys
+import os
+
+# Add src and root to path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'src'))
+
+from run_compiler import compile_source
+from play_lang.backend.interpreter import Interpreter, PlayRuntimeError
+from play_lang.backend.bytecode import BytecodeCompiler, OPCODE_NAMES
+from play_lang.backend.vm import VM
+from play_lang.runtime.io import MemoryIO
+
+PROGRAM = """
+rank: g <-- 1, total
+rate: avg
+label: log <-- ""
+
+action step(rank n, rate w) -> rate {
+    rank: g <-- n * 2
+    choice (g % 3 == 0) -> { reward w / 2 }
+    reward w + g
+}
+
+action count(rank n) -> rank {
+    rank: i, c <-- 0
+    loop (i <-- 0; i < n; i <-- i + 1) -> {
+        choice (i == 7) -> { quit }
+        c <-- c + i
+    }
+    reward c
+}
+
+play {
+    rank: i
+    stay (i < 10) -> {
+        avg <-- avg + step(i, g)
+        total <-- total + count(i) - -i / 3 + i % 4
+        log <-- log + i + (i > 4 && g <> 2 || !true)
+        i <-- i + 1
+    }
+    drop "avg=" + -->avg + " total=" + -->total + " log=" + log + " 10%"
+} gameover
+"""
+
+SIGNED_ZEROS = """
+rate: z <-- 0.0
+action twice(rate x) -> rate { reward x * 2 }
+action tag(rank k, rate x) -> label { reward "" + k + ":" + x }
+play {
+    drop "" + twice(z) + " " + twice(-z) + " " + twice(-z) + " " + twice(z)
+    drop tag(0, -z) + " " + tag(0, z)
+} gameover
+"""
+
+class TestVM(unittest.TestCase):
+    def compile(self, code, superinstructions=True):
+        return BytecodeCompiler(superinstructions).compile_program(compile_source(code, lower=True))
+
+    def run_vm(self, code, inputs=(), superinstructions=True):
+        play_io = MemoryIO(inputs)
+        VM(io=play_io).run(self.compile(code, superinstructions))
+        return play_io.lines()
+
+    def run_interpreter(self, code, inputs=()):
+        play_io = MemoryIO(inputs)
+        Interpreter(io=play_io).run(compile_source(code, lower=True))
+        return play_io.lines()
+
+    def test_same_output_as_interpreter(self):
+        expected = self.run_interpreter(PROGRAM)
+        self.assertEqual(self.run_vm(PROGRAM, superinstructions=False), expected)
+        self.assertEqual(self.run_vm(PROGRAM), expected)
+
+    def test_specialized_opcodes_and_superinstructions(self):
+        module = self.compile(PROGRAM)
+        count = module.functions[module.function_index['count']]
+        names = {OPCODE_NAMES[op] for op in count.ops}
+        self.assertIn('INC_LOCAL', names)       # i <-- i + 1
+        self.assertIn('JUMP_IF_NOT_LT', names)  # i < n
+        step = module.functions[module.function_index['step']]
+        names = {OPCODE_NAMES[op] for op in step.ops}
+        self.assertIn('DIV_RATE', names)
+        self.assertIn('MOD_RANK', names)
+
+    def test_grab_and_local_shadowing(self):
+        code = """
+        rank: a, d
+        label: s
+
+        action f() -> rank {
+            a <-- a + 1
+            rank: a <-- 100
+            reward a
+        }
+
+        play {
+            a = d <-- grab "Numero: "
+            s, a <-- grab "Due valori: "
+            drop s + " " + -->a + " " + -->d + " " + f() + " " + -->a
+        } gameover
+        """
+        self.assertEqual(self.run_vm(code, ["4", "ciao", "9"]), ["ciao 9 4 100 10"])
+
+    def test_chained_assignment_evaluated_once(self):
+        code = """
+        rank: calls
+        action tick(rank n) -> rank { calls <-- calls + 1  reward n * 2 }
+        play {
+            rank: x = y <-- tick(3)
+            rate: r
+            label: s = t <-- "a" + x
+            x = r = y <-- tick(x) + 1
+            s = t <-- s + t
+            drop "" + x + " " + y + " " + r + " " + s + " " + t + " " + calls
+        } gameover
+        """
+        expected = ["13 13 13.0 a6a6 a6a6 2"]
+        self.assertEqual(self.run_interpreter(code), expected)
+        self.assertEqual(self.run_vm(code), expected)
+
+    def test_read_of_skipped_declaration(self):
+        code = """
+        action g(flag c) -> rank {
+            choice (c) -> { rank: y <-- 5 }
+            TARGET
+            reward 0
+        }
+        play {
+            choice (false) -> { label: s <-- "s" }
+            drop "" + g(true) + g(false)
+            drop s
+        } gameover
+        """
+        for target in ('drop "y=" + y', 'y <-- 1', 'y <-- grab "n: "'):
+            program = code.replace('TARGET', target)
+            for run in (self.run_interpreter, self.run_vm):
+                with self.assertRaisesRegex(PlayRuntimeError, "Variable 'y' not defined"):
+                    run(program, ["3", "4"])
+        program = code.replace('TARGET', '')
+        for run in (self.run_interpreter, self.run_vm):
+            with self.assertRaisesRegex(PlayRuntimeError, "Variable 's' not defined"):
+                run(program)
+
+    def test_division_by_zero(self):
+        code = """
+        rank: z <-- 0
+        play {
+            drop "x" + 1 / z
+        } gameover
+        """
+        with self.assertRaisesRegex(PlayRuntimeError, "Division by zero"):
+            self.run_vm(code)
+
+    def test_non_finite_modulo_and_big_rank(self):
+        code = """
+        rate: x
+        rank: r
+        play {
+            x <-- grab ""
+            drop "m " + x % 2.0
+            r <-- grab ""
+            drop "r " + (r + 0.5)
+        } gameover
+        """
+        for run in (self.run_interpreter, self.run_vm):
+            self.assertEqual(run(code, ["7.5", "3"]), ["m 1.5", "r 3.5"])
+            for value in ("inf", "-inf", "nan"):
+                with self.assertRaisesRegex(PlayRuntimeError, "Modulo of a non-finite value"):
+                    run(code, [value])
+            with self.assertRaisesRegex(PlayRuntimeError, "Rank too large for a rate"):
+                run(code, ["1", "1" + "0" * 400])
+
+    def test_pair_statistics(self):
+        vm = VM(io=MemoryIO(), collect_stats=True)
+        vm.run(self.compile(PROGRAM, superinstructions=False))
+        pairs = dict(vm.top_pairs(100))
+        self.assertGreater(pairs[('LOAD_LOCAL', 'CONST')], 0)
+        self.assertEqual(VM(io=MemoryIO()).pair_counts, {})
+
+class TestVMCalls(unittest.TestCase):
+    def run_vm(self, code, **options):
+        play_io = MemoryIO()
+        module = BytecodeCompiler().compile_program(compile_source(code, lower=True))
+        VM(io=play_io, **options).run(module)
+        return play_io.lines()
+
+    def test_deep_recursion_without_python_stack(self):
+        code = """
+        action sum(rank n) -> rank {
+            choice (n == 0) -> { reward 0 }
+            reward n + sum(n - 1)
+        }
+        play {
+            drop "sum=" + sum(50000)
+        } gameover
+        """
+        self.assertEqual(self.run_vm(code), ["sum=1250025000"])
+        with self.assertRaisesRegex(PlayRuntimeError, "Maximum call depth exceeded"):
+            self.run_vm(code, max_depth=1000)
+
+    def test_tail_calls_run_in_constant_depth(self):
+        code = """
+        action count(rank n, rank acc) -> rank {
+            choice (n == 0) -> { reward acc }
+            reward count(n - 1, acc + n)
+        }
+        action even(rank n) -> flag {
+            choice (n == 0) -> { reward true }
+            reward odd(n - 1)
+        }
+        action odd(rank n) -> flag {
+            choice (n == 0) -> { reward false }
+            reward even(n - 1)
+        }
+        play {
+            drop "count=" + count(200000, 0) + " even=" + even(100001)
+        } gameover
+        """
+        module = BytecodeCompiler().compile_program(compile_source(code, lower=True))
+        count = module.functions[module.function_index['count']]
+        self.assertIn('TAIL_CALL', [OPCODE_NAMES[op] for op in count.ops])
+        self.assertEqual(self.run_vm(code, max_depth=10), ["count=20000100000 even=false"])
+
+    def test_memoized_pure_calls(self):
+        code = """
+        action fib(rank n) -> rank {
+            choice (n < 2) -> { reward n }
+            reward fib(n - 1) + fib(n - 2)
+        }
+        action scale(rank n, rate k) -> rate { reward n * k }
+        play {
+            drop "fib=" + fib(90) + " " + scale(fib(5), 2) + " " + scale(5, 2)
+        } gameover
+        """
+        play_io = MemoryIO()
+        vm = VM(io=play_io, memo_size=16)
+        vm.run(BytecodeCompiler().compile_program(compile_source(code, lower=True)))
+        self.assertEqual(play_io.lines(), ["fib=2880067194370816120 10.0 10.0"])
+        stats = vm.memo.stats()
+        self.assertEqual((stats['size'], stats['max_size']), (16, 16))
+        # fib(5) was evicted by fib(90) and is computed again (6 misses, 3 hits),
+        # the second scale(5, 2.0) is a hit
+        self.assertEqual(stats['misses'], 91 + 6 + 1)
+        self.assertEqual(stats['hits'], 88 + 3 + 1)
+        self.assertEqual(self.run_vm(code.replace("fib(90)", "fib(15)"), memo_size=0),
+                         ["fib=610 10.0 10.0"])
+
+    def test_memo_keys_keep_zero_sign(self):
+        # -0.0 == 0.0, but the two calls give different results
+        expected = ["0.0 -0.0 -0.0 0.0", "0:-0.0 0:0.0"]
+        play_io = MemoryIO()
+        Interpreter(io=play_io).run(compile_source(SIGNED_ZEROS, lower=True))
+        self.assertEqual(play_io.lines(), expected)
+        self.assertEqual(self.run_vm(SIGNED_ZEROS), expected)
+
+    def test_call_site_promotion_and_frame_reuse(self):
+        code = """
+        action half(rank n, rate x) -> rate {
+            choice (n > 0) -> {
+                rate: h <-- x / 2
+                reward h
+            }
+            reward x
+        }
+        play {
+            drop "" + half(1, 3) + " " + half(0, 3) + " " + half(2, 5)
+        } gameover
+        """
+        module = BytecodeCompiler(pack_slots=False).compile_program(compile_source(code, lower=True))
+        main = [(OPCODE_NAMES[op], arg) for op, arg in zip(module.main.ops, module.main.args)]
+        self.assertIn(('CONST', 3.0), main)
+        self.assertNotIn('RANK_TO_RATE', [name for name, arg in main])
+        self.assertEqual(module.functions[0].reset_slots, (2,))
+        # Packed: h is written before every read and takes the slot of x, dead by then
+        packed = BytecodeCompiler().compile_program(compile_source(code, lower=True))
+        self.assertEqual(packed.functions[0].num_slots, 2)
+        self.assertEqual(packed.functions[0].reset_slots, ())
+        self.assertEqual(self.run_vm(code), ["1.5 3.0 2.5"])
+
+class TestProfiler(unittest.TestCase):
+    CODE = """
+    action fib(rank n) -> rank {
+        choice (n < 2) -> { reward n }
+        reward fib(n - 1) + fib(n - 2)
+    }
+    action loop_to(rank n) -> rank {
+        rank: i, s
+        loop (i <-- 0; i < n; i <-- i + 1) -> { s <-- s + i }
+        reward s
+    }
+    play {
+        rank: k <-- 0
+        stay (k < 3) -> {
+            drop "" + fib(5) + " " + loop_to(k * 10)
+            k <-- k + 1
+        }
+    } gameover
+    """
+
+    def test_counters_and_collapsed_stacks(self):
+        lowered = compile_source(self.CODE, lower=True)
+        module = BytecodeCompiler(profile=True, memoize=False).compile_program(lowered)
+        vm = VM(io=MemoryIO())
+        vm.run(module)
+        profiler = vm.profiler
+        index = module.function_index
+        self.assertEqual(profiler.calls[index['fib']], 3 * 15)
+        self.assertEqual(profiler.calls[index['loop_to']], 3)
+        self.assertEqual(profiler.calls[-1], 1)
+        iterations = dict(zip(profiler.loop_names, profiler.loop_iterations))
+        self.assertEqual(iterations, {'loop_to: loop #1': 30, '<play>: stay #1': 3})
+        # Inclusive time of a recursive function counts its outermost calls only
+        self.assertLessEqual(profiler.inclusive[index['fib']], profiler.inclusive[-1])
+        self.assertIn('fib', profiler.report())
+        paths = [line.rsplit(' ', 1)[0] for line in profiler.collapsed_stacks()]
+        self.assertIn('<play>;fib;fib;fib', paths)
+
+        plain = BytecodeCompiler().compile_program(lowered)
+        self.assertIsNone(plain.loop_names)
+        self.assertFalse({OPCODE_NAMES[op] for op in plain.main.ops} & {'PROF_ENTER', 'PROF_EXIT', 'PROF_LOOP'})
+
+if __name__ == '__main__':
+    unittest.main()